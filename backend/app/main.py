@@ -1,4 +1,6 @@
 from fastapi import FastAPI, HTTPException, Depends, status
+from contextlib import asynccontextmanager
+import asyncio
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List
@@ -7,16 +9,47 @@ from dotenv import load_dotenv
 from datetime import datetime
 
 # Import routers
-from app.routers import research, auth, users
+from app.routers import research, auth, users, admin
+from app.services.gemini_service import get_gemini_service
+from app.services.job_queue import get_job_queue, Worker
+from app.services.pdf_renderer import set_pdf_renderer
+from app.services.password_service import set_password_service
+from app.services.repository import close_repository
+from app.services.token_verifier import close_token_verifier
+from app.utils import metrics
 
 # Load environment variables
 load_dotenv()
 
+# API nodes only enqueue jobs. For single-process setups (e.g. `python run.py`)
+# a worker can run inside the API process instead of via worker.py.
+EMBEDDED_WORKER = os.environ.get("EMBEDDED_WORKER", "false").lower() == "true"
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", 4))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    worker = None
+    worker_task = None
+    if EMBEDDED_WORKER:
+        print("Starting embedded job worker")
+        worker = Worker(get_job_queue(), concurrency=WORKER_CONCURRENCY)
+        worker_task = asyncio.create_task(worker.run())
+    yield
+    if worker is not None:
+        worker.stop()
+        worker_task.cancel()
+    # Stop the PDF render processes
+    set_pdf_renderer(None)
+    set_password_service(None)
+    await close_repository()
+    await close_token_verifier()
+
 # Create FastAPI app
 app = FastAPI(
     title="DeepR - Deep Research Platform",
     description="A platform for conducting deep research and generating comprehensive reports",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -38,6 +71,7 @@ app.add_middleware(
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(research.router, prefix="/api/research", tags=["research"])
+app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 
 @app.get("/")
 async def root():
@@ -57,4 +91,11 @@ async def test_endpoint():
         "message": "Test endpoint successful", 
         "success": True,
         "timestamp": str(datetime.now())
-    } 
\ No newline at end of file
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Process metrics: counters, gauges and timings"""
+    snapshot = metrics.snapshot()
+    snapshot["gemini"] = get_gemini_service().stats()
+    return snapshot
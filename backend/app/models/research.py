@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Literal
 from datetime import datetime
 
 class Source(BaseModel):
@@ -10,6 +10,16 @@ class Source(BaseModel):
 class ResearchRequest(BaseModel):
     topic: str
     additional_context: Optional[str] = None
+    # Skip the report cache and always generate a fresh report
+    force_refresh: bool = False
+
+class ExportRequest(BaseModel):
+    """Reports to export: the given ids, or all created between two dates"""
+    research_ids: Optional[List[str]] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    # "zip" for one PDF per report, "pdf" for one combined PDF
+    format: Literal["zip", "pdf"] = "zip"
 
 class ResearchResponse(BaseModel):
     research_id: str
@@ -20,6 +30,29 @@ class ReportSection(BaseModel):
     title: str
     content: str
 
+class ResearchReportOutput(BaseModel):
+    """The report as generated by Gemini; also used as its response schema"""
+    summary: str
+    sections: List[ReportSection]
+    sources: List[Source]
+
+# Response schemas take no defaults other than None (the Gemini API
+# rejects them), so optional fields are Optional[...] = None
+
+class OutlineSection(BaseModel):
+    title: str
+    # What the section must cover, passed to the call that writes it
+    brief: Optional[str] = None
+
+class ReportOutline(BaseModel):
+    """The planning call's output: the report's sections, in order"""
+    sections: List[OutlineSection]
+
+class SectionOutput(BaseModel):
+    """One section as generated by its own Gemini call"""
+    content: str
+    sources: Optional[List[Source]] = None
+
 class Report(BaseModel):
     id: str
     topic: str
@@ -44,6 +77,45 @@ class ResearchHistory(BaseModel):
     user_id: int
     topic: str
     created_at: str
+    # Stored with the report; missing for reports saved before they were added
+    section_count: Optional[int] = None
+    word_count: Optional[int] = None
 
 class ResearchHistoryResponse(BaseModel):
-    researches: List[ResearchHistory] 
\ No newline at end of file
+    researches: List[ResearchHistory]
+    # Pass as ?cursor= to get the next page; None on the last page
+    next_cursor: Optional[str] = None 
+
+class InterruptedJob(BaseModel):
+    """A research job that failed or lost its worker, with what its
+    checkpoint has already saved"""
+    research_id: str
+    topic: Optional[str] = None
+    user_id: Optional[int] = None
+    # "failed" once retries ran out, "stalled" if its worker stopped heartbeating
+    state: str
+    attempts: int
+    error: Optional[str] = None
+    outline_sections: int = 0
+    sections_done: int = 0
+    text_chars: int = 0
+    tokens_saved: int = 0
+    checkpointed_at: Optional[datetime] = None
+
+class InterruptedJobsResponse(BaseModel):
+    jobs: List[InterruptedJob]
+
+class ResumeResponse(BaseModel):
+    research_id: str
+    status: str
+    tokens_saved: int
+
+class CitedSource(BaseModel):
+    """A source registry entry with how many reports cite it"""
+    id: str
+    title: str
+    url: str
+    citations: int
+
+class CitedSourcesResponse(BaseModel):
+    sources: List[CitedSource]
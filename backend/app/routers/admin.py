@@ -0,0 +1,86 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from typing import Optional
+
+# Local imports
+from app.models.research import (
+    CitedSource,
+    CitedSourcesResponse,
+    InterruptedJob,
+    InterruptedJobsResponse,
+    ResumeResponse,
+)
+from app.routers.auth import get_admin_user
+from app.routers.research import update_task
+from app.services.checkpoints import Checkpoint
+from app.services.job_queue import FAILED, RESERVED, Job, get_job_queue, interrupted
+from app.services.repository import get_repository
+from app.utils import metrics
+
+router = APIRouter()
+
+
+def interrupted_state(job: Optional[Job]) -> Optional[str]:
+    """Why a research job is no longer running, or None if it is live or done"""
+    if job is None or job.name != "conduct_research":
+        return None
+    return interrupted(job)
+
+
+@router.get("/jobs/interrupted", response_model=InterruptedJobsResponse)
+async def list_interrupted_jobs(
+    limit: int = Query(100, ge=1, le=1000),
+    admin: dict = Depends(get_admin_user),
+):
+    """List research jobs that failed or lost their worker, with their checkpoints"""
+    jobs = []
+    for job in await get_job_queue().list_jobs([FAILED, RESERVED], limit):
+        state = interrupted_state(job)
+        if state is None:
+            continue
+        checkpoint = await Checkpoint.load(job.id)
+        jobs.append(InterruptedJob(
+            research_id=job.id,
+            topic=job.payload.get("topic"),
+            user_id=job.payload.get("user_id"),
+            state=state,
+            attempts=job.attempts,
+            error=job.error,
+            outline_sections=len(checkpoint.outline or []),
+            sections_done=len(checkpoint.sections),
+            text_chars=len(checkpoint.text),
+            tokens_saved=checkpoint.tokens(),
+            checkpointed_at=checkpoint.data.get("updated_at"),
+        ))
+    return InterruptedJobsResponse(jobs=jobs)
+
+
+@router.post("/jobs/{research_id}/resume", response_model=ResumeResponse)
+async def resume_job(research_id: str, admin: dict = Depends(get_admin_user)):
+    """Queue an interrupted research job again; it continues from its checkpoint"""
+    queue = get_job_queue()
+    if interrupted_state(await queue.get_job(research_id)) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No interrupted research job with this id"
+        )
+    if not await queue.requeue(research_id):
+        # It was picked up again between the two calls
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Job is running again"
+        )
+
+    checkpoint = await Checkpoint.load(research_id)
+    await update_task(research_id, status="in_progress", error=None, completed_at=None)
+    metrics.increment("research.resumed_by_admin")
+    return ResumeResponse(research_id=research_id, status="queued", tokens_saved=checkpoint.tokens())
+
+
+@router.get("/sources/top", response_model=CitedSourcesResponse)
+async def get_top_sources(
+    limit: int = Query(20, ge=1, le=100),
+    admin: dict = Depends(get_admin_user),
+):
+    """The most cited sources across every user's reports"""
+    rows = await get_repository().most_cited_sources(limit=limit)
+    return CitedSourcesResponse(sources=[CitedSource(**row) for row in rows])
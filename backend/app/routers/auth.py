@@ -1,13 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 import os
 from dotenv import load_dotenv
-from supabase import create_client, Client
 import jwt as pyjwt
 import requests
 import httpx
@@ -17,19 +15,17 @@ import string
 
 # Models
 from app.models.user import UserCreate, UserResponse, Token, TokenData
+from app.services.repository import get_repository, RepositoryError
+from app.services.user_cache import get_user_cache
+from app.services.token_verifier import get_token_verifier
+from app.services.password_service import get_password_service, PasswordServiceBusy, TooManyAttempts
+from app.utils import metrics
 
 # Load environment variables
 load_dotenv()
 
-# Initialize supabase client
-supabase_url = os.environ.get("SUPABASE_URL")
-supabase_key = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(supabase_url, supabase_key)
-
 router = APIRouter()
 
-# Password hashing settings
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
 
 # JWT settings
@@ -37,12 +33,26 @@ SECRET_KEY = os.environ.get("SECRET_KEY", "YOUR_SECRET_KEY_HERE")
 ALGORITHM = os.environ.get("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
+# Users allowed to call the admin endpoints, by email (comma-separated)
+ADMIN_EMAILS = {email.strip().lower() for email in os.environ.get("ADMIN_EMAILS", "").split(",") if email.strip()}
+
 # Helper functions
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+def client_ip(request: Request) -> Optional[str]:
+    return request.client.host if request.client else None
+
+def password_busy(e: PasswordServiceBusy) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS if isinstance(e, TooManyAttempts) else status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)},
+    )
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def hash_password(password: str, ip: Optional[str] = None, email: Optional[str] = None) -> str:
+    """Hash a password off the event loop, mapping overload to 429/503"""
+    try:
+        return await get_password_service().hash(password, ip=ip, email=email)
+    except PasswordServiceBusy as e:
+        raise password_busy(e)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -59,28 +69,6 @@ def generate_random_password(length=16):
     alphabet = string.ascii_letters + string.digits + string.punctuation
     return ''.join(secrets.choice(alphabet) for _ in range(length))
 
-async def fetch_jwks(supabase_url: str) -> dict:
-    """Fetch the JWKS from Supabase"""
-    try:
-        # Correct JWKS URL format
-        jwks_url = f"{supabase_url}/rest/v1/rpc/jwks"
-        
-        # Include the anon key in the request headers
-        headers = {
-            'apikey': os.environ.get('SUPABASE_KEY', ''),
-            'Authorization': f'Bearer {os.environ.get("SUPABASE_KEY", "")}'
-        }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(jwks_url, headers=headers)
-            
-        if response.status_code != 200:
-            raise HTTPException(status_code=401, detail="Failed to fetch JWKS")
-            
-        return response.json()
-    except Exception as e:
-        raise HTTPException(status_code=401, detail=f"Failed to fetch JWKS: {str(e)}")
-
 async def validate_token(token: str = Depends(oauth2_scheme)) -> dict:
     """Validate the JWT token"""
     
@@ -91,14 +79,14 @@ async def validate_token(token: str = Depends(oauth2_scheme)) -> dict:
         # Check if this is a Supabase token
         if 'aud' in unverified_payload and unverified_payload['aud'] == 'authenticated':
             try:
-                # Get the user's email from the token claims
-                email = unverified_payload.get('email')
+                # Check the signature locally against Supabase's published keys
+                claims = await get_token_verifier().verify(token)
+                email = claims.get('email')
                 if not email:
                     raise HTTPException(status_code=401, detail="No email in token")
                 
                 # Try to get existing user
-                response = supabase.table("users").select("*").eq("email", email).execute()
-                user = response.data[0] if response.data else None
+                user = await get_user_cache().get_by_email(email)
                 
                 if not user:
                     # Create username from email
@@ -106,7 +94,7 @@ async def validate_token(token: str = Depends(oauth2_scheme)) -> dict:
                     
                     # Generate and hash a random password for Google users
                     random_password = generate_random_password()
-                    hashed_password = get_password_hash(random_password)
+                    hashed_password = await hash_password(random_password, email=email)
                     
                     # Create new user
                     new_user = {
@@ -115,11 +103,13 @@ async def validate_token(token: str = Depends(oauth2_scheme)) -> dict:
                         "hashed_password": hashed_password,
                         "created_at": datetime.utcnow().isoformat()
                     }
-                    response = supabase.table("users").insert(new_user).execute()
-                    user = response.data[0]
+                    user = await get_repository().create_user(new_user)
+                    get_user_cache().put(user)
                 
                 return user
                 
+            except HTTPException:
+                raise
             except Exception as e:
                 raise HTTPException(
                     status_code=401,
@@ -136,8 +126,7 @@ async def validate_token(token: str = Depends(oauth2_scheme)) -> dict:
                         detail="Could not validate credentials",
                     )
                 
-                response = supabase.table("users").select("*").eq("email", username).execute()
-                user = response.data[0] if response.data else None
+                user = await get_user_cache().get_by_email(username)
                 
                 if user is None:
                     raise HTTPException(
@@ -152,6 +141,14 @@ async def validate_token(token: str = Depends(oauth2_scheme)) -> dict:
                     detail="Could not validate credentials",
                 )
             
+    except HTTPException as e:
+        # Let "try again later" through; everything else is a bad token
+        if e.status_code in (status.HTTP_429_TOO_MANY_REQUESTS, status.HTTP_503_SERVICE_UNAVAILABLE):
+            raise
+        raise HTTPException(
+            status_code=401,
+            detail="Could not validate credentials",
+        )
     except Exception as e:
         raise HTTPException(
             status_code=401,
@@ -162,19 +159,27 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     """Get the current user from the token"""
     return await validate_token(token)
 
+async def get_admin_user(current_user: dict = Depends(get_current_user)):
+    """Get the current user, who must be listed in ADMIN_EMAILS"""
+    if (current_user.get("email") or "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
+
 # Routes
 @router.post("/register", response_model=UserResponse)
-async def register_user(user: UserCreate):
+async def register_user(user: UserCreate, request: Request):
     # Check if user already exists
-    response = supabase.table("users").select("*").eq("email", user.email).execute()
-    if response.data:
+    if await get_repository().get_user_by_email(user.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
     # Hash the password
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password(user.password, ip=client_ip(request), email=user.email)
     
     # Create user in Supabase
     new_user = {
@@ -184,15 +189,16 @@ async def register_user(user: UserCreate):
         "created_at": datetime.utcnow().isoformat()
     }
     
-    response = supabase.table("users").insert(new_user).execute()
-    
-    if not response.data:
+    try:
+        created_user = await get_repository().create_user(new_user)
+    except RepositoryError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to create user"
         )
+    # Drop the cached "unknown user" so the new account can sign in at once
+    get_user_cache().invalidate(user.email)
     
-    created_user = response.data[0]
     return UserResponse(
         id=created_user["id"],
         email=created_user["email"],
@@ -201,12 +207,29 @@ async def register_user(user: UserCreate):
     )
 
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    # Get user from Supabase
-    response = supabase.table("users").select("*").eq("email", form_data.username).execute()
-    user = response.data[0] if response.data else None
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    # Get user from the database
+    user = await get_repository().get_user_by_email(form_data.username)
+    
+    valid = False
+    if user:
+        try:
+            valid, new_hash = await get_password_service().verify_and_update(
+                form_data.password, user["hashed_password"], ip=client_ip(request), email=user["email"]
+            )
+        except PasswordServiceBusy as e:
+            raise password_busy(e)
+        if valid and new_hash:
+            # The hash predates the current BCRYPT_ROUNDS: upgrade it now that
+            # we know the password. Best effort: the old hash still works.
+            try:
+                await get_repository().update_user(user["id"], {"hashed_password": new_hash})
+                get_user_cache().invalidate(user["email"])
+            except RepositoryError as e:
+                print(f"Password rehash for user {user['id']} failed: {e}")
+                metrics.increment("auth.rehash_failed")
     
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -1,46 +1,54 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
+from typing import Optional
 import os
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 import json
 import asyncio
+import tempfile
+import base64
+import hashlib
+from email.utils import format_datetime, parsedate_to_datetime
 from dotenv import load_dotenv
-from supabase import create_client, Client
-from google import genai
 from google.genai import types
-from fpdf import FPDF
-import re
-import unicodedata
 
 # Local imports
 from app.models.research import (
+    CitedSource,
+    CitedSourcesResponse,
+    ExportRequest,
     ResearchRequest, 
     ResearchResponse, 
-    ReportSection,
-    Source,
-    Report,
     ReportResponse,
     ResearchHistory,
-    ResearchHistoryResponse
+    ResearchHistoryResponse,
+    ResearchReportOutput
 )
-from app.routers.auth import get_current_user
+from app.routers.auth import get_current_user, validate_token
+from app.services.gemini_service import get_gemini_service
+from app.services.report_pipeline import generate_report, topic_prompt
+from app.services.checkpoints import Checkpoint
+from app.services.job_queue import FAILED, get_job_queue, interrupted, job_task
+from app.services.task_store import get_task_store
+from app.services.progress_bus import get_progress_bus
+from app.services.report_cache import get_report_cache, cache_key
+from app.services.repository import get_repository
+from app.services.pdf_cache import get_pdf_cache
+from app.services.response_cache import get_response_cache, CachedResponse
+from app.services.pdf_renderer import get_pdf_renderer, RendererBusy, MERGED_PDF_SUFFIX, PDF_STREAM_MIN_SECTIONS
+from app.services.report_export import zip_export, merged_pdf_export, EXPORT_MAX_REPORTS
+from app.utils.json_parsing import finalize_report, validate_report
+from app.utils.json_stream import StreamingReportParser
+from app.utils import metrics
+from app.utils.http_cache import etag_matches, body_response
+from app.utils.pdf_report import pdf_cache_key, pdf_filename, parse_report_fields
 
 # Load environment variables
 load_dotenv()
 
-# Initialize supabase client
-supabase_url = os.environ.get("SUPABASE_URL")
-supabase_key = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(supabase_url, supabase_key)
-
 router = APIRouter()
 
-# Track active research tasks
-active_research_tasks: Dict[str, Any] = {}
-
 # Gemini system prompt for research
 SYSTEM_PROMPT = r"""
 You are an expert research assistant built by Raihan Khan (raihankhan.dev). Your task is to conduct comprehensive, deep research on the given topic and prepare a detailed, academic-quality report with the following components:
@@ -100,35 +108,248 @@ This format will be used to generate a downloadable PDF report, so ensure your c
 IMPORTANT: Return ONLY valid JSON without any additional text or code block markers. The content inside the JSON should use markdown formatting, but the JSON itself must be valid and parseable.
 """
 
-async def conduct_research(research_id: str, topic: str, additional_context: Optional[str], user_id: int):
-    """Background task to conduct research using Gemini API"""
+# "text" keeps Google Search grounding and parses the JSON out of plain text;
+# "structured" asks Gemini for schema-validated JSON without search
+GEMINI_OUTPUT_MODE = os.environ.get("GEMINI_OUTPUT_MODE", "text")
+
+# "planned" outlines the report and writes its sections in parallel calls;
+# "single" generates the whole report in one call, capped by one output window
+RESEARCH_PIPELINE = os.environ.get("RESEARCH_PIPELINE", "planned")
+
+# Appended to the prompt when a single-call generation resumes from its checkpoint
+RESUME_INSTRUCTION = """
+
+You already wrote the beginning of your response, shown between the markers below. Continue it from exactly where it stops: do not repeat any of it and do not start a new JSON object.
+<<<PARTIAL RESPONSE
+{text}
+PARTIAL RESPONSE>>>"""
+
+# Typical size of a full report, used to estimate generation progress
+EXPECTED_RESPONSE_CHARS = 30000
+
+# Statuses after which a task no longer changes
+TERMINAL_STATUSES = ("completed", "failed")
+
+# How often progress streams re-read the task store and send keep-alives
+PROGRESS_POLL_INTERVAL = float(os.environ.get("PROGRESS_POLL_INTERVAL", 2))
+
+# Render each finished report's PDF into the PDF cache ahead of its first download.
+# Only done where the API can serve it: with a PDF_CACHE_DIR disk tier the API
+# shares, or from a worker embedded in the API process.
+PDF_CACHE_WARM = os.environ.get("PDF_CACHE_WARM", "true").lower() == "true"
+EMBEDDED_WORKER = os.environ.get("EMBEDDED_WORKER", "false").lower() == "true"
+
+# Research history page sizes
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", 20))
+HISTORY_MAX_PAGE_SIZE = int(os.environ.get("HISTORY_MAX_PAGE_SIZE", 100))
+HISTORY_COLUMNS = "id, user_id, topic, created_at, section_count, word_count"
+
+# Finished reports never change, so browsers may keep them without revalidating
+REPORT_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+def report_stats(result: dict) -> dict:
+    """Section and word counts stored with a report for the history list"""
+    sections = result.get("sections") or []
+    texts = [result.get("summary") or ""] + [section.get("content") or "" for section in sections]
+    return {
+        "section_count": len(sections),
+        "word_count": sum(len(text.split()) for text in texts),
+    }
+
+def encode_cursor(row: dict) -> str:
+    """Opaque history cursor for the page after row"""
+    raw = json.dumps([row["created_at"], row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
     try:
-        # Update the status to processing
-        active_research_tasks[research_id]["status"] = "processing"
-        
-        # Prepare the prompt
-        prompt = f"Topic: {topic}"
-        if additional_context:
-            prompt += f"\nAdditional context: {additional_context}"
-        
-        prompt += "\n\nIMPORTANT: Your response MUST be a valid JSON object without any markdown formatting or code blocks. The JSON must be directly parseable by Python's json.loads() function. Properly escape all special characters in strings."
-        
-        # Using the exact code provided
-        client = genai.Client(
-            api_key=os.environ.get("GEMINI_API_KEY"),
+        created_at, research_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(created_at, str) or not isinstance(research_id, str):
+            raise ValueError(cursor)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
         )
+    return created_at, research_id
 
-        model = "gemini-2.0-flash"
-        contents = [
-            types.Content(
-                role="user",
-                parts=[
-                    types.Part.from_text(
-                        text=SYSTEM_PROMPT + "\n\n" + prompt
-                    ),
-                ],
-            ),
-        ]
+def not_modified_since(request: Request, last_modified: datetime) -> bool:
+    """Whether If-Modified-Since covers last_modified (second precision)"""
+    header = request.headers.get("if-modified-since")
+    if not header or request.headers.get("if-none-match"):
+        return False
+    try:
+        return last_modified.replace(microsecond=0) <= parsedate_to_datetime(header).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return False
+
+async def update_task(research_id: str, **fields) -> dict:
+    """Write task state to the store and push it to progress subscribers"""
+    task = await get_task_store().update(research_id, **fields)
+    await get_progress_bus().publish(research_id, {
+        "type": "status",
+        "status": task.get("status"),
+        "progress": task.get("progress", 0),
+        "error": task.get("error"),
+    })
+    return task
+
+def inflight_key(topic: str, additional_context: Optional[str]) -> str:
+    """Task store key naming the generation currently running for a topic"""
+    return "inflight:" + cache_key(topic, additional_context)
+
+async def resolve_follower(research_id: str, task: dict) -> dict:
+    """Settle a task that was attached to another task's generation.
+
+    Once the shared generation completes the report is cloned for this task;
+    until then the task mirrors the leader's progress.
+    """
+    leader_id = task.get("leader_id")
+    if not leader_id or task["status"] in TERMINAL_STATUSES:
+        return task
+    leader = await get_task_store().get(leader_id)
+    if leader is not None and leader["status"] not in TERMINAL_STATUSES:
+        job = await get_job_queue().get_job(leader_id)
+        if job is None or job.state != FAILED:
+            return {**task, "progress": leader.get("progress", 0)}
+        # The leader's job failed without its task record being settled
+        leader = {**leader, "status": "failed", "error": job.error}
+
+    now = datetime.utcnow().isoformat()
+    if leader is not None and leader["status"] == "completed":
+        cloned = await get_report_cache().clone(leader_id, research_id, task["user_id"], task["topic"])
+        if cloned:
+            return await update_task(research_id, status="completed", progress=100, error=None, completed_at=now)
+    error = leader.get("error") if leader is not None else None
+    return await update_task(
+        research_id,
+        status="failed",
+        error=error or "The shared research task did not produce a report",
+        completed_at=now,
+    )
+
+async def leader_is_live(leader_id: str) -> bool:
+    """Whether a generation can still be attached to. Besides its task
+    record, the leader's job is checked, since a job whose worker died
+    may never have settled the record."""
+    leader = await get_task_store().get(leader_id)
+    if leader is None or leader["status"] in TERMINAL_STATUSES:
+        return False
+    return interrupted(await get_job_queue().get_job(leader_id)) is None
+
+async def settle_followers(research_id: str, topic: str, additional_context: Optional[str]):
+    """Release the topic's in-flight slot and settle the tasks attached to it"""
+    task_store = get_task_store()
+    key = inflight_key(topic, additional_context)
+    claim = await task_store.get(key)
+    if claim is not None and claim.get("research_id") == research_id:
+        await task_store.delete(key)
+
+    followers = await task_store.get("followers:" + research_id)
+    if followers is None:
+        return
+    for follower_id in followers.get("ids", []):
+        task = await task_store.get(follower_id)
+        if task is not None:
+            await resolve_follower(follower_id, task)
+    await task_store.delete("followers:" + research_id)
+
+async def stream_and_cache_pdf(key: str, first: bytes, stream):
+    """Pass a streamed render through to the client, caching it once complete"""
+    pdf_cache = get_pdf_cache()
+    spool = tempfile.SpooledTemporaryFile(max_size=pdf_cache.max_entry_bytes)
+    complete = False
+    try:
+        spool.write(first)
+        yield first
+        async for chunk in stream:
+            spool.write(chunk)
+            yield chunk
+        complete = True
+    finally:
+        await stream.aclose()
+        try:
+            if complete:
+                await asyncio.to_thread(pdf_cache.put_file, key, spool)
+        finally:
+            spool.close()
+
+
+async def warm_pdf_cache(report_data: dict):
+    """Render a report's PDF into the cache so the first download is a hit"""
+    pdf_cache = get_pdf_cache()
+    key = pdf_cache_key(report_data)
+    if key in pdf_cache:
+        return
+    try:
+        rendered = await get_pdf_renderer().render(report_data)
+        body = pdf_cache.put_rendered(key, rendered)
+        if not isinstance(body, bytes):
+            body.close()
+        metrics.increment("pdf_cache.warmed")
+    except Exception as e:
+        # The download path renders on demand, so this is not fatal
+        print(f"PDF cache warm-up failed: {e}")
+
+async def on_research_failure(payload: dict, error: str, final: bool):
+    """Record a failed attempt; the task only shows as failed once retries run out"""
+    await update_task(
+        payload["research_id"],
+        status="failed" if final else "in_progress",
+        error=error,
+        completed_at=datetime.utcnow().isoformat() if final else None,
+    )
+    if final:
+        await settle_followers(payload["research_id"], payload["topic"], payload.get("additional_context"))
+        # Nobody will resume the text streamed so far
+        await get_progress_bus().clear(payload["research_id"])
+
+async def generate_single_report(
+    research_id: str,
+    topic: str,
+    additional_context: Optional[str],
+    structured: bool,
+    checkpoint: Checkpoint,
+):
+    """Generate the whole report in one call, streaming it to watchers and
+    checkpointing the text so far. Returns (success, result); on failure
+    result is a placeholder report."""
+    progress_bus = get_progress_bus()
+    # Prepare the prompt
+    prompt = topic_prompt(topic, additional_context)
+    
+    prompt += "\n\nIMPORTANT: Your response MUST be a valid JSON object without any markdown formatting or code blocks. The JSON must be directly parseable by Python's json.loads() function. Properly escape all special characters in strings."
+    
+    # A response schema makes Gemini start a fresh object, so only text mode
+    # can pick up where an earlier attempt stopped
+    resumed_text = "" if structured else checkpoint.text
+    if resumed_text:
+        prompt += RESUME_INSTRUCTION.format(text=resumed_text)
+    
+    model = "gemini-2.0-flash"
+    contents = [
+        types.Content(
+            role="user",
+            parts=[
+                types.Part.from_text(
+                    text=SYSTEM_PROMPT + "\n\n" + prompt
+                ),
+            ],
+        ),
+    ]
+    if structured:
+        # Gemini enforces the report schema itself. It cannot combine a
+        # response schema with the Google Search tool, so this mode
+        # trades search grounding for guaranteed JSON.
+        generate_content_config = types.GenerateContentConfig(
+            temperature=1,
+            top_p=0.95,
+            top_k=64,
+            max_output_tokens=8192,
+            response_mime_type="application/json",
+            response_schema=ResearchReportOutput,
+        )
+    else:
         tools = [
             types.Tool(google_search=types.GoogleSearch())
         ]
@@ -140,115 +361,136 @@ async def conduct_research(research_id: str, topic: str, additional_context: Opt
             tools=tools,
             response_mime_type="text/plain",
         )
+    
+    # Collect the response through the shared Gemini service, which keeps
+    # the event loop free and queues the call under the quota limits.
+    # The report is parsed incrementally as chunks arrive.
+    chunks = []
+    received_chars = 0
+    report_parser = StreamingReportParser()
+    reported_progress = 0
+    if resumed_text:
+        chunks.append(resumed_text)
+        received_chars = len(resumed_text)
+        await progress_bus.append_text(research_id, resumed_text)
+        for kind, value in report_parser.feed(resumed_text):
+            await progress_bus.publish(research_id, {"type": kind, "value": value})
+    async for chunk in get_gemini_service().generate_content_stream(
+        model=model,
+        contents=contents,
+        config=generate_content_config,
+    ):
+        if chunk.text:
+            chunks.append(chunk.text)
+            received_chars += len(chunk.text)
+            # Stream the partial output to anyone watching this task
+            await progress_bus.append_text(research_id, chunk.text)
+            # Push the summary, sections and sources as soon as each one closes
+            for kind, value in report_parser.feed(chunk.text):
+                await progress_bus.publish(research_id, {"type": kind, "value": value})
+            # Publish progress in 5% steps so the store isn't written per chunk
+            progress = min(90, received_chars * 90 // EXPECTED_RESPONSE_CHARS)
+            if progress >= reported_progress + 5:
+                reported_progress = progress
+                await update_task(research_id, progress=progress)
+                await checkpoint.save(text="".join(chunks))
+    
+    full_response = "".join(chunks)
+    print(f"Raw response preview: {full_response[:200]}...")  # Print first 200 chars for debugging
+    
+    stream_result = report_parser.result()
+    if stream_result is None:
+        print(f"Streaming parse failed ({report_parser.error}), trying full-text repair")
+    success, result = finalize_report(stream_result, full_response, structured)
+    
+    if not success:
+        # If all parsing attempts fail, create a basic structure
+        print("Failed to parse JSON from response. Creating fallback structure.")
+        result = {
+            "summary": "Error: Could not parse research results",
+            "sections": [
+                {
+                    "title": "Error",
+                    "content": "There was an error processing the research results. Please try again."
+                },
+                {
+                    "title": "Raw Response",
+                    "content": full_response[:1000] + ("..." if len(full_response) > 1000 else "")
+                }
+            ],
+            "sources": []
+        }
+    return success, result
+
+async def generate_planned_report(
+    research_id: str,
+    topic: str,
+    additional_context: Optional[str],
+    structured: bool,
+    checkpoint: Checkpoint,
+):
+    """Generate the report through the planner pipeline, publishing each
+    section as it finishes. Returns None if the outline could not be planned."""
+    progress_bus = get_progress_bus()
+    
+    async def on_section(section: dict, done: int, total: int):
+        # Sections finish in any order; each is appended whole so the
+        # partial text never interleaves two of them
+        await progress_bus.append_text(research_id, f"## {section['title']}\n\n{section['content']}\n\n")
+        await progress_bus.publish(research_id, {
+            "type": "section",
+            "value": {"title": section["title"], "content": section["content"]},
+        })
+        await update_task(research_id, progress=5 + 85 * done // total)
+    
+    result = await generate_report(topic, additional_context, structured, on_section, checkpoint)
+    if result is None:
+        return None
+    await progress_bus.publish(research_id, {"type": "summary", "value": result["summary"]})
+    for source in result["sources"]:
+        await progress_bus.publish(research_id, {"type": "source", "value": source})
+    return result
+
+@job_task("conduct_research", on_failure=on_research_failure)
+async def conduct_research(research_id: str, topic: str, additional_context: Optional[str], user_id: int):
+    """Job handler that conducts research using Gemini API"""
+    progress_bus = get_progress_bus()
+    try:
+        # Update the status to processing (the task may run in a worker process)
+        await progress_bus.reset(research_id)
+        await update_task(
+            research_id,
+            user_id=user_id,
+            topic=topic,
+            status="processing",
+            progress=0,
+            started_at=datetime.utcnow().isoformat(),
+        )
         
-        # Collect the response
-        full_response = ""
-        for chunk in client.models.generate_content_stream(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
-        ):
-            if chunk.text:
-                full_response += chunk.text
-        
-        print(f"Raw response preview: {full_response[:200]}...")  # Print first 200 chars for debugging
-        
-        # Parse JSON from the response using our improved approach
-        def parse_json(text):
-            # Try to parse as clean JSON first
-            try:
-                result = json.loads(text.strip())
-                print("Successfully parsed JSON from raw text")
-                return True, result
-            except json.JSONDecodeError as e:
-                print(f"JSON parsing error: {e}")
-                
-                # Check if the response is wrapped in a code block
-                code_block_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', text)
-                if code_block_match:
-                    json_str = code_block_match.group(1).strip()
-                    try:
-                        result = json.loads(json_str)
-                        print("Successfully parsed JSON from code block")
-                        return True, result
-                    except json.JSONDecodeError as e:
-                        print(f"JSON parsing error in code block: {e}")
-                        
-                        # Try to fix invalid escape sequences
-                        try:
-                            # Replace problematic escape sequences
-                            fixed_json_str = re.sub(r'\\(?!["\\/bfnrt]|u[0-9a-fA-F]{4})', r'\\\\', json_str)
-                            result = json.loads(fixed_json_str)
-                            print("Successfully parsed JSON from code block after fixing escape sequences")
-                            return True, result
-                        except json.JSONDecodeError as e2:
-                            print(f"Still failed after fixing escapes in code block: {e2}")
-                
-                # Try to extract JSON between curly braces
-                try:
-                    # Find the first { and the last }
-                    start_idx = text.find('{')
-                    end_idx = text.rfind('}')
-                    
-                    if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                        json_str = text[start_idx:end_idx+1]
-                        
-                        # Try with original string
-                        try:
-                            result = json.loads(json_str)
-                            print("Successfully extracted JSON between curly braces")
-                            return True, result
-                        except json.JSONDecodeError as e:
-                            # Try to fix invalid escape sequences
-                            try:
-                                # Replace problematic escape sequences
-                                fixed_json_str = re.sub(r'\\(?!["\\/bfnrt]|u[0-9a-fA-F]{4})', r'\\\\', json_str)
-                                result = json.loads(fixed_json_str)
-                                print("Successfully extracted JSON after fixing escape sequences")
-                                return True, result
-                            except json.JSONDecodeError as e2:
-                                print(f"Still failed after fixing escapes: {e2}")
-                except Exception as e:
-                    print(f"JSON extraction error: {e}")
-                
-                # Last resort: try to manually fix common issues in the entire text
-                try:
-                    # Replace problematic escape sequences in the entire text
-                    fixed_text = re.sub(r'\\(?!["\\/bfnrt]|u[0-9a-fA-F]{4})', r'\\\\', text)
-                    
-                    # Try to find JSON in the fixed text
-                    start_idx = fixed_text.find('{')
-                    end_idx = fixed_text.rfind('}')
-                    
-                    if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                        fixed_json_str = fixed_text[start_idx:end_idx+1]
-                        result = json.loads(fixed_json_str)
-                        print("Successfully parsed JSON after comprehensive fixing")
-                        return True, result
-                except Exception as e:
-                    print(f"Comprehensive fixing failed: {e}")
-                
-                return False, None
+        # Pick up whatever an earlier attempt at this job already generated
+        checkpoint = await Checkpoint.load(research_id)
+        saved_tokens = checkpoint.tokens()
+        if saved_tokens:
+            print(f"Resuming research {research_id} from its checkpoint ({saved_tokens} tokens saved)")
+            metrics.increment("research.resumed")
+            metrics.increment("research.resume_tokens_saved", saved_tokens)
+            metrics.observe("research.resume_tokens_saved_per_retry", saved_tokens)
+        await checkpoint.save(attempts=checkpoint.data.get("attempts", 0) + 1)
         
-        success, result = parse_json(full_response)
+        structured = GEMINI_OUTPUT_MODE == "structured"
+        result = None
+        if RESEARCH_PIPELINE == "planned" or checkpoint.outline:
+            result = await generate_planned_report(research_id, topic, additional_context, structured, checkpoint)
+            if result is None:
+                print("Report planning failed, generating the report in a single call")
+        if result is None:
+            success, result = await generate_single_report(research_id, topic, additional_context, structured, checkpoint)
+        else:
+            success = validate_report(result) is not None
         
-        if not success:
-            # If all parsing attempts fail, create a basic structure
-            print("Failed to parse JSON from response. Creating fallback structure.")
-            result = {
-                "summary": "Error: Could not parse research results",
-                "sections": [
-                    {
-                        "title": "Error",
-                        "content": "There was an error processing the research results. Please try again."
-                    },
-                    {
-                        "title": "Raw Response",
-                        "content": full_response[:1000] + ("..." if len(full_response) > 1000 else "")
-                    }
-                ],
-                "sources": []
-            }
+        # Point the sources at the shared registry, without duplicates
+        if isinstance(result.get("sources"), list):
+            result["sources"] = await get_repository().canonicalize_sources(result["sources"])
         
         # Create a report object
         report = {
@@ -259,46 +501,122 @@ async def conduct_research(research_id: str, topic: str, additional_context: Opt
             "sections": result.get("sections", []),
             "sources": result.get("sources", []),
             "created_at": datetime.utcnow().isoformat(),
-            "report_json": json.dumps(result)
+            "report_json": json.dumps(result),
+            **report_stats(result),
+            # Only successfully parsed reports are offered to the report cache
+            "topic_key": cache_key(topic, additional_context) if success else None
         }
         
-        # Save to Supabase
-        supabase.table("research_reports").insert(report).execute()
+        # Save to the database; the partial output is no longer needed.
+        # Upserted, so a retry after a failure in the steps below replaces
+        # the saved report instead of conflicting with it
+        await get_repository().upsert_report(report)
+        await checkpoint.clear()
+        if success:
+            get_report_cache().remember(research_id, topic, additional_context)
         
         # Update the status
-        active_research_tasks[research_id]["status"] = "completed"
+        await update_task(
+            research_id,
+            status="completed",
+            progress=100,
+            error=None,
+            completed_at=datetime.utcnow().isoformat(),
+        )
+        await settle_followers(research_id, topic, additional_context)
+        await progress_bus.clear(research_id)
+        if PDF_CACHE_WARM and (EMBEDDED_WORKER or get_pdf_cache().directory):
+            await warm_pdf_cache(report)
         
     except Exception as e:
-        # Handle errors
-        active_research_tasks[research_id]["status"] = "failed"
-        active_research_tasks[research_id]["error"] = str(e)
+        # Log the error; the job's failure handler records it in the task store
         print(f"Research error: {e}")
+        # Re-raise so the worker can retry the job
+        raise
 
 @router.post("/", response_model=ResearchResponse)
 async def request_research(
     research_req: ResearchRequest, 
-    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user)
 ):
     """Start a research task on a topic"""
     # Generate a unique ID for this research
     research_id = str(uuid.uuid4())
     
+    # Reuse a recent report on the same topic unless the client asked for a fresh one
+    if not research_req.force_refresh:
+        cached_from = await get_report_cache().get_or_clone(
+            research_id,
+            current_user["id"],
+            research_req.topic,
+            research_req.additional_context,
+        )
+        if cached_from:
+            now = datetime.utcnow().isoformat()
+            await get_task_store().create(
+                research_id,
+                user_id=current_user["id"],
+                topic=research_req.topic,
+                status="completed",
+                progress=100,
+                started_at=now,
+                completed_at=now,
+            )
+            return ResearchResponse(
+                research_id=research_id,
+                status="completed",
+                estimated_time=0
+            )
+    else:
+        metrics.increment("report_cache.bypassed")
+    
+    # If the same topic is already being generated, attach to that generation
+    # instead of starting another one
+    task_store = get_task_store()
+    key = inflight_key(research_req.topic, research_req.additional_context)
+    if not await task_store.add(key, {"research_id": research_id}):
+        claim = await task_store.get(key) or {}
+        leader_id = claim.get("research_id")
+        if leader_id and await leader_is_live(leader_id):
+            leader = await task_store.get(leader_id) or {}
+            await task_store.create(
+                research_id,
+                user_id=current_user["id"],
+                topic=research_req.topic,
+                status="in_progress",
+                progress=leader.get("progress", 0),
+                leader_id=leader_id,
+            )
+            # Best effort: a follower missed here is still settled when it is polled
+            followers = await task_store.get("followers:" + leader_id) or {}
+            await task_store.update("followers:" + leader_id, ids=followers.get("ids", []) + [research_id])
+            metrics.increment("research.coalesced")
+            return ResearchResponse(
+                research_id=research_id,
+                status="in_progress",
+                estimated_time=60
+            )
+        # The previous generation has finished or died; take over the slot
+        await task_store.update(key, research_id=research_id)
+    
     # Initialize the task status
-    active_research_tasks[research_id] = {
-        "user_id": current_user["id"],
-        "topic": research_req.topic,
-        "status": "in_progress",
-        "start_time": datetime.utcnow().isoformat()
-    }
+    await task_store.create(
+        research_id,
+        user_id=current_user["id"],
+        topic=research_req.topic,
+        status="in_progress",
+    )
     
-    # Start the research task in the background
-    background_tasks.add_task(
-        conduct_research, 
-        research_id, 
-        research_req.topic, 
-        research_req.additional_context,
-        current_user["id"]
+    # Enqueue the research job; a worker picks it up and runs it
+    await get_job_queue().enqueue(
+        "conduct_research",
+        {
+            "research_id": research_id,
+            "topic": research_req.topic,
+            "additional_context": research_req.additional_context,
+            "user_id": current_user["id"],
+        },
+        job_id=research_id,
     )
     
     return ResearchResponse(
@@ -308,80 +626,311 @@ async def request_research(
     )
 
 @router.get("/history", response_model=ResearchHistoryResponse)
-async def get_research_history(current_user: dict = Depends(get_current_user)):
-    """Get the user's research history"""
-    response = supabase.table("research_reports")\
-        .select("id, user_id, topic, created_at")\
-        .eq("user_id", current_user["id"])\
-        .order("created_at", desc=True)\
-        .execute()
-    
-    researches = [
-        ResearchHistory(
-            id=item["id"],
-            user_id=item["user_id"],
-            topic=item["topic"],
-            created_at=item["created_at"]
-        )
-        for item in response.data
-    ]
+async def get_research_history(
+    request: Request,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    q: Optional[str] = Query(None, max_length=200),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get a page of the user's research history, newest first.
     
-    return ResearchHistoryResponse(researches=researches)
+    Pages are keyed on (created_at, id), so a page never shifts when new
+    research is added; q filters by topic.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    # One extra row tells us whether there is a next page
+    rows = await get_repository().list_reports(
+        HISTORY_COLUMNS,
+        user_id=current_user["id"],
+        after=after,
+        search=q.strip() if q else None,
+        limit=limit + 1,
+    )
+    page = rows[:limit]
+    
+    history = ResearchHistoryResponse(
+        researches=[
+            ResearchHistory(
+                id=item["id"],
+                user_id=item["user_id"],
+                topic=item["topic"],
+                created_at=item["created_at"],
+                section_count=item.get("section_count"),
+                word_count=item.get("word_count")
+            )
+            for item in page
+        ],
+        next_cursor=encode_cursor(page[-1]) if len(rows) > limit else None
+    )
+    
+    body = history.model_dump_json().encode()
+    headers = {
+        "ETag": f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+        "Cache-Control": "private, no-cache",
+    }
+    last_modified = None
+    if page:
+        # Reports are never edited, so the newest one dates the page
+        last_modified = max(datetime.fromisoformat(item["created_at"]).replace(tzinfo=None) for item in page)
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]) or (
+        last_modified is not None and not_modified_since(request, last_modified)
+    ):
+        metrics.increment("history.not_modified")
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
-@router.get("/{research_id}/status")
-async def get_research_status(research_id: str, current_user: dict = Depends(get_current_user)):
-    """Get the status of a research task"""
-    if research_id not in active_research_tasks:
-        # Check if it's in the database
-        response = supabase.table("research_reports")\
-            .select("*")\
-            .eq("id", research_id)\
-            .eq("user_id", current_user["id"])\
-            .execute()
-        
-        if response.data:
-            return {"status": "completed"}
-        
+@router.get("/sources/top", response_model=CitedSourcesResponse)
+async def get_top_sources(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    """The sources the user's reports cite most, from the source registry"""
+    rows = await get_repository().most_cited_sources(user_id=current_user["id"], limit=limit)
+    return CitedSourcesResponse(sources=[CitedSource(**row) for row in rows])
+
+async def get_owned_task(research_id: str, user_id: int) -> dict:
+    """Look up a task in the store and check that the user owns it"""
+    task = await get_task_store().get(research_id)
+    if task is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Research task not found"
         )
-    
-    task = active_research_tasks[research_id]
-    
-    # Ensure the user owns this research
-    if task["user_id"] != current_user["id"]:
+    if task.get("user_id") != user_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
         )
+    return await resolve_follower(research_id, task)
+
+@router.post("/export")
+async def export_research_reports(export_request: ExportRequest, current_user: dict = Depends(get_current_user)):
+    """Download several reports at once, as a ZIP of PDFs or one combined PDF"""
+    research_ids = export_request.research_ids
+    start_date, end_date = export_request.start_date, export_request.end_date
+    if research_ids:
+        if len(research_ids) > EXPORT_MAX_REPORTS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At most {EXPORT_MAX_REPORTS} reports can be exported at once"
+            )
+        # One round trip for all of them
+        reports = await get_repository().list_reports(user_id=current_user["id"], ids=research_ids)
+    elif start_date or end_date:
+        reports = await get_repository().list_reports(
+            user_id=current_user["id"],
+            since=start_date.isoformat() if start_date else None,
+            until=end_date.isoformat() if end_date else None,
+            descending=False,
+            limit=EXPORT_MAX_REPORTS,
+        )
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide research_ids or a date range to export"
+        )
+    
+    if not reports:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No research reports found to export"
+        )
+    if research_ids:
+        # Keep the order the reports were asked for in
+        position = {research_id: i for i, research_id in enumerate(research_ids)}
+        reports.sort(key=lambda report: position[report["id"]])
     
-    return {"status": task["status"]}
+    metrics.increment("export.requests")
+    if export_request.format == "pdf":
+        return StreamingResponse(
+            merged_pdf_export(reports),
+            media_type="application/pdf",
+            headers={"Content-Disposition": 'attachment; filename="DeepR_Research_Export.pdf"'}
+        )
+    return StreamingResponse(
+        zip_export(reports),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="DeepR_Research_Export.zip"'}
+    )
+
+@router.get("/{research_id}/status")
+async def get_research_status(research_id: str, current_user: dict = Depends(get_current_user)):
+    """Get the status of a research task"""
+    # A single key lookup in the shared task store; never touches the reports table
+    task = await get_owned_task(research_id, current_user["id"])
+    
+    return {
+        "status": task["status"],
+        "progress": task.get("progress", 0),
+        "created_at": task.get("created_at"),
+        "updated_at": task.get("updated_at"),
+        "started_at": task.get("started_at"),
+        "completed_at": task.get("completed_at"),
+        "error": task.get("error"),
+    }
+
+async def research_events(research_id: str):
+    """Yield progress events for a task until it completes or fails.
+
+    Yields None when nothing happened for a while so callers can send
+    keep-alives. The store is re-read on every idle tick, so status changes
+    made by workers the bus cannot reach still get through.
+    """
+    task_store = get_task_store()
+    progress_bus = get_progress_bus()
+
+    task = await task_store.get(research_id)
+    if task is None:
+        return
+    # Coalesced tasks follow the generation they are attached to
+    channel = task.get("leader_id") or research_id
+
+    async def current_status():
+        task = await task_store.get(research_id)
+        if task is None:
+            return None
+        task = await resolve_follower(research_id, task)
+        return {
+            "type": "status",
+            "status": task["status"],
+            "progress": task.get("progress", 0),
+            "error": task.get("error"),
+        }
+
+    # Subscribe before taking the snapshot so no delta falls in between
+    subscription = await progress_bus.subscribe(channel)
+    try:
+        event = await current_status()
+        if event is None:
+            return
+        last_status = (event["status"], event["progress"])
+        yield event
+        if event["status"] in TERMINAL_STATUSES:
+            return
+
+        text = await progress_bus.partial_text(channel)
+        sent_length = len(text)
+        if text:
+            yield {"type": "delta", "offset": 0, "text": text}
+
+        while True:
+            event = await subscription.get(PROGRESS_POLL_INTERVAL)
+            if event is None:
+                event = await current_status()
+                if event is None:
+                    return
+                if (event["status"], event["progress"]) == last_status:
+                    yield None
+                    continue
+            elif event["type"] == "status" and channel != research_id:
+                # Report this task's own status rather than the leader's
+                event = await current_status()
+                if event is None:
+                    return
+
+            if event["type"] == "delta":
+                # Skip text already sent in the snapshot
+                end = event["offset"] + len(event["text"])
+                if end <= sent_length:
+                    continue
+                event = {
+                    "type": "delta",
+                    "offset": sent_length,
+                    "text": event["text"][sent_length - event["offset"]:],
+                }
+                sent_length = end
+            elif event["type"] == "reset":
+                sent_length = 0
+            elif event["type"] == "status":
+                last_status = (event["status"], event.get("progress", 0))
+
+            yield event
+            if event["type"] == "status" and event["status"] in TERMINAL_STATUSES:
+                return
+    finally:
+        await subscription.close()
+
+@router.get("/{research_id}/events")
+async def stream_research_events(research_id: str, current_user: dict = Depends(get_current_user)):
+    """Server-sent events with status changes and partial output of a research task"""
+    await get_owned_task(research_id, current_user["id"])
+
+    async def event_stream():
+        async for event in research_events(research_id):
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.websocket("/{research_id}/ws")
+async def research_progress_websocket(websocket: WebSocket, research_id: str, token: str):
+    """WebSocket variant of the progress stream. Browsers cannot set headers on
+    WebSockets, so the access token is passed as a query parameter."""
+    try:
+        current_user = await validate_token(token)
+        await get_owned_task(research_id, current_user["id"])
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    try:
+        async for event in research_events(research_id):
+            if event is not None:
+                await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
 
 @router.get("/{research_id}", response_model=ReportResponse)
-async def get_research_report(research_id: str, current_user: dict = Depends(get_current_user)):
-    """Get the completed research report"""
+async def get_research_report(research_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+    """Get the completed research report.
+    
+    A saved report never changes, so its serialized response is kept in an
+    in-memory LRU and served with a strong ETag.
+    """
+    response_cache = get_response_cache()
+    cached = response_cache.get(research_id)
+    if cached is None or cached.user_id != current_user["id"]:
+        cached = await load_report_response(research_id, current_user["id"])
+        response_cache.put(research_id, cached)
+    
+    headers = {
+        "ETag": cached.etag,
+        "Cache-Control": REPORT_CACHE_CONTROL,
+    }
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        metrics.increment("report.not_modified")
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+async def load_report_response(research_id: str, user_id: int) -> CachedResponse:
+    """Read a finished report from the database and serialize it"""
     # Check if the research is completed
-    if research_id in active_research_tasks and active_research_tasks[research_id]["status"] != "completed":
+    task = await get_task_store().get(research_id)
+    if task is not None and task["status"] != "completed":
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Research is still in progress"
         )
     
     # Get from database
-    response = supabase.table("research_reports")\
-        .select("*")\
-        .eq("id", research_id)\
-        .eq("user_id", current_user["id"])\
-        .execute()
+    report_data = await get_repository().get_report(research_id, user_id=user_id)
     
-    if not response.data:
+    if not report_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Research report not found"
         )
     
-    report_data = response.data[0]
     
     # Parse the JSON fields
     try:
@@ -393,7 +942,7 @@ async def get_research_report(research_id: str, current_user: dict = Depends(get
         # If parsing fails, use the raw data
         pass
     
-    return ReportResponse(
+    report = ReportResponse(
         id=report_data["id"],
         topic=report_data["topic"],
         summary=report_data["summary"],
@@ -401,523 +950,88 @@ async def get_research_report(research_id: str, current_user: dict = Depends(get
         sources=report_data["sources"],
         created_at=report_data["created_at"]
     )
+    return CachedResponse.build(report.model_dump_json().encode(), user_id)
 
 @router.get("/{research_id}/pdf")
-async def get_research_pdf(research_id: str, current_user: dict = Depends(get_current_user)):
-    """Generate and download a PDF of the research report using ReportLab"""
-    pdf_path = None
-    try:
-        # Get the report
-        response = supabase.table("research_reports")\
-            .select("*")\
-            .eq("id", research_id)\
-            .eq("user_id", current_user["id"])\
-            .execute()
-        
-        if not response.data:
+async def get_research_pdf(research_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+    """Download the research report as a PDF, served from the PDF cache when possible"""
+    # Get the report
+    report_data = await get_repository().get_report(research_id, user_id=current_user["id"])
+    
+    if not report_data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Research report not found"
+        )
+    
+    
+    # Reports never change, so the content hash doubles as the ETag. A
+    # streamed PDF is merged from page groups and differs byte for byte from
+    # a one-shot render, so it is cached and tagged under its own key.
+    key = pdf_cache_key(report_data)
+    merged_key = key + MERGED_PDF_SUFFIX
+    headers = {"Cache-Control": "private, no-cache"}
+    # Either is a complete copy of the current report
+    for candidate in (key, merged_key):
+        if etag_matches(request.headers.get("if-none-match"), f'"{candidate}"'):
+            metrics.increment("pdf_cache.not_modified")
+            headers["ETag"] = f'"{candidate}"'
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    pdf_cache = get_pdf_cache()
+    cached_key = merged_key if key not in pdf_cache and merged_key in pdf_cache else key
+    body = pdf_cache.get(cached_key)
+    headers["Content-Disposition"] = f'attachment; filename="{pdf_filename(report_data)}"'
+    
+    # Large reports are sent page group by page group as they are laid out.
+    # A byte range needs the whole file first, so those are rendered in one go.
+    sections = parse_report_fields(dict(report_data)).get("sections") or []
+    if body is None and len(sections) >= PDF_STREAM_MIN_SECTIONS and not request.headers.get("range"):
+        headers["ETag"] = f'"{merged_key}"'
+        stream = get_pdf_renderer().render_stream(report_data)
+        try:
+            first = await stream.__anext__()
+        except RendererBusy as e:
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Research report not found"
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after)}
             )
-        
-        report_data = response.data[0]
-        
-        # Parse the JSON fields
-        if isinstance(report_data["sections"], str):
-            report_data["sections"] = json.loads(report_data["sections"])
-        if isinstance(report_data["sources"], str):
-            report_data["sources"] = json.loads(report_data["sources"])
-        
-        # Create a unique temporary file path
-        pdf_path = f"temp_{research_id}_{uuid.uuid4().hex[:8]}.pdf"
-        
-        # Simple sanitize function - strip problematic characters
-        def simple_sanitize(text):
-            if text is None:
-                return ""
-            # Convert to string
-            return str(text).encode('ascii', 'replace').decode('ascii')
-        
-        # Import ReportLab components
-        from reportlab.lib.pagesizes import letter
-        from reportlab.lib import colors
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, HRFlowable
-        from reportlab.lib.units import inch
-        
-        # Create the document with generous margins
-        doc = SimpleDocTemplate(
-            pdf_path,
-            pagesize=letter,
-            rightMargin=0.85*inch,
-            leftMargin=0.85*inch,
-            topMargin=0.85*inch,
-            bottomMargin=0.85*inch
-        )
-        
-        # Create styles
-        styles = getSampleStyleSheet()
-        
-        # Custom styles for better design
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Title'],
-            fontSize=20,
-            spaceAfter=24,
-            alignment=1,  # Center alignment
-            textColor=colors.darkblue
-        )
-        
-        heading1_style = ParagraphStyle(
-            'CustomHeading1',
-            parent=styles['Heading1'],
-            fontSize=16,
-            spaceBefore=16,
-            spaceAfter=10,
-            textColor=colors.darkblue,
-            borderWidth=0,
-            borderColor=colors.lightgrey,
-            borderPadding=5,
-            borderRadius=3
-        )
-        
-        heading2_style = ParagraphStyle(
-            'CustomHeading2',
-            parent=styles['Heading2'],
-            fontSize=14,
-            spaceBefore=14,
-            spaceAfter=8,
-            textColor=colors.darkblue
-        )
-        
-        heading3_style = ParagraphStyle(
-            'CustomHeading3',
-            parent=styles['Heading3'],
-            fontSize=12,
-            spaceBefore=12,
-            spaceAfter=6,
-            textColor=colors.darkblue
-        )
-        
-        normal_style = ParagraphStyle(
-            'CustomNormal',
-            parent=styles['Normal'],
-            fontSize=11,
-            spaceBefore=6,
-            spaceAfter=8,
-            leading=16  # Increased line spacing
-        )
-        
-        # Create a custom style for list items
-        list_style = ParagraphStyle(
-            'ListItem',
-            parent=normal_style,
-            leftIndent=30,
-            firstLineIndent=0,
-            spaceBefore=3,
-            spaceAfter=3,
-            bulletIndent=15,
-            bulletFontName='Helvetica',
-            bulletFontSize=11,
-            leading=16
-        )
-        
-        # Create a custom style for sources
-        source_style = ParagraphStyle(
-            'Source',
-            parent=normal_style,
-            fontSize=10,
-            spaceBefore=4,
-            spaceAfter=6,
-            leading=14
-        )
-        
-        # Create a custom style for URLs
-        url_style = ParagraphStyle(
-            'URL',
-            parent=normal_style,
-            textColor=colors.blue,
-            fontSize=9,
-            spaceBefore=2,
-            spaceAfter=6
-        )
-        
-        # Function to process markdown text
-        def process_markdown(text, is_list_item=False):
-            if not text:
-                return text
-                
-            # Process bold: **text** or __text__
-            text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
-            text = re.sub(r'__(.*?)__', r'<b>\1</b>', text)
-            
-            # Process italic: *text* or _text_
-            text = re.sub(r'\*([^*]+)\*', r'<i>\1</i>', text)
-            text = re.sub(r'_([^_]+)_', r'<i>\1</i>', text)
-            
-            # Process links: [text](url)
-            text = re.sub(r'\[(.*?)\]\((.*?)\)', r'<link href="\2">\1</link>', text)
-            
-            # Process inline code: `code`
-            text = re.sub(r'`(.*?)`', r'<code>\1</code>', text)
-            
-            # Process superscript: ^text^
-            text = re.sub(r'\^(.*?)\^', r'<super>\1</super>', text)
-            
-            # Process subscript: ~text~
-            text = re.sub(r'~(.*?)~', r'<sub>\1</sub>', text)
-            
-            # Process strikethrough: ~~text~~
-            text = re.sub(r'~~(.*?)~~', r'<strike>\1</strike>', text)
-            
-            return text
-        
-        # Build the document content
-        content = []
-        
-        # Add a spacer at the top for better layout
-        content.append(Spacer(1, 0.2*inch))
-        
-        # Title
-        topic = simple_sanitize(report_data.get('topic', 'Research Report'))
-        content.append(Paragraph(topic, title_style))
-        
-        # Date line
-        from datetime import datetime
-        date_style = ParagraphStyle('DateStyle', parent=normal_style, alignment=2, fontSize=9, textColor=colors.gray)
-        date_text = f"Generated on: {datetime.now().strftime('%B %d, %Y')}"
-        content.append(Paragraph(date_text, date_style))
-        content.append(Spacer(1, 0.3*inch))
-        
-        # Add a horizontal line
-        content.append(HRFlowable(
-            width="100%", 
-            thickness=1, 
-            lineCap='round', 
-            color=colors.lightgrey, 
-            spaceBefore=0.1*inch, 
-            spaceAfter=0.3*inch
-        ))
-        
-        # Executive Summary - don't repeat "Executive Summary" title
-        summary = simple_sanitize(report_data.get("summary", "No summary available"))
-        
-        # Process paragraphs
-        paragraphs = summary.split('\n\n')
-        
-        for para in paragraphs:
-            if not para.strip():
-                continue
-                
-            # Check if it's a list item
-            if para.startswith('- ') or para.startswith('* '):
-                lines = para.split('\n')
-                for line in lines:
-                    if not line.strip():
-                        continue
-                        
-                    if line.startswith('- ') or line.startswith('* '):
-                        processed_text = process_markdown(line[2:], True)
-                        content.append(Paragraph("• " + processed_text, list_style))
-                    else:
-                        processed_text = process_markdown(line)
-                        content.append(Paragraph(processed_text, normal_style))
-            else:
-                processed_text = process_markdown(para)
-                content.append(Paragraph(processed_text, normal_style))
-        
-        # Add a horizontal line before sections
-        content.append(Spacer(1, 0.2*inch))
-        
-        # Sections
-        for section in report_data.get("sections", []):
-            content.append(PageBreak())
-            
-            # Add some space at the top of each page
-            content.append(Spacer(1, 0.1*inch))
-            
-            # Section title with background
-            title = simple_sanitize(section.get("title", "Untitled Section"))
-            
-            # Create a styled heading with background
-            section_title_style = ParagraphStyle(
-                'SectionTitle',
-                parent=heading1_style,
-                backColor=colors.lightgrey.clone(alpha=0.3),
-                borderPadding=8,
-                borderWidth=0,
-                borderRadius=4
+        except Exception as e:
+            error_detail = f"Failed to generate PDF: {str(e)}"
+            print(error_detail)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=error_detail
             )
-            content.append(Paragraph(title, section_title_style))
-            content.append(Spacer(1, 0.2*inch))
-            
-            # Process section content
-            section_content = simple_sanitize(section.get("content", "No content available"))
-            
-            # Split by paragraphs
-            paragraphs = section_content.split('\n\n')
-            
-            for para in paragraphs:
-                if not para.strip():
-                    continue
-                
-                # Check if it's a heading
-                if para.startswith('# '):
-                    heading_text = process_markdown(para[2:])
-                    h1_style = ParagraphStyle(
-                        'InlineH1',
-                        parent=heading1_style,
-                        spaceBefore=16
-                    )
-                    content.append(Paragraph(heading_text, h1_style))
-                    content.append(Spacer(1, 0.1*inch))
-                elif para.startswith('## '):
-                    heading_text = process_markdown(para[3:])
-                    h2_style = ParagraphStyle(
-                        'InlineH2',
-                        parent=heading2_style,
-                        spaceBefore=14
-                    )
-                    content.append(Paragraph(heading_text, h2_style))
-                    content.append(Spacer(1, 0.05*inch))
-                elif para.startswith('### '):
-                    heading_text = process_markdown(para[4:])
-                    h3_style = ParagraphStyle(
-                        'InlineH3',
-                        parent=heading3_style,
-                        spaceBefore=12
-                    )
-                    content.append(Paragraph(heading_text, h3_style))
-                    content.append(Spacer(1, 0.05*inch))
-                # Check if it's a list
-                elif para.startswith('- ') or para.startswith('* '):
-                    lines = para.split('\n')
-                    for line in lines:
-                        if not line.strip():
-                            continue
-                            
-                        if line.startswith('- ') or line.startswith('* '):
-                            processed_text = process_markdown(line[2:], True)
-                            content.append(Paragraph("• " + processed_text, list_style))
-                        else:
-                            processed_text = process_markdown(line)
-                            content.append(Paragraph(processed_text, normal_style))
-                    # Add a small space after list
-                    content.append(Spacer(1, 0.05*inch))
-                # Check if it's a numbered list
-                elif re.match(r'^\d+\.', para):
-                    lines = para.split('\n')
-                    for line in lines:
-                        if not line.strip():
-                            continue
-                            
-                        match = re.match(r'^(\d+)\.', line)
-                        if match:
-                            num = match.group(1)
-                            rest = line[len(num)+1:].strip()
-                            processed_text = process_markdown(rest, True)
-                            
-                            # Create a custom bullet style with the number
-                            num_style = ParagraphStyle(
-                                f'NumberedList{num}',
-                                parent=list_style,
-                                bulletText=f"{num}."
-                            )
-                            content.append(Paragraph(processed_text, num_style))
-                        else:
-                            processed_text = process_markdown(line)
-                            content.append(Paragraph(processed_text, normal_style))
-                    # Add a small space after list
-                    content.append(Spacer(1, 0.05*inch))
-                # Check if it's a blockquote
-                elif para.startswith('>'):
-                    blockquote_text = '\n'.join([line[1:].strip() if line.startswith('>') else line for line in para.split('\n')])
-                    blockquote_style = ParagraphStyle(
-                        'Blockquote',
-                        parent=normal_style,
-                        leftIndent=40,
-                        rightIndent=40,
-                        fontName='Helvetica-Oblique',
-                        textColor=colors.darkslategray,
-                        borderWidth=0,
-                        borderColor=colors.lightgrey,
-                        borderPadding=10,
-                        borderRadius=4,
-                        backColor=colors.lightgrey.clone(alpha=0.2)
-                    )
-                    processed_text = process_markdown(blockquote_text)
-                    content.append(Paragraph(processed_text, blockquote_style))
-                    content.append(Spacer(1, 0.1*inch))
-                # Check if it might be a table (contains | character)
-                elif '|' in para and ('---' in para or '-+-' in para):
-                    # Simple table detection and processing
-                    try:
-                        rows = [row.strip() for row in para.split('\n') if row.strip()]
-                        if len(rows) >= 3 and all('|' in row for row in rows):
-                            # Skip separator row
-                            header_row = [cell.strip() for cell in rows[0].split('|') if cell.strip()]
-                            data_rows = []
-                            
-                            for row in rows[2:]:  # Skip header and separator
-                                cells = [cell.strip() for cell in row.split('|') if cell.strip()]
-                                if cells:
-                                    data_rows.append(cells)
-                            
-                            # Create table data including header
-                            table_data = [header_row]
-                            table_data.extend(data_rows)
-                            
-                            # Create table style
-                            table_style = TableStyle([
-                                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-                                ('TEXTCOLOR', (0, 0), (-1, 0), colors.darkblue),
-                                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                                ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-                                ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
-                                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                                ('FONTSIZE', (0, 1), (-1, -1), 9),
-                                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.whitesmoke])
-                            ])
-                            
-                            # Create the table
-                            table = Table(table_data)
-                            table.setStyle(table_style)
-                            content.append(Spacer(1, 0.1*inch))
-                            content.append(table)
-                            content.append(Spacer(1, 0.2*inch))
-                            continue
-                    except Exception as e:
-                        # If table processing fails, fall back to normal paragraph
-                        print(f"Table processing failed: {str(e)}")
-                
-                # Regular paragraph
-                else:
-                    processed_text = process_markdown(para)
-                    content.append(Paragraph(processed_text, normal_style))
-        
-        # Sources
-        content.append(PageBreak())
-        
-        # Add some space at the top
-        content.append(Spacer(1, 0.1*inch))
-        
-        # Sources title with background
-        sources_title_style = ParagraphStyle(
-            'SourcesTitle',
-            parent=heading1_style,
-            backColor=colors.lightgrey.clone(alpha=0.3),
-            borderPadding=8,
-            borderWidth=0,
-            borderRadius=4
-        )
-        content.append(Paragraph("Sources", sources_title_style))
-        content.append(Spacer(1, 0.2*inch))
-        
-        sources = report_data.get("sources", [])
-        if not sources:
-            content.append(Paragraph("No sources available", normal_style))
-        else:
-            # Create a more visually appealing sources section
-            for i, source in enumerate(sources):
-                # Source container with light background
-                title = simple_sanitize(source.get('title', f"Source {i+1}"))
-                
-                # Source box style
-                source_box_style = ParagraphStyle(
-                    'SourceBox',
-                    parent=heading2_style,
-                    fontSize=12,
-                    spaceBefore=12,
-                    spaceAfter=4,
-                    backColor=colors.lightgrey.clone(alpha=0.15),
-                    borderPadding=8,
-                    borderWidth=0,
-                    borderRadius=4
-                )
-                
-                # Source title with number
-                content.append(Paragraph(f"{i+1}. {title}", source_box_style))
-                
-                # URL with link styling
-                url = simple_sanitize(source.get('url', 'No URL provided'))
-                # Truncate very long URLs
-                if len(url) > 80:
-                    url = url[:77] + "..."
-                
-                url_display = f"URL: <link href='{url}'>{url}</link>"
-                content.append(Paragraph(url_display, url_style))
-                
-                # Snippet with proper formatting
-                if source.get("snippet"):
-                    snippet = simple_sanitize(source.get('snippet', ''))
-                    # Truncate very long snippets
-                    if len(snippet) > 300:
-                        snippet = snippet[:297] + "..."
-                    content.append(Paragraph(f"<i>Description:</i> {snippet}", source_style))
-                
-                # Add some space between sources
-                content.append(Spacer(1, 0.2*inch))
-        
-        # Footer function
-        def add_footer(canvas, doc):
-            canvas.saveState()
-            # Add a light gray line
-            canvas.setStrokeColor(colors.lightgrey)
-            canvas.line(doc.leftMargin, 0.5*inch, doc.width + doc.leftMargin, 0.5*inch)
-            
-            # Add footer text
-            canvas.setFont('Helvetica-Oblique', 8)
-            canvas.setFillColor(colors.grey)
-            footer_text = "Generated by DeepR - raihankhan.dev"
-            canvas.drawCentredString(doc.width/2 + doc.leftMargin, 0.35*inch, footer_text)
-            
-            # Add page number
-            canvas.setFont('Helvetica', 8)
-            canvas.drawRightString(doc.width + doc.leftMargin, 0.35*inch, f"Page {doc.page}")
-            canvas.restoreState()
-        
-        # Build the PDF
-        doc.build(content, onFirstPage=add_footer, onLaterPages=add_footer)
-        
-        # Create a background task to clean up the file after it's been sent
-        background_tasks = BackgroundTasks()
-        background_tasks.add_task(cleanup_temp_file, pdf_path)
-        
-        # Return the file as a response
-        return FileResponse(
-            path=pdf_path, 
-            filename=f"DeepR_Research_{topic.replace(' ', '_')}.pdf",
+        return StreamingResponse(
+            stream_and_cache_pdf(merged_key, first, stream),
             media_type="application/pdf",
-            background=background_tasks
-        )
-    except Exception as e:
-        # Clean up any temporary file if it exists
-        if pdf_path and os.path.exists(pdf_path):
-            try:
-                os.remove(pdf_path)
-            except:
-                pass
-                
-        # Log the error and return a proper HTTP exception
-        error_detail = f"Failed to generate PDF: {str(e)}"
-        print(error_detail)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=error_detail
+            headers=headers
         )
-
-# Helper function to clean up temporary files
-def cleanup_temp_file(file_path: str):
-    """Remove a temporary file after it's been sent to the client"""
-    try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"Cleaned up temporary file: {file_path}")
-    except Exception as e:
-        print(f"Error cleaning up temporary file {file_path}: {str(e)}") 
\ No newline at end of file
+    
+    if body is None:
+        try:
+            # Rendered in a worker process so layout never blocks the event loop
+            rendered = await get_pdf_renderer().render(report_data)
+        except RendererBusy as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        except Exception as e:
+            # Log the error and return a proper HTTP exception
+            error_detail = f"Failed to generate PDF: {str(e)}"
+            print(error_detail)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=error_detail
+            )
+        # Small PDFs come back in memory, large ones as a file that is
+        # deleted as soon as the response is done with it
+        body = pdf_cache.put_rendered(key, rendered)
+        cached_key = key
+    
+    headers["ETag"] = f'"{cached_key}"'
+    return body_response(request, body, "application/pdf", headers)
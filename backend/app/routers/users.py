@@ -2,20 +2,15 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List
 import os
 from dotenv import load_dotenv
-from supabase import create_client, Client
 
 # Local imports
 from app.models.user import UserResponse
 from app.routers.auth import get_current_user
+from app.services.repository import get_repository
 
 # Load environment variables
 load_dotenv()
 
-# Initialize supabase client
-supabase_url = os.environ.get("SUPABASE_URL")
-supabase_key = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(supabase_url, supabase_key)
-
 router = APIRouter()
 
 @router.get("/me", response_model=UserResponse)
@@ -32,8 +27,7 @@ async def get_current_user_profile(current_user: dict = Depends(get_current_user
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user_by_id(user_id: int, current_user: dict = Depends(get_current_user)):
     """Get a user by ID (requires authentication)"""
-    response = supabase.table("users").select("*").eq("id", user_id).execute()
-    user = response.data[0] if response.data else None
+    user = await get_repository().get_user(user_id)
     
     if not user:
         raise HTTPException(
@@ -0,0 +1,72 @@
+import asyncio
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.services.gemini_service import estimate_tokens
+from app.services.task_store import TaskStore, get_task_store
+
+# Checkpoints share the task store (and its durability and TTL) under their
+# own keys, so status polls never read them
+CHECKPOINT_PREFIX = "checkpoint:"
+
+
+class Checkpoint:
+    """Partial output of one research job, saved as it is generated so a
+    retry or a resumed job continues from it instead of starting over.
+
+    Fields: outline and sections (by outline index) for planned reports,
+    text for single-call reports, and attempts, the number of runs so far.
+    """
+
+    def __init__(self, research_id: str, data: Optional[Dict[str, Any]] = None, store: Optional[TaskStore] = None):
+        self.research_id = research_id
+        self.data = data or {}
+        self.store = store
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def load(cls, research_id: str, store: Optional[TaskStore] = None) -> "Checkpoint":
+        store = store or get_task_store()
+        return cls(research_id, await store.get(CHECKPOINT_PREFIX + research_id), store)
+
+    @property
+    def outline(self) -> Optional[List[Dict[str, str]]]:
+        return self.data.get("outline")
+
+    @property
+    def sections(self) -> Dict[int, Dict[str, Any]]:
+        return {int(index): section for index, section in self.data.get("sections", {}).items()}
+
+    @property
+    def text(self) -> str:
+        return self.data.get("text", "")
+
+    def tokens(self) -> int:
+        """Estimated output tokens already paid for in this checkpoint"""
+        if not self.data.get("outline") and not self.data.get("sections") and not self.text:
+            return 0
+        saved = [self.text, json.dumps(self.outline or []), *(json.dumps(s) for s in self.sections.values())]
+        return estimate_tokens(saved)
+
+    async def _write(self):
+        self.data["updated_at"] = datetime.utcnow().isoformat()
+        await self.store.put(CHECKPOINT_PREFIX + self.research_id, self.data)
+
+    async def save(self, **fields):
+        """Merge fields into the checkpoint and write it whole. Concurrent
+        sections of one job share this object, so writes never overlap."""
+        async with self._lock:
+            self.data.update(fields)
+            await self._write()
+
+    async def save_section(self, index: int, section: Dict[str, Any]):
+        async with self._lock:
+            # A new dict rather than an update in place: stores may hand
+            # out shallow copies that share the old one
+            self.data["sections"] = dict(self.data.get("sections", {}), **{str(index): section})
+            await self._write()
+
+    async def clear(self):
+        self.data = {}
+        await self.store.delete(CHECKPOINT_PREFIX + self.research_id)
@@ -1,43 +1,186 @@
-import base64
 import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional, AsyncIterator, Any
+
+from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 
+from app.utils import metrics
+
+# Load environment variables
+load_dotenv()
+
+# Limits for the shared client, tuned to the project's Gemini quota
+GEMINI_MAX_IN_FLIGHT = int(os.environ.get("GEMINI_MAX_IN_FLIGHT", 8))
+GEMINI_REQUESTS_PER_MINUTE = int(os.environ.get("GEMINI_REQUESTS_PER_MINUTE", 60))
+GEMINI_TOKENS_PER_MINUTE = int(os.environ.get("GEMINI_TOKENS_PER_MINUTE", 1000000))
+
+
+def estimate_tokens(contents) -> int:
+    """Rough token estimate for a prompt (about 4 characters per token)"""
+    characters = 0
+    for content in contents or []:
+        if isinstance(content, str):
+            characters += len(content)
+            continue
+        for part in getattr(content, "parts", None) or []:
+            characters += len(getattr(part, "text", None) or "")
+    return max(1, characters // 4)
+
+
+class TokenBucket:
+    """Refilling bucket that makes callers wait instead of failing when empty"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.fill_rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        """Wait until amount tokens are available and take them"""
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.fill_rate)
+
+    def consume(self, amount: float):
+        """Take tokens without waiting; the balance may go negative"""
+        self._refill()
+        self.tokens -= amount
+
 
-def generate():
-    client = genai.Client(
-        api_key=os.environ.get("GEMINI_API_KEY"),
-    )
-
-    model = "gemini-2.0-pro-exp-02-05"
-    contents = [
-        types.Content(
-            role="user",
-            parts=[
-                types.Part.from_text(
-                    text="""INSERT_INPUT_HERE"""
-                ),
-            ],
-        ),
-    ]
-    tools = [
-        types.Tool(google_search=types.GoogleSearch())
-    ]
-    generate_content_config = types.GenerateContentConfig(
-        temperature=1,
-        top_p=0.95,
-        top_k=64,
-        max_output_tokens=8192,
-        tools=tools,
-        response_mime_type="text/plain",
-    )
-
-    for chunk in client.models.generate_content_stream(
-        model=model,
-        contents=contents,
-        config=generate_content_config,
+class GeminiService:
+    """Process-wide Gemini client with a concurrency cap and RPM/TPM limits"""
+
+    def __init__(
+        self,
+        client: Optional[Any] = None,
+        max_in_flight: int = GEMINI_MAX_IN_FLIGHT,
+        requests_per_minute: int = GEMINI_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = GEMINI_TOKENS_PER_MINUTE,
     ):
-        print(chunk.text, end="")
+        self._client = client
+        self.max_in_flight = max_in_flight
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.queue_depth = 0
+        self.in_flight = 0
+        self._loop = None
+        self._semaphore = None
+        self._queue_lock = None
+
+    @property
+    def client(self):
+        """The single shared client, created on first use"""
+        if self._client is None:
+            self._client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        return self._client
+
+    def _ensure_primitives(self):
+        # asyncio primitives belong to one event loop, so rebuild them if the
+        # service is used from a new loop (e.g. a worker or a test run)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._queue_lock = asyncio.Lock()
+
+    def _publish_gauges(self):
+        metrics.set_gauge("gemini.queue_depth", self.queue_depth)
+        metrics.set_gauge("gemini.in_flight", self.in_flight)
+
+    @asynccontextmanager
+    async def limit(self, estimated_tokens: int = 1):
+        """Hold a generation slot; queues while the limits are exhausted"""
+        self._ensure_primitives()
+        self.queue_depth += 1
+        self._publish_gauges()
+        queued_at = time.monotonic()
+        acquired = False
+        try:
+            # The lock keeps waiters in arrival order while the buckets refill
+            async with self._queue_lock:
+                await self.request_bucket.acquire(1)
+                await self.token_bucket.acquire(estimated_tokens)
+            await self._semaphore.acquire()
+            acquired = True
+        finally:
+            self.queue_depth -= 1
+            if acquired:
+                self.in_flight += 1
+            self._publish_gauges()
+            metrics.observe("gemini.queue_wait_seconds", time.monotonic() - queued_at)
+
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+            self._publish_gauges()
+
+    async def generate_content_stream(
+        self,
+        *,
+        model: str,
+        contents,
+        config: Optional[types.GenerateContentConfig] = None,
+    ) -> AsyncIterator[types.GenerateContentResponse]:
+        """Stream a generation through the shared client under the limits"""
+        estimated_tokens = estimate_tokens(contents)
+        async with self.limit(estimated_tokens):
+            metrics.increment("gemini.requests")
+            used_tokens = 0
+            try:
+                async for chunk in await self.client.aio.models.generate_content_stream(
+                    model=model,
+                    contents=contents,
+                    config=config,
+                ):
+                    usage = getattr(chunk, "usage_metadata", None)
+                    if usage is not None and getattr(usage, "total_token_count", None):
+                        used_tokens = usage.total_token_count
+                    yield chunk
+            except Exception:
+                metrics.increment("gemini.errors")
+                raise
+            finally:
+                # Charge the bucket for what the call actually used
+                if used_tokens > estimated_tokens:
+                    self.token_bucket.consume(used_tokens - estimated_tokens)
+                metrics.increment("gemini.tokens", used_tokens or estimated_tokens)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+        }
+
+
+_gemini_service: Optional[GeminiService] = None
+
+
+def get_gemini_service() -> GeminiService:
+    """Return the process-wide Gemini service"""
+    global _gemini_service
+    if _gemini_service is None:
+        _gemini_service = GeminiService()
+    return _gemini_service
 
 
-generate() 
\ No newline at end of file
+def set_gemini_service(service: Optional[GeminiService]):
+    """Replace the process-wide service (used by tests)"""
+    global _gemini_service
+    _gemini_service = service
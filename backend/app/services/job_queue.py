@@ -0,0 +1,740 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import math
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
+
+from dotenv import load_dotenv
+
+from app.utils import metrics
+
+# Load environment variables
+load_dotenv()
+
+# Queue settings
+JOB_QUEUE_URL = os.environ.get("JOB_QUEUE_URL", "sqlite:///deepr_jobs.db")
+JOB_VISIBILITY_TIMEOUT = float(os.environ.get("JOB_VISIBILITY_TIMEOUT", 300))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+JOB_RETRY_DELAY = float(os.environ.get("JOB_RETRY_DELAY", 10))
+# Jobs a kombu broker remembers for get()
+KOMBU_KNOWN_JOBS = int(os.environ.get("KOMBU_KNOWN_JOBS", 1000))
+
+# Priority lanes, highest first. Workers always drain earlier lanes first.
+LANES = ("high", "default", "low")
+
+# Job states
+QUEUED = "queued"
+RESERVED = "reserved"
+DONE = "done"
+FAILED = "failed"
+
+# Error recorded for a job whose worker died on its last attempt
+EXPIRED_ERROR = "Visibility timeout expired"
+
+# Message header carrying the attempts a kombu job has started
+ATTEMPTS_HEADER = "x-deepr-attempts"
+
+
+@dataclass
+class Job:
+    id: str
+    name: str
+    payload: Dict[str, Any]
+    lane: str = "default"
+    state: str = QUEUED
+    attempts: int = 0
+    max_attempts: int = JOB_MAX_ATTEMPTS
+    error: Optional[str] = None
+    available_at: float = field(default_factory=time.time)
+    reserved_until: Optional[float] = None
+    created_at: float = field(default_factory=time.time)
+
+
+def interrupted(job: Optional[Job]) -> Optional[str]:
+    """Why a job is no longer running: "failed", "stalled" if its worker
+    stopped heartbeating, or None if it is queued, live or done"""
+    if job is None:
+        return None
+    if job.state == FAILED:
+        return "failed"
+    if job.state == RESERVED and job.reserved_until is not None and job.reserved_until <= time.time():
+        return "stalled"
+    return None
+
+
+class Broker(ABC):
+    """Storage and delivery for jobs. Methods are synchronous; JobQueue runs
+    them in a thread so the event loop is never blocked."""
+
+    @abstractmethod
+    def enqueue(self, job: Job) -> None: ...
+
+    @abstractmethod
+    def reserve(self, lanes: List[str], visibility_timeout: float) -> Optional[Job]:
+        """Hand out the next available job, hidden for visibility_timeout"""
+
+    def expire(self, lanes: List[str]) -> List[Job]:
+        """Fail reserved jobs whose worker died on their last attempt and
+        return them; brokers whose transport handles this return []"""
+        return []
+
+    @abstractmethod
+    def extend(self, job_id: str, visibility_timeout: float) -> None:
+        """Keep a reserved job hidden while its worker is still running it"""
+
+    @abstractmethod
+    def ack(self, job_id: str) -> None: ...
+
+    @abstractmethod
+    def retry(self, job_id: str, error: str, delay: float) -> None: ...
+
+    @abstractmethod
+    def fail(self, job_id: str, error: str) -> None: ...
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job; brokers that cannot do this return None"""
+        return None
+
+    def list_jobs(self, states: List[str], limit: int = 100) -> List[Job]:
+        """Jobs in any of states, oldest first; brokers that cannot do this return []"""
+        return []
+
+    def requeue(self, job_id: str) -> bool:
+        """Queue a failed or abandoned job again with a fresh set of attempts.
+        Returns False if there is no such job or it is still live."""
+        return False
+
+
+class MemoryBroker(Broker):
+    """In-process broker for tests and single-process development"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, job: Job) -> None:
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def reserve(self, lanes: List[str], visibility_timeout: float) -> Optional[Job]:
+        now = time.time()
+        with self._lock:
+            candidates = [
+                job for job in self._jobs.values()
+                if job.lane in lanes and (
+                    (job.state == QUEUED and job.available_at <= now)
+                    or (job.state == RESERVED and job.reserved_until <= now and job.attempts < job.max_attempts)
+                )
+            ]
+            candidates.sort(key=lambda job: (LANES.index(job.lane), job.created_at))
+            for job in candidates:
+                job.state = RESERVED
+                job.attempts += 1
+                job.reserved_until = now + visibility_timeout
+                return Job(**asdict(job))
+        return None
+
+    def expire(self, lanes: List[str]) -> List[Job]:
+        now = time.time()
+        expired = []
+        with self._lock:
+            for job in self._jobs.values():
+                if (
+                    job.lane in lanes and job.state == RESERVED
+                    and job.reserved_until <= now and job.attempts >= job.max_attempts
+                ):
+                    job.state = FAILED
+                    job.error = EXPIRED_ERROR
+                    expired.append(Job(**asdict(job)))
+        return expired
+
+    def extend(self, job_id: str, visibility_timeout: float) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job.state == RESERVED:
+                job.reserved_until = time.time() + visibility_timeout
+
+    def ack(self, job_id: str) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].state = DONE
+
+    def retry(self, job_id: str, error: str, delay: float) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.state = QUEUED
+                job.error = error
+                job.available_at = time.time() + delay
+                job.reserved_until = None
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.state = FAILED
+                job.error = error
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return Job(**asdict(job)) if job else None
+
+    def list_jobs(self, states: List[str], limit: int = 100) -> List[Job]:
+        with self._lock:
+            jobs = sorted((job for job in self._jobs.values() if job.state in states), key=lambda job: job.created_at)
+            return [Job(**asdict(job)) for job in jobs[:limit]]
+
+    def requeue(self, job_id: str) -> bool:
+        now = time.time()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not (job.state == FAILED or (job.state == RESERVED and job.reserved_until <= now)):
+                return False
+            job.state = QUEUED
+            job.attempts = 0
+            job.error = None
+            job.available_at = now
+            job.reserved_until = None
+            return True
+
+
+class SQLiteBroker(Broker):
+    """Durable broker backed by a SQLite file, shared by every process on the host"""
+
+    def __init__(self, path: str):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    lane TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    error TEXT,
+                    available_at REAL NOT NULL,
+                    reserved_until REAL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (state, priority, available_at)"
+            )
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def _row_to_job(row) -> Job:
+        return Job(
+            id=row[0],
+            name=row[1],
+            payload=json.loads(row[2]),
+            lane=row[3],
+            state=row[5],
+            attempts=row[6],
+            max_attempts=row[7],
+            error=row[8],
+            available_at=row[9],
+            reserved_until=row[10],
+            created_at=row[11],
+        )
+
+    def enqueue(self, job: Job) -> None:
+        self._update(
+            "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job.id, job.name, json.dumps(job.payload), job.lane, LANES.index(job.lane),
+                job.state, job.attempts, job.max_attempts, job.error,
+                job.available_at, job.reserved_until, job.created_at,
+            ),
+        )
+
+    def reserve(self, lanes: List[str], visibility_timeout: float) -> Optional[Job]:
+        placeholders = ", ".join("?" for _ in lanes)
+        conn = self._connect()
+        try:
+            now = time.time()
+            # BEGIN IMMEDIATE takes the write lock so two workers can
+            # never reserve the same row
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                f"""
+                SELECT * FROM jobs
+                WHERE lane IN ({placeholders})
+                  AND ((state = ? AND available_at <= ?)
+                       OR (state = ? AND reserved_until <= ? AND attempts < max_attempts))
+                ORDER BY priority, created_at
+                LIMIT 1
+                """,
+                (*lanes, QUEUED, now, RESERVED, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            job = self._row_to_job(row)
+            job.state = RESERVED
+            job.attempts += 1
+            job.reserved_until = now + visibility_timeout
+            conn.execute(
+                "UPDATE jobs SET state = ?, attempts = ?, reserved_until = ? WHERE id = ?",
+                (job.state, job.attempts, job.reserved_until, job.id),
+            )
+            conn.execute("COMMIT")
+            return job
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def expire(self, lanes: List[str]) -> List[Job]:
+        placeholders = ", ".join("?" for _ in lanes)
+        conn = self._connect()
+        try:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                f"""
+                SELECT * FROM jobs
+                WHERE lane IN ({placeholders}) AND state = ? AND reserved_until <= ? AND attempts >= max_attempts
+                """,
+                (*lanes, RESERVED, now),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET state = ?, error = ? WHERE id = ?",
+                [(FAILED, EXPIRED_ERROR, row[0]) for row in rows],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        jobs = [self._row_to_job(row) for row in rows]
+        for job in jobs:
+            job.state, job.error = FAILED, EXPIRED_ERROR
+        return jobs
+
+    def _update(self, sql: str, params: tuple):
+        conn = self._connect()
+        try:
+            conn.execute(sql, params)
+        finally:
+            conn.close()
+
+    def extend(self, job_id: str, visibility_timeout: float) -> None:
+        self._update(
+            "UPDATE jobs SET reserved_until = ? WHERE id = ? AND state = ?",
+            (time.time() + visibility_timeout, job_id, RESERVED),
+        )
+
+    def ack(self, job_id: str) -> None:
+        self._update("UPDATE jobs SET state = ? WHERE id = ?", (DONE, job_id))
+
+    def retry(self, job_id: str, error: str, delay: float) -> None:
+        self._update(
+            "UPDATE jobs SET state = ?, error = ?, available_at = ?, reserved_until = NULL WHERE id = ?",
+            (QUEUED, error, time.time() + delay, job_id),
+        )
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._update("UPDATE jobs SET state = ?, error = ? WHERE id = ?", (FAILED, error, job_id))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._row_to_job(row) if row else None
+
+    def list_jobs(self, states: List[str], limit: int = 100) -> List[Job]:
+        placeholders = ", ".join("?" for _ in states)
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT * FROM jobs WHERE state IN ({placeholders}) ORDER BY created_at LIMIT ?",
+                (*states, limit),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [self._row_to_job(row) for row in rows]
+
+    def requeue(self, job_id: str) -> bool:
+        now = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                """
+                UPDATE jobs SET state = ?, attempts = 0, error = NULL, available_at = ?, reserved_until = NULL
+                WHERE id = ? AND (state = ? OR (state = ? AND reserved_until <= ?))
+                """,
+                (QUEUED, now, job_id, FAILED, RESERVED, now),
+            )
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+
+class KombuBroker(Broker):
+    """Broker on any kombu transport (Redis, RabbitMQ, SQS) for multi-host
+    deployments. Visibility timeouts are enforced by the transport.
+
+    A job's attempt count travels in the ATTEMPTS_HEADER message header: a
+    retry republishes the job with the count so far, and a message the
+    transport redelivers because its worker died is republished with that
+    attempt counted. Jobs out of attempts are dead-lettered to
+    deepr.jobs.dead. Retry backoff uses the transport's delays: a TTL queue
+    that dead-letters back into the lane on RabbitMQ, DelaySeconds on SQS.
+    Other transports have neither, so a message that is not due yet is held
+    unacked by the worker that received it until it is.
+
+    get() only knows the jobs this process has handled.
+    """
+
+    def __init__(self, url: str, visibility_timeout: float = JOB_VISIBILITY_TIMEOUT):
+        from kombu import Connection
+
+        self.connection = Connection(
+            url, transport_options={"visibility_timeout": visibility_timeout}
+        )
+        self.driver = self.connection.transport.driver_type
+        self._queues = {
+            lane: self.connection.SimpleQueue(f"deepr.jobs.{lane}", serializer="json")
+            for lane in LANES
+        }
+        self._delay_queues = {}
+        if self.driver == "amqp":
+            self._delay_queues = {
+                lane: self.connection.SimpleQueue(
+                    f"deepr.jobs.{lane}.delayed",
+                    serializer="json",
+                    queue_args={
+                        "x-dead-letter-exchange": f"deepr.jobs.{lane}",
+                        "x-dead-letter-routing-key": f"deepr.jobs.{lane}",
+                    },
+                )
+                for lane in LANES
+            }
+        self._dead = self.connection.SimpleQueue("deepr.jobs.dead", serializer="json")
+        # Unacked messages: being run, or held until their delay is up
+        self._reserved: Dict[str, Tuple[Job, Any]] = {}
+        self._held: Dict[str, Tuple[Job, Any]] = {}
+        self._expired: List[Job] = []
+        # Recently seen jobs, for get()
+        self._known: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, job: Job):
+        self._known[job.id] = Job(**asdict(job))
+        self._known.move_to_end(job.id)
+        while len(self._known) > KOMBU_KNOWN_JOBS:
+            self._known.popitem(last=False)
+
+    def _publish(self, job: Job, delay: float = 0.0):
+        headers = {ATTEMPTS_HEADER: job.attempts}
+        if delay > 0 and self._delay_queues:
+            self._delay_queues[job.lane].put(asdict(job), headers=headers, expiration=delay)
+        elif delay > 0 and self.driver == "sqs":
+            # Longer delays are held by the receiving worker for the rest
+            self._queues[job.lane].put(asdict(job), headers=headers, DelaySeconds=min(math.ceil(delay), 900))
+        else:
+            self._queues[job.lane].put(asdict(job), headers=headers)
+        self._remember(job)
+
+    def _dead_letter(self, job: Job):
+        self._dead.put(asdict(job), headers={ATTEMPTS_HEADER: job.attempts})
+        self._remember(job)
+
+    def enqueue(self, job: Job) -> None:
+        with self._lock:
+            self._publish(job)
+
+    def _start(self, job: Job, message: Any, visibility_timeout: float) -> Job:
+        job.state = RESERVED
+        job.attempts += 1
+        job.reserved_until = time.time() + visibility_timeout
+        self._reserved[job.id] = (job, message)
+        self._remember(job)
+        return Job(**asdict(job))
+
+    def reserve(self, lanes: List[str], visibility_timeout: float) -> Optional[Job]:
+        from kombu.simple import SimpleQueue
+
+        now = time.time()
+        with self._lock:
+            for lane in lanes:
+                for job_id, (job, message) in list(self._held.items()):
+                    if job.lane == lane and job.available_at <= now:
+                        del self._held[job_id]
+                        return self._start(job, message, visibility_timeout)
+                while True:
+                    try:
+                        message = self._queues[lane].get(block=False)
+                    except SimpleQueue.Empty:
+                        break
+                    job = Job(**message.payload)
+                    job.attempts = int(message.headers.get(ATTEMPTS_HEADER, job.attempts))
+                    if message.delivery_info.get("redelivered") or message.headers.get("redelivered"):
+                        # Its worker died mid-attempt: count that attempt
+                        job.attempts += 1
+                        if job.attempts >= job.max_attempts:
+                            job.state, job.error = FAILED, EXPIRED_ERROR
+                            self._dead_letter(job)
+                            self._expired.append(job)
+                        else:
+                            job.state, job.reserved_until = QUEUED, None
+                            self._publish(job)
+                        message.ack()
+                        continue
+                    if job.available_at > now:
+                        # Backoff the transport could not delay
+                        self._held[job.id] = (job, message)
+                        continue
+                    return self._start(job, message, visibility_timeout)
+        return None
+
+    def expire(self, lanes: List[str]) -> List[Job]:
+        with self._lock:
+            expired = [job for job in self._expired if job.lane in lanes]
+            self._expired = [job for job in self._expired if job.lane not in lanes]
+        return expired
+
+    def extend(self, job_id: str, visibility_timeout: float) -> None:
+        # The transport keeps unacked messages reserved for its configured timeout
+        with self._lock:
+            if job_id in self._reserved:
+                self._reserved[job_id][0].reserved_until = time.time() + visibility_timeout
+
+    def _finish(self, job_id: str) -> Optional[Job]:
+        job, message = self._reserved.pop(job_id, (None, None))
+        if message is not None:
+            message.ack()
+        return job
+
+    def ack(self, job_id: str) -> None:
+        with self._lock:
+            job = self._finish(job_id)
+            if job:
+                job.state = DONE
+                self._remember(job)
+
+    def retry(self, job_id: str, error: str, delay: float) -> None:
+        with self._lock:
+            job = self._finish(job_id)
+            if job:
+                job.state = QUEUED
+                job.error = error
+                job.available_at = time.time() + delay
+                job.reserved_until = None
+                self._publish(job, delay)
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._lock:
+            job = self._finish(job_id)
+            if job:
+                job.state = FAILED
+                job.error = error
+                self._dead_letter(job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._known.get(job_id)
+            return Job(**asdict(job)) if job else None
+
+
+def create_broker(url: str = JOB_QUEUE_URL) -> Broker:
+    """Build a broker from a URL: memory://, sqlite:///path or a kombu URL"""
+    if url.startswith("memory://"):
+        return MemoryBroker()
+    if url.startswith("sqlite:///"):
+        return SQLiteBroker(url[len("sqlite:///"):])
+    return KombuBroker(url)
+
+
+# Registered job handlers, keyed by job name
+TASKS: Dict[str, Callable[..., Awaitable[Any]]] = {}
+
+# Optional failure callbacks: on_failure(payload, error, final)
+FAILURE_HANDLERS: Dict[str, Callable[..., Awaitable[Any]]] = {}
+
+
+def job_task(name: str, on_failure: Optional[Callable[..., Awaitable[Any]]] = None):
+    """Register an async function as a job handler. on_failure is awaited
+    after each failed attempt, with final=True once no retries are left."""
+    def decorator(func):
+        TASKS[name] = func
+        if on_failure is not None:
+            FAILURE_HANDLERS[name] = on_failure
+        return func
+    return decorator
+
+
+async def run_failure_handler(job: Job, error: str, final: bool):
+    """Await the job's on_failure hook, if it has one; errors are logged"""
+    on_failure = FAILURE_HANDLERS.get(job.name)
+    if on_failure is None:
+        return
+    try:
+        await on_failure(job.payload, error, final)
+    except Exception as hook_error:
+        print(f"Failure handler for job {job.id} raised: {hook_error}")
+
+
+class JobQueue:
+    """Async facade over a broker"""
+
+    def __init__(self, broker: Broker, visibility_timeout: float = JOB_VISIBILITY_TIMEOUT):
+        self.broker = broker
+        self.visibility_timeout = visibility_timeout
+
+    async def enqueue(
+        self,
+        name: str,
+        payload: Dict[str, Any],
+        job_id: Optional[str] = None,
+        lane: str = "default",
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+    ) -> str:
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane: {lane}")
+        job = Job(
+            id=job_id or str(uuid.uuid4()),
+            name=name,
+            payload=payload,
+            lane=lane,
+            max_attempts=max_attempts,
+        )
+        await asyncio.to_thread(self.broker.enqueue, job)
+        metrics.increment(f"jobs.enqueued.{lane}")
+        return job.id
+
+    async def reserve(self, lanes: List[str]) -> Optional[Job]:
+        # Jobs whose worker died on their last attempt fail here, and their
+        # failure hooks run as if the handler had raised
+        for job in await asyncio.to_thread(self.broker.expire, lanes):
+            print(f"Job {job.id} failed permanently: {job.error}")
+            metrics.increment("jobs.failed")
+            metrics.increment("jobs.expired")
+            await run_failure_handler(job, job.error, True)
+        return await asyncio.to_thread(self.broker.reserve, lanes, self.visibility_timeout)
+
+    async def get_job(self, job_id: str) -> Optional[Job]:
+        return await asyncio.to_thread(self.broker.get, job_id)
+
+    async def list_jobs(self, states: List[str], limit: int = 100) -> List[Job]:
+        return await asyncio.to_thread(self.broker.list_jobs, states, limit)
+
+    async def requeue(self, job_id: str) -> bool:
+        requeued = await asyncio.to_thread(self.broker.requeue, job_id)
+        if requeued:
+            metrics.increment("jobs.requeued")
+        return requeued
+
+
+class Worker:
+    """Pulls jobs from the queue and runs them, `concurrency` at a time"""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        lanes: Optional[List[str]] = None,
+        concurrency: int = 4,
+        poll_interval: float = 1.0,
+        retry_delay: float = JOB_RETRY_DELAY,
+    ):
+        self.queue = queue
+        self.lanes = list(lanes or LANES)
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self._stopping = False
+
+    async def _heartbeat(self, job: Job):
+        # Keep the reservation alive while the handler is still running
+        interval = max(1.0, self.queue.visibility_timeout / 3)
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.queue.broker.extend, job.id, self.queue.visibility_timeout)
+
+    async def run_job(self, job: Job):
+        broker = self.queue.broker
+        handler = TASKS.get(job.name)
+        if handler is None:
+            await asyncio.to_thread(broker.fail, job.id, f"Unknown task: {job.name}")
+            return
+
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            await handler(**job.payload)
+        except Exception as e:
+            error = str(e)
+            final = job.attempts >= job.max_attempts
+            await run_failure_handler(job, error, final)
+            if not final:
+                # Exponential backoff between attempts
+                delay = self.retry_delay * (2 ** (job.attempts - 1))
+                print(f"Job {job.id} failed (attempt {job.attempts}), retrying in {delay}s: {error}")
+                await asyncio.to_thread(broker.retry, job.id, error, delay)
+                metrics.increment("jobs.retried")
+            else:
+                print(f"Job {job.id} failed permanently: {error}")
+                await asyncio.to_thread(broker.fail, job.id, error)
+                metrics.increment("jobs.failed")
+        else:
+            await asyncio.to_thread(broker.ack, job.id)
+            metrics.increment("jobs.completed")
+        finally:
+            heartbeat.cancel()
+
+    async def _slot(self):
+        while not self._stopping:
+            job = await self.queue.reserve(self.lanes)
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self.run_job(job)
+
+    async def run(self):
+        """Run until stop() is called"""
+        self._stopping = False
+        await asyncio.gather(*[self._slot() for _ in range(self.concurrency)])
+
+    def stop(self):
+        self._stopping = True
+
+
+_job_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """Return the process-wide job queue"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(create_broker())
+    return _job_queue
+
+
+def set_job_queue(queue: Optional[JobQueue]):
+    """Replace the process-wide queue (used by tests)"""
+    global _job_queue
+    _job_queue = queue
@@ -0,0 +1,153 @@
+import os
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional, Tuple, List
+
+from dotenv import load_dotenv
+from passlib.context import CryptContext
+
+from app.utils import metrics
+
+# Load environment variables
+load_dotenv()
+
+# Password hashing settings. bcrypt releases the GIL while it works, so a
+# small thread pool keeps hashing off the event loop without the cost of
+# worker processes.
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+# Hashes allowed to wait for a worker before new ones are turned away
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", 4 * PASSWORD_HASH_WORKERS))
+# Hashes one client IP / one account may have in progress at once
+PASSWORD_MAX_PER_IP = int(os.environ.get("PASSWORD_MAX_PER_IP", 2))
+PASSWORD_MAX_PER_EMAIL = int(os.environ.get("PASSWORD_MAX_PER_EMAIL", 1))
+PASSWORD_RETRY_AFTER = int(os.environ.get("PASSWORD_RETRY_AFTER", 2))
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when the hashing pool is saturated"""
+
+    def __init__(self, message: str, retry_after: int = PASSWORD_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TooManyAttempts(PasswordServiceBusy):
+    """Raised when a client IP or account already has hashes in progress"""
+
+
+class PasswordService:
+    """Hashes and verifies passwords with bcrypt on a bounded thread pool.
+
+    Hashes made with a different cost than rounds are flagged by
+    verify_and_update() so they can be re-hashed at the next login.
+    """
+
+    def __init__(
+        self,
+        rounds: int = BCRYPT_ROUNDS,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING,
+        max_per_ip: int = PASSWORD_MAX_PER_IP,
+        max_per_email: int = PASSWORD_MAX_PER_EMAIL,
+    ):
+        self.rounds = rounds
+        self.max_pending = max_pending
+        self.max_per_ip = max_per_ip
+        self.max_per_email = max_per_email
+        self.context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds,
+        )
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="bcrypt")
+        self._pending = 0
+        self._in_progress: Counter = Counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _slot(self, ip: Optional[str], email: Optional[str]):
+        keys: List[Tuple[str, int]] = []
+        if ip:
+            keys.append((f"ip:{ip}", self.max_per_ip))
+        if email:
+            keys.append((f"email:{email.lower()}", self.max_per_email))
+        with self._lock:
+            for key, limit in keys:
+                if self._in_progress[key] >= limit:
+                    metrics.increment("password.throttled")
+                    raise TooManyAttempts("Too many sign-in attempts in progress")
+            if self._pending >= self.max_pending:
+                metrics.increment("password.rejected")
+                raise PasswordServiceBusy("Password service is busy")
+            self._pending += 1
+            for key, _ in keys:
+                self._in_progress[key] += 1
+            metrics.set_gauge("password.pending", self._pending)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pending -= 1
+                for key, _ in keys:
+                    self._in_progress[key] -= 1
+                    if self._in_progress[key] <= 0:
+                        del self._in_progress[key]
+                metrics.set_gauge("password.pending", self._pending)
+
+    async def _run(self, call, *args, ip: Optional[str], email: Optional[str]):
+        with self._slot(ip, email):
+            # The slot is held until bcrypt finishes even if the caller goes
+            # away, so abandoned requests still count against the limits
+            future = asyncio.get_running_loop().run_in_executor(self._pool, call, *args)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                await asyncio.wait([future])
+                raise
+
+    async def hash(self, password: str, ip: Optional[str] = None, email: Optional[str] = None) -> str:
+        metrics.increment("password.hashes")
+        return await self._run(self.context.hash, password, ip=ip, email=email)
+
+    async def verify(self, password: str, hashed: str, ip: Optional[str] = None, email: Optional[str] = None) -> bool:
+        valid, _ = await self.verify_and_update(password, hashed, ip=ip, email=email)
+        return valid
+
+    async def verify_and_update(
+        self, password: str, hashed: str, ip: Optional[str] = None, email: Optional[str] = None
+    ) -> Tuple[bool, Optional[str]]:
+        """Check a password. When it is right but its hash uses another cost,
+        also return a new hash to store in its place."""
+        metrics.increment("password.verifications")
+        valid, new_hash = await self._run(self.context.verify_and_update, password, hashed, ip=ip, email=email)
+        if new_hash is not None:
+            metrics.increment("password.rehashes")
+        return valid, new_hash
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
+
+_password_service: Optional[PasswordService] = None
+
+
+def get_password_service() -> PasswordService:
+    """Return the process-wide password service"""
+    global _password_service
+    if _password_service is None:
+        _password_service = PasswordService()
+    return _password_service
+
+
+def set_password_service(service: Optional[PasswordService]):
+    """Replace the process-wide service (used by tests)"""
+    global _password_service
+    if _password_service is not None:
+        _password_service.close()
+    _password_service = service
@@ -0,0 +1,164 @@
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional, Union, BinaryIO
+
+from dotenv import load_dotenv
+
+from app.services.pdf_renderer import PDF_SPOOL_MAX_MEMORY
+from app.utils import metrics
+from app.utils.pdf_report import RenderedPDF
+
+# Load environment variables
+load_dotenv()
+
+# PDF cache settings. PDF_CACHE_DIR enables a disk tier; point the API and
+# worker processes at the same directory so PDFs warmed by a worker are
+# served by the API.
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+PDF_CACHE_DIR = os.environ.get("PDF_CACHE_DIR", "")
+
+
+class PDFCache:
+    """Content-addressed cache of rendered PDFs.
+
+    Keys are pdf_cache_key() hashes, so an entry never goes stale: a changed
+    report or template simply gets a new key. Entries live in an in-memory
+    LRU bounded by total size, backed by an optional directory on disk.
+    PDFs larger than max_entry_bytes are only kept on disk and are handed
+    out as open files rather than read into memory.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = PDF_CACHE_MAX_BYTES,
+        directory: Optional[str] = PDF_CACHE_DIR or None,
+        max_entry_bytes: int = PDF_SPOOL_MAX_MEMORY,
+    ):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > min(self.max_bytes, self.max_entry_bytes):
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                metrics.increment("pdf_cache.evictions")
+            metrics.set_gauge("pdf_cache.bytes", self._size)
+
+    def get(self, key: str) -> Optional[Union[bytes, BinaryIO]]:
+        """The cached PDF as bytes, or as an open binary file for large PDFs
+        on disk (the caller closes it); None on a miss"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+        if data is not None:
+            metrics.increment("pdf_cache.hits_memory")
+            return data
+
+        if self.directory:
+            try:
+                f = open(self._path(key), "rb")
+            except FileNotFoundError:
+                f = None
+            if f is not None:
+                metrics.increment("pdf_cache.hits_disk")
+                if os.fstat(f.fileno()).st_size > self.max_entry_bytes:
+                    return f
+                with f:
+                    data = f.read()
+                self._remember(key, data)
+                return data
+
+        metrics.increment("pdf_cache.misses")
+        return None
+
+    def _write_file(self, key: str, write):
+        # Write to a temporary name first so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def put(self, key: str, data: bytes):
+        self._remember(key, data)
+        if self.directory:
+            self._write_file(key, lambda f: f.write(data))
+
+    def put_file(self, key: str, f: BinaryIO):
+        """Cache the PDF in an open binary file (e.g. a spooled stream)"""
+        size = f.seek(0, os.SEEK_END)
+        f.seek(0)
+        if size <= self.max_entry_bytes:
+            self.put(key, f.read())
+        elif self.directory:
+            self._write_file(key, lambda out: shutil.copyfileobj(f, out))
+
+    def put_rendered(self, key: str, rendered: RenderedPDF) -> Union[bytes, BinaryIO]:
+        """Cache a render and return its body as get() would.
+
+        A spilled render's temporary file is removed here: it is opened and
+        then unlinked, so the space is freed as soon as the returned file is
+        closed, whether or not the download completes.
+        """
+        if rendered.data is not None:
+            self.put(key, rendered.data)
+            return rendered.data
+
+        try:
+            if self.directory:
+                def copy(f):
+                    with open(rendered.path, "rb") as source:
+                        shutil.copyfileobj(source, f)
+                self._write_file(key, copy)
+            f = open(rendered.path, "rb")
+        finally:
+            os.remove(rendered.path)
+        return f
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            if key in self._entries:
+                return True
+        return bool(self.directory) and os.path.exists(self._path(key))
+
+
+_pdf_cache: Optional[PDFCache] = None
+
+
+def get_pdf_cache() -> PDFCache:
+    """Return the process-wide PDF cache"""
+    global _pdf_cache
+    if _pdf_cache is None:
+        _pdf_cache = PDFCache()
+    return _pdf_cache
+
+
+def set_pdf_cache(cache: Optional[PDFCache]):
+    """Replace the process-wide cache (used by tests)"""
+    global _pdf_cache
+    _pdf_cache = cache
@@ -0,0 +1,263 @@
+import os
+import time
+import asyncio
+import functools
+import itertools
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Dict, Any, AsyncIterator, Tuple
+
+from dotenv import load_dotenv
+
+from app.utils import metrics
+from app.utils.pdf_merge import PDFMerger
+from app.utils.pdf_report import (
+    RenderedPDF,
+    render_report_pdf_spooled,
+    page_groups,
+    page_number_stamp,
+    render_page_group,
+)
+
+# Load environment variables
+load_dotenv()
+
+# PDF renderer settings. Workers are separate processes, so ReportLab layout
+# neither blocks the event loop nor competes for the GIL; 0 renders in a
+# thread inside the API process instead.
+PDF_RENDER_WORKERS = int(os.environ.get("PDF_RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+PDF_RENDER_TIMEOUT = float(os.environ.get("PDF_RENDER_TIMEOUT", 30))
+# Renders allowed to wait for a worker before new ones are turned away
+PDF_RENDER_MAX_PENDING = int(os.environ.get("PDF_RENDER_MAX_PENDING", 2 * max(1, PDF_RENDER_WORKERS)))
+PDF_RENDER_RETRY_AFTER = int(os.environ.get("PDF_RENDER_RETRY_AFTER", 5))
+# Recycle worker processes now and then to bound ReportLab memory growth
+PDF_RENDER_MAX_TASKS_PER_CHILD = int(os.environ.get("PDF_RENDER_MAX_TASKS_PER_CHILD", 200))
+# PDFs larger than this are handed over as temporary files (in PDF_SPOOL_DIR,
+# or the system temp directory) instead of in memory
+PDF_SPOOL_MAX_MEMORY = int(os.environ.get("PDF_SPOOL_MAX_MEMORY", 8 * 1024 * 1024))
+PDF_SPOOL_DIR = os.environ.get("PDF_SPOOL_DIR") or None
+# Reports with at least this many sections are streamed: laid out in page
+# groups of PDF_STREAM_SECTIONS_PER_GROUP sections across the workers and
+# sent page group by page group
+PDF_STREAM_MIN_SECTIONS = int(os.environ.get("PDF_STREAM_MIN_SECTIONS", 12))
+PDF_STREAM_SECTIONS_PER_GROUP = int(os.environ.get("PDF_STREAM_SECTIONS_PER_GROUP", 4))
+# Appended to the PDF cache key (and ETag) of streamed PDFs, which are not
+# byte-identical to a one-shot render of the same report
+MERGED_PDF_SUFFIX = "-merged"
+
+
+class RendererBusy(Exception):
+    """Raised when the renderer is saturated or a render timed out"""
+
+    def __init__(self, message: str, retry_after: int = PDF_RENDER_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PDFRenderer:
+    """Runs PDF renders on a bounded pool of worker processes"""
+
+    def __init__(
+        self,
+        workers: int = PDF_RENDER_WORKERS,
+        timeout: float = PDF_RENDER_TIMEOUT,
+        max_pending: int = PDF_RENDER_MAX_PENDING,
+        spool_max_memory: int = PDF_SPOOL_MAX_MEMORY,
+        spool_dir: Optional[str] = PDF_SPOOL_DIR,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.spool_max_memory = spool_max_memory
+        self.spool_dir = spool_dir
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=PDF_RENDER_MAX_TASKS_PER_CHILD,
+            )
+        return self._pool
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+            metrics.set_gauge("pdf_render.pending", self._pending)
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                metrics.increment("pdf_render.rejected")
+                raise RendererBusy("PDF renderer is busy")
+            self._pending += 1
+            metrics.set_gauge("pdf_render.pending", self._pending)
+
+    def _submit(self, call) -> asyncio.Future:
+        if self.workers > 0:
+            return asyncio.get_running_loop().run_in_executor(self._get_pool(), call)
+        return asyncio.ensure_future(asyncio.to_thread(call))
+
+    def _submit_group(self, call) -> Tuple[Optional[Future], asyncio.Future]:
+        """Submit a page group, with the pool's own future when there is a
+        pool: unlike its asyncio wrapper, that one refuses to cancel once the
+        group is being laid out. Threads cannot be cancelled at all."""
+        if self.workers > 0:
+            source = self._get_pool().submit(call)
+            return source, asyncio.wrap_future(source)
+        return None, self._submit(call)
+
+    async def render(self, report_data: Dict[str, Any]) -> RenderedPDF:
+        """Render a report, raising RendererBusy under overload.
+
+        A result with a path is a temporary file the caller must remove.
+        """
+        self._acquire()
+        start = time.perf_counter()
+        render = functools.partial(
+            render_report_pdf_spooled,
+            report_data,
+            max_memory=self.spool_max_memory,
+            directory=self.spool_dir,
+        )
+        try:
+            future = self._submit(render)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is freed when the render really ends, not when a caller
+        # gives up on it, so timed-out renders still count against the limit
+        future.add_done_callback(self._release)
+
+        try:
+            rendered = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            metrics.increment("pdf_render.timeouts")
+            # Nobody will collect this render, so remove its file when it lands
+            future.add_done_callback(_discard_result)
+            raise RendererBusy("PDF rendering timed out")
+        except asyncio.CancelledError:
+            # The caller went away (e.g. the client disconnected)
+            future.add_done_callback(_discard_result)
+            raise
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool next time
+            metrics.increment("pdf_render.errors")
+            self._pool = None
+            raise
+        except Exception:
+            metrics.increment("pdf_render.errors")
+            raise
+        metrics.observe("pdf_render.seconds", time.perf_counter() - start)
+        metrics.increment("pdf_render.renders")
+        if rendered.path:
+            metrics.increment("pdf_render.spilled")
+        return rendered
+
+    async def render_stream(
+        self,
+        report_data: Dict[str, Any],
+        sections_per_group: int = PDF_STREAM_SECTIONS_PER_GROUP,
+    ) -> AsyncIterator[bytes]:
+        """Render a report page group by page group, yielding the PDF in
+        order as soon as each group is laid out.
+
+        Up to one group per worker is laid out at a time, so only that many
+        groups are ever held in memory. The first chunk arrives with the
+        first group; RendererBusy is raised as for render().
+        """
+        self._acquire()
+        start = time.perf_counter()
+        groups = iter(page_groups(report_data, sections_per_group))
+        window = max(1, self.workers)
+        futures = deque()
+        merger = PDFMerger(stamp=page_number_stamp)
+        try:
+            for group in itertools.islice(groups, window):
+                futures.append(self._submit_group(functools.partial(render_page_group, report_data, group)))
+            header = merger.header()
+            while futures:
+                try:
+                    part = await asyncio.wait_for(asyncio.shield(futures[0][1]), self.timeout)
+                except asyncio.TimeoutError:
+                    metrics.increment("pdf_render.timeouts")
+                    raise RendererBusy("PDF rendering timed out")
+                except BrokenProcessPool:
+                    metrics.increment("pdf_render.errors")
+                    self._pool = None
+                    raise
+                except Exception:
+                    metrics.increment("pdf_render.errors")
+                    raise
+                futures.popleft()
+                group = next(groups, None)
+                if group is not None:
+                    futures.append(self._submit_group(functools.partial(render_page_group, report_data, group)))
+                if header:
+                    metrics.observe("pdf_render.first_chunk_seconds", time.perf_counter() - start)
+                    yield header + merger.add(part)
+                    header = b""
+                else:
+                    yield merger.add(part)
+            yield merger.finish()
+            metrics.observe("pdf_render.seconds", time.perf_counter() - start)
+            metrics.increment("pdf_render.streams")
+        finally:
+            # Groups still queued on the pool are dropped; ones already being
+            # laid out cannot be stopped, so the slot is held until they end,
+            # as render() does
+            running = [future for source, future in futures if source is None or not source.cancel()]
+            try:
+                if running:
+                    await asyncio.wait(running)
+                    for future in running:
+                        if not future.cancelled():
+                            future.exception()
+            finally:
+                self._release()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def _discard_result(future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    discard_rendered(future.result())
+
+
+def discard_rendered(rendered: RenderedPDF):
+    """Remove the temporary file of a spilled render, if any"""
+    if rendered.path:
+        try:
+            os.remove(rendered.path)
+        except FileNotFoundError:
+            pass
+
+
+_pdf_renderer: Optional[PDFRenderer] = None
+
+
+def get_pdf_renderer() -> PDFRenderer:
+    """Return the process-wide PDF renderer"""
+    global _pdf_renderer
+    if _pdf_renderer is None:
+        _pdf_renderer = PDFRenderer()
+    return _pdf_renderer
+
+
+def set_pdf_renderer(renderer: Optional[PDFRenderer]):
+    """Replace the process-wide renderer (used by tests)"""
+    global _pdf_renderer
+    if _pdf_renderer is not None and _pdf_renderer is not renderer:
+        _pdf_renderer.shutdown()
+    _pdf_renderer = renderer
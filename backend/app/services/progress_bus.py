@@ -0,0 +1,183 @@
+import os
+import json
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, Any, Set, List
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Progress bus settings. memory:// only reaches subscribers in the process that
+# runs the job; use a Redis-protocol URL when workers run in other processes.
+PROGRESS_BUS_URL = os.environ.get("PROGRESS_BUS_URL", "memory://")
+PROGRESS_TEXT_TTL = int(os.environ.get("PROGRESS_TEXT_TTL", 60 * 60))
+
+
+class Subscription(ABC):
+    """Stream of events for one research task"""
+
+    @abstractmethod
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Next event, or None if nothing arrived within timeout"""
+
+    @abstractmethod
+    async def close(self) -> None: ...
+
+
+class ProgressBus(ABC):
+    """Pub/sub channel for research progress.
+
+    Events are dicts with a "type":
+    - status: status, progress and error changes
+    - delta: generated text, with the offset it starts at in the full text
+    - reset: generation restarted (e.g. a retry), discard partial text
+    - summary / section / source: a piece of the report, as soon as it is
+      fully generated (the parsed value is in "value")
+    """
+
+    @abstractmethod
+    async def publish(self, research_id: str, event: Dict[str, Any]) -> None: ...
+
+    @abstractmethod
+    async def append_text(self, research_id: str, text: str) -> None:
+        """Add generated text to the task's buffer and publish it as a delta"""
+
+    @abstractmethod
+    async def partial_text(self, research_id: str) -> str:
+        """All text generated so far"""
+
+    @abstractmethod
+    async def clear(self, research_id: str) -> None:
+        """Drop the text buffer"""
+
+    @abstractmethod
+    async def subscribe(self, research_id: str) -> Subscription: ...
+
+    async def reset(self, research_id: str) -> None:
+        await self.clear(research_id)
+        await self.publish(research_id, {"type": "reset"})
+
+
+class MemorySubscription(Subscription):
+    def __init__(self, bus: "MemoryProgressBus", research_id: str):
+        self.bus = bus
+        self.research_id = research_id
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self) -> None:
+        subscribers = self.bus._subscribers.get(self.research_id)
+        if subscribers is not None:
+            subscribers.discard(self)
+            if not subscribers:
+                del self.bus._subscribers[self.research_id]
+
+
+class MemoryProgressBus(ProgressBus):
+    """In-process bus for single-process deployments and tests"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[MemorySubscription]] = {}
+        self._text: Dict[str, List[str]] = {}
+        self._text_length: Dict[str, int] = {}
+
+    async def publish(self, research_id: str, event: Dict[str, Any]) -> None:
+        for subscription in list(self._subscribers.get(research_id, ())):
+            subscription.queue.put_nowait(event)
+
+    async def append_text(self, research_id: str, text: str) -> None:
+        offset = self._text_length.get(research_id, 0)
+        self._text.setdefault(research_id, []).append(text)
+        self._text_length[research_id] = offset + len(text)
+        await self.publish(research_id, {"type": "delta", "offset": offset, "text": text})
+
+    async def partial_text(self, research_id: str) -> str:
+        return "".join(self._text.get(research_id, ()))
+
+    async def clear(self, research_id: str) -> None:
+        self._text.pop(research_id, None)
+        self._text_length.pop(research_id, None)
+
+    async def subscribe(self, research_id: str) -> Subscription:
+        subscription = MemorySubscription(self, research_id)
+        self._subscribers.setdefault(research_id, set()).add(subscription)
+        return subscription
+
+
+class RedisSubscription(Subscription):
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if message is None:
+            return None
+        return json.loads(message["data"])
+
+    async def close(self) -> None:
+        await self.pubsub.unsubscribe()
+        await self.pubsub.aclose()
+
+
+class RedisProgressBus(ProgressBus):
+    """Bus on a Redis-protocol server, shared by API and worker processes"""
+
+    def __init__(self, url: str, prefix: str = "deepr:progress:"):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    async def publish(self, research_id: str, event: Dict[str, Any]) -> None:
+        await self.redis.publish(self.prefix + research_id, json.dumps(event))
+
+    async def append_text(self, research_id: str, text: str) -> None:
+        key = self.prefix + research_id + ":text"
+        # APPEND returns the new length, which gives this delta's offset
+        length = await self.redis.append(key, text)
+        await self.redis.expire(key, PROGRESS_TEXT_TTL)
+        await self.publish(research_id, {"type": "delta", "offset": length - len(text), "text": text})
+
+    async def partial_text(self, research_id: str) -> str:
+        return await self.redis.get(self.prefix + research_id + ":text") or ""
+
+    async def clear(self, research_id: str) -> None:
+        await self.redis.delete(self.prefix + research_id + ":text")
+
+    async def subscribe(self, research_id: str) -> Subscription:
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self.prefix + research_id)
+        return RedisSubscription(pubsub)
+
+
+def create_progress_bus(url: str = PROGRESS_BUS_URL) -> ProgressBus:
+    """Build a progress bus from a URL: memory:// or redis://"""
+    if url.startswith("memory://"):
+        return MemoryProgressBus()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisProgressBus(url)
+    raise ValueError(f"Unsupported progress bus URL: {url}")
+
+
+_progress_bus: Optional[ProgressBus] = None
+
+
+def get_progress_bus() -> ProgressBus:
+    """Return the process-wide progress bus"""
+    global _progress_bus
+    if _progress_bus is None:
+        _progress_bus = create_progress_bus()
+    return _progress_bus
+
+
+def set_progress_bus(bus: Optional[ProgressBus]):
+    """Replace the process-wide bus (used by tests)"""
+    global _progress_bus
+    _progress_bus = bus
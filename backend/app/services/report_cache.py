@@ -0,0 +1,274 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import Optional, Dict, List, Set, Tuple
+
+from dotenv import load_dotenv
+
+from app.services.repository import Repository, get_repository
+from app.utils import metrics
+
+# Load environment variables
+load_dotenv()
+
+# Report cache settings
+REPORT_CACHE_ENABLED = os.environ.get("REPORT_CACHE_ENABLED", "true").lower() == "true"
+REPORT_CACHE_TTL = int(os.environ.get("REPORT_CACHE_TTL", 7 * 24 * 60 * 60))
+# Minimum shingle Jaccard similarity for a near-duplicate hit; 0 disables it
+REPORT_CACHE_SIMILARITY = float(os.environ.get("REPORT_CACHE_SIMILARITY", 0.8))
+REPORT_CACHE_REFRESH_SECONDS = int(os.environ.get("REPORT_CACHE_REFRESH_SECONDS", 300))
+REPORT_CACHE_INDEX_LIMIT = int(os.environ.get("REPORT_CACHE_INDEX_LIMIT", 5000))
+
+# Rough cost of one full generation, used to report savings
+ESTIMATED_TOKENS_PER_REPORT = int(os.environ.get("ESTIMATED_TOKENS_PER_REPORT", 10000))
+
+# Words that don't change what a topic is about
+STOPWORDS = {
+    "a", "an", "the", "of", "on", "in", "for", "to", "and", "or", "with", "about",
+    "at", "by", "from", "into", "its", "is", "are", "what", "how", "why", "does",
+    "do", "vs", "versus", "research", "report",
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# MinHash parameters: 64 hashes in 16 LSH bands of 4 rows
+NUM_HASHES = 64
+BAND_ROWS = 4
+_MERSENNE_PRIME = (1 << 61) - 1
+_HASH_PARAMS = [
+    (
+        int.from_bytes(hashlib.sha256(f"a{i}".encode()).digest()[:8], "big") % _MERSENNE_PRIME or 1,
+        int.from_bytes(hashlib.sha256(f"b{i}".encode()).digest()[:8], "big") % _MERSENNE_PRIME,
+    )
+    for i in range(NUM_HASHES)
+]
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Lowercase and drop punctuation and stopwords, so "The impact of AI on
+    healthcare" and "impact AI healthcare" match. Word order is kept:
+    "Java to Kotlin" and "Kotlin to Java" are different topics."""
+    if not text:
+        return ""
+    return " ".join(word for word in _WORD.findall(text.lower()) if word not in STOPWORDS)
+
+
+def cache_key(topic: str, additional_context: Optional[str] = None) -> str:
+    """Stable key for a (topic, additional_context) pair"""
+    normalized = normalize_text(topic) + "|" + normalize_text(additional_context)
+    return hashlib.sha256(normalized.encode()).hexdigest()[:32]
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """Character shingles of normalized text, plus its word pairs so that
+    reordered words score lower than the same words in the same order"""
+    words = text.split()
+    pairs = {f"{first} {second}|" for first, second in zip(words, words[1:])}
+    text = f" {text} "
+    if len(text) <= size:
+        return {text} | pairs
+    return {text[i:i + size] for i in range(len(text) - size + 1)} | pairs
+
+
+def minhash(items: Set[str]) -> List[int]:
+    hashed = [int.from_bytes(hashlib.blake2b(item.encode(), digest_size=8).digest(), "big") for item in items]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashed) for a, b in _HASH_PARAMS]
+
+
+def lsh_bands(signature: List[int]) -> List[Tuple[int, Tuple[int, ...]]]:
+    return [
+        (band, tuple(signature[band * BAND_ROWS:(band + 1) * BAND_ROWS]))
+        for band in range(NUM_HASHES // BAND_ROWS)
+    ]
+
+
+class SimilarityIndex:
+    """In-process MinHash/LSH index over the normalized text of recent reports"""
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[str, Set[str], float]] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, research_id: str, text: str, created_at: float):
+        items = shingles(text)
+        with self._lock:
+            if research_id in self._entries:
+                return
+            self._entries[research_id] = (text, items, created_at)
+            for band in lsh_bands(minhash(items)):
+                self._buckets.setdefault(band, set()).add(research_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def query(self, text: str, threshold: float, min_created_at: float) -> Optional[Tuple[str, float]]:
+        """Most similar fresh entry at or above threshold, as (research_id, score)"""
+        items = shingles(text)
+        with self._lock:
+            candidates = set()
+            for band in lsh_bands(minhash(items)):
+                candidates |= self._buckets.get(band, set())
+            best = None
+            for research_id in candidates:
+                _, other, created_at = self._entries[research_id]
+                if created_at < min_created_at:
+                    continue
+                # Verify the LSH candidate with the exact Jaccard similarity
+                score = len(items & other) / len(items | other)
+                if score >= threshold and (best is None or score > best[1]):
+                    best = (research_id, score)
+            return best
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _parse_timestamp(value: str) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None).timestamp()
+
+
+class ReportCache:
+    """Reuses recent reports for repeated topics instead of generating again.
+
+    Exact hits look up research_reports.topic_key (the normalized
+    (topic, additional_context) key written when a report is saved).
+    Near-duplicates are found in an in-process similarity index that is
+    reloaded from recent reports every REPORT_CACHE_REFRESH_SECONDS.
+    """
+
+    def __init__(
+        self,
+        repository: Optional[Repository] = None,
+        ttl: int = REPORT_CACHE_TTL,
+        similarity: float = REPORT_CACHE_SIMILARITY,
+        enabled: bool = REPORT_CACHE_ENABLED,
+    ):
+        self._repository = repository
+        self.ttl = ttl
+        self.similarity = similarity
+        self.enabled = enabled
+        self.index = SimilarityIndex()
+        self._index_loaded_at = 0.0
+
+    @property
+    def repository(self) -> Repository:
+        return self._repository or get_repository()
+
+    def _cutoff(self) -> datetime:
+        return datetime.utcnow() - timedelta(seconds=self.ttl)
+
+    async def _find_exact(self, key: str) -> Optional[str]:
+        rows = await self.repository.list_reports(
+            "id, created_at", topic_key=key, since=self._cutoff().isoformat(), limit=1
+        )
+        return rows[0]["id"] if rows else None
+
+    async def _refresh_index(self):
+        # Reload recent cacheable reports into the similarity index
+        rows = await self.repository.list_reports(
+            "id, topic, topic_key, created_at", since=self._cutoff().isoformat(), limit=REPORT_CACHE_INDEX_LIMIT
+        )
+        self.index.clear()
+        for row in rows:
+            if row.get("topic_key"):
+                self.index.add(row["id"], normalize_text(row["topic"]), _parse_timestamp(row["created_at"]))
+        self._index_loaded_at = time.monotonic()
+
+    async def _lookup(self, topic: str, additional_context: Optional[str]) -> Optional[Tuple[str, str]]:
+        source_id = await self._find_exact(cache_key(topic, additional_context))
+        if source_id:
+            return source_id, "exact"
+
+        # Additional context changes the report, so only bare topics are
+        # matched by similarity
+        if self.similarity <= 0 or normalize_text(additional_context):
+            return None
+        if time.monotonic() - self._index_loaded_at > REPORT_CACHE_REFRESH_SECONDS:
+            await self._refresh_index()
+        match = self.index.query(normalize_text(topic), self.similarity, self._cutoff().timestamp())
+        if match:
+            return match[0], "similar"
+        return None
+
+    async def clone(self, source_id: str, research_id: str, user_id: int, topic: str) -> bool:
+        """Copy a saved report to a new id and owner; safe to repeat.
+
+        The copy has no topic_key, so only the generated original is ever
+        matched and its TTL runs from when it was generated, not reused.
+        """
+        row = await self.repository.get_report(source_id)
+        if not row:
+            return False
+        row.update({
+            "id": research_id,
+            "user_id": user_id,
+            "topic": topic,
+            "created_at": datetime.utcnow().isoformat(),
+            "topic_key": None,
+        })
+        await self.repository.upsert_report(row)
+        return True
+
+    def remember(self, research_id: str, topic: str, additional_context: Optional[str]):
+        """Add a freshly saved report to the local similarity index"""
+        if not normalize_text(additional_context):
+            self.index.add(research_id, normalize_text(topic), time.time())
+
+    async def get_or_clone(
+        self,
+        research_id: str,
+        user_id: int,
+        topic: str,
+        additional_context: Optional[str] = None,
+    ) -> Optional[str]:
+        """Clone a cached report into research_id for this user.
+
+        Returns the id of the report that was reused, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        metrics.increment("report_cache.lookups")
+        try:
+            match = await self._lookup(topic, additional_context)
+            if match and await self.clone(match[0], research_id, user_id, topic):
+                source_id, kind = match
+                metrics.increment(f"report_cache.hits_{kind}")
+                metrics.increment("report_cache.generations_saved")
+                metrics.increment("report_cache.tokens_saved", ESTIMATED_TOKENS_PER_REPORT)
+                self._publish_ratio()
+                return source_id
+        except Exception as e:
+            # The cache must never stop a research request
+            print(f"Report cache lookup failed: {e}")
+            metrics.increment("report_cache.errors")
+        metrics.increment("report_cache.misses")
+        self._publish_ratio()
+        return None
+
+    def _publish_ratio(self):
+        lookups = metrics.get_counter("report_cache.lookups")
+        hits = metrics.get_counter("report_cache.hits_exact") + metrics.get_counter("report_cache.hits_similar")
+        metrics.set_gauge("report_cache.hit_ratio", hits / lookups if lookups else 0.0)
+
+
+_report_cache: Optional[ReportCache] = None
+
+
+def get_report_cache() -> ReportCache:
+    """Return the process-wide report cache"""
+    global _report_cache
+    if _report_cache is None:
+        _report_cache = ReportCache()
+    return _report_cache
+
+
+def set_report_cache(cache: Optional[ReportCache]):
+    """Replace the process-wide cache (used by tests)"""
+    global _report_cache
+    _report_cache = cache
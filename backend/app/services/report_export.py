@@ -0,0 +1,164 @@
+import io
+import os
+import asyncio
+import zipfile
+import itertools
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Tuple, Union, BinaryIO
+
+from dotenv import load_dotenv
+
+from app.services.pdf_cache import get_pdf_cache
+from app.services.pdf_renderer import get_pdf_renderer, RendererBusy, PDF_RENDER_WORKERS
+from app.utils import metrics
+from app.utils.http_cache import body_size, iter_body
+from app.utils.pdf_merge import PDFMerger
+from app.utils.pdf_report import (
+    pdf_cache_key,
+    pdf_filename,
+    report_date,
+    render_contents_pdf,
+    simple_sanitize,
+)
+
+# Load environment variables
+load_dotenv()
+
+# Bulk export settings. Reports are fetched or rendered EXPORT_CONCURRENCY at
+# a time, so at most that many PDFs are held while an export streams out.
+EXPORT_MAX_REPORTS = int(os.environ.get("EXPORT_MAX_REPORTS", 50))
+EXPORT_CONCURRENCY = int(os.environ.get("EXPORT_CONCURRENCY", max(1, PDF_RENDER_WORKERS)))
+# Renders turned away by a busy renderer are retried this many times
+EXPORT_RENDER_ATTEMPTS = int(os.environ.get("EXPORT_RENDER_ATTEMPTS", 3))
+
+Body = Union[bytes, BinaryIO]
+
+
+async def load_pdf(report_data: Dict[str, Any]) -> Body:
+    """A report's PDF from the PDF cache, rendering and caching it on a miss"""
+    pdf_cache = get_pdf_cache()
+    key = pdf_cache_key(report_data)
+    body = await asyncio.to_thread(pdf_cache.get, key)
+    if body is not None:
+        metrics.increment("export.cached")
+        return body
+
+    for attempt in range(EXPORT_RENDER_ATTEMPTS):
+        try:
+            rendered = await get_pdf_renderer().render(report_data)
+            break
+        except RendererBusy as e:
+            if attempt == EXPORT_RENDER_ATTEMPTS - 1:
+                raise
+            await asyncio.sleep(e.retry_after)
+    metrics.increment("export.rendered")
+    return pdf_cache.put_rendered(key, rendered)
+
+
+def _close_body(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is None and not isinstance(task.result(), bytes):
+        task.result().close()
+
+
+async def iter_report_pdfs(
+    reports: List[Dict[str, Any]],
+    concurrency: int = EXPORT_CONCURRENCY,
+) -> AsyncIterator[Tuple[Dict[str, Any], Union[Body, Exception]]]:
+    """Yield (report, PDF) in order, loading up to concurrency PDFs ahead.
+    A report whose PDF could not be produced comes with the exception."""
+    pending = iter(reports)
+    tasks = deque(
+        (report, asyncio.ensure_future(load_pdf(report)))
+        for report in itertools.islice(pending, max(1, concurrency))
+    )
+    try:
+        while tasks:
+            report, task = tasks[0]
+            try:
+                body = await task
+            except Exception as e:
+                print(f"Export of report {report.get('id')} failed: {str(e)}")
+                metrics.increment("export.failed")
+                body = e
+            tasks.popleft()
+            following = next(pending, None)
+            if following is not None:
+                tasks.append((following, asyncio.ensure_future(load_pdf(following))))
+            yield report, body
+    finally:
+        # The export was abandoned: stop what we can, close what arrives
+        for _, task in tasks:
+            task.cancel()
+            task.add_done_callback(_close_body)
+
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable file that collects what ZipFile writes, to be streamed out"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def zip_export(reports: List[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Stream a ZIP archive with one PDF per report.
+
+    Without a seekable output ZipFile writes each entry's sizes after its
+    data, so entries go out chunk by chunk as they are read.
+    """
+    sink = _ZipSink()
+    failed = []
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+        index = 0
+        async for report, body in iter_report_pdfs(reports):
+            if isinstance(body, Exception):
+                failed.append(report)
+                continue
+            index += 1
+            info = zipfile.ZipInfo(
+                f"{index:02d}_{pdf_filename(report)}",
+                date_time=report_date(report).timetuple()[:6],
+            )
+            info.file_size = body_size(body)
+            with archive.open(info, "w") as entry:
+                async for chunk in iter_body(body, 0, info.file_size - 1):
+                    entry.write(chunk)
+                    yield sink.drain()
+        if failed:
+            archive.writestr("errors.txt", "".join(
+                f"Could not export {report.get('topic')} ({report.get('id')})\n" for report in failed
+            ))
+    yield sink.drain()
+
+
+async def merged_pdf_export(reports: List[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Stream one PDF with a contents page followed by every report, with a
+    bookmark for each"""
+    merger = PDFMerger()
+    contents = await asyncio.to_thread(render_contents_pdf, reports)
+    yield merger.header() + merger.add(contents, title="Contents")
+    async for report, body in iter_report_pdfs(reports):
+        if isinstance(body, Exception):
+            continue
+        if not isinstance(body, bytes):
+            with body:
+                body = await asyncio.to_thread(body.read)
+        title = simple_sanitize(report.get("topic", "Research Report"))
+        yield await asyncio.to_thread(merger.add, body, title)
+    yield merger.finish()
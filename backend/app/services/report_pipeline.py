@@ -0,0 +1,283 @@
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+from google.genai import types
+from pydantic import ValidationError
+
+from app.models.research import ReportOutline, SectionOutput
+from app.services.checkpoints import Checkpoint
+from app.services.gemini_service import get_gemini_service
+from app.utils import metrics
+from app.utils.json_parsing import parse_json
+from app.utils.json_stream import StreamingJSONParser
+from app.utils.source_urls import normalize_url
+
+# Load environment variables
+load_dotenv()
+
+# A report is planned by one short call, its sections are written by
+# concurrent calls (each with its own output window) and a last call writes
+# the summary. Wall-clock time follows the slowest section, not the report.
+MODEL = "gemini-2.0-flash"
+RESEARCH_MAX_SECTIONS = int(os.environ.get("RESEARCH_MAX_SECTIONS", 8))
+PLAN_MAX_OUTPUT_TOKENS = int(os.environ.get("PLAN_MAX_OUTPUT_TOKENS", 1024))
+SECTION_MAX_OUTPUT_TOKENS = int(os.environ.get("SECTION_MAX_OUTPUT_TOKENS", 8192))
+# How much of each section the summary call reads
+SUMMARY_SECTION_CHARS = int(os.environ.get("SUMMARY_SECTION_CHARS", 3000))
+
+PLANNER_PROMPT = r"""
+You are an expert research assistant built by Raihan Khan (raihankhan.dev), planning a comprehensive, academic-quality research report. Do not write the report yet: return only its outline.
+
+The outline must contain, in order:
+1. Introduction: background and context of the topic, its significance and relevance
+2. Main Body: 3-5 sections, each exploring a different aspect of the topic in depth
+3. Findings & Insights: key discoveries and their implications
+4. Conclusion: summary of the research and potential future directions
+
+Sections are written independently by different writers, so give each one a brief of 2-3 sentences that states exactly what it covers and keeps it from overlapping the others. Do not include an executive summary or a sources section; they are produced separately.
+
+Return a JSON object: {"sections": [{"title": "Section title", "brief": "What this section covers"}]}
+"""
+
+SECTION_PROMPT = r"""
+You are an expert research assistant built by Raihan Khan (raihankhan.dev), writing ONE section of a larger academic-quality research report. The other sections are written separately, so stay within this section's brief and do not repeat material that belongs to them.
+
+Write at least 500 words (300 for an introduction or findings section, 250 for a conclusion). For each fact or claim, include a citation linking to the source. Consider multiple perspectives and use clear, precise, objective language.
+
+Use markdown in the content: ## for subheadings, **bold**, *italics*, bullet and numbered lists, > for callouts and markdown tables for structured data. Do not repeat the section title at the beginning of the content.
+
+Format your response as a JSON object:
+{
+  "content": "Section content with markdown formatting",
+  "sources": [
+    {
+      "title": "Source title",
+      "url": "Source URL",
+      "snippet": "Description of the source"
+    }
+  ]
+}
+
+The JSON must be parseable by Python's json.loads(): escape backslashes, quotes and newlines in strings, and do not wrap it in code blocks or add any text around it.
+"""
+
+SUMMARY_PROMPT = r"""
+You are an expert research assistant built by Raihan Khan (raihankhan.dev). Below is a finished research report. Write its executive summary: a concise yet comprehensive overview of the topic and the key findings, of at least 250 words.
+
+Use markdown formatting. Do not start with "Executive Summary" or any heading. Return only the summary text.
+"""
+
+
+def topic_prompt(topic: str, additional_context: Optional[str]) -> str:
+    prompt = f"Topic: {topic}"
+    if additional_context:
+        prompt += f"\nAdditional context: {additional_context}"
+    return prompt
+
+
+def source_key(url: str) -> str:
+    """Key under which two source URLs count as the same source"""
+    return normalize_url(url)
+
+
+def merge_sources(groups: Iterable[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Sources of all sections, in order of first citation, without duplicates"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    cited = 0
+    for sources in groups:
+        for source in sources:
+            cited += 1
+            key = source_key(source.get("url") or "") or source.get("title", "")
+            if key not in merged:
+                merged[key] = dict(source)
+            elif not merged[key].get("snippet") and source.get("snippet"):
+                merged[key]["snippet"] = source["snippet"]
+    metrics.increment("report_pipeline.duplicate_sources", cited - len(merged))
+    return list(merged.values())
+
+
+async def generate_text(prompt: str, config: types.GenerateContentConfig) -> str:
+    """Run one generation through the shared, rate-limited Gemini service"""
+    contents = [types.Content(role="user", parts=[types.Part.from_text(text=prompt)])]
+    chunks = []
+    async for chunk in get_gemini_service().generate_content_stream(model=MODEL, contents=contents, config=config):
+        if chunk.text:
+            chunks.append(chunk.text)
+    return "".join(chunks)
+
+
+async def plan_report(topic: str, additional_context: Optional[str]) -> Optional[List[Dict[str, str]]]:
+    """Outline the report; None if the planner failed or its output is unusable"""
+    try:
+        text = await generate_text(
+            PLANNER_PROMPT + "\n\n" + topic_prompt(topic, additional_context),
+            types.GenerateContentConfig(
+                temperature=0.7,
+                max_output_tokens=PLAN_MAX_OUTPUT_TOKENS,
+                response_mime_type="application/json",
+                response_schema=ReportOutline,
+            ),
+        )
+    except Exception as e:
+        # The single-call path can still write the report
+        print(f"Report planner failed: {e}")
+        return None
+    success, result = parse_json(text)
+    if not success:
+        return None
+    try:
+        outline = ReportOutline.model_validate(result)
+    except ValidationError as e:
+        print(f"Report outline failed validation: {e}")
+        return None
+    sections = [
+        {"title": section.title, "brief": section.brief or ""}
+        for section in outline.sections
+        if section.title.strip()
+    ]
+    return sections[:RESEARCH_MAX_SECTIONS] or None
+
+
+class SectionParseError(Exception):
+    """Raised when a section's output is not usable JSON, even after repair"""
+
+
+def parse_section(text: str) -> Optional[Dict[str, Any]]:
+    """A section's content and sources from its raw output: parse_json's
+    repairs first, then the lenient streaming parser, which also accepts raw
+    control characters and invalid escapes inside strings"""
+    success, result = parse_json(text)
+    if not success:
+        parser = StreamingJSONParser()
+        try:
+            parser.feed(text)
+            result = parser.close()
+        except ValueError:
+            return None
+    try:
+        output = SectionOutput.model_validate(result)
+    except ValidationError:
+        return None
+    return {"content": output.content, "sources": [source.model_dump() for source in output.sources or []]}
+
+
+async def write_section(
+    topic: str,
+    additional_context: Optional[str],
+    outline: List[Dict[str, str]],
+    index: int,
+    structured: bool,
+) -> Dict[str, Any]:
+    """Write one section of the outline; returns its title, content and sources"""
+    section = outline[index]
+    titles = "\n".join(f"{i + 1}. {item['title']}" for i, item in enumerate(outline))
+    prompt = (
+        f"{SECTION_PROMPT}\n\n{topic_prompt(topic, additional_context)}\n\n"
+        f"Report outline:\n{titles}\n\n"
+        f"Write section {index + 1}: {section['title']}\nBrief: {section['brief']}"
+    )
+    if structured:
+        config = types.GenerateContentConfig(
+            temperature=1,
+            top_p=0.95,
+            top_k=64,
+            max_output_tokens=SECTION_MAX_OUTPUT_TOKENS,
+            response_mime_type="application/json",
+            response_schema=SectionOutput,
+        )
+    else:
+        config = types.GenerateContentConfig(
+            temperature=1,
+            top_p=0.95,
+            top_k=64,
+            max_output_tokens=SECTION_MAX_OUTPUT_TOKENS,
+            tools=[types.Tool(google_search=types.GoogleSearch())],
+            response_mime_type="text/plain",
+        )
+
+    start = time.monotonic()
+    text = await generate_text(prompt, config)
+    metrics.observe("report_pipeline.section_seconds", time.monotonic() - start)
+
+    output = parse_section(text)
+    if output is None:
+        # Raw model text here is usually a half-escaped JSON blob, so it is
+        # never published; the attempt fails and the retry only rewrites
+        # this section (the others are checkpointed)
+        metrics.increment("report_pipeline.section_unparsed")
+        raise SectionParseError(f"Section {index + 1} ({section['title']}) could not be parsed")
+    return {"title": section["title"], **output}
+
+
+async def write_summary(topic: str, sections: List[Dict[str, Any]]) -> str:
+    """Write the executive summary from the finished sections"""
+    report = "\n\n".join(
+        f"## {section['title']}\n\n{section['content'][:SUMMARY_SECTION_CHARS]}" for section in sections
+    )
+    text = await generate_text(
+        f"{SUMMARY_PROMPT}\n\nTopic: {topic}\n\n{report}",
+        types.GenerateContentConfig(temperature=0.7, max_output_tokens=2048, response_mime_type="text/plain"),
+    )
+    return text.strip()
+
+
+async def generate_report(
+    topic: str,
+    additional_context: Optional[str],
+    structured: bool,
+    on_section: Optional[Callable[[Dict[str, Any], int, int], Awaitable[None]]] = None,
+    checkpoint: Optional[Checkpoint] = None,
+) -> Optional[Dict[str, Any]]:
+    """Plan, write the sections concurrently and merge them into a report
+    dict shaped like ResearchReportOutput. Returns None if planning failed.
+
+    on_section(section, done, total) is awaited as each section finishes.
+    With a checkpoint, the outline and each finished section are saved as
+    they arrive, and whatever an earlier attempt saved is reused.
+    """
+    outline = checkpoint.outline if checkpoint is not None else None
+    saved = checkpoint.sections if checkpoint is not None else {}
+    if outline is None:
+        outline = await plan_report(topic, additional_context)
+        if outline is None:
+            metrics.increment("report_pipeline.plan_failed")
+            return None
+        if checkpoint is not None:
+            await checkpoint.save(outline=outline)
+
+    done = 0
+
+    async def section(index: int) -> Dict[str, Any]:
+        nonlocal done
+        written = saved.get(index)
+        if written is None:
+            written = await write_section(topic, additional_context, outline, index, structured)
+            if checkpoint is not None:
+                await checkpoint.save_section(index, written)
+        else:
+            metrics.increment("report_pipeline.sections_resumed")
+        done += 1
+        if on_section is not None:
+            await on_section(written, done, len(outline))
+        return written
+
+    # Every section queues for the shared Gemini limits like any other call
+    tasks = [asyncio.ensure_future(section(index)) for index in range(len(outline))]
+    try:
+        sections = await asyncio.gather(*tasks)
+    except BaseException:
+        # One failed section fails the attempt; don't keep paying for the rest
+        for task in tasks:
+            task.cancel()
+        raise
+
+    summary = await write_summary(topic, sections)
+    metrics.increment("report_pipeline.reports")
+    return {
+        "summary": summary,
+        "sections": [{"title": section["title"], "content": section["content"]} for section in sections],
+        "sources": merge_sources(section["sources"] for section in sections),
+    }
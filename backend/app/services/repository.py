@@ -0,0 +1,804 @@
+import os
+import copy
+import json
+import asyncio
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterable, List, Sequence, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+from app.utils import metrics
+from app.services.source_index import SourceIndex, canonical_sources, registry_rows
+from app.utils.report_codec import (
+    STORAGE_VERSION,
+    decode_report,
+    encode_report,
+    needs_body,
+    resolve_sources,
+    storage_columns,
+    unresolved_sources,
+)
+
+# Load environment variables
+load_dotenv()
+
+# Database settings. DATABASE_URL picks the backend: empty for Supabase
+# (PostgREST at SUPABASE_URL), or memory:// / sqlite:///path for local use.
+DATABASE_URL = os.environ.get("DATABASE_URL", "")
+DATABASE_TIMEOUT = float(os.environ.get("DATABASE_TIMEOUT", 10))
+DATABASE_RETRIES = int(os.environ.get("DATABASE_RETRIES", 2))
+DATABASE_MAX_CONNECTIONS = int(os.environ.get("DATABASE_MAX_CONNECTIONS", 20))
+
+
+class RepositoryError(Exception):
+    """Raised when the database rejects a request or cannot be reached"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def project(row: Dict[str, Any], columns: str) -> Dict[str, Any]:
+    """Keep only the comma-separated columns of a row ("*" keeps all)"""
+    if columns.strip() == "*":
+        return dict(row)
+    return {name.strip(): row.get(name.strip()) for name in columns.split(",")}
+
+
+def _source_urls(report: Dict[str, Any]) -> List[Dict[str, Any]]:
+    sources = report.get("sources")
+    return sources if isinstance(sources, list) else []
+
+
+class Repository(ABC):
+    """Async data access for the users, research_reports and sources tables.
+
+    Every router and service goes through get_repository(), so one
+    connection pool serves the whole process and tests can swap in a
+    local backend with set_repository(). Reports are stored through
+    report_codec and come back in their decoded shape.
+
+    Sources live in a registry keyed by normalized URL (see source_urls),
+    cached per process in a SourceIndex. Stored reports reference them,
+    and report_sources links each report to the sources it cites.
+    """
+
+    def __init__(self):
+        self.source_index = SourceIndex()
+
+    # Users
+
+    @abstractmethod
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def create_user(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        """Insert a user and return it with its id"""
+
+    @abstractmethod
+    async def update_user(self, user_id: int, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Change some of a user's fields; returns the user, or None if there
+        is no such user"""
+
+    # Research reports
+
+    @abstractmethod
+    async def get_report(
+        self, report_id: str, user_id: Optional[int] = None, columns: str = "*"
+    ) -> Optional[Dict[str, Any]]:
+        """A report by id, optionally only if user_id owns it"""
+
+    @abstractmethod
+    async def list_reports(
+        self,
+        columns: str = "*",
+        user_id: Optional[int] = None,
+        ids: Optional[Sequence[str]] = None,
+        topic_key: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        descending: bool = True,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[str, str]] = None,
+        search: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Reports matching every given filter, ordered by (created_at, id).
+        since and until are inclusive ISO timestamps; after is a keyset
+        cursor, the (created_at, id) of the last row of the previous page;
+        search matches topics containing it, ignoring case."""
+
+    @abstractmethod
+    async def insert_report(self, report: Dict[str, Any]) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def upsert_report(self, report: Dict[str, Any]) -> Dict[str, Any]:
+        """Insert a report, replacing any report with the same id"""
+
+    @abstractmethod
+    async def most_cited_sources(self, user_id: Optional[int] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Registry rows with a citations count, most cited first, counting
+        the reports of user_id only if given"""
+
+    @abstractmethod
+    async def _fetch_sources(self, ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Registry rows by id"""
+
+    @abstractmethod
+    async def _insert_sources(self, rows: List[Dict[str, Any]]) -> None:
+        """Add registry rows, keeping the existing row for any id already there"""
+
+    async def close(self) -> None:
+        """Release connections"""
+
+    # Source registry
+
+    async def get_sources(self, ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Registry rows by id, from the in-process index where possible"""
+        found, missing = self.source_index.lookup(dict.fromkeys(ids))
+        if missing:
+            fetched = await self._fetch_sources(missing)
+            self.source_index.put(fetched.values())
+            found.update(fetched)
+        return found
+
+    async def register_sources(self, sources: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Add sources to the registry and return their rows by id. The
+        first report to cite a source decides the title shown for it in
+        most-cited lists; reports keep their own titles."""
+        rows = registry_rows(sources, datetime.utcnow().isoformat())
+        found = await self.get_sources(rows)
+        new = [row for key, row in rows.items() if key not in found]
+        if new:
+            await self._insert_sources(new)
+            metrics.increment("source_registry.registered", len(new))
+            # Read back, in case another process registered one first
+            stored = await self._fetch_sources([row["id"] for row in new])
+            self.source_index.put(stored.values())
+            found.update(stored)
+        return found
+
+    async def canonicalize_sources(self, sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """A new report's sources, deduplicated by normalized URL, with
+        tracking parameters stripped so the stored report can reference
+        the registry"""
+        return canonical_sources(sources, await self.register_sources(sources))
+
+    async def _encode(self, report: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        """The row to store for a report, and the registry ids it cites"""
+        registered = await self.register_sources(_source_urls(report))
+        return encode_report(report, registered), list(registered)
+
+    async def _read(self, rows: List[Dict[str, Any]], columns: str) -> List[Dict[str, Any]]:
+        """Stored report rows as the caller asked for them. The body is only
+        decompressed when body fields were asked for."""
+        if not needs_body(columns):
+            return [project(row, columns) for row in rows]
+        reports = [decode_report(row, self.source_index) for row in rows]
+        missing = set().union(*(unresolved_sources(report) for report in reports))
+        if missing:
+            found = await self.get_sources(missing)
+            reports = [resolve_sources(report, found) for report in reports]
+            if any(unresolved_sources(report) for report in reports):
+                raise RepositoryError("Report cites sources missing from the registry")
+        return [project(report, columns) for report in reports]
+
+
+def _quote(value: str) -> str:
+    """Quote a value inside a PostgREST logic filter"""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _like_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class PostgRESTRepository(Repository):
+    """Supabase's REST API over one shared httpx pool (HTTP/2 where the
+    server offers it), with timeouts and retries"""
+
+    def __init__(
+        self,
+        url: str,
+        key: str,
+        timeout: float = DATABASE_TIMEOUT,
+        retries: int = DATABASE_RETRIES,
+        max_connections: int = DATABASE_MAX_CONNECTIONS,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        super().__init__()
+        self.retries = retries
+        self.client = httpx.AsyncClient(
+            base_url=f"{url.rstrip('/')}/rest/v1",
+            headers={"apikey": key, "Authorization": f"Bearer {key}"},
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            http2=True,
+            transport=transport,
+        )
+
+    async def _request(
+        self,
+        method: str,
+        table: str,
+        params: Optional[List[tuple]] = None,
+        body: Optional[Dict[str, Any]] = None,
+        prefer: Optional[str] = None,
+        idempotent: bool = True,
+    ) -> List[Dict[str, Any]]:
+        headers = {"Prefer": prefer} if prefer else {}
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = await self.client.request(method, f"/{table}", params=params, json=body, headers=headers)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                # The request never reached the server, so it is always safe to repeat
+                if last:
+                    raise RepositoryError(f"Database unreachable: {e}")
+            except httpx.TransportError as e:
+                if last or not idempotent:
+                    raise RepositoryError(f"Database request failed: {e}")
+            else:
+                if response.status_code < 400:
+                    return response.json() if response.content else []
+                if response.status_code < 500 or last or not idempotent:
+                    raise RepositoryError(response.text, response.status_code)
+            metrics.increment("database.retries")
+            await asyncio.sleep(0.1 * 2 ** attempt)
+
+    async def _select(self, table: str, columns: str, filters: List[tuple], **extra) -> List[Dict[str, Any]]:
+        params = [("select", columns.replace(" ", ""))] + filters
+        params += [(name, str(value)) for name, value in extra.items() if value is not None]
+        return await self._request("GET", table, params=params)
+
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        rows = await self._select("users", "*", [("id", f"eq.{user_id}")])
+        return rows[0] if rows else None
+
+    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        rows = await self._select("users", "*", [("email", f"eq.{email}")])
+        return rows[0] if rows else None
+
+    async def create_user(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        rows = await self._request("POST", "users", body=user, prefer="return=representation", idempotent=False)
+        return rows[0]
+
+    async def update_user(self, user_id: int, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        rows = await self._request(
+            "PATCH", "users", params=[("id", f"eq.{user_id}")], body=fields, prefer="return=representation"
+        )
+        return rows[0] if rows else None
+
+    async def get_report(self, report_id: str, user_id: Optional[int] = None, columns: str = "*"):
+        filters = [("id", f"eq.{report_id}")]
+        if user_id is not None:
+            filters.append(("user_id", f"eq.{user_id}"))
+        rows = await self._select("research_reports", storage_columns(columns), filters)
+        return (await self._read(rows, columns))[0] if rows else None
+
+    async def list_reports(
+        self,
+        columns: str = "*",
+        user_id: Optional[int] = None,
+        ids: Optional[Sequence[str]] = None,
+        topic_key: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        descending: bool = True,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[str, str]] = None,
+        search: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        filters = []
+        if user_id is not None:
+            filters.append(("user_id", f"eq.{user_id}"))
+        if ids is not None:
+            filters.append(("id", "in.(" + ",".join(_quote(i) for i in ids) + ")"))
+        if topic_key is not None:
+            filters.append(("topic_key", f"eq.{topic_key}"))
+        if since is not None:
+            filters.append(("created_at", f"gte.{since}"))
+        if until is not None:
+            filters.append(("created_at", f"lte.{until}"))
+        if after is not None:
+            op = "lt" if descending else "gt"
+            created_at, report_id = (_quote(value) for value in after)
+            filters.append(("or", f"(created_at.{op}.{created_at},and(created_at.eq.{created_at},id.{op}.{report_id}))"))
+        if search:
+            filters.append(("topic", f"ilike.*{_like_escape(search.replace('*', ''))}*"))
+        order = "created_at.desc,id.desc" if descending else "created_at.asc,id.asc"
+        rows = await self._select("research_reports", storage_columns(columns), filters, order=order, limit=limit)
+        return await self._read(rows, columns)
+
+    async def _write_citations(self, report: Dict[str, Any], source_ids: List[str]):
+        if not source_ids:
+            return
+        links = [
+            {"report_id": report["id"], "source_id": key, "user_id": report.get("user_id")}
+            for key in source_ids
+        ]
+        await self._request(
+            "POST", "report_sources", body=links, prefer="resolution=ignore-duplicates,return=minimal"
+        )
+
+    async def insert_report(self, report: Dict[str, Any]) -> Dict[str, Any]:
+        row, source_ids = await self._encode(report)
+        # return=minimal: the report is not sent back over the wire
+        await self._request(
+            "POST", "research_reports", body=row, prefer="return=minimal", idempotent=False
+        )
+        await self._write_citations(report, source_ids)
+        return dict(report)
+
+    async def upsert_report(self, report: Dict[str, Any]) -> Dict[str, Any]:
+        row, source_ids = await self._encode(report)
+        await self._request(
+            "POST", "research_reports", body=row,
+            prefer="resolution=merge-duplicates,return=minimal",
+        )
+        await self._write_citations(report, source_ids)
+        return dict(report)
+
+    async def _fetch_sources(self, ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        rows = await self._select("sources", "*", [("id", "in.(" + ",".join(_quote(i) for i in ids) + ")")])
+        return {row["id"]: row for row in rows}
+
+    async def _insert_sources(self, rows: List[Dict[str, Any]]) -> None:
+        await self._request("POST", "sources", body=rows, prefer="resolution=ignore-duplicates,return=minimal")
+
+    async def most_cited_sources(self, user_id: Optional[int] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        # Counted by the source_citations / source_totals views over report_sources
+        if user_id is not None:
+            counts = await self._select(
+                "source_citations", "source_id, citations", [("user_id", f"eq.{user_id}")],
+                order="citations.desc,source_id", limit=limit,
+            )
+        else:
+            counts = await self._select("source_totals", "source_id, citations", [], order="citations.desc,source_id", limit=limit)
+        sources = await self.get_sources(row["source_id"] for row in counts)
+        return [dict(sources[row["source_id"]], citations=row["citations"]) for row in counts if row["source_id"] in sources]
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def _matches(
+    row: Dict[str, Any],
+    user_id: Optional[int],
+    ids: Optional[Sequence[str]],
+    topic_key: Optional[str],
+    since: Optional[str],
+    until: Optional[str],
+    search: Optional[str],
+) -> bool:
+    return (
+        (user_id is None or row.get("user_id") == user_id)
+        and (ids is None or row.get("id") in ids)
+        and (topic_key is None or row.get("topic_key") == topic_key)
+        and (since is None or (row.get("created_at") or "") >= since)
+        and (until is None or (row.get("created_at") or "") <= until)
+        and (not search or search.lower() in (row.get("topic") or "").lower())
+    )
+
+
+def _order_key(row: Dict[str, Any]) -> Tuple[str, str]:
+    return row.get("created_at") or "", row.get("id") or ""
+
+
+class MemoryRepository(Repository):
+    """Tables as lists of dicts, for tests and single-process development"""
+
+    def __init__(self, users: Optional[List[Dict[str, Any]]] = None, reports: Optional[List[Dict[str, Any]]] = None):
+        super().__init__()
+        self.users: List[Dict[str, Any]] = list(users or [])
+        self.reports: List[Dict[str, Any]] = list(reports or [])
+        self.sources: Dict[str, Dict[str, Any]] = {}
+        # report_sources rows: (report_id, source_id) -> user_id
+        self.citations: Dict[Tuple[str, str], Optional[int]] = {}
+        self._lock = threading.Lock()
+
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            user = next((u for u in self.users if u.get("id") == user_id), None)
+            return copy.deepcopy(user)
+
+    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            user = next((u for u in self.users if u.get("email") == email), None)
+            return copy.deepcopy(user)
+
+    async def create_user(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            if any(u.get("email") == user.get("email") for u in self.users):
+                raise RepositoryError("duplicate key value violates unique constraint", 409)
+            row = dict(copy.deepcopy(user), id=max((u.get("id", 0) for u in self.users), default=0) + 1)
+            self.users.append(row)
+            return copy.deepcopy(row)
+
+    async def update_user(self, user_id: int, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            user = next((u for u in self.users if u.get("id") == user_id), None)
+            if user is None:
+                return None
+            user.update(copy.deepcopy(fields))
+            return copy.deepcopy(user)
+
+    async def get_report(self, report_id: str, user_id: Optional[int] = None, columns: str = "*"):
+        rows = await self.list_reports(columns, user_id=user_id, ids=[report_id])
+        return rows[0] if rows else None
+
+    async def list_reports(
+        self,
+        columns: str = "*",
+        user_id: Optional[int] = None,
+        ids: Optional[Sequence[str]] = None,
+        topic_key: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        descending: bool = True,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[str, str]] = None,
+        search: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = [r for r in self.reports if _matches(r, user_id, ids, topic_key, since, until, search)]
+            if after is not None:
+                after = tuple(after)
+                rows = [r for r in rows if (_order_key(r) < after if descending else _order_key(r) > after)]
+            rows.sort(key=_order_key, reverse=descending)
+            rows = [copy.deepcopy(r) for r in rows[:limit]]
+        return await self._read(rows, columns)
+
+    def _cite(self, report: Dict[str, Any], source_ids: List[str]):
+        for key in source_ids:
+            self.citations[(report.get("id"), key)] = report.get("user_id")
+
+    async def insert_report(self, report: Dict[str, Any]) -> Dict[str, Any]:
+        row, source_ids = await self._encode(copy.deepcopy(report))
+        with self._lock:
+            if any(r.get("id") == report.get("id") for r in self.reports):
+                raise RepositoryError("duplicate key value violates unique constraint", 409)
+            self.reports.append(row)
+            self._cite(report, source_ids)
+        return copy.deepcopy(report)
+
+    async def upsert_report(self, report: Dict[str, Any]) -> Dict[str, Any]:
+        row, source_ids = await self._encode(copy.deepcopy(report))
+        with self._lock:
+            self.reports[:] = [r for r in self.reports if r.get("id") != report.get("id")]
+            self.reports.append(row)
+            self._cite(report, source_ids)
+        return copy.deepcopy(report)
+
+    async def _fetch_sources(self, ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {key: dict(self.sources[key]) for key in ids if key in self.sources}
+
+    async def _insert_sources(self, rows: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            for row in rows:
+                self.sources.setdefault(row["id"], dict(row))
+
+    async def most_cited_sources(self, user_id: Optional[int] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            counts = Counter(key for (_, key), owner in self.citations.items() if user_id is None or owner == user_id)
+            ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            return [dict(self.sources[key], citations=count) for key, count in ranked]
+
+
+class SQLiteRepository(Repository):
+    """Tables in a local SQLite file, for development without Supabase.
+
+    Rows are stored as JSON next to the columns that are filtered on, so
+    new report fields need no migration.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    email TEXT UNIQUE NOT NULL,
+                    data TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS research_reports (
+                    id TEXT PRIMARY KEY,
+                    user_id INTEGER,
+                    topic_key TEXT,
+                    created_at TEXT,
+                    data TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS reports_user ON research_reports (user_id, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS reports_topic_key ON research_reports (topic_key, created_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sources (
+                    id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS report_sources (
+                    report_id TEXT NOT NULL,
+                    source_id TEXT NOT NULL,
+                    user_id INTEGER,
+                    PRIMARY KEY (report_id, source_id)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS report_sources_user ON report_sources (user_id, source_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS report_sources_source ON report_sources (source_id)")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _fetch_user(self, column: str, value) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            row = conn.execute(f"SELECT id, data FROM users WHERE {column} = ?", (value,)).fetchone()
+        finally:
+            conn.close()
+        return dict(json.loads(row[1]), id=row[0]) if row else None
+
+    def _insert_user(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "INSERT INTO users (email, data) VALUES (?, ?)", (user.get("email"), json.dumps(user))
+            )
+        except sqlite3.IntegrityError as e:
+            raise RepositoryError(str(e), 409)
+        finally:
+            conn.close()
+        return dict(user, id=cursor.lastrowid)
+
+    def _patch_user(self, user_id: int, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT data FROM users WHERE id = ?", (user_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            user = dict(json.loads(row[0]), **fields)
+            user.pop("id", None)
+            conn.execute(
+                "UPDATE users SET email = ?, data = ? WHERE id = ?", (user.get("email"), json.dumps(user), user_id)
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return dict(user, id=user_id)
+
+    def _write_report(self, report: Dict[str, Any], row: Dict[str, Any], source_ids: List[str], replace: bool) -> Dict[str, Any]:
+        verb = "INSERT OR REPLACE" if replace else "INSERT"
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                f"{verb} INTO research_reports (id, user_id, topic_key, created_at, data) VALUES (?, ?, ?, ?, ?)",
+                (report.get("id"), report.get("user_id"), report.get("topic_key"),
+                 report.get("created_at"), json.dumps(row, default=str)),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO report_sources (report_id, source_id, user_id) VALUES (?, ?, ?)",
+                [(report.get("id"), key, report.get("user_id")) for key in source_ids],
+            )
+            conn.execute("COMMIT")
+        except sqlite3.IntegrityError as e:
+            conn.execute("ROLLBACK")
+            raise RepositoryError(str(e), 409)
+        finally:
+            conn.close()
+        return report
+
+    def _select_sources(self, ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT data FROM sources WHERE id IN ({','.join('?' * len(ids))})", list(ids)
+            ).fetchall()
+        finally:
+            conn.close()
+        return {row["id"]: row for row in (json.loads(data) for (data,) in rows)}
+
+    def _add_sources(self, rows: List[Dict[str, Any]]):
+        conn = self._connect()
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO sources (id, data) VALUES (?, ?)", [(row["id"], json.dumps(row)) for row in rows]
+            )
+        finally:
+            conn.close()
+
+    def _count_citations(self, user_id: Optional[int], limit: int) -> List[Tuple[str, int]]:
+        sql = "SELECT source_id, COUNT(*) AS citations FROM report_sources"
+        params: List[Any] = []
+        if user_id is not None:
+            sql += " WHERE user_id = ?"
+            params.append(user_id)
+        sql += " GROUP BY source_id ORDER BY citations DESC, source_id LIMIT ?"
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params + [limit]).fetchall()
+        finally:
+            conn.close()
+
+    def _query_reports(self, columns, user_id, ids, topic_key, since, until, descending, limit, after, search):
+        clauses, params = [], []
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if ids is not None:
+            clauses.append(f"id IN ({','.join('?' * len(ids))})" if ids else "0")
+            params.extend(ids)
+        if topic_key is not None:
+            clauses.append("topic_key = ?")
+            params.append(topic_key)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at <= ?")
+            params.append(until)
+        if after is not None:
+            op = "<" if descending else ">"
+            clauses.append(f"(created_at {op} ? OR (created_at = ? AND id {op} ?))")
+            params.extend([after[0], after[0], after[1]])
+        if search:
+            clauses.append("json_extract(data, '$.topic') LIKE ? ESCAPE '\\'")
+            params.append(f"%{_like_escape(search)}%")
+        direction = "DESC" if descending else "ASC"
+        sql = "SELECT data FROM research_reports"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY created_at {direction}, id {direction}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        return [json.loads(row[0]) for row in rows]
+
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._fetch_user, "id", user_id)
+
+    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._fetch_user, "email", email)
+
+    async def create_user(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._insert_user, user)
+
+    async def update_user(self, user_id: int, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._patch_user, user_id, fields)
+
+    async def get_report(self, report_id: str, user_id: Optional[int] = None, columns: str = "*"):
+        rows = await self.list_reports(columns, user_id=user_id, ids=[report_id])
+        return rows[0] if rows else None
+
+    async def list_reports(
+        self,
+        columns: str = "*",
+        user_id: Optional[int] = None,
+        ids: Optional[Sequence[str]] = None,
+        topic_key: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        descending: bool = True,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[str, str]] = None,
+        search: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        rows = await asyncio.to_thread(
+            self._query_reports, columns, user_id, ids, topic_key, since, until, descending, limit, after, search
+        )
+        return await self._read(rows, columns)
+
+    async def insert_report(self, report: Dict[str, Any]) -> Dict[str, Any]:
+        row, source_ids = await self._encode(report)
+        return await asyncio.to_thread(self._write_report, report, row, source_ids, False)
+
+    async def upsert_report(self, report: Dict[str, Any]) -> Dict[str, Any]:
+        row, source_ids = await self._encode(report)
+        return await asyncio.to_thread(self._write_report, report, row, source_ids, True)
+
+    async def _fetch_sources(self, ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        return await asyncio.to_thread(self._select_sources, ids)
+
+    async def _insert_sources(self, rows: List[Dict[str, Any]]) -> None:
+        await asyncio.to_thread(self._add_sources, rows)
+
+    async def most_cited_sources(self, user_id: Optional[int] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        counts = await asyncio.to_thread(self._count_citations, user_id, limit)
+        sources = await self.get_sources(key for key, _ in counts)
+        return [dict(sources[key], citations=count) for key, count in counts if key in sources]
+
+
+async def backfill_report_storage(repository: Optional[Repository] = None, batch_size: int = 100) -> Dict[str, int]:
+    """Re-store reports saved in the legacy layout in the current storage
+    format, oldest first, and version 1 rows whose sources can now
+    reference the source registry. Safe to interrupt and run again."""
+    repository = repository or get_repository()
+    stats = {"scanned": 0, "converted": 0, "upgraded": 0, "bytes_before": 0, "bytes_after": 0}
+    after = None
+    while True:
+        rows = await repository.list_reports(
+            "id, created_at, storage_version", after=after, descending=False, limit=batch_size
+        )
+        if not rows:
+            return stats
+        for row in rows:
+            stats["scanned"] += 1
+            version = row.get("storage_version")
+            if version is not None and version >= STORAGE_VERSION:
+                continue
+            report = await repository.get_report(row["id"])
+            if report is None:
+                continue
+            encoded = encode_report(report, await repository.register_sources(_source_urls(report)))
+            if version is not None:
+                if encoded["storage_version"] < STORAGE_VERSION:
+                    continue
+                stats["upgraded"] += 1
+            else:
+                stats["converted"] += 1
+            await repository.upsert_report(report)
+            stats["bytes_before"] += len(json.dumps(report if version is None else encode_report(report), default=str))
+            stats["bytes_after"] += len(json.dumps(encoded, default=str))
+        after = (rows[-1]["created_at"], rows[-1]["id"])
+
+
+def create_repository(url: str = DATABASE_URL) -> Repository:
+    """Build a repository from a URL: empty for Supabase, memory:// or
+    sqlite:///path"""
+    if not url:
+        return PostgRESTRepository(os.environ.get("SUPABASE_URL", ""), os.environ.get("SUPABASE_KEY", ""))
+    if url.startswith("memory://"):
+        return MemoryRepository()
+    if url.startswith("sqlite:///"):
+        return SQLiteRepository(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported database URL: {url}")
+
+
+_repository: Optional[Repository] = None
+
+
+def get_repository() -> Repository:
+    """Return the process-wide repository"""
+    global _repository
+    if _repository is None:
+        _repository = create_repository()
+    return _repository
+
+
+def set_repository(repository: Optional[Repository]):
+    """Replace the process-wide repository (used by tests)"""
+    global _repository
+    _repository = repository
+
+
+async def close_repository():
+    """Close the process-wide repository's connections, if it was created"""
+    global _repository
+    if _repository is not None:
+        await _repository.close()
+        _repository = None
@@ -0,0 +1,84 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from app.utils import metrics
+
+# Load environment variables
+load_dotenv()
+
+# Serialized report responses kept in memory, bounded by total size
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    # Only the owner is served from the cache
+    user_id: int
+
+    @classmethod
+    def build(cls, body: bytes, user_id: int) -> "CachedResponse":
+        """A response with a strong ETag: the hash of its exact bytes"""
+        return cls(body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"', user_id=user_id)
+
+
+class ResponseCache:
+    """LRU of serialized responses for resources that never change, such
+    as finished reports, bounded by the total size of their bodies"""
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        metrics.increment("response_cache.hits" if entry is not None else "response_cache.misses")
+        return entry
+
+    def put(self, key: str, entry: CachedResponse):
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous.body)
+            self._entries[key] = entry
+            self._size += len(entry.body)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+                metrics.increment("response_cache.evictions")
+            metrics.set_gauge("response_cache.bytes", self._size)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """Return the process-wide response cache"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
+
+
+def set_response_cache(cache: Optional[ResponseCache]):
+    """Replace the process-wide cache (used by tests)"""
+    global _response_cache
+    _response_cache = cache
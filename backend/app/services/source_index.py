@@ -0,0 +1,102 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from app.utils import metrics
+from app.utils.source_urls import clean_url, normalize_url, source_id
+
+# Load environment variables
+load_dotenv()
+
+# Registry rows kept in memory by each process
+SOURCE_INDEX_MAX_ENTRIES = int(os.environ.get("SOURCE_INDEX_MAX_ENTRIES", 50000))
+
+
+class SourceIndex:
+    """In-process LRU of source registry rows by id. Registry rows never
+    change once written, so an entry can never go stale."""
+
+    def __init__(self, max_entries: int = SOURCE_INDEX_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._rows: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._rows.get(key)
+            if row is not None:
+                self._rows.move_to_end(key)
+        metrics.increment("source_index.hits" if row is not None else "source_index.misses")
+        return row if row is not None else default
+
+    def lookup(self, ids: Iterable[str]) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        """(rows found, ids missing)"""
+        found, missing = {}, []
+        for key in ids:
+            row = self.get(key)
+            if row is None:
+                missing.append(key)
+            else:
+                found[key] = row
+        return found, missing
+
+    def put(self, rows: Iterable[Dict[str, Any]]):
+        with self._lock:
+            for row in rows:
+                self._rows[row["id"]] = row
+                self._rows.move_to_end(row["id"])
+            while len(self._rows) > self.max_entries:
+                self._rows.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+def registry_rows(sources: Iterable[Dict[str, Any]], created_at: str) -> Dict[str, Dict[str, Any]]:
+    """Registry rows for a report's sources, by id, first citation first.
+    Sources without a usable URL are left out."""
+    rows: Dict[str, Dict[str, Any]] = {}
+    for source in sources:
+        url = (source.get("url") or "").strip() if isinstance(source, dict) else ""
+        if not normalize_url(url):
+            continue
+        key = source_id(url)
+        if key not in rows:
+            rows[key] = {
+                "id": key,
+                "url": clean_url(url),
+                "normalized_url": normalize_url(url),
+                "title": source.get("title") or url,
+                "created_at": created_at,
+            }
+    return rows
+
+
+def canonical_sources(sources: Iterable[Any], registry: Dict[str, Dict[str, Any]]) -> List[Any]:
+    """A report's sources deduplicated by normalized URL, with tracking
+    parameters and fragments stripped from registered URLs. Each report
+    keeps its own titles and snippets (the first given, if a source is cited
+    twice); only the source's identity comes from the registry."""
+    canonical: Dict[str, Any] = {}
+    for index, source in enumerate(sources):
+        if not isinstance(source, dict):
+            canonical[f"#{index}"] = source
+            continue
+        url = (source.get("url") or "").strip()
+        entry = registry.get(source_id(url)) if normalize_url(url) else None
+        key = entry["id"] if entry is not None else f"{source.get('title')}|{url}"
+        if key in canonical:
+            kept = canonical[key]
+            for field in ("title", "snippet"):
+                if not kept[field] and source.get(field):
+                    kept[field] = source[field]
+            continue
+        canonical[key] = {
+            "title": source.get("title", ""),
+            "url": clean_url(url) if entry is not None else url,
+            "snippet": source.get("snippet"),
+        }
+    return list(canonical.values())
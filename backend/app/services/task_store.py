@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Task store settings
+TASK_STORE_URL = os.environ.get("TASK_STORE_URL", "sqlite:///deepr_tasks.db")
+TASK_STATE_TTL = int(os.environ.get("TASK_STATE_TTL", 24 * 60 * 60))
+TASK_STORE_MAX_ENTRIES = int(os.environ.get("TASK_STORE_MAX_ENTRIES", 100000))
+
+
+class TaskStore(ABC):
+    """Shared status records for research tasks, keyed by research id.
+
+    A record holds user_id, topic, status, progress (0-100), error and the
+    created_at / updated_at / started_at / completed_at timestamps. Every
+    write refreshes the record's TTL.
+    """
+
+    def __init__(self, ttl: int = TASK_STATE_TTL):
+        self.ttl = ttl
+
+    @abstractmethod
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def put(self, task_id: str, record: Dict[str, Any]) -> None:
+        """Write a record whole, replacing any record under task_id"""
+
+    @abstractmethod
+    async def delete(self, task_id: str) -> None: ...
+
+    @abstractmethod
+    async def add(self, task_id: str, record: Dict[str, Any]) -> bool:
+        """Atomically write a record only if task_id has no live record.
+        Returns False if one already exists."""
+
+    async def create(self, task_id: str, **fields) -> Dict[str, Any]:
+        now = datetime.utcnow().isoformat()
+        record = {
+            "status": "in_progress",
+            "progress": 0,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        record.update(fields)
+        await self.put(task_id, record)
+        return record
+
+    async def update(self, task_id: str, **fields) -> Dict[str, Any]:
+        """Merge fields into a record, creating it if it has expired"""
+        record = await self.get(task_id) or {}
+        record.update(fields)
+        record["updated_at"] = datetime.utcnow().isoformat()
+        await self.put(task_id, record)
+        return record
+
+
+class MemoryTaskStore(TaskStore):
+    """Single-process store with TTL expiry and an LRU size cap"""
+
+    def __init__(self, ttl: int = TASK_STATE_TTL, max_entries: int = TASK_STORE_MAX_ENTRIES):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._records: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        # Records are kept in write order, so expired ones sit at the front
+        while self._records:
+            task_id, (expires_at, _) = next(iter(self._records.items()))
+            if expires_at > now and len(self._records) <= self.max_entries:
+                break
+            self._records.popitem(last=False)
+
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._records.get(task_id)
+            if entry is None:
+                return None
+            expires_at, record = entry
+            if expires_at <= now:
+                del self._records[task_id]
+                return None
+            return dict(record)
+
+    async def put(self, task_id: str, record: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._records.pop(task_id, None)
+            self._records[task_id] = (now + self.ttl, dict(record))
+            self._evict(now)
+
+    async def delete(self, task_id: str) -> None:
+        with self._lock:
+            self._records.pop(task_id, None)
+
+    async def add(self, task_id: str, record: Dict[str, Any]) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._records.get(task_id)
+            if entry is not None and entry[0] > now:
+                return False
+            self._records.pop(task_id, None)
+            self._records[task_id] = (now + self.ttl, dict(record))
+            self._evict(now)
+            return True
+
+    def __len__(self):
+        return len(self._records)
+
+
+class SQLiteTaskStore(TaskStore):
+    """Store in a local SQLite file, shared by every process on the host"""
+
+    def __init__(self, path: str, ttl: int = TASK_STATE_TTL):
+        super().__init__(ttl)
+        self.path = path
+        self._writes = 0
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_expires_at ON tasks (expires_at)")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT data FROM tasks WHERE id = ? AND expires_at > ?",
+                (task_id, time.time()),
+            ).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, task_id: str, record: Dict[str, Any]):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO tasks (id, data, expires_at) VALUES (?, ?, ?)",
+                (task_id, json.dumps(record), now + self.ttl),
+            )
+            # Purge expired rows every so often instead of on every write
+            self._writes += 1
+            if self._writes % 500 == 0:
+                conn.execute("DELETE FROM tasks WHERE expires_at <= ?", (now,))
+        finally:
+            conn.close()
+
+    def _delete(self, task_id: str):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+        finally:
+            conn.close()
+
+    def _add(self, task_id: str, record: Dict[str, Any]) -> bool:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM tasks WHERE id = ? AND expires_at <= ?", (task_id, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO tasks (id, data, expires_at) VALUES (?, ?, ?)",
+                (task_id, json.dumps(record), now + self.ttl),
+            )
+            conn.execute("COMMIT")
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, task_id)
+
+    async def put(self, task_id: str, record: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self._put, task_id, record)
+
+    async def delete(self, task_id: str) -> None:
+        await asyncio.to_thread(self._delete, task_id)
+
+    async def add(self, task_id: str, record: Dict[str, Any]) -> bool:
+        return await asyncio.to_thread(self._add, task_id, record)
+
+
+class RedisTaskStore(TaskStore):
+    """Store on any Redis-protocol server (Redis, Valkey, KeyDB) for
+    deployments with API and worker processes on several hosts"""
+
+    def __init__(self, url: str, ttl: int = TASK_STATE_TTL, prefix: str = "deepr:task:"):
+        super().__init__(ttl)
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        data = await self.redis.get(self.prefix + task_id)
+        return json.loads(data) if data else None
+
+    async def put(self, task_id: str, record: Dict[str, Any]) -> None:
+        await self.redis.set(self.prefix + task_id, json.dumps(record), ex=self.ttl)
+
+    async def delete(self, task_id: str) -> None:
+        await self.redis.delete(self.prefix + task_id)
+
+    async def add(self, task_id: str, record: Dict[str, Any]) -> bool:
+        return bool(await self.redis.set(self.prefix + task_id, json.dumps(record), ex=self.ttl, nx=True))
+
+
+def create_task_store(url: str = TASK_STORE_URL) -> TaskStore:
+    """Build a task store from a URL: memory://, sqlite:///path or redis://"""
+    if url.startswith("memory://"):
+        return MemoryTaskStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteTaskStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisTaskStore(url)
+    raise ValueError(f"Unsupported task store URL: {url}")
+
+
+_task_store: Optional[TaskStore] = None
+
+
+def get_task_store() -> TaskStore:
+    """Return the process-wide task store"""
+    global _task_store
+    if _task_store is None:
+        _task_store = create_task_store()
+    return _task_store
+
+
+def set_task_store(store: Optional[TaskStore]):
+    """Replace the process-wide store (used by tests)"""
+    global _task_store
+    _task_store = store
@@ -0,0 +1,189 @@
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Optional, Dict, Any
+
+import httpx
+from cachetools import TLRUCache
+from dotenv import load_dotenv
+from jose import JWTError, jwt
+
+from app.utils import metrics
+
+# Load environment variables
+load_dotenv()
+
+# Supabase token verification. Asymmetric tokens are checked against the
+# project's JWKS; legacy HS256 tokens need SUPABASE_JWT_SECRET.
+SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
+SUPABASE_JWKS_URL = os.environ.get("SUPABASE_JWKS_URL", f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json")
+SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET", "")
+SUPABASE_JWT_AUDIENCE = os.environ.get("SUPABASE_JWT_AUDIENCE", "authenticated")
+# Keys older than JWKS_TTL are refreshed in the background while still in
+# use; past JWKS_MAX_STALE requests wait for a fresh copy
+JWKS_TTL = float(os.environ.get("JWKS_TTL", 600))
+JWKS_MAX_STALE = float(os.environ.get("JWKS_MAX_STALE", 24 * 60 * 60))
+# An unknown kid triggers at most one refetch per interval
+JWKS_REFETCH_INTERVAL = float(os.environ.get("JWKS_REFETCH_INTERVAL", 30))
+JWKS_TIMEOUT = float(os.environ.get("JWKS_TIMEOUT", 5))
+TOKEN_CACHE_MAX_SIZE = int(os.environ.get("TOKEN_CACHE_MAX_SIZE", 10000))
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+
+class JWKSCache:
+    """The signing keys published by Supabase, by kid.
+
+    Keys are fetched once and then served from memory. When they get old a
+    refresh runs in the background while the old keys keep answering
+    (stale-while-revalidate), and a token with an unknown kid, as after a
+    key rotation, causes one immediate refetch.
+    """
+
+    def __init__(
+        self,
+        url: str = SUPABASE_JWKS_URL,
+        ttl: float = JWKS_TTL,
+        max_stale: float = JWKS_MAX_STALE,
+        refetch_interval: float = JWKS_REFETCH_INTERVAL,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.url = url
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.refetch_interval = refetch_interval
+        key = os.environ.get("SUPABASE_KEY", "")
+        self.client = httpx.AsyncClient(
+            headers={"apikey": key, "Authorization": f"Bearer {key}"},
+            timeout=httpx.Timeout(JWKS_TIMEOUT),
+            transport=transport,
+        )
+        self.keys: Dict[str, Dict[str, Any]] = {}
+        self.fetched_at: Optional[float] = None
+        self.refetched_at = float("-inf")
+        self._fetch: Optional[asyncio.Task] = None
+
+    async def _download(self):
+        try:
+            response = await self.client.get(self.url)
+            response.raise_for_status()
+            keys = {key["kid"]: key for key in response.json().get("keys", []) if "kid" in key}
+        except Exception as e:
+            metrics.increment("jwks.fetch_errors")
+            print(f"Failed to fetch JWKS: {str(e)}")
+            raise
+        metrics.increment("jwks.fetches")
+        self.keys = keys
+        self.fetched_at = time.monotonic()
+
+    def refresh(self) -> asyncio.Task:
+        """Start a fetch, or join the one in progress"""
+        if self._fetch is None or self._fetch.done():
+            self._fetch = asyncio.ensure_future(self._download())
+            # Background refreshes may fail unobserved; the error is logged
+            self._fetch.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self._fetch
+
+    async def get_key(self, kid: str) -> Optional[Dict[str, Any]]:
+        """The JWK with this kid, or None if Supabase does not publish it"""
+        age = None if self.fetched_at is None else time.monotonic() - self.fetched_at
+        if age is None or age > self.max_stale:
+            await asyncio.shield(self.refresh())
+        elif age > self.ttl:
+            self.refresh()
+
+        if kid not in self.keys:
+            if self._fetch is not None and not self._fetch.done():
+                await asyncio.shield(self._fetch)
+            elif time.monotonic() - self.refetched_at >= self.refetch_interval:
+                self.refetched_at = time.monotonic()
+                metrics.increment("jwks.unknown_kid_refetches")
+                await asyncio.shield(self.refresh())
+        return self.keys.get(kid)
+
+    async def close(self):
+        if self._fetch is not None:
+            self._fetch.cancel()
+        await self.client.aclose()
+
+
+def _expiry(key: str, claims: Dict[str, Any], now: float) -> float:
+    return float(claims.get("exp", now))
+
+
+class TokenVerifier:
+    """Verifies Supabase access tokens locally and remembers valid ones by
+    hash until they expire, so a repeated token costs neither a signature
+    check nor a network call"""
+
+    def __init__(
+        self,
+        jwks: Optional[JWKSCache] = None,
+        jwt_secret: str = SUPABASE_JWT_SECRET,
+        audience: str = SUPABASE_JWT_AUDIENCE,
+        max_size: int = TOKEN_CACHE_MAX_SIZE,
+    ):
+        self.jwks = jwks or JWKSCache()
+        self.jwt_secret = jwt_secret
+        self.audience = audience
+        self._verified = TLRUCache(maxsize=max_size, ttu=_expiry, timer=time.time)
+        self._lock = threading.Lock()
+
+    async def verify(self, token: str) -> Dict[str, Any]:
+        """The token's claims. Raises JWTError if it is not a valid, current
+        token for this project."""
+        digest = hashlib.sha256(token.encode()).hexdigest()
+        with self._lock:
+            claims = self._verified.get(digest)
+        if claims is not None:
+            metrics.increment("token_cache.hits")
+            return dict(claims)
+        metrics.increment("token_cache.misses")
+
+        header = jwt.get_unverified_header(token)
+        algorithm = header.get("alg")
+        if algorithm in ASYMMETRIC_ALGORITHMS:
+            key = await self.jwks.get_key(header.get("kid"))
+            if key is None:
+                raise JWTError("Unknown signing key")
+        elif algorithm == "HS256" and self.jwt_secret:
+            key = self.jwt_secret
+        else:
+            raise JWTError(f"Unsupported token algorithm: {algorithm}")
+
+        claims = jwt.decode(token, key, algorithms=[algorithm], audience=self.audience)
+        if "exp" not in claims:
+            raise JWTError("Token has no expiry")
+        with self._lock:
+            self._verified[digest] = claims
+        return dict(claims)
+
+    async def close(self):
+        await self.jwks.close()
+
+
+_token_verifier: Optional[TokenVerifier] = None
+
+
+def get_token_verifier() -> TokenVerifier:
+    """Return the process-wide token verifier"""
+    global _token_verifier
+    if _token_verifier is None:
+        _token_verifier = TokenVerifier()
+    return _token_verifier
+
+
+def set_token_verifier(verifier: Optional[TokenVerifier]):
+    """Replace the process-wide verifier (used by tests)"""
+    global _token_verifier
+    _token_verifier = verifier
+
+
+async def close_token_verifier():
+    """Close the process-wide verifier's connections, if it was created"""
+    global _token_verifier
+    if _token_verifier is not None:
+        await _token_verifier.close()
+        _token_verifier = None
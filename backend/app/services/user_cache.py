@@ -0,0 +1,88 @@
+import os
+import threading
+from typing import Optional, Dict, Any
+
+from cachetools import TTLCache
+from dotenv import load_dotenv
+
+from app.services.repository import get_repository
+from app.utils import metrics
+
+# Load environment variables
+load_dotenv()
+
+# User cache settings. Unknown users are remembered for a shorter time so a
+# fresh registration is picked up quickly even on another instance.
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 60))
+USER_CACHE_NEGATIVE_TTL = int(os.environ.get("USER_CACHE_NEGATIVE_TTL", 10))
+USER_CACHE_MAX_SIZE = int(os.environ.get("USER_CACHE_MAX_SIZE", 10000))
+
+
+class UserCache:
+    """Users looked up by token subject (their email), kept for a short TTL
+    in a size-bounded LRU so polling clients do not hit the users table on
+    every request"""
+
+    def __init__(
+        self,
+        ttl: int = USER_CACHE_TTL,
+        negative_ttl: int = USER_CACHE_NEGATIVE_TTL,
+        max_size: int = USER_CACHE_MAX_SIZE,
+    ):
+        self._users: TTLCache = TTLCache(maxsize=max_size, ttl=ttl)
+        self._unknown: TTLCache = TTLCache(maxsize=max_size, ttl=negative_ttl)
+        self._lock = threading.Lock()
+
+    async def get_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """The user with this email, from the cache or the database"""
+        with self._lock:
+            user = self._users.get(email)
+            unknown = email in self._unknown
+        if user is not None:
+            metrics.increment("user_cache.hits")
+            return dict(user)
+        if unknown:
+            metrics.increment("user_cache.negative_hits")
+            return None
+
+        metrics.increment("user_cache.misses")
+        user = await get_repository().get_user_by_email(email)
+        if user is None:
+            with self._lock:
+                self._unknown[email] = True
+            return None
+        self.put(user)
+        return dict(user)
+
+    def put(self, user: Dict[str, Any]):
+        with self._lock:
+            self._unknown.pop(user["email"], None)
+            self._users[user["email"]] = dict(user)
+
+    def invalidate(self, email: str):
+        """Forget what is known about email, e.g. after it registers"""
+        with self._lock:
+            self._users.pop(email, None)
+            self._unknown.pop(email, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._unknown.clear()
+
+
+_user_cache: Optional[UserCache] = None
+
+
+def get_user_cache() -> UserCache:
+    """Return the process-wide user cache"""
+    global _user_cache
+    if _user_cache is None:
+        _user_cache = UserCache()
+    return _user_cache
+
+
+def set_user_cache(cache: Optional[UserCache]):
+    """Replace the process-wide cache (used by tests)"""
+    global _user_cache
+    _user_cache = cache
@@ -0,0 +1,118 @@
+import os
+import re
+import asyncio
+from typing import Optional, Union, BinaryIO, Dict, Tuple
+
+from fastapi import Request, status
+from fastapi.responses import Response, StreamingResponse
+
+# Chunk size for streamed bodies
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches etag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in tags)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range Range header into inclusive (start, end).
+
+    Returns None when the whole body should be sent (no header, or a form
+    we don't serve such as multiple ranges) and raises ValueError when the
+    range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    first, last = match.group(1), match.group(2)
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+
+def body_size(body: Union[bytes, BinaryIO]) -> int:
+    return len(body) if isinstance(body, bytes) else os.fstat(body.fileno()).st_size
+
+
+async def iter_body(body: Union[bytes, BinaryIO], start: int, end: int):
+    """Yield bytes start..end (inclusive) of bytes or an open file in
+    chunks, closing the file at the end"""
+    try:
+        if isinstance(body, bytes):
+            view = memoryview(body)
+            for offset in range(start, end + 1, STREAM_CHUNK_SIZE):
+                yield bytes(view[offset:min(offset + STREAM_CHUNK_SIZE, end + 1)])
+        else:
+            await asyncio.to_thread(body.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await asyncio.to_thread(body.read, min(STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+    finally:
+        if not isinstance(body, bytes):
+            body.close()
+
+
+def body_response(
+    request: Request,
+    body: Union[bytes, BinaryIO],
+    media_type: str,
+    headers: Dict[str, str],
+) -> Response:
+    """Stream bytes or an open binary file with Content-Length, honouring a
+    single byte Range (and If-Range against the ETag in headers).
+
+    Files are closed once the response ends.
+    """
+    size = body_size(body)
+    headers = dict(headers, **{"Accept-Ranges": "bytes"})
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != headers.get("ETag"):
+        # The client's partial copy is of a different version: send it all
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        if not isinstance(body, bytes):
+            body.close()
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, status.HTTP_200_OK
+    else:
+        start, end = byte_range
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_body(body, start, end),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers,
+    )
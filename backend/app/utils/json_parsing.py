@@ -0,0 +1,130 @@
+import json
+import re
+import time
+from typing import Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.models.research import ResearchReportOutput
+from app.utils import metrics
+
+
+def parse_json(text):
+    """Parse a JSON report from raw model output, repairing code fences,
+    surrounding text and invalid escape sequences"""
+    # Try to parse as clean JSON first
+    try:
+        result = json.loads(text.strip())
+        print("Successfully parsed JSON from raw text")
+        return True, result
+    except json.JSONDecodeError as e:
+        print(f"JSON parsing error: {e}")
+
+        # Check if the response is wrapped in a code block
+        code_block_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', text)
+        if code_block_match:
+            json_str = code_block_match.group(1).strip()
+            try:
+                result = json.loads(json_str)
+                print("Successfully parsed JSON from code block")
+                return True, result
+            except json.JSONDecodeError as e:
+                print(f"JSON parsing error in code block: {e}")
+
+                # Try to fix invalid escape sequences
+                try:
+                    # Replace problematic escape sequences
+                    fixed_json_str = re.sub(r'\\(?!["\\/bfnrt]|u[0-9a-fA-F]{4})', r'\\\\', json_str)
+                    result = json.loads(fixed_json_str)
+                    print("Successfully parsed JSON from code block after fixing escape sequences")
+                    return True, result
+                except json.JSONDecodeError as e2:
+                    print(f"Still failed after fixing escapes in code block: {e2}")
+
+        # Try to extract JSON between curly braces
+        try:
+            # Find the first { and the last }
+            start_idx = text.find('{')
+            end_idx = text.rfind('}')
+
+            if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
+                json_str = text[start_idx:end_idx+1]
+
+                # Try with original string
+                try:
+                    result = json.loads(json_str)
+                    print("Successfully extracted JSON between curly braces")
+                    return True, result
+                except json.JSONDecodeError as e:
+                    # Try to fix invalid escape sequences
+                    try:
+                        # Replace problematic escape sequences
+                        fixed_json_str = re.sub(r'\\(?!["\\/bfnrt]|u[0-9a-fA-F]{4})', r'\\\\', json_str)
+                        result = json.loads(fixed_json_str)
+                        print("Successfully extracted JSON after fixing escape sequences")
+                        return True, result
+                    except json.JSONDecodeError as e2:
+                        print(f"Still failed after fixing escapes: {e2}")
+        except Exception as e:
+            print(f"JSON extraction error: {e}")
+
+        # Last resort: try to manually fix common issues in the entire text
+        try:
+            # Replace problematic escape sequences in the entire text
+            fixed_text = re.sub(r'\\(?!["\\/bfnrt]|u[0-9a-fA-F]{4})', r'\\\\', text)
+
+            # Try to find JSON in the fixed text
+            start_idx = fixed_text.find('{')
+            end_idx = fixed_text.rfind('}')
+
+            if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
+                fixed_json_str = fixed_text[start_idx:end_idx+1]
+                result = json.loads(fixed_json_str)
+                print("Successfully parsed JSON after comprehensive fixing")
+                return True, result
+        except Exception as e:
+            print(f"Comprehensive fixing failed: {e}")
+
+        return False, None
+
+
+def validate_report(result) -> Optional[dict]:
+    """Validate a parsed report against ResearchReportOutput"""
+    try:
+        return ResearchReportOutput.model_validate(result).model_dump()
+    except ValidationError as e:
+        print(f"Report failed validation: {e}")
+        return None
+
+
+def finalize_report(stream_result: Optional[dict], full_response: str, structured: bool) -> Tuple[bool, Optional[dict]]:
+    """Turn generation output into a report dict, counting which path was used.
+
+    Paths, in order: the structured-output response or the streaming parser,
+    then the parse_json repair fallback. Each is counted under
+    report_parse.<path> so the fallback rate can be watched.
+    """
+    primary = "structured" if structured else "streaming"
+    if stream_result is not None:
+        report = validate_report(stream_result)
+        if report is not None:
+            metrics.increment(f"report_parse.{primary}")
+            return True, report
+        metrics.increment(f"report_parse.{primary}_invalid")
+
+    # Measured fallback: the whole-text repair parser
+    start = time.perf_counter()
+    success, result = parse_json(full_response)
+    metrics.observe("report_parse.repair_seconds", time.perf_counter() - start)
+    if success and isinstance(result, dict):
+        report = validate_report(result)
+        if report is not None:
+            metrics.increment("report_parse.repair")
+            return True, report
+        # Parsed, but not a report: a failure, so it is never cached as one
+        metrics.increment("report_parse.repair_invalid")
+        return False, None
+
+    metrics.increment("report_parse.failed")
+    return False, None
+
@@ -0,0 +1,239 @@
+import re
+import json
+from typing import Optional, List, Tuple, Any, Callable
+
+# Runs of ordinary string characters, consumed in one step
+_STRING_RUN = re.compile(r'[^"\\]+')
+# Characters that can make up a number or a true/false/null literal
+_SCALAR_RUN = re.compile(r'[-+0-9.eEtrufalsn]+')
+_WHITESPACE = " \t\r\n"
+
+_ESCAPES = {
+    '"': '"',
+    '\\': '\\',
+    '/': '/',
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+}
+
+
+class StreamingJSONParser:
+    """Incremental, resumable JSON parser.
+
+    Text can be fed in arbitrary chunks. Every time a value is completed,
+    on_value(path, value) is called, where path is the tuple of keys/indexes
+    leading to it, so callers can act on items as soon as they close.
+
+    It is lenient in the ways LLM output needs:
+    - anything before the first "{" (e.g. a ```json fence) and after the
+      root object closes is ignored
+    - invalid escapes such as "\\d" are kept as a literal backslash
+    - raw newlines and other control characters inside strings are allowed
+    """
+
+    def __init__(self, on_value: Optional[Callable[[Tuple, Any], None]] = None):
+        self.on_value = on_value
+        self._buffer = ""
+        self._pos = 0
+        # Stack frames: [container, path, pending_key, expecting_key]
+        self._stack: List[list] = []
+        self._in_string = False
+        self._string_parts: List[str] = []
+        self._started = False
+        self.done = False
+        self.root = None
+
+    def feed(self, text: str):
+        """Consume a chunk of text"""
+        if self.done or not text:
+            return
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        self._parse(final=False)
+
+    def close(self):
+        """Signal the end of input; raises ValueError if the JSON is incomplete"""
+        if not self.done:
+            self._parse(final=True)
+        if not self.done:
+            raise ValueError("Incomplete JSON document")
+        return self.root
+
+    def _path_for_child(self) -> Tuple:
+        container, path, pending_key, _ = self._stack[-1]
+        if isinstance(container, list):
+            return path + (len(container),)
+        return path + (pending_key,)
+
+    def _complete(self, value):
+        """Attach a finished value to its parent and report it"""
+        if not self._stack:
+            self.root = value
+            self.done = True
+            if self.on_value:
+                self.on_value((), value)
+            return
+        frame = self._stack[-1]
+        path = self._path_for_child()
+        if isinstance(frame[0], list):
+            frame[0].append(value)
+        else:
+            frame[0][frame[2]] = value
+            frame[2] = None
+        if self.on_value:
+            self.on_value(path, value)
+
+    def _open(self, container):
+        path = self._path_for_child() if self._stack else ()
+        self._stack.append([container, path, None, isinstance(container, dict)])
+
+    def _finish_string(self):
+        value = "".join(self._string_parts)
+        self._string_parts = []
+        self._in_string = False
+        if any("\ud800" <= char <= "\udfff" for char in value):
+            # Join \\u escaped surrogate pairs into real characters
+            value = value.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+        frame = self._stack[-1] if self._stack else None
+        if frame is not None and isinstance(frame[0], dict) and frame[3]:
+            frame[2] = value
+            frame[3] = False
+        else:
+            self._complete(value)
+
+    def _parse(self, final: bool):
+        buffer = self._buffer
+        length = len(buffer)
+        pos = self._pos
+
+        while pos < length and not self.done:
+            if self._in_string:
+                run = _STRING_RUN.match(buffer, pos)
+                if run:
+                    self._string_parts.append(run.group())
+                    pos = run.end()
+                    continue
+                char = buffer[pos]
+                if char == '"':
+                    pos += 1
+                    self._finish_string()
+                    continue
+                # Backslash escape
+                if pos + 1 >= length:
+                    if not final:
+                        break
+                    self._string_parts.append("\\")
+                    pos += 1
+                    continue
+                escaped = buffer[pos + 1]
+                if escaped in _ESCAPES:
+                    self._string_parts.append(_ESCAPES[escaped])
+                    pos += 2
+                elif escaped == "u":
+                    digits = buffer[pos + 2:pos + 6]
+                    if len(digits) < 4 and not final:
+                        break
+                    try:
+                        if len(digits) < 4:
+                            raise ValueError(digits)
+                        self._string_parts.append(chr(int(digits, 16)))
+                        pos += 6
+                    except ValueError:
+                        # Not a real \\u escape: keep the backslash
+                        self._string_parts.append("\\u")
+                        pos += 2
+                else:
+                    # Invalid escape: keep the backslash literally
+                    self._string_parts.append("\\" + escaped)
+                    pos += 2
+                continue
+
+            char = buffer[pos]
+            if not self._started:
+                # Skip code fences or chatter before the root object
+                start = buffer.find("{", pos)
+                if start == -1:
+                    pos = length
+                    break
+                pos = start + 1
+                self._started = True
+                self._open({})
+                continue
+
+            if char in _WHITESPACE or char == "," or char == ":":
+                pos += 1
+                if char == "," and self._stack and isinstance(self._stack[-1][0], dict):
+                    self._stack[-1][3] = True
+            elif char == '"':
+                self._in_string = True
+                pos += 1
+            elif char == "{":
+                self._open({})
+                pos += 1
+            elif char == "[":
+                self._open([])
+                pos += 1
+            elif char == "}" or char == "]":
+                frame = self._stack.pop()
+                pos += 1
+                self._complete(frame[0])
+            else:
+                run = _SCALAR_RUN.match(buffer, pos)
+                if not run:
+                    raise ValueError(f"Unexpected character {char!r} at offset {pos}")
+                if run.end() >= length and not final:
+                    # The number or literal may continue in the next chunk
+                    break
+                token = run.group()
+                try:
+                    value = json.loads(token)
+                except json.JSONDecodeError:
+                    raise ValueError(f"Invalid literal {token!r}")
+                pos = run.end()
+                self._complete(value)
+
+        self._pos = pos
+
+
+class StreamingReportParser:
+    """Parses a research report as it streams and reports each piece as soon
+    as it closes: the summary, each sections[] item and each sources[] item."""
+
+    def __init__(self):
+        self._events: List[Tuple[str, Any]] = []
+        self._parser = StreamingJSONParser(self._on_value)
+        self.failed = False
+        self.error: Optional[str] = None
+
+    def _on_value(self, path: Tuple, value: Any):
+        if path == ("summary",) and isinstance(value, str):
+            self._events.append(("summary", value))
+        elif len(path) == 2 and path[0] in ("sections", "sources") and isinstance(path[1], int):
+            self._events.append((path[0][:-1], value))
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk and return the (kind, value) items it completed,
+        where kind is "summary", "section" or "source" """
+        if not self.failed:
+            try:
+                self._parser.feed(text)
+            except ValueError as e:
+                self.failed = True
+                self.error = str(e)
+        events, self._events = self._events, []
+        return events
+
+    def result(self) -> Optional[dict]:
+        """The parsed report, or None if the stream was not a complete object"""
+        if self.failed:
+            return None
+        try:
+            root = self._parser.close()
+        except ValueError as e:
+            self.failed = True
+            self.error = str(e)
+            return None
+        return root if isinstance(root, dict) else None
@@ -0,0 +1,408 @@
+import re
+from typing import List, Optional, Tuple, Any
+
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, Spacer, Table, TableStyle, HRFlowable, Preformatted
+
+# Width of the text frame on a letter page with the report's 0.85" margins
+DEFAULT_FRAME_WIDTH = 8.5 * inch - 2 * 0.85 * inch
+
+# Deepest list level that still gets its own indent
+MAX_LIST_DEPTH = 3
+
+
+def _build_styles() -> dict:
+    """All paragraph styles used by the report, built once at import"""
+    base = getSampleStyleSheet()
+    styles = {}
+
+    styles["title"] = ParagraphStyle(
+        "CustomTitle",
+        parent=base["Title"],
+        fontSize=20,
+        spaceAfter=24,
+        alignment=1,  # Center alignment
+        textColor=colors.darkblue,
+    )
+    styles["h1"] = ParagraphStyle(
+        "CustomHeading1",
+        parent=base["Heading1"],
+        fontSize=16,
+        spaceBefore=16,
+        spaceAfter=10,
+        textColor=colors.darkblue,
+        borderWidth=0,
+        borderColor=colors.lightgrey,
+        borderPadding=5,
+        borderRadius=3,
+    )
+    styles["h2"] = ParagraphStyle(
+        "CustomHeading2",
+        parent=base["Heading2"],
+        fontSize=14,
+        spaceBefore=14,
+        spaceAfter=8,
+        textColor=colors.darkblue,
+    )
+    styles["h3"] = ParagraphStyle(
+        "CustomHeading3",
+        parent=base["Heading3"],
+        fontSize=12,
+        spaceBefore=12,
+        spaceAfter=6,
+        textColor=colors.darkblue,
+    )
+    styles["normal"] = ParagraphStyle(
+        "CustomNormal",
+        parent=base["Normal"],
+        fontSize=11,
+        spaceBefore=6,
+        spaceAfter=8,
+        leading=16,
+    )
+    for depth in range(MAX_LIST_DEPTH + 1):
+        styles[f"list{depth}"] = ParagraphStyle(
+            f"ListItem{depth}",
+            parent=styles["normal"],
+            leftIndent=30 + 20 * depth,
+            firstLineIndent=0,
+            spaceBefore=3,
+            spaceAfter=3,
+            bulletIndent=15 + 20 * depth,
+            bulletFontName="Helvetica",
+            bulletFontSize=11,
+            leading=16,
+        )
+    styles["blockquote"] = ParagraphStyle(
+        "Blockquote",
+        parent=styles["normal"],
+        leftIndent=40,
+        rightIndent=40,
+        fontName="Helvetica-Oblique",
+        textColor=colors.darkslategray,
+        borderWidth=0,
+        borderColor=colors.lightgrey,
+        borderPadding=10,
+        borderRadius=4,
+        backColor=colors.lightgrey.clone(alpha=0.2),
+    )
+    styles["code"] = ParagraphStyle(
+        "Code",
+        parent=styles["normal"],
+        fontName="Courier",
+        fontSize=9,
+        leading=12,
+        leftIndent=12,
+        borderPadding=6,
+        backColor=colors.whitesmoke,
+    )
+    styles["table_header"] = ParagraphStyle(
+        "TableHeader",
+        parent=styles["normal"],
+        fontName="Helvetica-Bold",
+        fontSize=10,
+        leading=12,
+        spaceBefore=0,
+        spaceAfter=0,
+        textColor=colors.darkblue,
+        alignment=1,
+    )
+    styles["table_cell"] = ParagraphStyle(
+        "TableCell",
+        parent=styles["normal"],
+        fontSize=9,
+        leading=11,
+        spaceBefore=0,
+        spaceAfter=0,
+    )
+    styles["date"] = ParagraphStyle(
+        "DateStyle",
+        parent=styles["normal"],
+        alignment=2,
+        fontSize=9,
+        textColor=colors.gray,
+    )
+    styles["section_title"] = ParagraphStyle(
+        "SectionTitle",
+        parent=styles["h1"],
+        backColor=colors.lightgrey.clone(alpha=0.3),
+        borderPadding=8,
+        borderWidth=0,
+        borderRadius=4,
+    )
+    styles["source_title"] = ParagraphStyle(
+        "SourceBox",
+        parent=styles["h2"],
+        fontSize=12,
+        spaceBefore=12,
+        spaceAfter=4,
+        backColor=colors.lightgrey.clone(alpha=0.15),
+        borderPadding=8,
+        borderWidth=0,
+        borderRadius=4,
+    )
+    styles["url"] = ParagraphStyle(
+        "URL",
+        parent=styles["normal"],
+        textColor=colors.blue,
+        fontSize=9,
+        spaceBefore=2,
+        spaceAfter=6,
+    )
+    styles["source"] = ParagraphStyle(
+        "Source",
+        parent=styles["normal"],
+        fontSize=10,
+        spaceBefore=4,
+        spaceAfter=6,
+        leading=14,
+    )
+    return styles
+
+
+STYLES = _build_styles()
+
+TABLE_STYLE = TableStyle([
+    ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+    ("BOTTOMPADDING", (0, 0), (-1, 0), 8),
+    ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+    ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+    ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.whitesmoke]),
+])
+
+# Inline markup, matched in one pass. Earlier alternatives win, so code spans
+# are never formatted and ** is tried before *.
+_INLINE = re.compile(
+    r"`(?P<code>[^`]+)`"
+    r"|\*\*(?P<bold>.+?)\*\*"
+    r"|(?<![\w_])__(?P<bold_u>.+?)__(?![\w_])"
+    r"|~~(?P<strike>.+?)~~"
+    r"|\[(?P<label>[^\]]+)\]\((?P<href>[^)\s]+)\)"
+    r"|\*(?P<italic>[^*\s][^*]*)\*"
+    r"|(?<![\w_])_(?P<italic_u>[^_\s][^_]*)_(?![\w_])"
+    r"|\^(?P<sup>[^^\s]+)\^"
+    r"|~(?P<sub>[^~\s]+)~"
+)
+
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_LIST_ITEM = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)$")
+_RULE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+_TABLE_SEPARATOR = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$")
+_CELL_SPLIT = re.compile(r"(?<!\\)\|")
+
+
+def escape(text: str) -> str:
+    """Escape text for ReportLab's paragraph markup"""
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _inline_replace(match: re.Match) -> str:
+    # lastgroup is the last group that matched, so links report "href"
+    kind = match.lastgroup
+    if kind == "href":
+        kind = "label"
+    value = match.group(kind)
+    if kind == "code":
+        return f'<font face="Courier">{escape(value)}</font>'
+    if kind in ("bold", "bold_u"):
+        return f"<b>{inline(value)}</b>"
+    if kind in ("italic", "italic_u"):
+        return f"<i>{inline(value)}</i>"
+    if kind == "strike":
+        return f"<strike>{inline(value)}</strike>"
+    if kind == "label":
+        href = escape(match.group("href")).replace('"', "&quot;")
+        return f'<link href="{href}">{inline(value)}</link>'
+    if kind == "sup":
+        return f"<super>{escape(value)}</super>"
+    return f"<sub>{escape(value)}</sub>"
+
+
+def inline(text: str) -> str:
+    """Convert inline markdown to ReportLab paragraph markup"""
+    parts = []
+    position = 0
+    for match in _INLINE.finditer(text):
+        parts.append(escape(text[position:match.start()]))
+        parts.append(_inline_replace(match))
+        position = match.end()
+    parts.append(escape(text[position:]))
+    return "".join(parts)
+
+
+def _split_row(line: str) -> List[str]:
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|") and not line.endswith("\\|"):
+        line = line[:-1]
+    return [cell.strip().replace("\\|", "|") for cell in _CELL_SPLIT.split(line)]
+
+
+def _is_table_start(lines: List[str], i: int) -> bool:
+    return (
+        "|" in lines[i]
+        and i + 1 < len(lines)
+        and _TABLE_SEPARATOR.match(lines[i + 1]) is not None
+    )
+
+
+def _starts_block(lines: List[str], i: int) -> bool:
+    line = lines[i]
+    return (
+        _FENCE.match(line) is not None
+        or _HEADING.match(line) is not None
+        or _LIST_ITEM.match(line) is not None
+        or line.lstrip().startswith(">")
+        or _RULE.match(line) is not None
+        or _is_table_start(lines, i)
+    )
+
+
+def tokenize(text: str) -> List[Tuple[Any, ...]]:
+    """Split markdown into block tokens in a single pass over its lines:
+    ("heading", level, text), ("para", text), ("item", depth, marker, text),
+    ("quote", text), ("code", text), ("table", rows), ("rule",) and
+    ("break",) between blocks."""
+    lines = text.replace("\r\n", "\n").split("\n")
+    tokens: List[Tuple[Any, ...]] = []
+    # Indents of the enclosing list items, to turn indentation into depth
+    list_indents: List[int] = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+
+        if not line.strip():
+            if tokens and tokens[-1] != ("break",):
+                tokens.append(("break",))
+            i += 1
+            continue
+
+        fence = _FENCE.match(line)
+        if fence:
+            marker = fence.group(1)
+            body = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith(marker):
+                body.append(lines[i])
+                i += 1
+            i += 1  # closing fence
+            tokens.append(("code", "\n".join(body)))
+            continue
+
+        heading = _HEADING.match(line)
+        if heading:
+            tokens.append(("heading", len(heading.group(1)), heading.group(2)))
+            list_indents = []
+            i += 1
+            continue
+
+        if _is_table_start(lines, i):
+            rows = [_split_row(line)]
+            i += 2  # header and separator
+            while i < len(lines) and "|" in lines[i] and lines[i].strip():
+                rows.append(_split_row(lines[i]))
+                i += 1
+            tokens.append(("table", rows))
+            list_indents = []
+            continue
+
+        if _RULE.match(line) and not _LIST_ITEM.match(line):
+            tokens.append(("rule",))
+            i += 1
+            continue
+
+        item = _LIST_ITEM.match(line)
+        if item:
+            indent = len(item.group(1).expandtabs(4))
+            while list_indents and indent < list_indents[-1]:
+                list_indents.pop()
+            if not list_indents or indent > list_indents[-1]:
+                list_indents.append(indent)
+            depth = min(len(list_indents) - 1, MAX_LIST_DEPTH)
+            marker = item.group(2)
+            text_lines = [item.group(3)]
+            i += 1
+            # Lazy continuation lines belong to the item
+            while i < len(lines) and lines[i].strip() and not _starts_block(lines, i):
+                text_lines.append(lines[i].strip())
+                i += 1
+            tokens.append(("item", depth, marker, " ".join(text_lines)))
+            continue
+        list_indents = []
+
+        if line.lstrip().startswith(">"):
+            quote = []
+            while i < len(lines) and lines[i].lstrip().startswith(">"):
+                quote.append(lines[i].lstrip()[1:].strip())
+                i += 1
+            tokens.append(("quote", " ".join(quote)))
+            continue
+
+        para = [line.strip()]
+        i += 1
+        while i < len(lines) and lines[i].strip() and not _starts_block(lines, i):
+            para.append(lines[i].strip())
+            i += 1
+        tokens.append(("para", " ".join(para)))
+
+    if tokens and tokens[-1] == ("break",):
+        tokens.pop()
+    return tokens
+
+
+def _table(rows: List[List[str]], width: float) -> Table:
+    columns = max(len(row) for row in rows)
+    data = []
+    for index, row in enumerate(rows):
+        style = STYLES["table_header"] if index == 0 else STYLES["table_cell"]
+        cells = row + [""] * (columns - len(row))
+        data.append([Paragraph(inline(cell), style) for cell in cells])
+    table = Table(data, colWidths=[width / columns] * columns, repeatRows=1)
+    table.setStyle(TABLE_STYLE)
+    return table
+
+
+def markdown_to_flowables(text: Optional[str], width: float = DEFAULT_FRAME_WIDTH) -> list:
+    """Convert a markdown string to a list of ReportLab flowables"""
+    flowables = []
+    if not text:
+        return flowables
+    in_list = False
+    for token in tokenize(text):
+        kind = token[0]
+        if in_list and kind != "item":
+            # A little space after each list
+            flowables.append(Spacer(1, 0.05 * inch))
+            in_list = False
+
+        if kind == "heading":
+            level = min(token[1], 3)
+            flowables.append(Paragraph(inline(token[2]), STYLES[f"h{level}"]))
+            flowables.append(Spacer(1, (0.1 if level == 1 else 0.05) * inch))
+        elif kind == "para":
+            flowables.append(Paragraph(inline(token[1]), STYLES["normal"]))
+        elif kind == "item":
+            _, depth, marker, item_text = token
+            bullet = "•" if marker in ("-", "*", "+") else marker.rstrip(")").rstrip(".") + "."
+            flowables.append(Paragraph(inline(item_text), STYLES[f"list{depth}"], bulletText=bullet))
+            in_list = True
+        elif kind == "quote":
+            flowables.append(Paragraph(inline(token[1]), STYLES["blockquote"]))
+            flowables.append(Spacer(1, 0.1 * inch))
+        elif kind == "code":
+            flowables.append(Preformatted(token[1], STYLES["code"], maxLineLength=90))
+            flowables.append(Spacer(1, 0.1 * inch))
+        elif kind == "table":
+            flowables.append(Spacer(1, 0.1 * inch))
+            flowables.append(_table(token[1], width))
+            flowables.append(Spacer(1, 0.2 * inch))
+        elif kind == "rule":
+            flowables.append(HRFlowable(width="100%", thickness=0.5, color=colors.lightgrey,
+                                        spaceBefore=0.1 * inch, spaceAfter=0.1 * inch))
+    if in_list:
+        flowables.append(Spacer(1, 0.05 * inch))
+    return flowables
@@ -0,0 +1,58 @@
+import threading
+from typing import Dict, Any
+
+# Process-wide metrics registry. Values are plain numbers so the snapshot can
+# be returned as JSON from the /metrics endpoint.
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+_timings: Dict[str, Dict[str, float]] = {}
+
+
+def increment(name: str, value: float = 1):
+    """Increase a counter by value"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float):
+    """Set a gauge to its current value"""
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value: float):
+    """Record a timing or size sample (count, total, max and last)"""
+    with _lock:
+        timing = _timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0})
+        timing["count"] += 1
+        timing["total"] += value
+        timing["max"] = max(timing["max"], value)
+        timing["last"] = value
+
+
+def get_counter(name: str) -> float:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot() -> Dict[str, Any]:
+    """Return a copy of every metric"""
+    with _lock:
+        timings = {
+            name: dict(timing, avg=timing["total"] / timing["count"] if timing["count"] else 0.0)
+            for name, timing in _timings.items()
+        }
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": timings,
+        }
+
+
+def reset():
+    """Clear every metric (used by tests)"""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timings.clear()
@@ -0,0 +1,199 @@
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Names the merger adds to every page's font resources
+STAMP_FONT = b"/FStamp"
+
+_STARTXREF = re.compile(rb"startxref\s+(\d+)\s+%%EOF\s*$")
+_XREF_ENTRY = re.compile(rb"(\d{10}) (\d{5}) ([nf])")
+_REF = re.compile(rb"(\d+) 0 R")
+_STREAM = re.compile(rb"\bstream\r?\n")
+
+
+class PDFMergeError(ValueError):
+    """Raised for PDFs the merger cannot take apart"""
+
+
+def _ref(match: Optional[re.Match], what: str) -> int:
+    if match is None:
+        raise PDFMergeError(f"PDF part has no {what}")
+    return int(match.group(1))
+
+
+def _read_objects(data: bytes) -> Tuple[Dict[int, bytes], bytes]:
+    """Split a PDF with a classic xref table into {number: body} and its trailer"""
+    match = _STARTXREF.search(data[-64:])
+    if match is None:
+        raise PDFMergeError("PDF part has no startxref")
+    xref_at = int(match.group(1))
+    trailer_at = data.index(b"trailer", xref_at)
+    offsets = sorted(
+        (int(offset), number)
+        for number, (offset, _, kind) in enumerate(_XREF_ENTRY.findall(data[xref_at:trailer_at]))
+        if kind == b"n"
+    )
+    objects = {}
+    for index, (offset, number) in enumerate(offsets):
+        end = offsets[index + 1][0] if index + 1 < len(offsets) else xref_at
+        chunk = data[offset:end]
+        start = chunk.index(b" obj") + len(b" obj")
+        stop = chunk.rindex(b"endobj")
+        objects[number] = chunk[start:stop].strip(b"\r\n")
+    return objects, data[trailer_at:]
+
+
+def _split_stream(body: bytes) -> Tuple[bytes, bytes]:
+    """The dictionary of an object, and its stream (with keyword) if any"""
+    match = _STREAM.search(body)
+    if match is None:
+        return body, b""
+    return body[:match.start()], body[match.start():]
+
+
+class PDFMerger:
+    """Concatenates the pages of ReportLab-generated PDFs into one PDF,
+    emitting each part's objects as soon as the part is added.
+
+    Only the simple structure ReportLab writes is supported: one xref
+    table, no object streams. stamp(page_number) may return extra content
+    drawn on every page with STAMP_FONT (Helvetica), e.g. page numbers,
+    which the parts cannot know when rendered independently.
+    """
+
+    def __init__(self, stamp: Optional[Callable[[int], bytes]] = None):
+        self.stamp = stamp
+        self.offset = 0
+        self.offsets: Dict[int, int] = {}
+        self.pages: List[int] = []
+        self.next_number = 4  # 1: catalog, 2: page tree, 3: stamp font
+        self._save_number: Optional[int] = None
+        self.outline: List[Tuple[str, int]] = []
+
+    def _emit(self, number: int, body: bytes) -> bytes:
+        chunk = b"%d 0 obj\n%s\nendobj\n" % (number, body)
+        self.offsets[number] = self.offset
+        self.offset += len(chunk)
+        return chunk
+
+    def header(self) -> bytes:
+        chunk = b"%PDF-1.4\n%\x93\x8c\x8b\x9e merged\n"
+        self.offset += len(chunk)
+        return chunk + self._emit(
+            3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+        )
+
+    def add(self, data: bytes, title: Optional[str] = None) -> bytes:
+        """Append a part's pages and return the bytes to write out.
+
+        A title adds an outline entry (bookmark) for the part's first page.
+        """
+        objects, trailer = _read_objects(data)
+        root = _ref(re.search(rb"/Root (\d+) 0 R", trailer), "catalog")
+        info = re.search(rb"/Info (\d+) 0 R", trailer)
+        tree = _ref(re.search(rb"/Pages (\d+) 0 R", objects[root]), "page tree")
+
+        # Walk the page tree for the leaf pages, in order
+        pages, nodes, stack = [], {root}, [tree]
+        while stack:
+            number = stack.pop()
+            body = objects[number]
+            if b"/Type /Pages" in body:
+                nodes.add(number)
+                kids = re.search(rb"/Kids\s*\[([^\]]*)\]", body)
+                stack.extend(reversed([int(n) for n in _REF.findall(kids.group(1))]))
+            else:
+                pages.append(number)
+        if info:
+            nodes.add(int(info.group(1)))
+
+        kept = [number for number in sorted(objects) if number not in nodes]
+        numbers = {}
+        for number in kept:
+            numbers[number] = self.next_number
+            self.next_number += 1
+        first_page = len(self.pages) + 1
+        position = {number: index for index, number in enumerate(pages)}
+        font_dicts = {
+            int(n) for page in pages for n in re.findall(rb"/Font (\d+) 0 R", objects[page])
+        }
+
+        def renumber(match):
+            return b"%d 0 R" % numbers[int(match.group(1))]
+
+        out = []
+        for number in kept:
+            dictionary, stream = _split_stream(objects[number])
+            if number in pages:
+                dictionary = re.sub(rb"/Parent \d+ 0 R", b"/Parent @", dictionary)
+            dictionary = _REF.sub(renumber, dictionary)
+            if number in pages:
+                dictionary = dictionary.replace(b"/Parent @", b"/Parent 2 0 R")
+                if self.stamp is not None:
+                    stamp = self.stamp(first_page + position[number])
+                    stamp_number = self.next_number
+                    self.next_number += 1
+                    out.append(self._emit(
+                        stamp_number,
+                        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stamp) + 2, b"Q\n" + stamp),
+                    ))
+                    # Save the graphics state before the page's own content so
+                    # the stamp starts from a clean one
+                    dictionary = re.sub(
+                        rb"/Contents (\d+) 0 R",
+                        lambda m: b"/Contents [ %d 0 R %s 0 R %d 0 R ]" % (self._save_state(out), m.group(1), stamp_number),
+                        dictionary,
+                    )
+            elif number in font_dicts and self.stamp is not None:
+                dictionary = dictionary.replace(b"<<", b"<<\n%s 3 0 R" % STAMP_FONT, 1)
+            out.append(self._emit(numbers[number], dictionary + (b"\n" + stream if stream else b"")))
+        self.pages.extend(numbers[page] for page in pages)
+        if title is not None and pages:
+            self.outline.append((title, numbers[pages[0]]))
+        return b"".join(out)
+
+    def _save_state(self, out: List[bytes]) -> int:
+        # One shared "q" stream serves every page
+        if self._save_number is None:
+            self._save_number = self.next_number
+            self.next_number += 1
+            out.append(self._emit(self._save_number, b"<< /Length 2 >>\nstream\nq\n\nendstream"))
+        return self._save_number
+
+    def finish(self) -> bytes:
+        """The page tree, catalog, xref table and trailer"""
+        kids = b" ".join(b"%d 0 R" % page for page in self.pages)
+        out = [self._emit(2, b"<< /Type /Pages /Count %d /Kids [ %s ] >>" % (len(self.pages), kids))]
+        catalog = b"<< /Type /Catalog /Pages 2 0 R"
+        if self.outline:
+            catalog += b" /Outlines %d 0 R /PageMode /UseOutlines" % self._outline(out)
+        out.append(self._emit(1, catalog + b" >>"))
+
+        size = self.next_number
+        xref = [b"xref\n0 %d\n0000000000 65535 f \n" % size]
+        for number in range(1, size):
+            xref.append(b"%010d 00000 n \n" % self.offsets[number])
+        xref_at = self.offset
+        xref.append(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref_at))
+        return b"".join(out) + b"".join(xref)
+
+    def _outline(self, out: List[bytes]) -> int:
+        root = self.next_number
+        first, last = root + 1, root + len(self.outline)
+        self.next_number = last + 1
+        for index, (title, page) in enumerate(self.outline):
+            number = first + index
+            entry = b"<< /Title %s /Parent %d 0 R /Dest [ %d 0 R /Fit ]" % (_pdf_string(title), root, page)
+            if number > first:
+                entry += b" /Prev %d 0 R" % (number - 1)
+            if number < last:
+                entry += b" /Next %d 0 R" % (number + 1)
+            out.append(self._emit(number, entry + b" >>"))
+        out.append(self._emit(
+            root, b"<< /Type /Outlines /First %d 0 R /Last %d 0 R /Count %d >>" % (first, last, len(self.outline))
+        ))
+        return root
+
+
+def _pdf_string(text: str) -> bytes:
+    text = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return b"(" + text.encode("latin-1", "replace") + b")"
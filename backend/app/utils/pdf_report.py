@@ -0,0 +1,303 @@
+import io
+import os
+import json
+import hashlib
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib import colors
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, HRFlowable
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from app.utils.markdown_pdf import STYLES, escape, markdown_to_flowables
+from app.utils.pdf_merge import STAMP_FONT
+
+# Bump whenever the layout below changes so cached PDFs are not reused
+TEMPLATE_VERSION = "2"
+
+PAGE_MARGIN = 0.85*inch
+
+
+def parse_report_fields(report_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Decode the sections/sources columns if they come back as JSON strings"""
+    if isinstance(report_data.get("sections"), str):
+        report_data["sections"] = json.loads(report_data["sections"])
+    if isinstance(report_data.get("sources"), str):
+        report_data["sources"] = json.loads(report_data["sources"])
+    return report_data
+
+
+def report_date(report_data: Dict[str, Any]) -> datetime:
+    """The date printed on the report: when it was created, so that a
+    report always renders to the same PDF"""
+    created_at = report_data.get("created_at")
+    if isinstance(created_at, str):
+        try:
+            return datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        except ValueError:
+            pass
+    return datetime.utcnow()
+
+
+def pdf_cache_key(report_data: Dict[str, Any]) -> str:
+    """Content address of a report's PDF: everything the layout reads, plus
+    the template version"""
+    body = report_data.get("report_json")
+    if body is None:
+        body = {key: report_data.get(key) for key in ("summary", "sections", "sources")}
+    if not isinstance(body, str):
+        body = json.dumps(body, sort_keys=True)
+    material = json.dumps([
+        TEMPLATE_VERSION,
+        report_data.get("topic"),
+        report_date(report_data).strftime("%Y-%m-%d"),
+        body,
+    ])
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def pdf_filename(report_data: Dict[str, Any]) -> str:
+    topic = str(report_data.get("topic") or "Research Report").encode("ascii", "replace").decode("ascii")
+    topic = topic.replace(" ", "_").replace('"', "")
+    return f"DeepR_Research_{topic}.pdf"
+
+
+def render_report_pdf_bytes(report_data: Dict[str, Any]) -> bytes:
+    """Render a report to PDF in memory"""
+    buffer = io.BytesIO()
+    render_report_pdf(report_data, buffer)
+    return buffer.getvalue()
+
+
+@dataclass
+class RenderedPDF:
+    """A rendered PDF: in memory, or spilled to a temporary file whose owner
+    must remove it"""
+    size: int
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+
+
+def render_report_pdf_spooled(report_data: Dict[str, Any], max_memory: int, directory: Optional[str] = None) -> RenderedPDF:
+    """Render a report, returning it in memory up to max_memory bytes and
+    spilling larger PDFs to a temporary file in directory.
+
+    ReportLab assembles the whole document before writing it out, so this
+    bounds what is handed back to the caller, not the render itself.
+    """
+    buffer = io.BytesIO()
+    render_report_pdf(report_data, buffer)
+    size = buffer.tell()
+    if size <= max_memory:
+        return RenderedPDF(size=size, data=buffer.getvalue())
+
+    fd, path = tempfile.mkstemp(dir=directory, prefix="deepr_", suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(buffer.getbuffer())
+    except BaseException:
+        os.remove(path)
+        raise
+    return RenderedPDF(size=size, path=path)
+
+
+def simple_sanitize(text) -> str:
+    """Strip characters the built-in PDF fonts cannot draw"""
+    if text is None:
+        return ""
+    return str(text).encode('ascii', 'replace').decode('ascii')
+
+
+def header_flowables(report_data: Dict[str, Any]) -> list:
+    """Title, date line and executive summary"""
+    content = []
+
+    # Add a spacer at the top for better layout
+    content.append(Spacer(1, 0.2*inch))
+
+    topic = simple_sanitize(report_data.get('topic', 'Research Report'))
+    content.append(Paragraph(escape(topic), STYLES["title"]))
+
+    date_text = f"Generated on: {report_date(report_data).strftime('%B %d, %Y')}"
+    content.append(Paragraph(date_text, STYLES["date"]))
+    content.append(Spacer(1, 0.3*inch))
+
+    content.append(HRFlowable(
+        width="100%",
+        thickness=1,
+        lineCap='round',
+        color=colors.lightgrey,
+        spaceBefore=0.1*inch,
+        spaceAfter=0.3*inch
+    ))
+
+    # Executive Summary - don't repeat "Executive Summary" title
+    summary = simple_sanitize(report_data.get("summary", "No summary available"))
+    content.extend(markdown_to_flowables(summary))
+    content.append(Spacer(1, 0.2*inch))
+    return content
+
+
+def section_flowables(section: Dict[str, Any]) -> list:
+    """One report section, starting on a new page"""
+    content = [PageBreak(), Spacer(1, 0.1*inch)]
+    title = simple_sanitize(section.get("title", "Untitled Section"))
+    content.append(Paragraph(escape(title), STYLES["section_title"]))
+    content.append(Spacer(1, 0.2*inch))
+    section_content = simple_sanitize(section.get("content", "No content available"))
+    content.extend(markdown_to_flowables(section_content))
+    return content
+
+
+def sources_flowables(sources: List[Dict[str, Any]]) -> list:
+    """The numbered source list, starting on a new page"""
+    content = [PageBreak(), Spacer(1, 0.1*inch)]
+    content.append(Paragraph("Sources", STYLES["section_title"]))
+    content.append(Spacer(1, 0.2*inch))
+
+    if not sources:
+        content.append(Paragraph("No sources available", STYLES["normal"]))
+        return content
+
+    for i, source in enumerate(sources):
+        title = simple_sanitize(source.get('title', f"Source {i+1}"))
+        content.append(Paragraph(f"{i+1}. {escape(title)}", STYLES["source_title"]))
+
+        url = simple_sanitize(source.get('url', 'No URL provided'))
+        # Truncate very long URLs
+        if len(url) > 80:
+            url = url[:77] + "..."
+        url = escape(url)
+        content.append(Paragraph(f"URL: <link href=\"{url}\">{url}</link>", STYLES["url"]))
+
+        if source.get("snippet"):
+            snippet = simple_sanitize(source.get('snippet', ''))
+            # Truncate very long snippets
+            if len(snippet) > 300:
+                snippet = snippet[:297] + "..."
+            content.append(Paragraph(f"<i>Description:</i> {escape(snippet)}", STYLES["source"]))
+
+        # Add some space between sources
+        content.append(Spacer(1, 0.2*inch))
+    return content
+
+
+def add_footer(canvas, doc, page_number: bool = True):
+    """Footer line, credit and page number drawn on every page"""
+    canvas.saveState()
+    canvas.setStrokeColor(colors.lightgrey)
+    canvas.line(doc.leftMargin, 0.5*inch, doc.width + doc.leftMargin, 0.5*inch)
+
+    canvas.setFont('Helvetica-Oblique', 8)
+    canvas.setFillColor(colors.grey)
+    footer_text = "Generated by DeepR - raihankhan.dev"
+    canvas.drawCentredString(doc.width/2 + doc.leftMargin, 0.35*inch, footer_text)
+
+    if page_number:
+        canvas.setFont('Helvetica', 8)
+        canvas.drawRightString(doc.width + doc.leftMargin, 0.35*inch, f"Page {doc.page}")
+    canvas.restoreState()
+
+
+def add_footer_without_page_number(canvas, doc):
+    add_footer(canvas, doc, page_number=False)
+
+
+def page_number_stamp(page: int) -> bytes:
+    """PDF content drawing the footer's page number, for pages rendered in
+    separate groups and numbered when merged (see PDFMerger)"""
+    text = f"Page {page}"
+    x = letter[0] - PAGE_MARGIN - stringWidth(text, 'Helvetica', 8)
+    grey = " ".join(f"{c:g}" for c in colors.grey.rgb())
+    return (
+        f"BT {STAMP_FONT.decode()} 8 Tf {grey} rg 1 0 0 1 {x:.2f} {0.35*inch:.2f} Tm ({text}) Tj ET"
+    ).encode("ascii")
+
+
+def report_document(output) -> SimpleDocTemplate:
+    """The page template every report is laid out on"""
+    return SimpleDocTemplate(
+        output,
+        pagesize=letter,
+        rightMargin=PAGE_MARGIN,
+        leftMargin=PAGE_MARGIN,
+        topMargin=PAGE_MARGIN,
+        bottomMargin=PAGE_MARGIN
+    )
+
+
+@dataclass
+class PageGroup:
+    """A run of pages that can be laid out on its own: every section starts
+    on a new page, so the document splits cleanly at section boundaries"""
+    header: bool = False
+    first_section: int = 0
+    last_section: int = 0
+    sources: bool = False
+
+
+def page_groups(report_data: Dict[str, Any], sections_per_group: int) -> List[PageGroup]:
+    """Split a report into page groups of up to sections_per_group sections.
+    The first group carries the title page, the last one the sources."""
+    report_data = parse_report_fields(report_data)
+    count = len(report_data.get("sections") or [])
+    sections_per_group = max(1, sections_per_group)
+    groups = [PageGroup(header=True)]
+    for start in range(0, count, sections_per_group):
+        groups.append(PageGroup(first_section=start, last_section=min(count, start + sections_per_group)))
+    groups[-1].sources = True
+    return groups
+
+
+def render_page_group(report_data: Dict[str, Any], group: PageGroup) -> bytes:
+    """Render one page group to a standalone PDF without page numbers, to
+    be merged with the others by PDFMerger"""
+    report_data = parse_report_fields(dict(report_data))
+    content = header_flowables(report_data) if group.header else []
+    for section in (report_data.get("sections") or [])[group.first_section:group.last_section]:
+        content.extend(section_flowables(section))
+    if group.sources:
+        content.extend(sources_flowables(report_data.get("sources") or []))
+    if content and isinstance(content[0], PageBreak):
+        # The group already starts on a fresh page
+        content = content[1:]
+
+    buffer = io.BytesIO()
+    doc = report_document(buffer)
+    doc.build(content, onFirstPage=add_footer_without_page_number, onLaterPages=add_footer_without_page_number)
+    return buffer.getvalue()
+
+
+def render_contents_pdf(reports: List[Dict[str, Any]]) -> bytes:
+    """A contents page listing the reports of a combined export, in order"""
+    content = [Spacer(1, 0.2*inch), Paragraph("Research Reports", STYLES["title"])]
+    content.append(Paragraph(f"{len(reports)} reports", STYLES["date"]))
+    content.append(Spacer(1, 0.3*inch))
+    for i, report_data in enumerate(reports):
+        topic = escape(simple_sanitize(report_data.get("topic", "Research Report")))
+        date = report_date(report_data).strftime('%B %d, %Y')
+        content.append(Paragraph(f"{i+1}. {topic}", STYLES["source_title"]))
+        content.append(Paragraph(date, STYLES["source"]))
+
+    buffer = io.BytesIO()
+    doc = report_document(buffer)
+    doc.build(content, onFirstPage=add_footer_without_page_number, onLaterPages=add_footer_without_page_number)
+    return buffer.getvalue()
+
+
+def render_report_pdf(report_data: Dict[str, Any], output):
+    """Lay out a research report with ReportLab and write the PDF to output,
+    a file path or a binary file object"""
+    report_data = parse_report_fields(dict(report_data))
+
+    content = header_flowables(report_data)
+    for section in report_data.get("sections") or []:
+        content.extend(section_flowables(section))
+    content.extend(sources_flowables(report_data.get("sources") or []))
+
+    doc = report_document(output)
+    doc.build(content, onFirstPage=add_footer, onLaterPages=add_footer)
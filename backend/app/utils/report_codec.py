@@ -0,0 +1,154 @@
+import json
+import zlib
+import base64
+from typing import Any, Dict, Mapping, Optional, Set
+
+from app.utils.source_urls import source_id
+
+# Report rows are stored as a small uncompressed header (the columns list
+# views and lookups filter or show) plus one compressed body. The body is
+# the report JSON exactly as generated, so report_json, and the PDF cache
+# keys derived from it, survive a round trip unchanged.
+#
+# Versions:
+#   None  legacy rows: summary/sections/sources columns plus report_json
+#   1     zlib-compressed report JSON, base64 encoded, in the body column
+#   2     as 1, but sources found in the source registry are stored as
+#         {"ref": id, "title": ..., "snippet": ...}; their url comes from
+#         the registry when the row is read, unless the report's own url
+#         differs from the registry's and is stored too
+STORAGE_VERSION = 2
+SOURCE_FIELDS = ["title", "url", "snippet"]
+COMPRESSION_LEVEL = 6
+
+# Fields that live in the compressed body
+BODY_FIELDS = ("summary", "sections", "sources", "report_json")
+# Columns a row needs for decode_report() to rebuild the body fields
+STORAGE_COLUMNS = ("storage_version", "body") + BODY_FIELDS
+
+
+def needs_body(columns: str) -> bool:
+    """Whether a comma-separated column list asks for body fields"""
+    names = {name.strip() for name in columns.split(",")}
+    return "*" in names or not names.isdisjoint(BODY_FIELDS)
+
+
+def storage_columns(columns: str) -> str:
+    """The columns to fetch from the database to answer columns"""
+    if not needs_body(columns) or columns.strip() == "*":
+        return columns
+    names = [name.strip() for name in columns.split(",") if name.strip() not in BODY_FIELDS]
+    return ", ".join(names + list(STORAGE_COLUMNS))
+
+
+def _report_json(report: Dict[str, Any]) -> str:
+    body = report.get("report_json")
+    if isinstance(body, str):
+        return body
+    fields = {}
+    for key in ("summary", "sections", "sources"):
+        value = report.get(key)
+        fields[key] = json.loads(value) if key != "summary" and isinstance(value, str) else value
+    return json.dumps(fields)
+
+
+def _source_refs(text: str, sources: Optional[Mapping[str, Dict[str, Any]]]) -> Optional[str]:
+    """The report JSON with registered sources replaced by references, or
+    None if nothing can be referenced without changing the report"""
+    if not sources:
+        return None
+    result = json.loads(text)
+    # Reading the row rebuilds report_json with json.dumps, so only reports
+    # it reproduces exactly can be stored this way
+    if not isinstance(result, dict) or not isinstance(result.get("sources"), list) or json.dumps(result) != text:
+        return None
+    stored, referenced = [], False
+    for source in result["sources"]:
+        entry = sources.get(source_id(source.get("url") or "")) if isinstance(source, dict) else None
+        if entry is not None and list(source) == SOURCE_FIELDS:
+            # The title stays the report's own; only the source's identity
+            # is shared
+            ref = {"ref": entry["id"], "title": source["title"], "snippet": source["snippet"]}
+            if source["url"] != entry["url"]:
+                ref["url"] = source["url"]
+            stored.append(ref)
+            referenced = True
+        else:
+            stored.append(source)
+    return json.dumps(dict(result, sources=stored)) if referenced else None
+
+
+def encode_report(report: Dict[str, Any], sources: Optional[Mapping[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """The row to store for a report. sources maps registry ids to registry
+    rows; sources found there are stored as references. Already encoded
+    rows pass through."""
+    if report.get("storage_version") is not None:
+        return dict(report)
+    row = {key: value for key, value in report.items() if key not in BODY_FIELDS}
+    text = _report_json(report)
+    referenced = _source_refs(text, sources)
+    compressed = zlib.compress((referenced or text).encode(), COMPRESSION_LEVEL)
+    row["body"] = base64.b64encode(compressed).decode()
+    row["storage_version"] = STORAGE_VERSION if referenced else 1
+    # Cleared explicitly so an upsert over a legacy row drops the old copies
+    row.update({key: None for key in BODY_FIELDS})
+    return row
+
+
+def decode_report(row: Dict[str, Any], sources: Optional[Mapping[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """A stored row with its body fields restored, in the shape reports had
+    before the codec; legacy rows are returned unchanged.
+
+    Source references are resolved from sources (registry id to registry
+    row). Any that are missing stay as {"ref", ...} entries, with
+    report_json None, until resolve_sources() is given their rows.
+    """
+    version: Optional[int] = row.get("storage_version")
+    if version is None:
+        return {key: value for key, value in row.items() if key not in ("storage_version", "body")}
+    if version not in (1, STORAGE_VERSION):
+        raise ValueError(f"Unknown report storage version: {version}")
+    text = zlib.decompress(base64.b64decode(row["body"])).decode()
+    result = json.loads(text)
+    report = {key: value for key, value in row.items() if key not in STORAGE_COLUMNS}
+    report.update(
+        summary=result.get("summary", ""),
+        sections=result.get("sections", []),
+        sources=result.get("sources", []),
+        report_json=text,
+    )
+    if version == 1:
+        return report
+    report["_body"] = result
+    return resolve_sources(report, sources or {})
+
+
+def unresolved_sources(report: Dict[str, Any]) -> Set[str]:
+    """Registry ids a decoded report still needs"""
+    if "_body" not in report:
+        return set()
+    return {source["ref"] for source in report["sources"] if "ref" in source}
+
+
+def resolve_sources(report: Dict[str, Any], sources: Mapping[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Fill in a decoded report's source references from registry rows"""
+    if "_body" not in report:
+        return report
+    resolved = []
+    for source in report["sources"]:
+        entry = sources.get(source["ref"]) if "ref" in source else None
+        if entry is not None:
+            source = {
+                "title": source.get("title", entry["title"]),
+                "url": source.get("url", entry["url"]),
+                "snippet": source["snippet"],
+            }
+        resolved.append(source)
+    report["sources"] = resolved
+    if any("ref" in source for source in resolved):
+        report["report_json"] = None
+        return report
+    result = report.pop("_body")
+    result["sources"] = resolved
+    report["report_json"] = json.dumps(result)
+    return report
@@ -0,0 +1,48 @@
+import hashlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track the click and never change the page.
+# Plain "ref" is not one of them: on some sites (GitHub's ?ref=<branch>) it
+# selects the content.
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "ref_src", "ref_url", "_ga", "_gl", "spm", "si",
+}
+TRACKING_PREFIXES = ("utm_",)
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+
+def _is_tracking(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def clean_url(url: str) -> str:
+    """The URL without tracking parameters, fragment or default port, and
+    with a lowercase scheme and host. Still a working link."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and str(port) != DEFAULT_PORTS.get(scheme):
+        host += f":{port}"
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _is_tracking(k)])
+    return urlunsplit((scheme, host, parts.path, query, ""))
+
+
+def normalize_url(url: str) -> str:
+    """Key under which URLs count as the same source: clean_url without the
+    scheme, "www." or a trailing slash, and with the query sorted"""
+    parts = urlsplit(clean_url(url))
+    host = parts.netloc[4:] if parts.netloc.startswith("www.") else parts.netloc
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    key = host + parts.path.rstrip("/")
+    return f"{key}?{query}" if query else key
+
+
+def source_id(url: str) -> str:
+    """Stable registry id of the source a URL points to"""
+    return hashlib.sha256(normalize_url(url).encode()).hexdigest()[:16]
@@ -0,0 +1,26 @@
+import argparse
+import asyncio
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.services.repository import backfill_report_storage, close_repository
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert saved reports to the compressed storage format")
+    parser.add_argument("--batch-size", type=int, default=100, help="Reports to list per query")
+    args = parser.parse_args()
+
+    async def main():
+        try:
+            return await backfill_report_storage(batch_size=args.batch_size)
+        finally:
+            await close_repository()
+
+    stats = asyncio.run(main())
+    print(f"Scanned {stats['scanned']} reports, converted {stats['converted']}, "
+          f"moved the sources of {stats['upgraded']} to the source registry")
+    if stats["converted"] or stats["upgraded"]:
+        saved = 1 - stats["bytes_after"] / stats["bytes_before"]
+        print(f"Stored size {stats['bytes_before']} -> {stats['bytes_after']} bytes ({saved:.0%} smaller)")
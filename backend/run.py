@@ -1,4 +1,7 @@
+import os
 import uvicorn
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    # Run research jobs inside the dev server unless a separate worker is used
+    os.environ.setdefault("EMBEDDED_WORKER", "true")
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,293 @@
+import os
+import json
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+import httpx
+
+from app.main import app
+from app.routers import auth, research
+from app.routers.auth import get_current_user
+from app.services.checkpoints import Checkpoint
+from app.services.gemini_service import GeminiService, set_gemini_service
+from app.services.job_queue import JobQueue, MemoryBroker, Worker, set_job_queue
+from app.services.progress_bus import MemoryProgressBus, get_progress_bus, set_progress_bus
+from app.services.report_pipeline import PLANNER_PROMPT, SECTION_PROMPT, SUMMARY_PROMPT
+from app.services.repository import MemoryRepository, set_repository
+from app.services.task_store import MemoryTaskStore, get_task_store, set_task_store
+from app.utils import metrics
+from app.utils.report_codec import decode_report
+
+ADMIN = {"id": 1, "email": "admin@test.dev", "username": "admin"}
+USER = {"id": 2, "email": "user@test.dev", "username": "user"}
+N_SECTIONS = 5
+FAILING_SECTION = 3
+# A single-call report long enough to be checkpointed several times
+LONG_REPORT = json.dumps({
+    "summary": "Summary",
+    "sections": [{"title": f"Section {i}", "content": "Some content. " * 300} for i in range(5)],
+    "sources": [],
+})
+CHUNK = 500
+
+
+class FlakyModels:
+    """Fake client.aio.models whose first attempt dies part way through"""
+
+    def __init__(self):
+        self.failures_left = 1
+        self.section_calls = []
+        self.resumed_prompts = []
+
+    async def generate_content_stream(self, model, contents, config):
+        prompt = contents[0].parts[0].text
+        if prompt.startswith(PLANNER_PROMPT):
+            return self.reply(json.dumps({"sections": [{"title": f"Part {i}"} for i in range(N_SECTIONS)]}))
+        if prompt.startswith(SECTION_PROMPT):
+            index = int(prompt.rsplit("Write section ", 1)[1].split(":")[0]) - 1
+            self.section_calls.append(index)
+            if index == FAILING_SECTION and self.failures_left:
+                self.failures_left -= 1
+                # Fails after the other sections have finished
+                return self.reply("", delay=0.05, error=RuntimeError("Gemini unavailable"))
+            return self.reply(json.dumps({"content": f"Content of part {index}. " * 100, "sources": []}))
+        if prompt.startswith(SUMMARY_PROMPT):
+            return self.reply("Summary")
+
+        # Single-call generation: the first attempt dies 60% of the way through
+        if "PARTIAL RESPONSE>>>" in prompt:
+            partial = prompt.split("<<<PARTIAL RESPONSE\n", 1)[1].rsplit("\nPARTIAL RESPONSE>>>", 1)[0]
+            self.resumed_prompts.append(partial)
+            assert LONG_REPORT.startswith(partial)
+            return self.reply(LONG_REPORT[len(partial):])
+        if self.failures_left:
+            self.failures_left -= 1
+            cut = len(LONG_REPORT) * 6 // 10
+            return self.reply(LONG_REPORT[:cut], error=RuntimeError("Connection reset"))
+        return self.reply(LONG_REPORT)
+
+    def reply(self, text, delay=0.0, error=None):
+        async def stream():
+            await asyncio.sleep(delay)
+            for i in range(0, len(text), CHUNK):
+                yield SimpleNamespace(text=text[i:i + CHUNK])
+                await asyncio.sleep(0)
+            if error is not None:
+                raise error
+        return stream()
+
+
+def setup(models):
+    metrics.reset()
+    db = MemoryRepository()
+    queue = JobQueue(MemoryBroker())
+    set_repository(db)
+    set_task_store(MemoryTaskStore())
+    set_progress_bus(MemoryProgressBus())
+    set_job_queue(queue)
+    set_gemini_service(GeminiService(client=SimpleNamespace(aio=SimpleNamespace(models=models))))
+    return db, queue
+
+
+def teardown():
+    set_repository(None)
+    set_task_store(None)
+    set_progress_bus(None)
+    set_job_queue(None)
+    set_gemini_service(None)
+    app.dependency_overrides.pop(get_current_user, None)
+
+
+async def run_next_job(queue, worker):
+    job = await queue.reserve(["default"])
+    await worker.run_job(job)
+    return job
+
+
+async def submit(queue, max_attempts=3):
+    research_id = str(uuid.uuid4())
+    await get_task_store().create(research_id, user_id=USER["id"], topic="Tides")
+    payload = {"research_id": research_id, "topic": "Tides", "additional_context": None, "user_id": USER["id"]}
+    await queue.enqueue("conduct_research", payload, job_id=research_id, max_attempts=max_attempts)
+    return research_id
+
+
+def test_retry_resumes_finished_sections():
+    models = FlakyModels()
+    db, queue = setup(models)
+    worker = Worker(queue, retry_delay=0)
+
+    async def run():
+        research_id = await submit(queue)
+        await run_next_job(queue, worker)
+        checkpoint = await Checkpoint.load(research_id)
+        first_calls = list(models.section_calls)
+        await run_next_job(queue, worker)
+        return research_id, checkpoint, first_calls, await get_task_store().get(research_id)
+
+    try:
+        research_id, checkpoint, first_calls, task = asyncio.run(run())
+        leftover = asyncio.run(Checkpoint.load(research_id))
+    finally:
+        teardown()
+
+    # The failed attempt saved the outline and every section but the one that failed
+    assert len(checkpoint.outline) == N_SECTIONS
+    assert sorted(checkpoint.sections) == [i for i in range(N_SECTIONS) if i != FAILING_SECTION]
+    # The retry only wrote the missing section
+    assert sorted(first_calls) == list(range(N_SECTIONS))
+    assert models.section_calls[len(first_calls):] == [FAILING_SECTION]
+    assert task["status"] == "completed"
+    report = decode_report(db.reports[0], db.source_index)
+    assert [section["title"] for section in report["sections"]] == [f"Part {i}" for i in range(N_SECTIONS)]
+    # The checkpoint is dropped once the report is saved
+    assert leftover.data == {}
+
+    saved = metrics.snapshot()["timings"]["research.resume_tokens_saved_per_retry"]
+    assert saved["count"] == 1 and saved["last"] == checkpoint.tokens() > 0
+    print(f"Planned retry: {N_SECTIONS - 1} of {N_SECTIONS} sections reused, {saved['last']:.0f} tokens saved")
+
+
+def test_single_call_retry_continues_the_text():
+    models = FlakyModels()
+    db, queue = setup(models)
+    worker = Worker(queue, retry_delay=0)
+    research.RESEARCH_PIPELINE = "single"
+
+    async def run():
+        research_id = await submit(queue)
+        await run_next_job(queue, worker)
+        checkpoint = await Checkpoint.load(research_id)
+        await run_next_job(queue, worker)
+        return checkpoint, await get_task_store().get(research_id)
+
+    try:
+        checkpoint, task = asyncio.run(run())
+    finally:
+        research.RESEARCH_PIPELINE = "planned"
+        teardown()
+
+    assert task["status"] == "completed"
+    # The retry was asked to continue the checkpointed text rather than restart
+    assert models.resumed_prompts == [checkpoint.text] and len(checkpoint.text) > len(LONG_REPORT) // 2
+    report = decode_report(db.reports[0], db.source_index)
+    assert report["report_json"] == json.dumps(json.loads(LONG_REPORT)) and report["topic_key"] is not None
+    saved = metrics.snapshot()["timings"]["research.resume_tokens_saved_per_retry"]["last"]
+    print(f"Single-call retry: {len(checkpoint.text)} of {len(LONG_REPORT)} chars reused, {saved:.0f} tokens saved")
+
+
+def test_final_failure_drops_the_streamed_text():
+    models = FlakyModels()
+    db, queue = setup(models)
+    worker = Worker(queue, retry_delay=0)
+    research.RESEARCH_PIPELINE = "single"
+
+    async def run():
+        research_id = await submit(queue, max_attempts=1)
+        await run_next_job(queue, worker)
+        return await get_task_store().get(research_id), await get_progress_bus().partial_text(research_id)
+
+    try:
+        task, text = asyncio.run(run())
+    finally:
+        research.RESEARCH_PIPELINE = "planned"
+        teardown()
+
+    assert task["status"] == "failed" and text == ""
+    print("Final failure text test passed")
+
+
+def test_retry_after_the_report_is_saved():
+    models = FlakyModels()
+    models.failures_left = 0
+    db, queue = setup(models)
+    worker = Worker(queue, retry_delay=0)
+    settle_followers = research.settle_followers
+    calls = []
+
+    async def flaky_settle(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("Task store unavailable")
+        await settle_followers(*args)
+
+    research.settle_followers = flaky_settle
+
+    async def run():
+        research_id = await submit(queue)
+        await run_next_job(queue, worker)
+        await run_next_job(queue, worker)
+        return await get_task_store().get(research_id)
+
+    try:
+        task = asyncio.run(run())
+    finally:
+        research.settle_followers = settle_followers
+        teardown()
+
+    # The first attempt saved the report before failing; the retry replaced it
+    assert len(calls) == 2 and task["status"] == "completed"
+    assert len(db.reports) == 1
+    print("Retry after save test passed")
+
+
+def test_admin_lists_and_resumes_interrupted_jobs():
+    models = FlakyModels()
+    db, queue = setup(models)
+    worker = Worker(queue, retry_delay=0)
+    auth.ADMIN_EMAILS.add(ADMIN["email"])
+
+    async def call(user, method, path):
+        app.dependency_overrides[get_current_user] = lambda: user
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, path)
+
+    async def run():
+        # A job with no retries left fails for good on its first error
+        research_id = await submit(queue, max_attempts=1)
+        await run_next_job(queue, worker)
+        assert (await get_task_store().get(research_id))["status"] == "failed"
+
+        forbidden = await call(USER, "GET", "/api/admin/jobs/interrupted")
+        listed = await call(ADMIN, "GET", "/api/admin/jobs/interrupted")
+        resumed = await call(ADMIN, "POST", f"/api/admin/jobs/{research_id}/resume")
+        task = await get_task_store().get(research_id)
+        again = await call(ADMIN, "POST", f"/api/admin/jobs/{research_id}/resume")
+
+        await run_next_job(queue, worker)
+        finished = await call(ADMIN, "GET", "/api/admin/jobs/interrupted")
+        return research_id, forbidden, listed, resumed, task, again, finished, await get_task_store().get(research_id)
+
+    try:
+        research_id, forbidden, listed, resumed, task, again, finished, final = asyncio.run(run())
+    finally:
+        auth.ADMIN_EMAILS.discard(ADMIN["email"])
+        teardown()
+
+    assert forbidden.status_code == 403
+    jobs = listed.json()["jobs"]
+    assert len(jobs) == 1 and jobs[0]["research_id"] == research_id
+    assert jobs[0]["state"] == "failed" and jobs[0]["error"] == "Gemini unavailable"
+    assert jobs[0]["outline_sections"] == N_SECTIONS and jobs[0]["sections_done"] == N_SECTIONS - 1
+    assert resumed.status_code == 200 and resumed.json()["tokens_saved"] == jobs[0]["tokens_saved"] > 0
+    assert task["status"] == "in_progress" and task["error"] is None
+    # A queued job is not interrupted and cannot be resumed twice
+    assert again.status_code == 404
+    assert final["status"] == "completed" and finished.json()["jobs"] == []
+    assert len(db.reports) == 1
+    print("Admin resume test passed")
+
+
+if __name__ == "__main__":
+    test_retry_resumes_finished_sections()
+    test_single_call_retry_continues_the_text()
+    test_final_failure_drops_the_streamed_text()
+    test_retry_after_the_report_is_saved()
+    test_admin_lists_and_resumes_interrupted_jobs()
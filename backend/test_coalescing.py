@@ -0,0 +1,145 @@
+import os
+import asyncio
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+import httpx
+
+from app.main import app
+from app.routers import research
+from app.routers.auth import get_current_user
+from app.services.gemini_service import GeminiService, set_gemini_service
+from app.services.job_queue import JobQueue, MemoryBroker, set_job_queue
+from app.services.progress_bus import MemoryProgressBus, set_progress_bus
+from app.services.report_cache import ReportCache, set_report_cache
+from app.services.task_store import MemoryTaskStore, set_task_store
+from app.utils import metrics
+from app.utils.report_codec import decode_report
+from app.services.repository import MemoryRepository, set_repository
+from test_concurrency import FakeGeminiClient, CALLS_PER_REPORT
+
+USERS = [{"id": i, "email": f"user{i}@test.dev", "username": f"user{i}"} for i in range(1, 4)]
+
+
+async def submit_as(user, topic):
+    """POST /api/research as the given user"""
+    app.dependency_overrides[get_current_user] = lambda: user
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/api/research/", json={"topic": topic})
+    assert response.status_code == 200
+    return response.json()["research_id"]
+
+
+async def run_coalescing(fail: bool):
+    db = MemoryRepository()
+    store = MemoryTaskStore()
+    queue = JobQueue(MemoryBroker())
+    set_repository(db)
+    set_task_store(store)
+    set_job_queue(queue)
+    set_progress_bus(MemoryProgressBus())
+    set_report_cache(ReportCache(repository=db, ttl=3600))
+    set_gemini_service(GeminiService(client=FakeGeminiClient()))
+
+    try:
+        ids = [await submit_as(user, "Deep sea mining") for user in USERS]
+        leader_id = ids[0]
+
+        # Only the first submission queued a generation
+        job = await queue.reserve(["default"])
+        assert job.id == leader_id
+        assert await queue.reserve(["default"]) is None
+        for follower_id in ids[1:]:
+            assert (await store.get(follower_id))["leader_id"] == leader_id
+
+        if fail:
+            await research.on_research_failure(job.payload, "Gemini unavailable", final=True)
+        else:
+            await research.conduct_research(**job.payload)
+
+        tasks = [await store.get(research_id) for research_id in ids]
+        reports = {row["id"]: decode_report(row, db.source_index) for row in db.reports}
+        # The topic's slot is free again for the next generation
+        next_id = await submit_as(USERS[0], "Deep sea mining")
+        next_task = await store.get(next_id)
+        return ids, tasks, reports, next_task
+    finally:
+        set_repository(None)
+        set_task_store(None)
+        set_job_queue(None)
+        set_progress_bus(None)
+        set_report_cache(None)
+        set_gemini_service(None)
+        app.dependency_overrides.pop(get_current_user, None)
+
+
+def test_identical_requests_share_one_generation():
+    metrics.reset()
+    ids, tasks, reports, next_task = asyncio.run(run_coalescing(fail=False))
+
+    assert len(set(ids)) == 3
+    assert [task["status"] for task in tasks] == ["completed"] * 3
+    # Every requester owns a copy of the single generated report
+    for research_id, user in zip(ids, USERS):
+        assert reports[research_id]["user_id"] == user["id"]
+        assert reports[research_id]["summary"] == "Summary"
+    assert metrics.get_counter("research.coalesced") == 2
+    assert metrics.get_counter("gemini.requests") == CALLS_PER_REPORT
+    # The finished report is now served from the report cache
+    assert next_task["status"] == "completed" and "leader_id" not in next_task
+    print("Coalescing test passed")
+
+
+def test_followers_fail_with_the_shared_generation():
+    ids, tasks, reports, next_task = asyncio.run(run_coalescing(fail=True))
+
+    assert [task["status"] for task in tasks] == ["failed"] * 3
+    assert all(task["error"] == "Gemini unavailable" for task in tasks)
+    assert reports == {}
+    # A new request starts a new generation instead of attaching to the failed one
+    assert next_task["status"] == "in_progress" and "leader_id" not in next_task
+    print("Coalesced failure test passed")
+
+
+def test_dead_leader_is_not_followed():
+    store = MemoryTaskStore()
+    queue = JobQueue(MemoryBroker(), visibility_timeout=0.05)
+    set_task_store(store)
+    set_job_queue(queue)
+    set_report_cache(ReportCache(repository=MemoryRepository(), ttl=3600))
+
+    async def run():
+        leader_id = await submit_as(USERS[0], "Deep sea mining")
+        follower_id = await submit_as(USERS[1], "Deep sea mining")
+        # The leader's worker dies mid-job and never settles the task record
+        await queue.reserve(["default"])
+        await asyncio.sleep(0.1)
+        taken_over_id = await submit_as(USERS[2], "Deep sea mining")
+        # Its job then fails for good without running the failure hook
+        queue.broker.fail(leader_id, "Worker lost")
+        follower = await research.get_owned_task(follower_id, USERS[1]["id"])
+        return leader_id, follower, await store.get(taken_over_id), await store.get(research.inflight_key("Deep sea mining", None))
+
+    try:
+        leader_id, follower, taken_over, claim = asyncio.run(run())
+    finally:
+        set_task_store(None)
+        set_job_queue(None)
+        set_report_cache(None)
+        app.dependency_overrides.pop(get_current_user, None)
+
+    # A request after the leader stalled starts its own generation
+    assert "leader_id" not in taken_over and claim["research_id"] != leader_id
+    # The follower of the dead leader fails instead of waiting forever
+    assert follower["status"] == "failed" and follower["error"] == "Worker lost"
+    print("Dead leader test passed")
+
+
+if __name__ == "__main__":
+    test_identical_requests_share_one_generation()
+    test_followers_fail_with_the_shared_generation()
+    test_dead_leader_is_not_followed()
@@ -0,0 +1,149 @@
+import os
+import asyncio
+import time
+import uuid
+from types import SimpleNamespace
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+import httpx
+
+from app.main import app
+from app.routers import research
+from app.routers.auth import get_current_user
+from app.services.gemini_service import GeminiService, set_gemini_service
+from app.services.report_pipeline import PLANNER_PROMPT, SECTION_PROMPT, SUMMARY_PROMPT
+from app.services.task_store import get_task_store
+from app.services.repository import MemoryRepository, set_repository
+
+TEST_USER = {"id": 1, "email": "load@test.dev", "username": "load"}
+
+# Number of fake generations to run concurrently and their shape
+N_GENERATIONS = 50
+CHUNKS_PER_GENERATION = 40
+CHUNK_DELAY = 0.01
+STATUS_POLLS = 200
+
+FAKE_REPORT = '{"summary": "Summary", "sections": [{"title": "Section 1", "content": "Content 1"}], "sources": []}'
+# Replies to the planned pipeline's calls: an outline, each section and the summary
+FAKE_OUTLINE = '{"sections": [{"title": "Section 1", "brief": "First"}, {"title": "Section 2", "brief": "Second"}]}'
+FAKE_SECTION = '{"content": "Content", "sources": [{"title": "Example", "url": "https://example.com"}]}'
+FAKE_SUMMARY = "Summary"
+# Gemini calls one planned report makes: the outline, two sections, the summary
+CALLS_PER_REPORT = 4
+
+
+def fake_reply(contents) -> str:
+    """The canned text for a prompt, by the pipeline stage it belongs to"""
+    prompt = contents[0].parts[0].text
+    if prompt.startswith(PLANNER_PROMPT):
+        return FAKE_OUTLINE
+    if prompt.startswith(SECTION_PROMPT):
+        return FAKE_SECTION
+    if prompt.startswith(SUMMARY_PROMPT):
+        return FAKE_SUMMARY
+    return FAKE_REPORT
+
+
+class FakeAsyncModels:
+    """Stands in for client.aio.models and streams canned replies slowly"""
+
+    async def generate_content_stream(self, model, contents, config):
+        reply = fake_reply(contents)
+
+        async def stream():
+            step = max(1, len(reply) // CHUNKS_PER_GENERATION)
+            for i in range(0, len(reply), step):
+                # Simulate network latency between chunks
+                await asyncio.sleep(CHUNK_DELAY)
+                yield SimpleNamespace(text=reply[i:i + step])
+        return stream()
+
+
+class FakeGeminiClient:
+    def __init__(self):
+        self.aio = SimpleNamespace(models=FakeAsyncModels())
+
+
+def p99(samples):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+
+async def poll_status(client, research_id, count):
+    """Poll the status endpoint and return the latency of each call in ms"""
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = await client.get(f"/api/research/{research_id}/status")
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200
+    return latencies
+
+
+async def run_load_test():
+    set_gemini_service(GeminiService(
+        client=FakeGeminiClient(),
+        max_in_flight=N_GENERATIONS,
+        requests_per_minute=10 * CALLS_PER_REPORT * N_GENERATIONS,
+    ))
+    set_repository(MemoryRepository())
+    app.dependency_overrides[get_current_user] = lambda: TEST_USER
+
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            task_store = get_task_store()
+            probe_id = str(uuid.uuid4())
+            await task_store.create(probe_id, user_id=TEST_USER["id"], topic="probe")
+
+            # Baseline: no generations running
+            idle = await poll_status(client, probe_id, STATUS_POLLS)
+
+            # Start N fake generations and poll while they stream
+            research_ids = []
+            for _ in range(N_GENERATIONS):
+                research_id = str(uuid.uuid4())
+                await task_store.create(research_id, user_id=TEST_USER["id"], topic="load test")
+                research_ids.append(research_id)
+
+            start = time.perf_counter()
+            generations = asyncio.gather(*[
+                research.conduct_research(research_id, "load test", None, TEST_USER["id"])
+                for research_id in research_ids
+            ])
+            loaded = await poll_status(client, probe_id, STATUS_POLLS)
+            await generations
+            elapsed = time.perf_counter() - start
+            statuses = [(await task_store.get(research_id))["status"] for research_id in research_ids]
+    finally:
+        set_gemini_service(None)
+        set_repository(None)
+        app.dependency_overrides.pop(get_current_user, None)
+
+    return idle, loaded, elapsed, statuses
+
+
+def test_status_latency_under_load():
+    idle, loaded, elapsed, statuses = asyncio.run(run_load_test())
+
+    print(f"Idle p99:   {p99(idle):.2f} ms")
+    print(f"Loaded p99: {p99(loaded):.2f} ms ({N_GENERATIONS} concurrent generations)")
+    print(f"Generations finished in {elapsed:.2f} s")
+
+    # Every generation completed
+    assert statuses == ["completed"] * N_GENERATIONS
+
+    # The generations run concurrently rather than one after another
+    sequential_time = N_GENERATIONS * CALLS_PER_REPORT * CHUNKS_PER_GENERATION * CHUNK_DELAY
+    assert elapsed < sequential_time / 4
+
+    # Status polls are not stuck behind the generations
+    assert p99(loaded) < 100
+
+
+if __name__ == "__main__":
+    test_status_latency_under_load()
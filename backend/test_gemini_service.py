@@ -0,0 +1,74 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from app.services.gemini_service import GeminiService, TokenBucket
+from app.utils import metrics
+
+
+class SlowModels:
+    """Fake client.aio.models that records how many streams run at once"""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    async def generate_content_stream(self, model, contents, config):
+        async def stream():
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            try:
+                for _ in range(3):
+                    await asyncio.sleep(0.01)
+                    yield SimpleNamespace(text="x", usage_metadata=None)
+            finally:
+                self.active -= 1
+        return stream()
+
+
+async def collect(service):
+    text = ""
+    async for chunk in service.generate_content_stream(model="test", contents=["prompt"]):
+        text += chunk.text
+    return text
+
+
+def test_token_bucket_queues_instead_of_failing():
+    async def run():
+        bucket = TokenBucket(per_minute=600)  # refills 10 tokens per second
+        await bucket.acquire(600)
+        start = time.monotonic()
+        await bucket.acquire(5)
+        return time.monotonic() - start
+
+    waited = asyncio.run(run())
+    print(f"Waited {waited:.2f} s for an empty bucket to refill")
+    assert 0.3 < waited < 2
+
+
+def test_max_in_flight_is_enforced():
+    metrics.reset()
+    models = SlowModels()
+    service = GeminiService(
+        client=SimpleNamespace(aio=SimpleNamespace(models=models)),
+        max_in_flight=3,
+        requests_per_minute=1000,
+    )
+
+    async def run():
+        return await asyncio.gather(*[collect(service) for _ in range(10)])
+
+    results = asyncio.run(run())
+    assert results == ["xxx"] * 10
+    assert models.peak == 3
+    assert service.in_flight == 0 and service.queue_depth == 0
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["gemini.requests"] == 10
+    assert snapshot["timings"]["gemini.queue_wait_seconds"]["count"] == 10
+    assert snapshot["timings"]["gemini.queue_wait_seconds"]["max"] > 0
+
+
+if __name__ == "__main__":
+    test_token_bucket_queues_instead_of_failing()
+    test_max_in_flight_is_enforced()
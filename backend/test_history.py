@@ -0,0 +1,123 @@
+import os
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+import httpx
+
+from app.main import app
+from app.routers.auth import get_current_user
+from app.routers.research import report_stats
+from app.services.repository import MemoryRepository, set_repository
+from test_pdf_cache import make_report, TEST_USER
+
+N_REPORTS = 300
+TOPICS = ["Solar power", "Wind power", "Quantum computing", "Roman history"]
+
+
+def make_history():
+    start = datetime(2025, 1, 1)
+    reports = []
+    for i in range(N_REPORTS):
+        report = make_report(sections=5)
+        report.update(topic=f"{TOPICS[i % len(TOPICS)]} {i}", **report_stats(report))
+        # Pairs of reports share a timestamp, so the id has to break the tie
+        report["created_at"] = (start + timedelta(minutes=i // 2)).isoformat()
+        reports.append(report)
+    reports.append(dict(make_report(user_id=99), created_at=start.isoformat()))
+    return reports
+
+
+def get(db, path, headers=None):
+    set_repository(db)
+    app.dependency_overrides[get_current_user] = lambda: TEST_USER
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path, headers=headers)
+
+    try:
+        return asyncio.run(run())
+    finally:
+        set_repository(None)
+        app.dependency_overrides.pop(get_current_user, None)
+
+
+def test_report_stats():
+    stats = report_stats({
+        "summary": "Three word summary",
+        "sections": [{"title": "A", "content": "one two"}, {"title": "B", "content": "- three\n\nfour"}],
+    })
+    assert stats == {"section_count": 2, "word_count": 8}
+    print("Report stats test passed")
+
+
+def test_pages_cover_history_once_in_order():
+    reports = make_history()
+    db = MemoryRepository(reports=reports)
+
+    seen, cursor, pages = [], None, 0
+    start = time.perf_counter()
+    while True:
+        response = get(db, "/api/research/history?limit=25" + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200
+        page = response.json()
+        seen.extend(page["researches"])
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    elapsed = time.perf_counter() - start
+
+    mine = sorted((r for r in reports if r["user_id"] == TEST_USER["id"]),
+                  key=lambda r: (r["created_at"], r["id"]), reverse=True)
+    assert [item["id"] for item in seen] == [r["id"] for r in mine]
+    assert pages == N_REPORTS // 25
+    assert seen[0]["section_count"] == 5 and seen[0]["word_count"] == mine[0]["word_count"]
+    assert "sections" not in seen[0]
+    print(f"{pages} pages of 25 in {elapsed * 1000:.0f}ms")
+
+
+def test_search_and_bad_input():
+    db = MemoryRepository(reports=make_history())
+
+    response = get(db, "/api/research/history?q=QUANTUM&limit=100")
+    topics = [item["topic"] for item in response.json()["researches"]]
+    assert len(topics) == N_REPORTS // len(TOPICS)
+    assert all(topic.startswith("Quantum computing") for topic in topics)
+
+    assert get(db, "/api/research/history?cursor=not-a-cursor").status_code == 400
+    assert get(db, "/api/research/history?limit=0").status_code == 422
+    assert get(db, "/api/research/history?limit=1000").status_code == 422
+    print("History search test passed")
+
+
+def test_conditional_requests():
+    db = MemoryRepository(reports=make_history())
+
+    first = get(db, "/api/research/history")
+    etag, last_modified = first.headers["etag"], first.headers["last-modified"]
+    assert get(db, "/api/research/history", {"If-None-Match": etag}).status_code == 304
+    assert get(db, "/api/research/history", {"If-Modified-Since": last_modified}).status_code == 304
+
+    # New research changes the first page
+    newest = dict(make_report(), created_at=datetime(2026, 1, 1).isoformat())
+    db.reports.append(newest)
+    changed = get(db, "/api/research/history", {"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["researches"][0]["id"] == newest["id"]
+    assert get(db, "/api/research/history", {"If-Modified-Since": last_modified}).status_code == 200
+    print("History conditional request test passed")
+
+
+if __name__ == "__main__":
+    test_report_stats()
+    test_pages_cover_history_once_in_order()
+    test_search_and_bad_input()
+    test_conditional_requests()
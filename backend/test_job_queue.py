@@ -0,0 +1,210 @@
+import os
+import asyncio
+import tempfile
+import time
+from dataclasses import asdict
+
+from app.services.job_queue import (
+    Job, JobQueue, KombuBroker, MemoryBroker, SQLiteBroker, Worker, job_task,
+    QUEUED, RESERVED, DONE, FAILED, ATTEMPTS_HEADER, EXPIRED_ERROR,
+)
+
+
+def make_sqlite_broker():
+    directory = tempfile.mkdtemp()
+    return SQLiteBroker(os.path.join(directory, "jobs.db"))
+
+
+def test_priority_lanes():
+    for broker in (MemoryBroker(), make_sqlite_broker()):
+        broker.enqueue(Job(id="low", name="noop", payload={}, lane="low"))
+        broker.enqueue(Job(id="default", name="noop", payload={}, lane="default"))
+        broker.enqueue(Job(id="high", name="noop", payload={}, lane="high"))
+
+        order = [broker.reserve(["high", "default", "low"], 60).id for _ in range(3)]
+        assert order == ["high", "default", "low"]
+        assert broker.reserve(["high", "default", "low"], 60) is None
+
+
+def test_visibility_timeout_redelivers_job():
+    for broker in (MemoryBroker(), make_sqlite_broker()):
+        broker.enqueue(Job(id="job", name="noop", payload={}, max_attempts=2))
+
+        first = broker.reserve(["default"], 0.05)
+        assert first.attempts == 1
+        # Hidden while reserved
+        assert broker.reserve(["default"], 0.05) is None
+
+        # The worker "died"; the job comes back after the timeout
+        time.sleep(0.1)
+        second = broker.reserve(["default"], 0.05)
+        assert second.id == "job" and second.attempts == 2
+
+        # Out of attempts: the job is failed instead of redelivered
+        time.sleep(0.1)
+        assert broker.reserve(["default"], 0.05) is None
+        assert [job.id for job in broker.expire(["default"])] == ["job"]
+        assert broker.get("job").state == FAILED and broker.get("job").error == EXPIRED_ERROR
+        assert broker.expire(["default"]) == []
+
+
+def test_sqlite_jobs_survive_restart():
+    broker = make_sqlite_broker()
+    broker.enqueue(Job(id="durable", name="noop", payload={"topic": "AI"}))
+
+    reopened = SQLiteBroker(broker.path)
+    job = reopened.reserve(["default"], 60)
+    assert job.payload == {"topic": "AI"}
+    assert reopened.get("durable").state == RESERVED
+
+
+def test_kombu_attempts_travel_in_headers():
+    # kombu's in-process transport; every connection shares its queues
+    broker = KombuBroker("memory://")
+    dead = broker.connection.SimpleQueue("deepr.jobs.dead", serializer="json")
+    broker.enqueue(Job(id="kombu", name="noop", payload={}, max_attempts=3))
+    assert broker.reserve(["default"], 60).attempts == 1
+    broker.retry("kombu", "boom", 0)
+
+    # Another process picks the retry up with the attempts so far
+    other = KombuBroker("memory://")
+    job = other.reserve(["default"], 60)
+    assert job.attempts == 2 and job.error == "boom"
+    # This transport cannot delay messages, so the backoff is held, not handed out early
+    other.retry("kombu", "boom", 0.1)
+    assert other.reserve(["default"], 60) is None
+    time.sleep(0.15)
+    assert other.reserve(["default"], 60).attempts == 3
+    other.fail("kombu", "boom")
+    assert other.get("kombu").state == FAILED
+    message = dead.get(block=False)
+    assert message.payload["id"] == "kombu" and message.headers[ATTEMPTS_HEADER] == 3
+    message.ack()
+
+    # A message redelivered because its worker died counts that attempt,
+    # and is dead-lettered if it was the last
+    broker.connection.SimpleQueue("deepr.jobs.default", serializer="json").put(
+        asdict(Job(id="crashed", name="noop", payload={}, max_attempts=2)),
+        headers={ATTEMPTS_HEADER: 1, "redelivered": True},
+    )
+    assert broker.reserve(["default"], 60) is None
+    assert [job.id for job in broker.expire(["default"])] == ["crashed"]
+    assert broker.get("crashed").error == EXPIRED_ERROR and broker.expire(["default"]) == []
+    assert dead.get(block=False).payload["id"] == "crashed"
+    dead.clear()
+
+
+def test_list_and_requeue_interrupted_jobs():
+    for broker in (MemoryBroker(), make_sqlite_broker()):
+        for job_id in ("failed", "stalled", "running", "queued"):
+            broker.enqueue(Job(id=job_id, name="noop", payload={}, max_attempts=1))
+        broker.reserve(["default"], 60)
+        broker.fail("failed", "boom")
+        broker.reserve(["default"], 0.05)
+        broker.reserve(["default"], 60)
+        time.sleep(0.1)
+
+        listed = broker.list_jobs([FAILED, RESERVED])
+        assert [job.id for job in listed] == ["failed", "stalled", "running"]
+
+        # Live and queued jobs are left alone
+        assert not broker.requeue("running") and not broker.requeue("queued") and not broker.requeue("missing")
+        assert broker.requeue("failed") and broker.requeue("stalled")
+        job = broker.get("failed")
+        assert job.state == QUEUED and job.attempts == 0 and job.error is None
+        assert {broker.reserve(["default"], 60).id for _ in range(3)} == {"failed", "stalled", "queued"}
+
+
+def test_worker_retries_then_succeeds():
+    calls = []
+
+    @job_task("flaky")
+    async def flaky(value):
+        calls.append(value)
+        if len(calls) < 2:
+            raise RuntimeError("transient error")
+
+    async def run():
+        queue = JobQueue(MemoryBroker(), visibility_timeout=5)
+        job_id = await queue.enqueue("flaky", {"value": 42}, max_attempts=3)
+        assert (await queue.get_job(job_id)).state == QUEUED
+
+        worker = Worker(queue, concurrency=2, poll_interval=0.01, retry_delay=0.01)
+        worker_task = asyncio.create_task(worker.run())
+        for _ in range(200):
+            if (await queue.get_job(job_id)).state == DONE:
+                break
+            await asyncio.sleep(0.01)
+        worker.stop()
+        await worker_task
+        return await queue.get_job(job_id)
+
+    job = asyncio.run(run())
+    assert calls == [42, 42]
+    assert job.state == DONE and job.attempts == 2
+    assert job.error == "transient error"
+
+
+def test_worker_gives_up_after_max_attempts():
+    failures = []
+
+    async def on_failure(payload, error, final):
+        failures.append((error, final))
+
+    @job_task("broken", on_failure=on_failure)
+    async def broken():
+        raise RuntimeError("permanent error")
+
+    async def run():
+        queue = JobQueue(MemoryBroker(), visibility_timeout=5)
+        job_id = await queue.enqueue("broken", {}, max_attempts=2)
+        worker = Worker(queue, poll_interval=0.01, retry_delay=0.01)
+        for _ in range(2):
+            job = None
+            while job is None:
+                job = await queue.reserve(worker.lanes)
+                await asyncio.sleep(0.01)
+            await worker.run_job(job)
+        return await queue.get_job(job_id)
+
+    job = asyncio.run(run())
+    assert job.state == FAILED and job.attempts == 2
+    assert job.error == "permanent error"
+    assert failures == [("permanent error", False), ("permanent error", True)]
+
+
+def test_expired_last_attempt_runs_failure_handler():
+    failures = []
+
+    async def on_failure(payload, error, final):
+        failures.append((payload, error, final))
+
+    @job_task("abandoned", on_failure=on_failure)
+    async def abandoned(topic):
+        pass
+
+    async def run(broker):
+        queue = JobQueue(broker, visibility_timeout=0.05)
+        job_id = await queue.enqueue("abandoned", {"topic": "AI"}, max_attempts=1)
+        # The worker holding the job dies without acking it
+        assert (await queue.reserve(["default"])).id == job_id
+        await asyncio.sleep(0.1)
+        assert await queue.reserve(["default"]) is None
+        return await queue.get_job(job_id)
+
+    for broker in (MemoryBroker(), make_sqlite_broker()):
+        failures.clear()
+        job = asyncio.run(run(broker))
+        assert job.state == FAILED and job.error == EXPIRED_ERROR
+        assert failures == [({"topic": "AI"}, EXPIRED_ERROR, True)]
+
+
+if __name__ == "__main__":
+    test_priority_lanes()
+    test_visibility_timeout_redelivers_job()
+    test_sqlite_jobs_survive_restart()
+    test_kombu_attempts_travel_in_headers()
+    test_list_and_requeue_interrupted_jobs()
+    test_worker_retries_then_succeeds()
+    test_worker_gives_up_after_max_attempts()
+    test_expired_last_attempt_runs_failure_handler()
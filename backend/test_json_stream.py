@@ -0,0 +1,249 @@
+import io
+import json
+import random
+import time
+from contextlib import redirect_stdout
+
+from app.utils import metrics
+from app.utils.json_parsing import parse_json, finalize_report
+from app.utils.json_stream import StreamingReportParser
+
+# Same fixtures as test_json_parsing.py, plus the repairs the stream handles
+test_cases = [
+    {
+        "name": "Clean JSON",
+        "input": '{"summary": "This is a summary", "sections": [{"title": "Section 1", "content": "Content 1"}], "sources": [{"title": "Source 1", "url": "http://example.com", "snippet": "Example snippet"}]}',
+        "expected_success": True
+    },
+    {
+        "name": "JSON with newlines",
+        "input": '''
+{
+  "summary": "This is a summary",
+  "sections": [
+    {
+      "title": "Section 1",
+      "content": "Content 1"
+    }
+  ],
+  "sources": [
+    {
+      "title": "Source 1",
+      "url": "http://example.com",
+      "snippet": "Example snippet"
+    }
+  ]
+}
+''',
+        "expected_success": True
+    },
+    {
+        "name": "JSON in code block",
+        "input": '''```json
+{"summary": "This is a summary", "sections": [{"title": "Section 1", "content": "Content 1"}], "sources": [{"title": "Source 1", "url": "http://example.com", "snippet": "Example snippet"}]}
+```''',
+        "expected_success": True
+    },
+    {
+        "name": "JSON with text before and after",
+        "input": '''Here is your research report:
+
+{"summary": "This is a summary", "sections": [{"title": "Section 1", "content": "Content 1"}], "sources": [{"title": "Source 1", "url": "http://example.com", "snippet": "Example snippet"}]}
+
+I hope this helps!''',
+        "expected_success": True
+    },
+    {
+        "name": "Malformed JSON",
+        "input": '{"summary": "This is a summary", "sections": [{"title": "Section 1", "content": "Content 1"}], "sources": [{"title": "Source 1", "url": "http://example.com", "snippet": "Example snippet}]}',
+        "expected_success": False
+    },
+    {
+        "name": "Invalid escapes in code block",
+        "input": '''```json
+{"summary": "Costs fell by \\$5 \\(approx\\)", "sections": [{"title": "Math", "content": "Use \\\\alpha and \\d+"}], "sources": []}
+```''',
+        "expected_success": True
+    },
+    {
+        "name": "Unicode escapes and numbers",
+        "input": '{"summary": "caf\\u00e9 \\ud83d\\ude80", "sections": [], "sources": [], "version": 2, "score": -1.5e3, "draft": false, "extra": null}',
+        "expected_success": True
+    },
+]
+
+
+def parse_streaming(text, chunk_size=None):
+    """Feed text in chunks and return (result, items emitted while streaming)"""
+    parser = StreamingReportParser()
+    items = []
+    if chunk_size is None:
+        items.extend(parser.feed(text))
+    else:
+        for i in range(0, len(text), chunk_size):
+            items.extend(parser.feed(text[i:i + chunk_size]))
+    return parser.result(), items
+
+
+def quiet_parse_json(text):
+    with redirect_stdout(io.StringIO()):
+        return parse_json(text)
+
+
+def test_streaming_parser_matches_parse_json():
+    for test_case in test_cases:
+        print(f"Test: {test_case['name']}")
+        expected_success, expected = quiet_parse_json(test_case["input"])
+
+        for chunk_size in (None, 1, 3, 7, 64):
+            result, items = parse_streaming(test_case["input"], chunk_size)
+            assert (result is not None) == test_case["expected_success"], test_case["name"]
+            if result is None:
+                continue
+            if expected_success:
+                assert result == expected, test_case["name"]
+
+            # Every item was emitted while streaming, in order
+            assert [kind for kind, _ in items] == (
+                ["summary"] * ("summary" in result)
+                + ["section"] * len(result["sections"])
+                + ["source"] * len(result["sources"])
+            )
+
+
+def test_invalid_escape_repair():
+    text = '{"summary": "a \\d b", "sections": [{"title": "t", "content": "line\nbreak"}], "sources": []}'
+    result, _ = parse_streaming(text, chunk_size=2)
+    assert result["summary"] == "a \\d b"
+    # Raw newlines inside strings are accepted
+    assert result["sections"][0]["content"] == "line\nbreak"
+
+
+def test_items_are_emitted_before_the_stream_ends():
+    report = {
+        "summary": "S",
+        "sections": [{"title": "One", "content": "1"}, {"title": "Two", "content": "2"}],
+        "sources": [],
+    }
+    text = json.dumps(report)
+    cut = text.index('{"title": "Two"')
+    parser = StreamingReportParser()
+    first = parser.feed(text[:cut])
+    assert first == [("summary", "S"), ("section", {"title": "One", "content": "1"})]
+    assert parser.feed(text[cut:]) == [("section", {"title": "Two", "content": "2"})]
+    assert parser.result() == report
+
+
+def test_finalize_report_counts_parse_paths():
+    metrics.reset()
+    clean = test_cases[0]["input"]
+    fenced_with_text = "Report:\n" + test_cases[2]["input"] + "\nThanks"
+
+    with redirect_stdout(io.StringIO()):
+        # Structured output validates straight into the models
+        success, report = finalize_report(json.loads(clean), clean, structured=True)
+        assert success and report["sources"][0]["snippet"] == "Example snippet"
+
+        # Streaming parse gave nothing usable: the repair parser runs
+        success, report = finalize_report(None, fenced_with_text, structured=False)
+        assert success and report["summary"] == "This is a summary"
+
+        # Parsed, but not a report
+        success, report = finalize_report({"summary": 1}, "{}", structured=False)
+        assert not success and report is None
+
+        # Nothing parses
+        success, report = finalize_report(None, "not json", structured=False)
+        assert not success and report is None
+
+    counters = metrics.snapshot()["counters"]
+    assert counters["report_parse.structured"] == 1
+    assert counters["report_parse.streaming_invalid"] == 1
+    assert counters["report_parse.repair"] == 1
+    assert counters["report_parse.repair_invalid"] == 1
+    assert counters["report_parse.failed"] == 1
+    assert metrics.snapshot()["timings"]["report_parse.repair_seconds"]["count"] == 3
+
+
+def make_report(sections=20, words_per_section=600):
+    """A synthetic report about the size Gemini returns"""
+    random.seed(42)
+    vocabulary = ["research", "data", "analysis", "model", "impact", "policy", "growth",
+                  "**evidence**", "*trend*", "study", "results", "\\(see\\)", "health"]
+    report = {
+        "summary": " ".join(random.choice(vocabulary) for _ in range(300)),
+        "sections": [
+            {
+                "title": f"Section {i}",
+                "content": "\n\n".join(
+                    " ".join(random.choice(vocabulary) for _ in range(words_per_section // 4))
+                    for _ in range(4)
+                ),
+            }
+            for i in range(sections)
+        ],
+        "sources": [
+            {"title": f"Source {i}", "url": f"https://example.com/{i}", "snippet": "A source"}
+            for i in range(10)
+        ],
+    }
+    # Wrap in a code fence and leave the "\(" escapes invalid, like real output
+    text = json.dumps(report).replace("\\\\(", "\\(").replace("\\\\)", "\\)")
+    return "```json\n" + text + "\n```"
+
+
+def test_benchmark_against_parse_json():
+    text = make_report()
+    chunk_size = 120  # roughly what one streamed chunk carries
+    chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+    runs = 5
+
+    # Current approach: accumulate with +=, then parse the whole text
+    start = time.perf_counter()
+    for _ in range(runs):
+        full_response = ""
+        for chunk in chunks:
+            full_response += chunk
+        success, expected = quiet_parse_json(full_response)
+    full_text_time = (time.perf_counter() - start) / runs
+    assert success
+
+    # Streaming: parse while chunks arrive, nothing left to do at the end
+    start = time.perf_counter()
+    for _ in range(runs):
+        parser = StreamingReportParser()
+        first_section_at = None
+        for index, chunk in enumerate(chunks):
+            for kind, _ in parser.feed(chunk):
+                if kind == "section" and first_section_at is None:
+                    first_section_at = index
+        result = parser.result()
+    streaming_time = (time.perf_counter() - start) / runs
+    assert result == expected
+
+    # Time spent after the last chunk arrives, which is what the user waits for
+    start = time.perf_counter()
+    parser = StreamingReportParser()
+    for chunk in chunks[:-1]:
+        parser.feed(chunk)
+    tail_start = time.perf_counter()
+    parser.feed(chunks[-1])
+    parser.result()
+    tail_time = time.perf_counter() - tail_start
+
+    print(f"Report size: {len(text) / 1024:.1f} KB in {len(chunks)} chunks")
+    print(f"parse_json after stream: {full_text_time * 1000:.2f} ms")
+    print(f"Streaming parser total:  {streaming_time * 1000:.2f} ms (spread over the stream)")
+    print(f"Streaming parser tail:   {tail_time * 1000:.3f} ms after the last chunk")
+    print(f"First section available after chunk {first_section_at} of {len(chunks)}")
+
+    assert first_section_at < len(chunks) // 4
+    assert tail_time < full_text_time
+
+
+if __name__ == "__main__":
+    test_streaming_parser_matches_parse_json()
+    test_invalid_escape_repair()
+    test_items_are_emitted_before_the_stream_ends()
+    test_finalize_report_counts_parse_paths()
+    test_benchmark_against_parse_json()
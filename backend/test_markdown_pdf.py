@@ -0,0 +1,123 @@
+import time
+
+from reportlab.platypus import Paragraph, Preformatted, Table
+
+from app.utils.markdown_pdf import inline, tokenize, markdown_to_flowables
+from app.utils.pdf_report import render_report_pdf_bytes
+
+SECTION = """## Findings
+
+Intro with **bold**, *italic*, `a < b` and a [link](https://example.com?a=1&b=2).
+This line continues the same paragraph.
+
+- top level
+  - nested once
+    - nested twice
+- back to top
+  with a continuation line
+
+1. first
+2. second
+
+| Metric | Value | Notes |
+|--------|:-----:|-------|
+| Latency | 12 ms | p50 |
+| Pipe | a \\| b | |
+| Short |
+
+```
+def f(x):
+    return x * 2  # **not bold**
+```
+
+> A quoted remark
+> over two lines
+
+---
+"""
+
+
+def test_inline_markup():
+    assert inline("**bold** and *italic*") == "<b>bold</b> and <i>italic</i>"
+    assert inline("__bold__ and _italic_") == "<b>bold</b> and <i>italic</i>"
+    assert inline("~~gone~~ H~2~O x^2^") == "<strike>gone</strike> H<sub>2</sub>O x<super>2</super>"
+    # Markup inside code spans is left alone, and text is escaped once
+    assert inline("`**x** < y`") == '<font face="Courier">**x** &lt; y</font>'
+    assert inline("a < b & c") == "a &lt; b &amp; c"
+    assert inline("**[docs](https://x.dev)**") == '<b><link href="https://x.dev">docs</link></b>'
+    # Underscores inside words are not emphasis
+    assert inline("snake_case_name") == "snake_case_name"
+    print("Inline markup test passed")
+
+
+def test_block_tokens():
+    tokens = tokenize(SECTION)
+    kinds = [token[0] for token in tokens if token[0] != "break"]
+    assert kinds == [
+        "heading", "para",
+        "item", "item", "item", "item",
+        "item", "item",
+        "table", "code", "quote", "rule",
+    ]
+
+    items = [token for token in tokens if token[0] == "item"]
+    assert [item[1] for item in items] == [0, 1, 2, 0, 0, 0]
+    assert items[3][3] == "back to top with a continuation line"
+    assert [item[2] for item in items[4:]] == ["1.", "2."]
+
+    table = next(token for token in tokens if token[0] == "table")[1]
+    assert table[0] == ["Metric", "Value", "Notes"]
+    assert table[2] == ["Pipe", "a | b", ""]
+    assert table[3] == ["Short"]
+
+    code = next(token for token in tokens if token[0] == "code")[1]
+    assert code == "def f(x):\n    return x * 2  # **not bold**"
+    print("Block tokenizer test passed")
+
+
+def test_flowables():
+    flowables = markdown_to_flowables(SECTION)
+    tables = [f for f in flowables if isinstance(f, Table)]
+    assert len(tables) == 1
+    # Short rows are padded to the header's width
+    assert len(tables[0]._cellvalues[3]) == 3
+    assert any(isinstance(f, Preformatted) for f in flowables)
+    bullets = [f.bulletText for f in flowables if isinstance(f, Paragraph) and f.bulletText]
+    assert bullets == ["•", "•", "•", "•", "1.", "2."]
+    assert markdown_to_flowables("") == []
+    print("Flowables test passed")
+
+
+def test_conversion_benchmark():
+    sections = [SECTION.replace("Findings", f"Findings {i}") for i in range(20)]
+    runs = 20
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        for section in sections:
+            markdown_to_flowables(section)
+    convert_ms = (time.perf_counter() - start) / runs * 1000
+
+    report = {
+        "topic": "Benchmark",
+        "created_at": "2025-01-01T00:00:00",
+        "summary": "A **summary**.\n\n- one\n- two",
+        "sections": [{"title": f"Section {i}", "content": s} for i, s in enumerate(sections)],
+        "sources": [{"title": "Example", "url": "https://example.com", "snippet": "A source"}],
+    }
+    start = time.perf_counter()
+    pdf = render_report_pdf_bytes(report)
+    render_ms = (time.perf_counter() - start) * 1000
+
+    assert pdf.startswith(b"%PDF")
+    print(f"20-section report: markdown conversion {convert_ms:.1f} ms, full render {render_ms:.0f} ms")
+    # Conversion should be a small share of the layout work
+    assert convert_ms < render_ms
+    print("Conversion benchmark passed")
+
+
+if __name__ == "__main__":
+    test_inline_markup()
+    test_block_tokens()
+    test_flowables()
+    test_conversion_benchmark()
@@ -0,0 +1,182 @@
+import os
+import asyncio
+import time
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+import httpx
+
+from app.main import app
+from app.services.password_service import (
+    PasswordService,
+    PasswordServiceBusy,
+    TooManyAttempts,
+    set_password_service,
+)
+from app.services.repository import MemoryRepository, RepositoryError, set_repository
+from app.services.user_cache import UserCache, set_user_cache
+from app.utils import metrics
+
+# Cost of the hashes in the responsiveness test (about 60ms each)
+ROUNDS = 10
+N_LOGINS = 8
+
+
+async def max_loop_lag(work):
+    """Run work while a ticker measures how late the event loop wakes it"""
+    lags = []
+    done = False
+
+    async def ticker():
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - start - 0.005)
+
+    tick = asyncio.create_task(ticker())
+    result = await work
+    done = True
+    await tick
+    return result, max(lags)
+
+
+def test_hashing_does_not_block_the_loop():
+    service = PasswordService(rounds=ROUNDS, workers=2, max_pending=N_LOGINS, max_per_ip=N_LOGINS)
+    hashed = service.context.hash("secret")
+
+    async def run():
+        start = time.perf_counter()
+        inline = [service.context.verify("secret", hashed) for _ in range(2)]
+        inline_each = (time.perf_counter() - start) / 2
+        logins = asyncio.gather(*[
+            service.verify("secret", hashed, ip="10.0.0.1", email=f"user{i}@test.dev") for i in range(N_LOGINS)
+        ])
+        results, lag = await max_loop_lag(logins)
+        return inline + results, inline_each, lag
+
+    try:
+        results, inline_each, lag = asyncio.run(run())
+    finally:
+        service.close()
+
+    assert all(results)
+    # Inline, every login would stall the loop for a whole hash
+    assert lag < inline_each / 2
+    print(f"bcrypt at cost {ROUNDS}: {inline_each * 1000:.0f}ms per hash, "
+          f"max loop lag {lag * 1000:.1f}ms during {N_LOGINS} concurrent logins")
+
+
+def test_per_ip_email_and_pool_limits():
+    metrics.reset()
+    service = PasswordService(rounds=ROUNDS, workers=1, max_pending=3, max_per_ip=2, max_per_email=1)
+    hashed = service.context.hash("secret")
+
+    async def attempt(ip, email):
+        try:
+            return await service.verify("secret", hashed, ip=ip, email=email)
+        except TooManyAttempts:
+            return 429
+        except PasswordServiceBusy:
+            return 503
+
+    async def run():
+        return await asyncio.gather(
+            attempt("1.1.1.1", "a@test.dev"),
+            attempt("2.2.2.2", "a@test.dev"),  # same account
+            attempt("1.1.1.1", "b@test.dev"),
+            attempt("1.1.1.1", "c@test.dev"),  # third from one IP
+            attempt("3.3.3.3", "d@test.dev"),
+            attempt("4.4.4.4", "e@test.dev"),  # pool full
+        )
+
+    try:
+        results = asyncio.run(run())
+        # Limits are released once the hashes finish
+        assert asyncio.run(attempt("1.1.1.1", "a@test.dev")) is True
+    finally:
+        service.close()
+
+    assert results == [True, 429, True, 429, True, 503]
+    assert metrics.get_counter("password.throttled") == 2
+    assert metrics.get_counter("password.rejected") == 1
+    print("Password throttling test passed")
+
+
+def test_login_rehashes_at_the_configured_cost():
+    old = PasswordService(rounds=4)
+    db = MemoryRepository(users=[{
+        "id": 1, "email": "old@test.dev", "username": "old",
+        "hashed_password": old.context.hash("secret"), "created_at": "2025-01-01T00:00:00",
+    }])
+    old.close()
+    set_repository(db)
+    set_user_cache(UserCache())
+    set_password_service(PasswordService(rounds=5))
+
+    async def login(password):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/auth/token", data={"username": "old@test.dev", "password": password})
+
+    try:
+        wrong = asyncio.run(login("wrong"))
+        assert db.users[0]["hashed_password"].startswith("$2b$04$")
+        first = asyncio.run(login("secret"))
+        upgraded = db.users[0]["hashed_password"]
+        second = asyncio.run(login("secret"))
+    finally:
+        set_repository(None)
+        set_user_cache(None)
+        set_password_service(None)
+
+    assert wrong.status_code == 401
+    assert first.status_code == 200 and second.status_code == 200
+    assert upgraded.startswith("$2b$05$")
+    assert db.users[0]["hashed_password"] == upgraded
+    print("Lazy rehash test passed")
+
+
+def test_failed_rehash_still_logs_in():
+    metrics.reset()
+    old = PasswordService(rounds=4)
+
+    class ReadOnlyRepository(MemoryRepository):
+        async def update_user(self, user_id, fields):
+            raise RepositoryError("database is read-only", 503)
+
+    db = ReadOnlyRepository(users=[{
+        "id": 1, "email": "old@test.dev", "username": "old",
+        "hashed_password": old.context.hash("secret"), "created_at": "2025-01-01T00:00:00",
+    }])
+    old.close()
+    set_repository(db)
+    set_user_cache(UserCache())
+    set_password_service(PasswordService(rounds=5))
+
+    async def login():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/auth/token", data={"username": "old@test.dev", "password": "secret"})
+
+    try:
+        response = asyncio.run(login())
+    finally:
+        set_repository(None)
+        set_user_cache(None)
+        set_password_service(None)
+
+    # The upgrade is best effort: the correct password still gets a token
+    assert response.status_code == 200 and response.json()["access_token"]
+    assert db.users[0]["hashed_password"].startswith("$2b$04$")
+    assert metrics.get_counter("auth.rehash_failed") == 1
+    print("Failed rehash test passed")
+
+
+if __name__ == "__main__":
+    test_hashing_does_not_block_the_loop()
+    test_per_ip_email_and_pool_limits()
+    test_login_rehashes_at_the_configured_cost()
+    test_failed_rehash_still_logs_in()
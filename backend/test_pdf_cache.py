@@ -0,0 +1,152 @@
+import os
+import json
+import asyncio
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+import httpx
+
+from app.main import app
+from app.routers import research
+from app.routers.auth import get_current_user
+from app.services.gemini_service import GeminiService, set_gemini_service
+from app.services.pdf_cache import PDFCache, set_pdf_cache
+from app.services.pdf_renderer import MERGED_PDF_SUFFIX
+from app.utils import metrics
+from app.utils.pdf_report import pdf_cache_key, TEMPLATE_VERSION
+from app.utils.report_codec import decode_report
+from app.services.repository import MemoryRepository, set_repository
+from test_concurrency import FakeGeminiClient
+
+TEST_USER = {"id": 3, "email": "pdf@test.dev", "username": "pdf"}
+
+
+def make_report(user_id=TEST_USER["id"], sections=20):
+    body = {
+        "summary": "An **overview** of the topic.\n\n- first point\n- second point",
+        "sections": [
+            {"title": f"Section {i}", "content": f"## Part {i}\n\nSome *content* for section {i}.\n\n1. one\n2. two"}
+            for i in range(sections)
+        ],
+        "sources": [{"title": "Example", "url": "https://example.com", "snippet": "A source"}],
+    }
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "topic": "PDF caching",
+        "created_at": datetime.utcnow().isoformat(),
+        "report_json": json.dumps(body),
+        **body,
+    }
+
+
+def test_cache_key_is_content_addressed():
+    report = make_report()
+    clone = dict(report, id=str(uuid.uuid4()), user_id=99)
+    # The same content renders to the same PDF, whoever owns the row
+    assert pdf_cache_key(report) == pdf_cache_key(clone)
+    assert pdf_cache_key(report) != pdf_cache_key(dict(report, topic="Another topic"))
+    assert pdf_cache_key(report) != pdf_cache_key(dict(report, report_json=report["report_json"] + " "))
+    print(f"Cache key test passed (template version {TEMPLATE_VERSION})")
+
+
+def test_lru_byte_budget_and_disk_tier():
+    directory = tempfile.mkdtemp()
+    cache = PDFCache(max_bytes=250, directory=directory)
+    for i in range(3):
+        cache.put(f"key-{i}", bytes([i]) * 100)
+    # Only two 100-byte entries fit in memory; the oldest was evicted
+    assert len(cache._entries) == 2 and "key-0" not in cache._entries
+    # ...but it is still on disk and comes back from there
+    assert cache.get("key-0") == bytes([0]) * 100
+    assert "key-0" in cache._entries
+
+    # A second instance sharing the directory (e.g. the worker) sees the entries
+    other = PDFCache(max_bytes=250, directory=directory)
+    assert other.get("key-2") == bytes([2]) * 100
+    assert other.get("missing") is None
+    print("LRU and disk tier test passed")
+
+
+async def run_endpoint_test(db, research_id):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        url = f"/api/research/{research_id}/pdf"
+        start = time.perf_counter()
+        first = await client.get(url)
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        second = await client.get(url)
+        warm = time.perf_counter() - start
+
+        revalidated = await client.get(url, headers={"If-None-Match": first.headers["etag"]})
+    return first, second, revalidated, cold, warm
+
+
+def test_pdf_endpoint_serves_from_cache():
+    metrics.reset()
+    report = make_report()
+    db = MemoryRepository(reports=[report])
+    set_repository(db)
+    set_pdf_cache(PDFCache())
+    app.dependency_overrides[get_current_user] = lambda: TEST_USER
+    try:
+        first, second, revalidated, cold, warm = asyncio.run(run_endpoint_test(db, report["id"]))
+    finally:
+        set_repository(None)
+        set_pdf_cache(None)
+        app.dependency_overrides.pop(get_current_user, None)
+
+    print(f"Cold render: {cold * 1000:.1f} ms, cached: {warm * 1000:.1f} ms")
+    assert first.status_code == 200 and first.content.startswith(b"%PDF")
+    assert first.headers["content-type"] == "application/pdf"
+    # 20 sections: streamed, so tagged as the merged PDF
+    assert first.headers["etag"] == f'"{pdf_cache_key(report)}{MERGED_PDF_SUFFIX}"'
+    assert second.content == first.content
+    assert revalidated.status_code == 304 and revalidated.content == b""
+    assert metrics.get_counter("pdf_cache.misses") == 1
+    assert metrics.get_counter("pdf_cache.hits_memory") == 1
+    assert metrics.get_counter("pdf_cache.not_modified") == 1
+
+
+def run_research_with_cache(cache):
+    db = MemoryRepository()
+    set_repository(db)
+    set_pdf_cache(cache)
+    set_gemini_service(GeminiService(client=FakeGeminiClient()))
+    try:
+        research_id = str(uuid.uuid4())
+        asyncio.run(research.conduct_research(research_id, "Warm cache", None, TEST_USER["id"]))
+    finally:
+        set_repository(None)
+        set_pdf_cache(None)
+        set_gemini_service(None)
+    return decode_report(db.reports[0], db.source_index)
+
+
+def test_completed_research_warms_the_cache():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = PDFCache(directory=directory)
+        saved = run_research_with_cache(cache)
+        assert pdf_cache_key(saved) in cache
+
+    # A worker's private in-memory cache would never be read by the API
+    cache = PDFCache()
+    saved = run_research_with_cache(cache)
+    assert pdf_cache_key(saved) not in cache
+    print("Cache warm-up test passed")
+
+
+if __name__ == "__main__":
+    test_cache_key_is_content_addressed()
+    test_lru_byte_budget_and_disk_tier()
+    test_pdf_endpoint_serves_from_cache()
+    test_completed_research_warms_the_cache()
@@ -0,0 +1,160 @@
+import os
+import re
+import time
+import asyncio
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+import httpx
+
+from app.main import app
+from app.routers import research
+from app.routers.auth import get_current_user
+from app.services.pdf_cache import PDFCache, set_pdf_cache
+from app.services.pdf_renderer import PDFRenderer, set_pdf_renderer
+from app.utils.pdf_merge import PDFMerger
+from app.services.repository import MemoryRepository, set_repository
+from app.utils.pdf_report import (
+    page_groups,
+    page_number_stamp,
+    render_page_group,
+    render_report_pdf_bytes,
+)
+from test_pdf_cache import make_report, TEST_USER
+
+
+def check_pdf(data: bytes) -> int:
+    """Check the xref table and references of a PDF; return its page count"""
+    xref_at = int(re.search(rb"startxref\s+(\d+)", data[-64:]).group(1))
+    assert data[xref_at:].startswith(b"xref")
+    trailer_at = data.index(b"trailer", xref_at)
+    entries = re.findall(rb"(\d{10}) \d{5} ([nf])", data[xref_at:trailer_at])
+    numbers = set()
+    for number, (offset, kind) in enumerate(entries):
+        if kind == b"n":
+            assert data[int(offset):].startswith(b"%d 0 obj" % number), number
+            numbers.add(number)
+    # Every reference outside of streams points at an object
+    for chunk in re.split(rb"stream\n.*?endstream", data[:xref_at], flags=re.S):
+        for ref in re.findall(rb"(\d+) 0 R", chunk):
+            assert int(ref) in numbers, ref
+    counts = [int(c) for c in re.findall(rb"/Type /Pages /Count (\d+)", data)]
+    assert len(counts) == 1
+    return counts[0]
+
+
+def page_count(data: bytes) -> int:
+    return int(re.findall(rb"/Count (\d+)", data)[-1])
+
+
+def merge(report, sections_per_group):
+    merger = PDFMerger(stamp=page_number_stamp)
+    chunks = [merger.header()]
+    for group in page_groups(report, sections_per_group):
+        chunks.append(merger.add(render_page_group(report, group)))
+    chunks.append(merger.finish())
+    return b"".join(chunks)
+
+
+def test_merged_groups_match_the_single_document():
+    report = make_report(sections=9)
+    groups = page_groups(report, 4)
+    assert [(g.header, g.first_section, g.last_section, g.sources) for g in groups] == [
+        (True, 0, 0, False), (False, 0, 4, False), (False, 4, 8, False), (False, 8, 9, True)
+    ]
+
+    merged = merge(report, 4)
+    pages = check_pdf(merged)
+    # Sections start on new pages, so splitting there keeps the page count
+    assert pages == page_count(render_report_pdf_bytes(report))
+    # Pages are numbered across the groups
+    stamps = [int(n) for n in re.findall(rb"\(Page (\d+)\) Tj", merged)]
+    assert stamps == list(range(1, pages + 1))
+    print(f"Merge test passed ({pages} pages from {len(groups)} groups)")
+
+
+def test_first_chunk_and_chunk_sizes():
+    report = make_report(sections=60)
+    paragraph = "Some *content* with **markup** that wraps over several lines of the page. " * 8
+    for section in report["sections"]:
+        section["content"] += "\n\n" + "\n\n".join([paragraph] * 3)
+    report.pop("report_json")
+
+    start = time.perf_counter()
+    render_report_pdf_bytes(report)
+    whole_seconds = time.perf_counter() - start
+
+
+    async def first_chunk():
+        renderer = PDFRenderer(workers=2)
+        try:
+            # Start the worker processes before timing
+            [part async for part in renderer.render_stream(make_report(sections=0))]
+            stream = renderer.render_stream(report)
+            start = time.perf_counter()
+            chunks = [await stream.__anext__()]
+            first = time.perf_counter() - start
+            chunks += [part async for part in stream]
+            return first, time.perf_counter() - start, chunks
+        finally:
+            renderer.shutdown()
+
+    first, total, chunks = asyncio.run(first_chunk())
+    data = b"".join(chunks)
+    pages = check_pdf(data)
+    largest = max(len(chunk) for chunk in chunks)
+    print(f"60 sections ({pages} pages): single build {whole_seconds * 1000:.0f} ms, "
+          f"streamed first chunk {first * 1000:.0f} ms, streamed total {total * 1000:.0f} ms")
+    print(f"PDF size {len(data) / 1e3:.0f} KB, largest chunk held {largest / 1e3:.0f} KB")
+    assert data.startswith(b"%PDF") and first < total
+    # Only a page group at a time is buffered, never the whole PDF
+    assert largest < len(data) / 4
+    print("First chunk test passed")
+
+
+def test_endpoint_streams_large_reports_and_caches_them():
+    report = make_report(sections=20)
+    db = MemoryRepository(reports=[report])
+    set_repository(db)
+    set_pdf_renderer(PDFRenderer(workers=0))
+    set_pdf_cache(PDFCache())
+    app.dependency_overrides[get_current_user] = lambda: TEST_USER
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            url = f"/api/research/{report['id']}/pdf"
+            streamed, cached = await client.get(url), await client.get(url)
+            # Resuming the download on a process without the cached copy
+            set_pdf_cache(PDFCache())
+            resumed = await client.get(url, headers={"Range": "bytes=100-", "If-Range": streamed.headers["etag"]})
+            return streamed, cached, resumed
+
+    try:
+        streamed, cached, resumed = asyncio.run(run())
+    finally:
+        set_repository(None)
+        set_pdf_renderer(None)
+        set_pdf_cache(None)
+        app.dependency_overrides.pop(get_current_user, None)
+
+    assert streamed.status_code == 200
+    assert "content-length" not in streamed.headers
+    assert streamed.headers["etag"] == cached.headers["etag"]
+    check_pdf(streamed.content)
+    # The streamed PDF was cached as it went out
+    assert cached.content == streamed.content
+    assert cached.headers["content-length"] == str(len(streamed.content))
+    # A one-shot render is a different file, so the range is not cut from it
+    assert resumed.headers["etag"] != streamed.headers["etag"]
+    assert resumed.status_code == 200 and resumed.content.startswith(b"%PDF")
+    print("Streaming endpoint test passed")
+
+
+if __name__ == "__main__":
+    test_merged_groups_match_the_single_document()
+    test_first_chunk_and_chunk_sizes()
+    test_endpoint_streams_large_reports_and_caches_them()
@@ -0,0 +1,174 @@
+import os
+import asyncio
+import threading
+import time
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+import httpx
+
+from app.main import app
+from app.routers import research
+from app.routers.auth import get_current_user
+from app.services import pdf_renderer
+from app.services.pdf_cache import PDFCache, set_pdf_cache
+from app.services.pdf_renderer import PDFRenderer, RendererBusy, set_pdf_renderer
+from app.utils import metrics
+from app.utils.pdf_report import render_report_pdf_bytes
+from app.services.repository import MemoryRepository, set_repository
+from test_pdf_cache import make_report, TEST_USER
+
+N_RENDERS = 4
+
+
+async def max_loop_lag(work):
+    """Run work() and return the longest stall of the event loop meanwhile"""
+    lag = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lag = max(lag, time.perf_counter() - start - 0.005)
+
+    tick = asyncio.create_task(ticker())
+    # Let the ticker start before the work begins
+    await asyncio.sleep(0.01)
+    try:
+        result = await work()
+    finally:
+        done = True
+        await tick
+    return result, lag
+
+
+def test_renders_off_the_event_loop():
+    report = make_report(sections=40)
+    renderer = PDFRenderer(workers=2, max_pending=N_RENDERS)
+
+    async def run():
+        # Start the worker processes before measuring
+        await renderer.render(make_report(sections=1))
+
+        async def inline():
+            return [render_report_pdf_bytes(report) for _ in range(N_RENDERS)]
+
+        async def pooled():
+            return await asyncio.gather(*[renderer.render(report) for _ in range(N_RENDERS)])
+
+        inline_pdfs, inline_lag = await max_loop_lag(inline)
+        pooled_pdfs, pooled_lag = await max_loop_lag(pooled)
+        return inline_pdfs, inline_lag, pooled_pdfs, pooled_lag
+
+    try:
+        inline_pdfs, inline_lag, pooled_pdfs, pooled_lag = asyncio.run(run())
+    finally:
+        renderer.shutdown()
+
+    print(f"Max event loop stall, inline: {inline_lag * 1000:.1f} ms, process pool: {pooled_lag * 1000:.1f} ms")
+    assert all(pdf.data.startswith(b"%PDF") for pdf in pooled_pdfs)
+    assert pooled_pdfs[0].size == len(inline_pdfs[0])
+    assert pooled_lag < inline_lag / 2
+
+
+def test_back_pressure_and_timeout():
+    async def run():
+        renderer = PDFRenderer(workers=0, max_pending=1, timeout=0.001)
+        try:
+            first = asyncio.create_task(renderer.render(make_report(sections=40)))
+            await asyncio.sleep(0)
+            # The only slot is taken, so the next render is turned away at once
+            try:
+                await renderer.render(make_report(sections=1))
+                assert False, "expected RendererBusy"
+            except RendererBusy as e:
+                assert e.retry_after > 0
+
+            # The first render outlives its timeout...
+            try:
+                await first
+                assert False, "expected a timeout"
+            except RendererBusy as e:
+                assert "timed out" in str(e)
+            # ...but keeps its slot until it actually finishes
+            assert renderer._pending == 1
+            while renderer._pending:
+                await asyncio.sleep(0.01)
+        finally:
+            renderer.shutdown()
+
+    metrics.reset()
+    asyncio.run(run())
+    assert metrics.get_counter("pdf_render.rejected") == 1
+    assert metrics.get_counter("pdf_render.timeouts") == 1
+    print("Back-pressure and timeout test passed")
+
+
+def test_closed_stream_keeps_its_slot_until_groups_end():
+    release = threading.Event()
+    render_page_group = pdf_renderer.render_page_group
+    calls = []
+
+    def slow_page_group(report_data, group):
+        # Every group after the first is still being laid out when the stream closes
+        calls.append(group)
+        if len(calls) > 1:
+            release.wait(5)
+        return render_page_group(report_data, group)
+
+    async def run():
+        renderer = PDFRenderer(workers=0)
+        stream = renderer.render_stream(make_report(sections=20), sections_per_group=4)
+        await stream.__anext__()
+        closing = asyncio.create_task(stream.aclose())
+        await asyncio.sleep(0.05)
+        held = not closing.done() and renderer._pending == 1
+        release.set()
+        await closing
+        return held, renderer._pending
+
+    pdf_renderer.render_page_group = slow_page_group
+    try:
+        held, pending = asyncio.run(run())
+    finally:
+        pdf_renderer.render_page_group = render_page_group
+    assert held and pending == 0
+    print("Closed stream slot test passed")
+
+
+def test_endpoint_returns_503_when_saturated():
+    report = make_report()
+    db = MemoryRepository(reports=[report])
+    set_repository(db)
+    set_pdf_cache(PDFCache())
+    set_pdf_renderer(PDFRenderer(workers=0, max_pending=0))
+    app.dependency_overrides[get_current_user] = lambda: TEST_USER
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(f"/api/research/{report['id']}/pdf")
+
+    try:
+        response = asyncio.run(run())
+    finally:
+        set_repository(None)
+        set_pdf_cache(None)
+        set_pdf_renderer(None)
+        app.dependency_overrides.pop(get_current_user, None)
+
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) > 0
+    print("Saturation test passed")
+
+
+if __name__ == "__main__":
+    test_renders_off_the_event_loop()
+    test_back_pressure_and_timeout()
+    test_closed_stream_keeps_its_slot_until_groups_end()
+    test_endpoint_returns_503_when_saturated()
@@ -0,0 +1,115 @@
+import os
+import asyncio
+import tempfile
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+import httpx
+
+from app.main import app
+from app.routers import research
+from app.routers.auth import get_current_user
+from app.services.pdf_cache import PDFCache, set_pdf_cache
+from app.services.pdf_renderer import PDFRenderer, set_pdf_renderer
+from app.utils.http_cache import parse_range
+from app.services.repository import MemoryRepository, set_repository
+from test_pdf_cache import make_report, TEST_USER
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    # Multiple ranges are answered with the whole body
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    for unsatisfiable in ("bytes=100-", "bytes=10-5", "bytes=-0"):
+        try:
+            parse_range(unsatisfiable, 100)
+            assert False, unsatisfiable
+        except ValueError:
+            pass
+    print("Range parsing test passed")
+
+
+async def download(report_id, **headers):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get(f"/api/research/{report_id}/pdf", headers=headers)
+
+
+def with_pdf_services(renderer, cache, run):
+    db = MemoryRepository()
+    # Below PDF_STREAM_MIN_SECTIONS, so the PDF is rendered in one go
+    report = make_report(sections=10)
+    db.reports = [report]
+    set_repository(db)
+    set_pdf_renderer(renderer)
+    set_pdf_cache(cache)
+    app.dependency_overrides[get_current_user] = lambda: TEST_USER
+    try:
+        return asyncio.run(run(report["id"]))
+    finally:
+        set_repository(None)
+        set_pdf_renderer(None)
+        set_pdf_cache(None)
+        app.dependency_overrides.pop(get_current_user, None)
+
+
+def test_range_requests():
+    async def run(report_id):
+        full = await download(report_id)
+        head = await download(report_id, Range="bytes=0-99")
+        tail = await download(report_id, Range="bytes=-100")
+        stale = await download(report_id, Range="bytes=0-99", **{"If-Range": '"other"'})
+        bad = await download(report_id, Range=f"bytes={len(full.content)}-")
+        return full, head, tail, stale, bad
+
+    full, head, tail, stale, bad = with_pdf_services(PDFRenderer(workers=0), PDFCache(), run)
+
+    size = len(full.content)
+    assert full.status_code == 200
+    assert full.headers["content-length"] == str(size)
+    assert full.headers["accept-ranges"] == "bytes"
+    assert head.status_code == 206 and head.content == full.content[:100]
+    assert head.headers["content-range"] == f"bytes 0-99/{size}"
+    assert tail.status_code == 206 and tail.content == full.content[-100:]
+    # If-Range with another version's ETag gets the whole new body
+    assert stale.status_code == 200 and stale.content == full.content
+    assert bad.status_code == 416 and bad.headers["content-range"] == f"bytes */{size}"
+    print("Range request test passed")
+
+
+def test_large_pdfs_spill_to_disk_and_are_cleaned_up():
+    spool_dir = tempfile.mkdtemp()
+    cache_dir = tempfile.mkdtemp()
+    # Every PDF counts as large here
+    renderer = PDFRenderer(workers=0, spool_max_memory=1024, spool_dir=spool_dir)
+    cache = PDFCache(directory=cache_dir, max_entry_bytes=1024)
+
+    async def run(report_id):
+        first = await download(report_id)
+        partial = await download(report_id, Range="bytes=10-19")
+        return first, partial
+
+    first, partial = with_pdf_services(renderer, cache, run)
+
+    assert first.status_code == 200 and first.content.startswith(b"%PDF")
+    assert first.headers["content-length"] == str(len(first.content))
+    assert partial.status_code == 206 and partial.content == first.content[10:20]
+    # The spilled render's temporary file is gone, and the large PDF was kept
+    # on disk only
+    assert os.listdir(spool_dir) == []
+    assert len(os.listdir(cache_dir)) == 1
+    assert cache._entries == {}
+    print("Spill-to-disk test passed")
+
+
+if __name__ == "__main__":
+    test_parse_range()
+    test_range_requests()
+    test_large_pdfs_spill_to_disk_and_are_cleaned_up()
@@ -0,0 +1,117 @@
+import os
+import asyncio
+import json
+import uuid
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routers import research
+from app.routers.auth import get_current_user
+from app.services.gemini_service import GeminiService, set_gemini_service
+from app.services.progress_bus import MemoryProgressBus, set_progress_bus
+from app.services.task_store import MemoryTaskStore, set_task_store, get_task_store
+from app.services.repository import MemoryRepository, set_repository
+from test_concurrency import FakeGeminiClient, TEST_USER
+
+
+def parse_sse(body):
+    """Turn an SSE body into a list of event dicts"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        for line in block.split("\n"):
+            if line.startswith("data: "):
+                events.append(json.loads(line[len("data: "):]))
+    return events
+
+
+def setup():
+    set_gemini_service(GeminiService(client=FakeGeminiClient()))
+    set_task_store(MemoryTaskStore())
+    set_progress_bus(MemoryProgressBus())
+    set_repository(MemoryRepository())
+
+
+def teardown():
+    set_gemini_service(None)
+    set_task_store(None)
+    set_progress_bus(None)
+    set_repository(None)
+    app.dependency_overrides.pop(get_current_user, None)
+
+
+def test_sse_streams_status_and_partial_output():
+    setup()
+    app.dependency_overrides[get_current_user] = lambda: TEST_USER
+
+    async def run():
+        research_id = str(uuid.uuid4())
+        await get_task_store().create(research_id, user_id=TEST_USER["id"], topic="AI")
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            watcher = asyncio.create_task(client.get(f"/api/research/{research_id}/events"))
+            await asyncio.sleep(0.05)
+            await research.conduct_research(research_id, "AI", None, TEST_USER["id"])
+            response = await asyncio.wait_for(watcher, 5)
+        return response
+
+    try:
+        response = asyncio.run(run())
+    finally:
+        teardown()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = parse_sse(response.text)
+    statuses = [event["status"] for event in events if event["type"] == "status"]
+    assert statuses[0] == "in_progress"
+    assert "processing" in statuses
+    assert statuses[-1] == "completed"
+
+    # Each section is streamed whole as soon as it is written
+    text = "".join(event["text"] for event in events if event["type"] == "delta")
+    first, second = "## Section 1\n\nContent\n\n", "## Section 2\n\nContent\n\n"
+    assert text in (first + second, second + first)
+    sections = [event["value"]["title"] for event in events if event["type"] == "section"]
+    assert sorted(sections) == ["Section 1", "Section 2"]
+    assert [event["value"] for event in events if event["type"] == "summary"] == ["Summary"]
+
+
+def test_websocket_replays_partial_output():
+    setup()
+
+    async def fake_validate_token(token):
+        return TEST_USER
+
+    original_validate = research.validate_token
+    research.validate_token = fake_validate_token
+
+    research_id = str(uuid.uuid4())
+    client = TestClient(app)
+    try:
+        # A task that is halfway through generating when the client connects
+        asyncio.run(get_task_store().create(research_id, user_id=TEST_USER["id"], topic="AI", status="processing"))
+        bus = research.get_progress_bus()
+        asyncio.run(bus.append_text(research_id, "partial "))
+
+        with client.websocket_connect(f"/api/research/{research_id}/ws?token=abc") as websocket:
+            first = websocket.receive_json()
+            assert first["type"] == "status" and first["status"] == "processing"
+            snapshot = websocket.receive_json()
+            assert snapshot == {"type": "delta", "offset": 0, "text": "partial "}
+    finally:
+        research.validate_token = original_validate
+        teardown()
+
+
+if __name__ == "__main__":
+    test_sse_streams_status_and_partial_output()
+    test_websocket_replays_partial_output()
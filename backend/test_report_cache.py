@@ -0,0 +1,170 @@
+import os
+import json
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+import httpx
+
+from app.main import app
+from app.routers import research
+from app.routers.auth import get_current_user
+from app.services.job_queue import JobQueue, MemoryBroker, set_job_queue
+from app.services.report_cache import (
+    ReportCache,
+    SimilarityIndex,
+    cache_key,
+    normalize_text,
+    set_report_cache,
+)
+from app.services.task_store import get_task_store
+from app.utils import metrics
+from app.utils.report_codec import decode_report
+from app.services.repository import MemoryRepository
+
+TEST_USER = {"id": 2, "email": "cache@test.dev", "username": "cache"}
+
+
+def saved_report(topic, additional_context=None, age=timedelta(0), user_id=1):
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "topic": topic,
+        "summary": f"Summary of {topic}",
+        "sections": [{"title": "Section", "content": "Content"}],
+        "sources": [],
+        "created_at": (datetime.utcnow() - age).isoformat(),
+        "report_json": json.dumps({"summary": f"Summary of {topic}", "sections": [{"title": "Section", "content": "Content"}], "sources": []}),
+        "topic_key": cache_key(topic, additional_context),
+    }
+
+
+def test_normalization():
+    assert normalize_text("The Impact of AI on Healthcare!") == normalize_text("impact AI healthcare")
+    # Word order decides what a topic is about
+    assert cache_key("Migrating from Java to Kotlin") != cache_key("Migrating from Kotlin to Java")
+    assert cache_key("US exports to China") != cache_key("China exports to US")
+    assert cache_key("Quantum computing", None) == cache_key("  quantum   COMPUTING ", "")
+    assert cache_key("Quantum computing", "for beginners") != cache_key("Quantum computing", None)
+    print("Normalization test passed")
+
+
+def test_similarity_index():
+    index = SimilarityIndex()
+    index.add("a", normalize_text("impact of artificial intelligence on healthcare"), 100.0)
+    index.add("b", normalize_text("history of the roman empire"), 100.0)
+
+    match = index.query(normalize_text("impacts of artificial intelligence on healthcare"), 0.8, 0.0)
+    assert match is not None and match[0] == "a"
+    assert index.query(normalize_text("renewable energy policy"), 0.8, 0.0) is None
+    # The same words in another order are not a near-duplicate either
+    index.add("c", normalize_text("migrating from java to kotlin"), 100.0)
+    assert index.query(normalize_text("migrating from kotlin to java"), 0.8, 0.0) is None
+    # Entries older than the freshness cutoff are ignored
+    assert index.query(normalize_text("impact of artificial intelligence on healthcare"), 0.8, 200.0) is None
+    print("Similarity index test passed")
+
+
+def test_exact_and_similar_hits():
+    metrics.reset()
+    db = MemoryRepository()
+    exact = saved_report("Impact of AI on healthcare")
+    similar = saved_report("Impact of artificial intelligence on healthcare")
+    db.reports = [exact, similar]
+    cache = ReportCache(repository=db, ttl=3600, similarity=0.8)
+
+    new_id = str(uuid.uuid4())
+    source = asyncio.run(cache.get_or_clone(new_id, 7, "The impact of AI on healthcare?"))
+    assert source == exact["id"]
+    clone = next(decode_report(row, db.source_index) for row in db.reports if row["id"] == new_id)
+    # The clone belongs to the new user and keeps the cached report body
+    assert clone["user_id"] == 7
+    assert clone["topic"] == "The impact of AI on healthcare?"
+    assert clone["summary"] == exact["summary"]
+    # ...but is never matched itself
+    assert clone["topic_key"] is None
+
+    source = asyncio.run(cache.get_or_clone(str(uuid.uuid4()), 7, "Impacts of artificial intelligence on healthcare"))
+    assert source == similar["id"]
+
+    # Additional context is only matched exactly
+    assert asyncio.run(cache.get_or_clone(
+        str(uuid.uuid4()), 7, "Impacts of artificial intelligence on healthcare", "focus on radiology"
+    )) is None
+
+    assert metrics.get_counter("report_cache.hits_exact") == 1
+    assert metrics.get_counter("report_cache.hits_similar") == 1
+    assert metrics.get_counter("report_cache.misses") == 1
+    assert metrics.get_counter("report_cache.generations_saved") == 2
+    assert abs(metrics.snapshot()["gauges"]["report_cache.hit_ratio"] - 2 / 3) < 1e-9
+    print("Exact and similar hit test passed")
+
+
+def test_stale_reports_miss():
+    db = MemoryRepository(reports=[saved_report("Solar power", age=timedelta(days=30))])
+    cache = ReportCache(repository=db, ttl=7 * 24 * 60 * 60)
+    assert asyncio.run(cache.get_or_clone(str(uuid.uuid4()), 7, "Solar power")) is None
+
+    # Hits don't extend the TTL: it runs from when the original was generated
+    db = MemoryRepository(reports=[saved_report("Wind power", age=timedelta(days=6))])
+    assert asyncio.run(ReportCache(repository=db, ttl=7 * 24 * 60 * 60).get_or_clone(str(uuid.uuid4()), 7, "Wind power"))
+    assert asyncio.run(ReportCache(repository=db, ttl=5 * 24 * 60 * 60).get_or_clone(str(uuid.uuid4()), 7, "Wind power")) is None
+    print("Stale report test passed")
+
+
+async def post_research(client, topic, force_refresh=False):
+    response = await client.post("/api/research/", json={"topic": topic, "force_refresh": force_refresh})
+    assert response.status_code == 200
+    return response.json()
+
+
+async def run_endpoint_test():
+    db = MemoryRepository(reports=[saved_report("Ocean acidification")])
+    set_report_cache(ReportCache(repository=db, ttl=3600))
+    queue = JobQueue(MemoryBroker())
+    set_job_queue(queue)
+    app.dependency_overrides[get_current_user] = lambda: TEST_USER
+
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            cached = await post_research(client, "ocean acidification")
+            fresh = await post_research(client, "ocean acidification", force_refresh=True)
+        return (
+            cached,
+            await get_task_store().get(cached["research_id"]),
+            fresh,
+            await queue.get_job(cached["research_id"]),
+            await queue.get_job(fresh["research_id"]),
+        )
+    finally:
+        set_report_cache(None)
+        set_job_queue(None)
+        app.dependency_overrides.pop(get_current_user, None)
+
+
+def test_request_research_uses_cache():
+    cached, cached_task, fresh, cached_job, fresh_job = asyncio.run(run_endpoint_test())
+
+    # A cache hit completes immediately without queueing a generation
+    assert cached["status"] == "completed"
+    assert cached_task["status"] == "completed" and cached_task["progress"] == 100
+    assert cached_job is None
+
+    # force_refresh always queues a new generation
+    assert fresh["status"] == "in_progress"
+    assert fresh_job is not None
+    print("Request research cache test passed")
+
+
+if __name__ == "__main__":
+    test_normalization()
+    test_similarity_index()
+    test_exact_and_similar_hits()
+    test_stale_reports_miss()
+    test_request_research_uses_cache()
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime
+
+from app.services.repository import MemoryRepository, backfill_report_storage
+from app.utils.pdf_report import pdf_cache_key
+from app.utils.report_codec import decode_report, encode_report, needs_body, storage_columns
+
+# A vocabulary with a Zipf-like spread, so the text compresses about as
+# well as English prose does
+_rng = random.Random(42)
+WORDS = ["".join(_rng.choice("etaoinshrdlucmfwypvbgkjqxz"[:8 + i % 18]) for _ in range(2 + i % 9)) for i in range(3000)]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(WORDS))]
+N_TIMINGS = 200
+
+
+def make_report(target_bytes=40000, seed=0):
+    """A report of roughly target_bytes of JSON, shaped like Gemini's output"""
+    rng = random.Random(seed)
+
+    def paragraph(words):
+        return " ".join(rng.choices(WORDS, WEIGHTS, k=words)).capitalize() + "."
+
+    sections = []
+    while len(json.dumps(sections)) < target_bytes:
+        sections.append({
+            "title": paragraph(4),
+            "content": "\n\n".join(f"## {paragraph(3)}\n\n{paragraph(120)}\n\n- {paragraph(12)}" for _ in range(3)),
+        })
+    result = {
+        "summary": paragraph(250),
+        "sections": sections,
+        "sources": [
+            {"title": paragraph(5), "url": f"https://example.com/{i}", "snippet": paragraph(30)} for i in range(10)
+        ],
+    }
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": 1,
+        "topic": "Grid storage",
+        "created_at": datetime(2025, 1, 1, seed % 24).isoformat(),
+        "summary": result["summary"],
+        "sections": result["sections"],
+        "sources": result["sources"],
+        "report_json": json.dumps(result),
+        "topic_key": "grid storage",
+        "section_count": len(sections),
+        "word_count": 0,
+    }
+
+
+def timed(call, *args):
+    start = time.perf_counter()
+    for _ in range(N_TIMINGS):
+        result = call(*args)
+    return result, (time.perf_counter() - start) / N_TIMINGS * 1000
+
+
+def test_round_trip():
+    report = make_report()
+    decoded = decode_report(encode_report(report))
+    assert decoded == report
+    # PDFs cached before the migration are still found
+    assert pdf_cache_key(decoded) == pdf_cache_key(report)
+    # Legacy rows pass through untouched, and encoding is idempotent
+    assert decode_report(report) == report
+    assert encode_report(encode_report(report)) == encode_report(report)
+    try:
+        decode_report(dict(encode_report(report), storage_version=99))
+        assert False, "unknown version was decoded"
+    except ValueError:
+        pass
+    print("Codec round trip test passed")
+
+
+def test_columns():
+    assert not needs_body("id, topic, created_at")
+    assert needs_body("*") and needs_body("id, sections")
+    assert storage_columns("id, topic") == "id, topic"
+    assert storage_columns("*") == "*"
+    assert storage_columns("id, sections") == "id, storage_version, body, summary, sections, sources, report_json"
+    print("Codec column test passed")
+
+
+def test_size_and_latency():
+    print("size (bytes moved by select *) and latency per report:")
+    for target in (20000, 40000, 60000):
+        report = make_report(target)
+        legacy = json.dumps(report)
+        encoded_row, encode_ms = timed(encode_report, report)
+        stored = json.dumps(encoded_row)
+        _, legacy_parse_ms = timed(json.loads, legacy)
+        _, decode_ms = timed(lambda: decode_report(json.loads(stored)))
+        header = {key: value for key, value in encoded_row.items() if key not in ("body",)}
+        header_size = len(json.dumps(header))
+
+        ratio = len(stored) / len(legacy)
+        print(
+            f"  {len(report['report_json']) // 1000}KB report: legacy row {len(legacy)}, "
+            f"encoded row {len(stored)} ({ratio:.0%}), header only {header_size}; "
+            f"encode {encode_ms:.2f}ms, decode {decode_ms:.2f}ms vs legacy parse {legacy_parse_ms:.2f}ms"
+        )
+        assert ratio < 0.4
+        assert header_size < 1000
+
+
+def test_backfill_converts_legacy_rows():
+    legacy = [make_report(5000, seed=i) for i in range(25)]
+    db = MemoryRepository()
+    # Rows written before the codec existed
+    db.reports = [dict(report) for report in legacy]
+    # One report was already written in the new format
+    asyncio.run(db.upsert_report(legacy[0]))
+
+    stats = asyncio.run(backfill_report_storage(db, batch_size=7))
+    assert stats["scanned"] == 25 and stats["converted"] == 24
+    assert stats["bytes_after"] < stats["bytes_before"] * 0.4
+    assert all(row["storage_version"] in (1, 2) and row["summary"] is None for row in db.reports)
+    for report in legacy:
+        assert asyncio.run(db.get_report(report["id"])) == report
+
+    again = asyncio.run(backfill_report_storage(db))
+    assert again["converted"] == 0
+    print(f"Backfill converted {stats['converted']} reports: {stats['bytes_before']} -> {stats['bytes_after']} bytes")
+
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_columns()
+    test_size_and_latency()
+    test_backfill_converts_legacy_rows()
@@ -0,0 +1,119 @@
+import io
+import os
+import re
+import asyncio
+import zipfile
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+import httpx
+
+from app.main import app
+from app.routers import research
+from app.routers.auth import get_current_user
+from app.services.pdf_cache import PDFCache, set_pdf_cache
+from app.services.pdf_renderer import PDFRenderer, set_pdf_renderer
+from app.utils import metrics
+from app.utils.pdf_report import pdf_cache_key, render_report_pdf_bytes
+from app.services.repository import MemoryRepository, set_repository
+from test_pdf_cache import make_report, TEST_USER
+from test_pdf_page_groups import check_pdf, page_count
+
+
+def make_reports():
+    reports = []
+    for i, topic in enumerate(["Solar power", "Wind power", "Tidal power"]):
+        report = make_report(sections=3)
+        report.update(topic=topic, created_at=f"2025-03-0{i + 1}T12:00:00")
+        reports.append(report)
+    # Someone else's report is never exported
+    reports.append(dict(make_report(user_id=99, sections=1), created_at="2025-03-02T00:00:00"))
+    return reports
+
+
+def export(reports, payload, cache=None):
+    db = MemoryRepository(reports=reports)
+    queries = []
+    list_reports = db.list_reports
+    db.list_reports = lambda *args, **kwargs: queries.append(kwargs) or list_reports(*args, **kwargs)
+    set_repository(db)
+    set_pdf_renderer(PDFRenderer(workers=0))
+    set_pdf_cache(cache or PDFCache())
+    app.dependency_overrides[get_current_user] = lambda: TEST_USER
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/research/export", json=payload)
+
+    try:
+        return asyncio.run(run()), queries
+    finally:
+        set_repository(None)
+        set_pdf_renderer(None)
+        set_pdf_cache(None)
+        app.dependency_overrides.pop(get_current_user, None)
+
+
+def test_zip_export_by_ids():
+    metrics.reset()
+    reports = make_reports()
+    cache = PDFCache()
+    # One of the PDFs is already cached and is not rendered again
+    cache.put(pdf_cache_key(reports[1]), render_report_pdf_bytes(reports[1]))
+    ids = [reports[2]["id"], reports[0]["id"], reports[1]["id"], reports[3]["id"]]
+
+    response, queries = export(reports, {"research_ids": ids}, cache)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    assert len(queries) == 1
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert archive.testzip() is None
+    names = archive.namelist()
+    assert names == [
+        "01_DeepR_Research_Tidal_power.pdf",
+        "02_DeepR_Research_Solar_power.pdf",
+        "03_DeepR_Research_Wind_power.pdf",
+    ]
+    assert all(archive.read(name).startswith(b"%PDF") for name in names)
+    assert metrics.get_counter("export.cached") == 1
+    assert metrics.get_counter("export.rendered") == 2
+    print("ZIP export test passed")
+
+
+def test_merged_pdf_export_by_date_range():
+    reports = make_reports()
+    payload = {"start_date": "2025-03-02T00:00:00", "end_date": "2025-03-03T23:59:59", "format": "pdf"}
+
+    response, _ = export(reports, payload)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/pdf"
+    pages = check_pdf(response.content)
+    single = sum(page_count(render_report_pdf_bytes(report)) for report in reports[1:3])
+    # A contents page, then the two reports in the range
+    assert pages == 1 + single
+    titles = re.findall(rb"/Title \(([^)]*)\) /Parent", response.content)
+    assert titles == [b"Contents", b"Wind power", b"Tidal power"]
+    print("Merged PDF export test passed")
+
+
+def test_export_errors():
+    reports = make_reports()
+    response, _ = export(reports, {})
+    assert response.status_code == 400
+    response, _ = export(reports, {"research_ids": [reports[3]["id"]]})
+    assert response.status_code == 404
+    response, _ = export(reports, {"research_ids": ["x"] * 51})
+    assert response.status_code == 400
+    print("Export error test passed")
+
+
+if __name__ == "__main__":
+    test_zip_export_by_ids()
+    test_merged_pdf_export_by_date_range()
+    test_export_errors()
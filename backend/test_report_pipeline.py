@@ -0,0 +1,228 @@
+import os
+import json
+import asyncio
+import time
+import uuid
+from types import SimpleNamespace
+
+from google.genai import Client
+from google.genai._transformers import t_schema
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+from app.models.research import ReportOutline, ResearchReportOutput, SectionOutput
+from app.routers import research
+from app.services.gemini_service import GeminiService, set_gemini_service
+from app.services.progress_bus import MemoryProgressBus, set_progress_bus
+from app.services.report_pipeline import (
+    PLANNER_PROMPT,
+    SECTION_PROMPT,
+    SUMMARY_PROMPT,
+    SectionParseError,
+    generate_report,
+    merge_sources,
+    parse_section,
+)
+from app.services.repository import MemoryRepository, set_repository
+from app.services.task_store import MemoryTaskStore, set_task_store
+from app.utils import metrics
+from app.utils.report_codec import decode_report
+from test_concurrency import FAKE_REPORT, TEST_USER
+
+N_SECTIONS = 6
+SECTION_DELAY = 0.2
+# Characters per section: together far beyond one 8192-token output window
+SECTION_CHARS = 12000
+
+
+class PipelineModels:
+    """Fake client.aio.models: slow sections, fast planning and summary"""
+
+    def __init__(self, outline=None, fail_section=None, fail_planner=False):
+        self.outline = outline if outline is not None else json.dumps({
+            "sections": [{"title": f"Part {i}", "brief": f"Covers part {i}"} for i in range(N_SECTIONS)]
+        })
+        self.fail_section = fail_section
+        self.fail_planner = fail_planner
+        self.broken_section = None
+        self.started = []
+        self.finished = []
+
+    async def generate_content_stream(self, model, contents, config):
+        prompt = contents[0].parts[0].text
+        if prompt.startswith(PLANNER_PROMPT):
+            if self.fail_planner:
+                raise RuntimeError("Gemini unavailable")
+            reply, delay = self.outline, 0.01
+        elif prompt.startswith(SECTION_PROMPT):
+            index = int(prompt.rsplit("Write section ", 1)[1].split(":")[0]) - 1
+            self.started.append(index)
+            if index == self.fail_section:
+                raise RuntimeError("Gemini unavailable")
+            # Every section cites the same source under a different spelling, plus its own
+            reply = json.dumps({
+                "content": (f"Words of part {index}. " * SECTION_CHARS)[:SECTION_CHARS],
+                "sources": [
+                    {"title": "Shared", "url": ["https://www.example.com/a/", "http://example.com/a", "https://example.com/a#x"][index % 3]},
+                    {"title": f"Own {index}", "url": f"https://example.org/{index}", "snippet": "A source"},
+                ],
+            })
+            delay = SECTION_DELAY
+            if index == self.broken_section:
+                # Output cut off in the middle of the JSON
+                reply = reply[:len(reply) // 2]
+        elif prompt.startswith(SUMMARY_PROMPT):
+            reply, delay = "The summary.", 0.01
+        else:
+            reply, delay = FAKE_REPORT, 0.01
+
+        async def stream():
+            await asyncio.sleep(delay)
+            if prompt.startswith(SECTION_PROMPT):
+                self.finished.append(index)
+            yield SimpleNamespace(text=reply)
+        return stream()
+
+
+def use_models(models, max_in_flight=8):
+    set_gemini_service(GeminiService(client=SimpleNamespace(aio=SimpleNamespace(models=models)), max_in_flight=max_in_flight))
+
+
+def test_response_schemas_are_accepted():
+    # The SDK's own conversion, which rejects defaults other than None
+    client = Client(api_key="test")
+    for model in (ResearchReportOutput, ReportOutline, SectionOutput):
+        t_schema(client, model)
+    print("Response schema test passed")
+
+
+def test_merge_sources():
+    merged = merge_sources([
+        [{"title": "A", "url": "https://www.example.com/page/"}, {"title": "B", "url": "https://example.com/other"}],
+        [{"title": "A again", "url": "http://example.com/page#top", "snippet": "Filled in"}],
+        [{"title": "Query", "url": "https://example.com/page?id=1"}],
+    ])
+    assert [source["title"] for source in merged] == ["A", "B", "Query"]
+    assert merged[0]["snippet"] == "Filled in"
+    print("Source merge test passed")
+
+
+def test_sections_run_concurrently_under_the_limit():
+    timings = {}
+    for max_in_flight in (N_SECTIONS, 2):
+        models = PipelineModels()
+        use_models(models, max_in_flight)
+        start = time.perf_counter()
+        try:
+            report = asyncio.run(generate_report("Tides", None, structured=False))
+        finally:
+            set_gemini_service(None)
+        timings[max_in_flight] = time.perf_counter() - start
+
+        # Sections come back in outline order whatever order they finished in
+        assert [section["title"] for section in report["sections"]] == [f"Part {i}" for i in range(N_SECTIONS)]
+        assert report["summary"] == "The summary."
+        # One shared source plus one per section
+        assert len(report["sources"]) == N_SECTIONS + 1
+
+    sequential = N_SECTIONS * SECTION_DELAY
+    print(
+        f"{N_SECTIONS} sections of {SECTION_DELAY}s: {timings[N_SECTIONS]:.2f}s unlimited, "
+        f"{timings[2]:.2f}s with 2 in flight ({sequential:.1f}s sequential)"
+    )
+    # Wall-clock time follows the slowest section, not their sum...
+    assert timings[N_SECTIONS] < SECTION_DELAY * 2
+    # ...while the shared limiter still caps how many run at once
+    assert timings[2] >= SECTION_DELAY * N_SECTIONS / 2
+
+
+def test_failed_section_cancels_the_rest():
+    models = PipelineModels(fail_section=0)
+    use_models(models)
+    try:
+        asyncio.run(generate_report("Tides", None, structured=False))
+        assert False, "the failed section was ignored"
+    except RuntimeError as e:
+        assert str(e) == "Gemini unavailable"
+    finally:
+        set_gemini_service(None)
+    assert models.finished == []
+    print("Failed section test passed")
+
+
+def test_unparseable_section_fails_the_attempt():
+    assert parse_section('{"content": "Line one\nLine two with \\d", "sources": []} and more') == {
+        "content": "Line one\nLine two with \\d", "sources": []
+    }
+    assert parse_section('{"content": "Cut off in the mid') is None
+
+    models = PipelineModels()
+    models.broken_section = 2
+    use_models(models)
+    try:
+        asyncio.run(generate_report("Tides", None, structured=False))
+        assert False, "the broken section was published"
+    except SectionParseError:
+        pass
+    finally:
+        set_gemini_service(None)
+    print("Unparseable section test passed")
+
+
+def run_job(models):
+    db = MemoryRepository()
+    set_repository(db)
+    set_task_store(MemoryTaskStore())
+    set_progress_bus(MemoryProgressBus())
+    use_models(models)
+    research_id = str(uuid.uuid4())
+    try:
+        asyncio.run(research.conduct_research(research_id, "Tides", None, TEST_USER["id"]))
+    finally:
+        set_repository(None)
+        set_task_store(None)
+        set_progress_bus(None)
+        set_gemini_service(None)
+    return decode_report(db.reports[0], db.source_index)
+
+
+def test_report_is_longer_than_one_output_window():
+    metrics.reset()
+    report = run_job(PipelineModels())
+    assert report["section_count"] == N_SECTIONS
+    # About 4 characters per token
+    assert len(report["report_json"]) > 8192 * 4 * 2
+    assert report["topic_key"] is not None
+    assert metrics.get_counter("gemini.requests") == N_SECTIONS + 2
+    print(f"Planned report: {report['section_count']} sections, {report['word_count']} words")
+
+
+def test_unusable_outline_falls_back_to_one_call():
+    metrics.reset()
+    report = run_job(PipelineModels(outline="not an outline"))
+    assert report["summary"] == "Summary"
+    assert metrics.get_counter("report_pipeline.plan_failed") == 1
+    assert metrics.get_counter("gemini.requests") == 2
+    print("Planning fallback test passed")
+
+
+def test_failed_planner_falls_back_to_one_call():
+    metrics.reset()
+    report = run_job(PipelineModels(fail_planner=True))
+    assert report["summary"] == "Summary"
+    assert metrics.get_counter("report_pipeline.plan_failed") == 1
+    print("Planner error fallback test passed")
+
+
+if __name__ == "__main__":
+    test_response_schemas_are_accepted()
+    test_merge_sources()
+    test_sections_run_concurrently_under_the_limit()
+    test_failed_section_cancels_the_rest()
+    test_unparseable_section_fails_the_attempt()
+    test_report_is_longer_than_one_output_window()
+    test_unusable_outline_falls_back_to_one_call()
+    test_failed_planner_falls_back_to_one_call()
@@ -0,0 +1,148 @@
+import os
+import asyncio
+import time
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+import httpx
+
+from app.main import app
+from app.routers.auth import get_current_user
+from app.services.repository import MemoryRepository, set_repository
+from app.services.response_cache import CachedResponse, ResponseCache, set_response_cache
+from app.services.task_store import MemoryTaskStore, set_task_store
+from app.utils import metrics
+from test_pdf_cache import make_report, TEST_USER
+
+N_TIMINGS = 50
+
+
+class CountingRepository(MemoryRepository):
+    """Memory repository that counts report reads"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.reads = 0
+
+    async def get_report(self, report_id, user_id=None, columns="*"):
+        self.reads += 1
+        return await super().get_report(report_id, user_id=user_id, columns=columns)
+
+
+def fetch(db, requests, user=TEST_USER, store=None):
+    """Run (path, headers) requests against the app and return the responses"""
+    set_repository(db)
+    set_task_store(store or MemoryTaskStore())
+    app.dependency_overrides[get_current_user] = lambda: user
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [await client.get(path, headers=headers) for path, headers in requests]
+
+    try:
+        return asyncio.run(run())
+    finally:
+        set_repository(None)
+        set_task_store(None)
+        app.dependency_overrides.pop(get_current_user, None)
+
+
+def test_lru_byte_budget():
+    cache = ResponseCache(max_bytes=250)
+    for i in range(3):
+        cache.put(f"key-{i}", CachedResponse.build(bytes([i]) * 100, user_id=1))
+    assert "key-0" not in cache and "key-2" in cache
+    # Reading an entry makes it the most recently used
+    cache.get("key-1")
+    cache.put("key-3", CachedResponse.build(b"x" * 100, user_id=1))
+    assert "key-1" in cache and "key-2" not in cache
+    # Entries larger than the whole budget are not kept
+    cache.put("huge", CachedResponse.build(b"x" * 300, user_id=1))
+    assert "huge" not in cache
+    print("Response LRU test passed")
+
+
+def test_etag_and_not_modified():
+    set_response_cache(ResponseCache())
+    report = make_report()
+    db = CountingRepository(reports=[report])
+    url = f"/api/research/{report['id']}"
+
+    first, second = fetch(db, [(url, None), (url, None)])
+    assert first.status_code == 200 and first.json()["sections"] == report["sections"]
+    assert first.headers["cache-control"] == "private, max-age=31536000, immutable"
+    etag = first.headers["etag"]
+    assert etag.startswith('"') and not etag.startswith("W/")
+    # The repeat view came from the LRU, byte for byte
+    assert second.content == first.content and second.headers["etag"] == etag
+    assert db.reads == 1
+
+    not_modified, = fetch(db, [(url, {"If-None-Match": etag})])
+    assert not_modified.status_code == 304 and not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+    assert db.reads == 1
+
+    # Another process, with a cold cache, derives the same ETag from the same row
+    set_response_cache(ResponseCache())
+    cold, = fetch(db, [(url, {"If-None-Match": etag})])
+    assert cold.status_code == 304 and db.reads == 2
+    set_response_cache(None)
+    print("Report ETag test passed")
+
+
+def test_cache_respects_ownership_and_progress():
+    set_response_cache(ResponseCache())
+    report = make_report()
+    db = CountingRepository(reports=[report])
+    url = f"/api/research/{report['id']}"
+    fetch(db, [(url, None)])
+
+    # A cached report is still only served to its owner
+    other = dict(TEST_USER, id=99)
+    response, = fetch(db, [(url, None)], user=other)
+    assert response.status_code == 404
+
+    # Unfinished research is never cached
+    store = MemoryTaskStore()
+    asyncio.run(store.create("pending", status="in_progress", user_id=TEST_USER["id"]))
+    response, = fetch(db, [("/api/research/pending", None)], store=store)
+    assert response.status_code == 400
+    set_response_cache(None)
+    print("Report cache ownership test passed")
+
+
+def test_repeat_view_latency():
+    report = make_report(sections=40)
+    url = f"/api/research/{report['id']}"
+    timings = {}
+    for label, cache in (("uncached", ResponseCache(max_bytes=0)), ("cached", ResponseCache())):
+        set_response_cache(cache)
+        metrics.reset()
+        db = CountingRepository(reports=[report])
+        etag = fetch(db, [(url, None)])[0].headers["etag"]
+        for conditional in (False, True):
+            headers = {"If-None-Match": etag} if conditional else None
+            start = time.perf_counter()
+            responses = fetch(db, [(url, headers)] * N_TIMINGS)
+            timings[label, conditional] = (time.perf_counter() - start) / N_TIMINGS * 1000
+            assert all(r.status_code == (304 if conditional else 200) for r in responses)
+        timings[label, "reads"] = db.reads
+    set_response_cache(None)
+
+    assert timings["cached", "reads"] == 1
+    assert timings["uncached", "reads"] == 1 + 2 * N_TIMINGS
+    print(
+        f"per view: uncached {timings['uncached', False]:.2f}ms (304 {timings['uncached', True]:.2f}ms), "
+        f"cached {timings['cached', False]:.2f}ms (304 {timings['cached', True]:.2f}ms)"
+    )
+
+
+if __name__ == "__main__":
+    test_lru_byte_budget()
+    test_etag_and_not_modified()
+    test_cache_respects_ownership_and_progress()
+    test_repeat_view_latency()
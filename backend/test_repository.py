@@ -0,0 +1,151 @@
+import os
+import asyncio
+import json
+import tempfile
+
+import httpx
+
+from app.services.repository import (
+    MemoryRepository,
+    PostgRESTRepository,
+    RepositoryError,
+    SQLiteRepository,
+)
+from app.utils import metrics
+
+
+def report(report_id, user_id, created_at, topic_key="k"):
+    return {
+        "id": report_id,
+        "user_id": user_id,
+        "topic": f"Topic {report_id}",
+        "topic_key": topic_key,
+        "created_at": created_at,
+        "sections": [{"title": "Section", "content": "Content"}],
+    }
+
+
+async def check_contract(repo):
+    user = await repo.create_user({"email": "a@test.dev", "username": "a", "hashed_password": "x"})
+    assert user["id"]
+    assert (await repo.get_user(user["id"]))["email"] == "a@test.dev"
+    assert (await repo.get_user_by_email("a@test.dev"))["id"] == user["id"]
+    assert await repo.get_user_by_email("missing@test.dev") is None
+    updated = await repo.update_user(user["id"], {"hashed_password": "y"})
+    assert updated["hashed_password"] == "y" and updated["username"] == "a"
+    assert (await repo.get_user_by_email("a@test.dev"))["hashed_password"] == "y"
+    assert await repo.update_user(999, {"hashed_password": "z"}) is None
+    try:
+        await repo.create_user({"email": "a@test.dev", "username": "b"})
+        assert False, "duplicate email was accepted"
+    except RepositoryError as e:
+        assert e.status_code == 409
+
+    await repo.insert_report(report("r1", 1, "2025-01-01T00:00:00"))
+    await repo.insert_report(report("r2", 1, "2025-01-02T00:00:00", topic_key="other"))
+    await repo.insert_report(report("r3", 2, "2025-01-03T00:00:00"))
+    try:
+        await repo.insert_report(report("r1", 1, "2025-01-01T00:00:00"))
+        assert False, "duplicate report was accepted"
+    except RepositoryError as e:
+        assert e.status_code == 409
+
+    assert [r["id"] for r in await repo.list_reports()] == ["r3", "r2", "r1"]
+    assert [r["id"] for r in await repo.list_reports(user_id=1, descending=False)] == ["r1", "r2"]
+    assert [r["id"] for r in await repo.list_reports(ids=["r1", "r3"])] == ["r3", "r1"]
+    assert [r["id"] for r in await repo.list_reports(topic_key="k", limit=1)] == ["r3"]
+    window = await repo.list_reports(since="2025-01-02T00:00:00", until="2025-01-02T23:59:59")
+    assert [r["id"] for r in window] == ["r2"]
+    assert await repo.list_reports("id, topic", user_id=2) == [{"id": "r3", "topic": "Topic r3"}]
+    # Keyset pages: r4 shares r2's timestamp and comes first on the id tie-break
+    await repo.insert_report(report("r4", 1, "2025-01-02T00:00:00"))
+    assert [r["id"] for r in await repo.list_reports(after=("2025-01-02T00:00:00", "r4"))] == ["r2", "r1"]
+    assert [r["id"] for r in await repo.list_reports(after=("2025-01-02T00:00:00", "r2"), descending=False)] == ["r4", "r3"]
+    assert [r["id"] for r in await repo.list_reports(search="TOPIC R4")] == ["r4"]
+    assert await repo.list_reports(search="100%_") == []
+
+    assert (await repo.get_report("r3"))["sections"][0]["title"] == "Section"
+    assert await repo.get_report("r3", user_id=1) is None
+
+    await repo.upsert_report(dict(report("r1", 1, "2025-01-01T00:00:00"), topic="Renamed"))
+    assert (await repo.get_report("r1"))["topic"] == "Renamed"
+    assert len(await repo.list_reports()) == 4
+
+
+def test_memory_repository():
+    asyncio.run(check_contract(MemoryRepository()))
+    print("Memory repository test passed")
+
+
+def test_sqlite_repository():
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(check_contract(SQLiteRepository(os.path.join(directory, "db.sqlite"))))
+    print("SQLite repository test passed")
+
+
+def test_postgrest_requests_and_retries():
+    metrics.reset()
+    requests = []
+    failures = {"GET": 1, "POST": 1}
+
+    def handler(request):
+        requests.append(request)
+        if failures.get(request.method):
+            failures[request.method] -= 1
+            return httpx.Response(503, text="unavailable")
+        if request.method == "POST":
+            return httpx.Response(201, json=[json.loads(request.content)])
+        return httpx.Response(200, json=[{"id": "r1", "topic": "Topic r1"}])
+
+    async def run():
+        repo = PostgRESTRepository(
+            "http://db.test", "key", retries=2, transport=httpx.MockTransport(handler)
+        )
+        try:
+            rows = await repo.list_reports(
+                "id, topic", user_id=1, ids=["r1", 'r"2'], since="2025-01-01", descending=False, limit=5,
+                after=("2025-01-02T00:00:00", "r1"), search="50%",
+            )
+            try:
+                await repo.insert_report({"id": "r9"})
+                assert False, "insert was not rejected"
+            except RepositoryError as e:
+                assert e.status_code == 503
+            upserted = await repo.upsert_report({"id": "r9"})
+            return rows, upserted
+        finally:
+            await repo.close()
+
+    rows, upserted = asyncio.run(run())
+    assert rows == [{"id": "r1", "topic": "Topic r1"}] and upserted == {"id": "r9"}
+
+    # The GET was retried once; the insert was not, since it may have been applied
+    methods = [request.method for request in requests]
+    assert methods == ["GET", "GET", "POST", "POST"]
+    assert metrics.get_counter("database.retries") == 1
+
+    get = requests[0]
+    assert get.url.path == "/rest/v1/research_reports"
+    assert get.headers["apikey"] == "key"
+    params = get.url.params
+    assert params["select"] == "id,topic"
+    assert params["user_id"] == "eq.1"
+    # Values inside in.(...) are quoted and escaped
+    assert params["id"] == 'in.("r1","r\\"2")'
+    assert params["created_at"] == "gte.2025-01-01"
+    assert params["or"] == '(created_at.gt."2025-01-02T00:00:00",and(created_at.eq."2025-01-02T00:00:00",id.gt."r1"))'
+    assert params["topic"] == "ilike.*50\\%*"
+    assert params["order"] == "created_at.asc,id.asc"
+    assert params["limit"] == "5"
+    assert requests[2].headers["prefer"] == "return=minimal"
+    assert requests[3].headers["prefer"] == "resolution=merge-duplicates,return=minimal"
+    # Reports go over the wire encoded, with the legacy body columns cleared
+    stored = json.loads(requests[3].content)
+    assert stored["storage_version"] == 1 and stored["body"] and stored["summary"] is None
+    print("PostgREST repository test passed")
+
+
+if __name__ == "__main__":
+    test_memory_repository()
+    test_sqlite_repository()
+    test_postgrest_requests_and_retries()
@@ -10,20 +10,21 @@ load_dotenv()
 
 async def test_research_without_db_save():
     # Import here to avoid circular imports
-    from app.routers.research import active_research_tasks
+    from app.services.task_store import get_task_store
+    task_store = get_task_store()
     
     # Generate a random research ID
     research_id = str(uuid.uuid4())
     
-    # Mock active_research_tasks entry
-    active_research_tasks[research_id] = {"status": "pending"}
-    
     # Test topic
     topic = "The impact of artificial intelligence on healthcare"
     
     # Mock user ID
     user_id = 1
     
+    # Mock task store entry
+    await task_store.create(research_id, user_id=user_id, topic=topic, status="pending")
+    
     print(f"Starting research on: {topic}")
     print(f"Research ID: {research_id}")
     
@@ -34,7 +35,7 @@ async def test_research_without_db_save():
         from app.routers.research import SYSTEM_PROMPT
         
         # Update the status to processing
-        active_research_tasks[research_id]["status"] = "processing"
+        await task_store.update(research_id, status="processing")
         
         # Prepare the prompt
         prompt = f"Topic: {topic}"
@@ -111,13 +112,12 @@ async def test_research_without_db_save():
             }
         
         # Update the status
-        active_research_tasks[research_id]["status"] = "completed"
+        await task_store.update(research_id, status="completed")
         print("Research completed successfully!")
         
     except Exception as e:
         # Handle errors
-        active_research_tasks[research_id]["status"] = "failed"
-        active_research_tasks[research_id]["error"] = str(e)
+        await task_store.update(research_id, status="failed", error=str(e))
         print(f"Research error: {e}")
 
 if __name__ == "__main__":
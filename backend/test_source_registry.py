@@ -0,0 +1,217 @@
+import os
+import copy
+import asyncio
+import hashlib
+import json
+import tempfile
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+import httpx
+
+from app.main import app
+from app.routers import auth
+from app.routers.auth import get_current_user
+from app.services.repository import MemoryRepository, SQLiteRepository, set_repository
+from app.services.source_index import SourceIndex
+from app.utils import metrics
+from app.utils.report_codec import decode_report, encode_report
+from app.utils.source_urls import clean_url, normalize_url, source_id
+
+ADMIN = {"id": 1, "email": "admin@test.dev", "username": "admin"}
+USER = {"id": 2, "email": "user@test.dev", "username": "user"}
+N_REPORTS = 30
+SHARED = 20
+
+
+def make_sources(i):
+    """Sources of report i: SHARED of them cited by every report, under
+    varying spellings of the same URL, plus a few of its own"""
+    sources = []
+    for n in range(SHARED):
+        slug = hashlib.sha256(str(n).encode()).hexdigest()
+        path = f"example.com/research/{slug[:24]}/{slug[24:40]}"
+        url = f"https://www.{path}/" if i % 2 else f"http://EXAMPLE.{path[8:]}?utm_source=feed#top"
+        title = f"Article {n}: findings {slug[40:56]} on coastal tides"
+        sources.append({"title": title, "url": url, "snippet": f"Report {i} quotes article {n}."})
+    for n in range(3):
+        sources.append({"title": f"Own {i}.{n}", "url": f"https://site{i}.org/page/{n}", "snippet": "Unique"})
+    return sources
+
+
+def make_report(i, user_id):
+    return {
+        "id": f"r{i:03d}",
+        "user_id": user_id,
+        "topic": f"Topic {i}",
+        "created_at": f"2024-01-01T00:00:{i:02d}",
+        "summary": "Summary",
+        "sections": [{"title": "Section", "content": "Content " * 50}],
+        "sources": make_sources(i),
+    }
+
+
+async def store_reports(db):
+    """Store the reports the way conduct_research does"""
+    reports = []
+    for i in range(N_REPORTS):
+        report = make_report(i, USER["id"] if i % 3 else ADMIN["id"])
+        report["sources"] = await db.canonicalize_sources(report["sources"])
+        report["report_json"] = json.dumps({key: report[key] for key in ("summary", "sections", "sources")})
+        await db.insert_report(report)
+        reports.append(report)
+    return reports
+
+
+def test_normalize_url():
+    same = [
+        "https://www.example.com/a/b/?utm_source=x&q=1#frag",
+        "http://example.com/a/b?q=1&fbclid=abc",
+        "HTTPS://Example.COM:443/a/b?q=1",
+    ]
+    assert len({normalize_url(url) for url in same}) == 1
+    assert len({source_id(url) for url in same}) == 1
+    assert normalize_url("https://example.com/a?x=1&y=2") == normalize_url("https://example.com/a?y=2&x=1")
+    assert normalize_url("https://example.com/a") != normalize_url("https://example.com/b")
+    assert normalize_url("https://example.com:8080/a") != normalize_url("https://example.com/a")
+    # The clean URL still works as a link
+    assert clean_url("HTTP://WWW.Example.com:80/Path?utm_medium=m&id=7#x") == "http://www.example.com/Path?id=7"
+    assert normalize_url("") == "" and normalize_url("not a url") == "not a url"
+    # ?ref= picks the content on some sites, so it is not a tracking parameter
+    assert normalize_url("https://github.com/o/r/blob/x.py?ref=main") != normalize_url("https://github.com/o/r/blob/x.py?ref=dev")
+    print("URL normalization test passed")
+
+
+def test_codec_references_registry():
+    db = MemoryRepository()
+
+    async def run():
+        report = make_report(1, USER["id"])
+        report["sources"] = await db.canonicalize_sources(report["sources"] + report["sources"][:5])
+        report["report_json"] = json.dumps({key: report[key] for key in ("summary", "sections", "sources")})
+        return report, await db.get_sources(source_id(source["url"]) for source in report["sources"])
+
+    report, registry = asyncio.run(run())
+    # Sources cited twice are stored once, with the registry's clean URL
+    assert len(report["sources"]) == SHARED + 3
+    assert report["sources"][0]["url"] == make_sources(1)[0]["url"]
+
+    inline, referenced = encode_report(report), encode_report(report, registry)
+    assert inline["storage_version"] == 1 and referenced["storage_version"] == 2
+    assert len(referenced["body"]) < len(inline["body"])
+    assert decode_report(referenced, registry) == decode_report(inline) == report
+    # Without the registry rows the references are left for the caller to resolve
+    partial = decode_report(referenced)
+    assert partial["report_json"] is None and all("ref" in source for source in partial["sources"])
+    print(f"Source references: body {len(inline['body'])} -> {len(referenced['body'])} bytes")
+
+
+def test_reports_keep_their_own_titles():
+    db = MemoryRepository()
+    url = "https://example.com/tides"
+
+    async def run():
+        first = make_report(1, ADMIN["id"])
+        first["sources"] = [{"title": "Wrong title", "url": url, "snippet": "First"}]
+        await db.insert_report(first)
+        second = make_report(2, USER["id"])
+        second["sources"] = await db.canonicalize_sources(
+            [{"title": "Tide tables", "url": url + "?utm_source=x", "snippet": "Second"}]
+        )
+        second["report_json"] = json.dumps({key: second[key] for key in ("summary", "sections", "sources")})
+        await db.insert_report(second)
+        return second, await db.get_report(second["id"]), db.reports[-1], await db.most_cited_sources()
+
+    second, stored, row, top = asyncio.run(run())
+    # The registry row came from the first report, but the second keeps its title
+    assert top[0]["title"] == "Wrong title" and top[0]["citations"] == 2
+    assert second["sources"] == [{"title": "Tide tables", "url": url, "snippet": "Second"}]
+    assert row["storage_version"] == 2 and stored["sources"] == second["sources"]
+    assert stored["report_json"] == second["report_json"]
+    print("Own titles test passed")
+
+
+async def check_registry(db):
+    reports = await store_reports(db)
+    # Shared sources are registered once, however their URLs were spelled
+    assert len(db.source_index) == SHARED + 3 * N_REPORTS
+    for report in reports:
+        stored = await db.get_report(report["id"])
+        assert stored["sources"] == report["sources"] and stored["report_json"] == report["report_json"]
+
+    # A fresh process has an empty index and reads the registry
+    fresh = copy.copy(db)
+    fresh.source_index = SourceIndex()
+    assert await fresh.get_report(reports[5]["id"]) == await db.get_report(reports[5]["id"])
+    assert len(fresh.source_index) == len(reports[5]["sources"])
+
+    top = await db.most_cited_sources(limit=5)
+    assert [row["citations"] for row in top] == [N_REPORTS] * 5
+    # The first report to cite a source decided its URL
+    assert all(row["url"].startswith("http://example.com/research/") for row in top)
+    mine = await db.most_cited_sources(user_id=ADMIN["id"], limit=SHARED + 1)
+    assert [row["citations"] for row in mine] == [N_REPORTS // 3] * SHARED + [1]
+
+    # Replacing a report does not count its citations twice
+    await db.upsert_report(reports[0])
+    assert (await db.most_cited_sources(limit=1))[0]["citations"] == N_REPORTS
+
+
+def test_memory_registry():
+    asyncio.run(check_registry(MemoryRepository()))
+    print("Memory source registry test passed")
+
+
+def test_sqlite_registry():
+    with tempfile.TemporaryDirectory() as directory:
+        db = SQLiteRepository(os.path.join(directory, "db.sqlite"))
+        asyncio.run(check_registry(db))
+        size = os.path.getsize(os.path.join(directory, "db.sqlite"))
+    print(f"SQLite source registry test passed ({size} bytes on disk)")
+
+
+def test_top_sources_endpoints():
+    metrics.reset()
+    db = MemoryRepository()
+    set_repository(db)
+    auth.ADMIN_EMAILS.add(ADMIN["email"])
+
+    async def call(user, path):
+        app.dependency_overrides[get_current_user] = lambda: user
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path)
+
+    async def run():
+        await store_reports(db)
+        return (
+            await call(USER, "/api/research/sources/top?limit=3"),
+            await call(USER, "/api/admin/sources/top"),
+            await call(ADMIN, "/api/admin/sources/top?limit=3"),
+        )
+
+    try:
+        mine, forbidden, everyone = asyncio.run(run())
+    finally:
+        auth.ADMIN_EMAILS.discard(ADMIN["email"])
+        app.dependency_overrides.pop(get_current_user, None)
+        set_repository(None)
+
+    assert mine.status_code == 200
+    assert [row["citations"] for row in mine.json()["sources"]] == [N_REPORTS - N_REPORTS // 3] * 3
+    assert forbidden.status_code == 403
+    assert [row["citations"] for row in everyone.json()["sources"]] == [N_REPORTS] * 3
+    assert all(row["title"].startswith("Article ") for row in everyone.json()["sources"])
+    print("Top sources endpoint test passed")
+
+
+if __name__ == "__main__":
+    test_normalize_url()
+    test_codec_references_registry()
+    test_reports_keep_their_own_titles()
+    test_memory_registry()
+    test_sqlite_registry()
+    test_top_sources_endpoints()
@@ -0,0 +1,88 @@
+import os
+import asyncio
+import tempfile
+import time
+
+from app.services.task_store import MemoryTaskStore, SQLiteTaskStore, RedisTaskStore
+
+
+async def exercise_store(store):
+    record = await store.create("task-1", user_id=1, topic="AI")
+    assert record["status"] == "in_progress" and record["progress"] == 0
+
+    await store.update("task-1", status="processing", progress=40)
+    task = await store.get("task-1")
+    assert task["status"] == "processing"
+    assert task["progress"] == 40
+    assert task["user_id"] == 1 and task["topic"] == "AI"
+    assert task["updated_at"] >= task["created_at"]
+
+    # put() replaces a record whole
+    await store.put("task-1", {"status": "failed"})
+    assert await store.get("task-1") == {"status": "failed"}
+
+    await store.delete("task-1")
+    assert await store.get("task-1") is None
+
+    # add() only writes when no live record exists
+    assert await store.add("claim", {"research_id": "a"})
+    assert not await store.add("claim", {"research_id": "b"})
+    assert (await store.get("claim"))["research_id"] == "a"
+    await store.delete("claim")
+    assert await store.add("claim", {"research_id": "c"})
+    await store.delete("claim")
+
+
+def test_memory_store():
+    asyncio.run(exercise_store(MemoryTaskStore()))
+
+
+def test_memory_store_ttl_and_size_cap():
+    async def run():
+        store = MemoryTaskStore(ttl=0.05, max_entries=3)
+        for i in range(5):
+            await store.create(f"task-{i}", user_id=1, topic="AI")
+        # Only the most recent entries are kept
+        assert len(store) == 3
+        assert await store.get("task-0") is None
+        assert await store.get("task-4") is not None
+
+        time.sleep(0.1)
+        assert await store.get("task-4") is None
+        await store.create("task-5", user_id=1, topic="AI")
+        # Expired entries are evicted on write
+        assert len(store) == 1
+
+    asyncio.run(run())
+
+
+def test_sqlite_store_is_shared_and_expires():
+    async def run():
+        path = os.path.join(tempfile.mkdtemp(), "tasks.db")
+        await exercise_store(SQLiteTaskStore(path))
+
+        # A second instance (e.g. another uvicorn worker) sees the same records
+        api_store = SQLiteTaskStore(path, ttl=0.05)
+        worker_store = SQLiteTaskStore(path, ttl=0.05)
+        await worker_store.create("task-2", user_id=2, topic="Climate", status="completed")
+        assert (await api_store.get("task-2"))["status"] == "completed"
+
+        time.sleep(0.1)
+        assert await api_store.get("task-2") is None
+
+    asyncio.run(run())
+
+
+def test_redis_store():
+    url = os.environ.get("TEST_REDIS_URL")
+    if not url:
+        print("Skipping Redis task store test (set TEST_REDIS_URL to run it)")
+        return
+    asyncio.run(exercise_store(RedisTaskStore(url, prefix="deepr:test:")))
+
+
+if __name__ == "__main__":
+    test_memory_store()
+    test_memory_store_ttl_and_size_cap()
+    test_sqlite_store_is_shared_and_expires()
+    test_redis_store()
@@ -0,0 +1,189 @@
+import os
+import asyncio
+import time
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from jose import JWTError, jwk, jwt
+
+from app.routers.auth import validate_token
+from app.services.repository import MemoryRepository, set_repository
+from app.services.token_verifier import JWKSCache, TokenVerifier, set_token_verifier
+from app.services.user_cache import UserCache, set_user_cache
+from app.utils import metrics
+
+N_REQUESTS = 200
+
+
+def make_key():
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return private.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+
+
+def public_jwk(pem, kid):
+    return dict(jwk.construct(pem, "RS256").public_key().to_dict(), kid=kid)
+
+
+def sign(pem, kid, email="google@test.dev", lifetime=3600):
+    claims = {"sub": "uuid", "email": email, "aud": "authenticated", "exp": int(time.time()) + lifetime}
+    return jwt.encode(claims, pem, algorithm="RS256", headers={"kid": kid})
+
+
+class FakeJWKS:
+    """A JWKS endpoint whose published keys can be changed"""
+
+    def __init__(self, *keys):
+        self.keys = list(keys)
+        self.requests = 0
+
+    def __call__(self, request):
+        self.requests += 1
+        return httpx.Response(200, json={"keys": self.keys})
+
+    def verifier(self, **options):
+        return TokenVerifier(JWKSCache("http://auth.test/jwks", transport=httpx.MockTransport(self), **options))
+
+
+def test_repeated_tokens_skip_crypto_and_network():
+    metrics.reset()
+    pem = make_key()
+    endpoint = FakeJWKS(public_jwk(pem, "k1"))
+    verifier = endpoint.verifier()
+    token = sign(pem, "k1")
+
+    async def run():
+        start = time.perf_counter()
+        await verifier.verify(token)
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(N_REQUESTS):
+            claims = await verifier.verify(token)
+        cached = (time.perf_counter() - start) / N_REQUESTS
+        await verifier.close()
+        return claims, first, cached
+
+    claims, first, cached = asyncio.run(run())
+    assert claims["email"] == "google@test.dev"
+    assert endpoint.requests == 1
+    assert metrics.get_counter("token_cache.misses") == 1
+    assert metrics.get_counter("token_cache.hits") == N_REQUESTS
+    print(f"First verification {first * 1000:.2f}ms, cached {cached * 1000:.3f}ms")
+
+
+def test_rejects_forged_and_expired_tokens():
+    pem, attacker = make_key(), make_key()
+    verifier = FakeJWKS(public_jwk(pem, "k1")).verifier()
+
+    async def rejected(token):
+        try:
+            await verifier.verify(token)
+        except JWTError:
+            return True
+        return False
+
+    async def run():
+        results = [
+            await rejected(sign(attacker, "k1")),
+            await rejected(sign(pem, "k1", lifetime=-10)),
+            await rejected(jwt.encode({"aud": "authenticated", "exp": int(time.time()) + 60}, "x", algorithm="HS256")),
+        ]
+        await verifier.close()
+        return results
+
+    assert asyncio.run(run()) == [True, True, True]
+    print("Forged token test passed")
+
+
+def test_unknown_kid_refetches_once():
+    metrics.reset()
+    old, new = make_key(), make_key()
+    endpoint = FakeJWKS(public_jwk(old, "k1"))
+    verifier = endpoint.verifier(refetch_interval=60)
+
+    async def run():
+        await verifier.verify(sign(old, "k1"))
+        # Supabase rotates its key
+        endpoint.keys.append(public_jwk(new, "k2"))
+        claims = await verifier.verify(sign(new, "k2"))
+        # Made-up kids do not cause a fetch each
+        for _ in range(5):
+            try:
+                await verifier.verify(sign(new, "bogus"))
+            except JWTError:
+                pass
+        await verifier.close()
+        return claims
+
+    claims = asyncio.run(run())
+    assert claims["email"] == "google@test.dev"
+    assert endpoint.requests == 2
+    assert metrics.get_counter("jwks.unknown_kid_refetches") == 1
+    print("Key rotation test passed")
+
+
+def test_stale_keys_are_served_while_refreshing():
+    pem = make_key()
+    endpoint = FakeJWKS(public_jwk(pem, "k1"))
+    verifier = endpoint.verifier(ttl=0)
+
+    async def run():
+        await verifier.verify(sign(pem, "k1", email="a@test.dev"))
+        assert endpoint.requests == 1
+        # The keys are already stale: this token is checked with them while
+        # a refresh runs in the background
+        claims = await verifier.verify(sign(pem, "k1", email="b@test.dev"))
+        requests_before_refresh = endpoint.requests
+        await asyncio.sleep(0.05)
+        await verifier.close()
+        return claims, requests_before_refresh
+
+    claims, requests_before_refresh = asyncio.run(run())
+    assert claims["email"] == "b@test.dev"
+    assert requests_before_refresh == 1
+    assert endpoint.requests == 2
+    print("Stale-while-revalidate test passed")
+
+
+def test_validate_token_checks_supabase_signatures():
+    pem, attacker = make_key(), make_key()
+    set_token_verifier(FakeJWKS(public_jwk(pem, "k1")).verifier())
+    set_repository(MemoryRepository())
+    set_user_cache(UserCache())
+
+    async def status(token):
+        try:
+            user = await validate_token(token)
+            return user["email"]
+        except HTTPException as e:
+            return e.status_code
+
+    async def run():
+        return await status(sign(attacker, "k1")), await status(sign(pem, "k1"))
+
+    try:
+        forged, genuine = asyncio.run(run())
+    finally:
+        set_token_verifier(None)
+        set_repository(None)
+        set_user_cache(None)
+
+    assert forged == 401
+    assert genuine == "google@test.dev"
+    print("validate_token signature test passed")
+
+
+if __name__ == "__main__":
+    test_repeated_tokens_skip_crypto_and_network()
+    test_rejects_forged_and_expired_tokens()
+    test_unknown_kid_refetches_once()
+    test_stale_keys_are_served_while_refreshing()
+    test_validate_token_checks_supabase_signatures()
@@ -0,0 +1,117 @@
+import os
+import asyncio
+import time
+
+# Keep the database in memory
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("JOB_QUEUE_URL", "memory://")
+os.environ.setdefault("TASK_STORE_URL", "memory://")
+
+import httpx
+from fastapi import HTTPException
+
+from app.main import app
+from app.routers.auth import create_access_token, validate_token
+from app.services.repository import MemoryRepository, set_repository
+from app.services.user_cache import UserCache, set_user_cache
+from app.utils import metrics
+
+N_REQUESTS = 200
+
+
+def counting_repository():
+    db = MemoryRepository(users=[{"id": 1, "email": "poll@test.dev", "username": "poll", "hashed_password": "x"}])
+    lookups = []
+    get_user_by_email = db.get_user_by_email
+
+    async def counted(email):
+        lookups.append(email)
+        return await get_user_by_email(email)
+
+    db.get_user_by_email = counted
+    return db, lookups
+
+
+def test_validate_token_reads_each_user_once():
+    metrics.reset()
+    db, lookups = counting_repository()
+    set_repository(db)
+    set_user_cache(UserCache(ttl=60))
+    token = create_access_token({"sub": "poll@test.dev"})
+
+    async def run():
+        start = time.perf_counter()
+        for _ in range(N_REQUESTS):
+            user = await validate_token(token)
+            assert user["id"] == 1
+        return (time.perf_counter() - start) / N_REQUESTS * 1000
+
+    try:
+        per_request_ms = asyncio.run(run())
+    finally:
+        set_repository(None)
+        set_user_cache(None)
+
+    assert lookups == ["poll@test.dev"]
+    assert metrics.get_counter("user_cache.misses") == 1
+    assert metrics.get_counter("user_cache.hits") == N_REQUESTS - 1
+    print(f"{N_REQUESTS} validations, 1 users query, {per_request_ms:.3f}ms each")
+
+
+def test_entries_expire():
+    db, lookups = counting_repository()
+    set_repository(db)
+    cache = UserCache(ttl=0.05)
+    try:
+        asyncio.run(cache.get_by_email("poll@test.dev"))
+        asyncio.run(cache.get_by_email("poll@test.dev"))
+        time.sleep(0.1)
+        asyncio.run(cache.get_by_email("poll@test.dev"))
+    finally:
+        set_repository(None)
+    assert len(lookups) == 2
+    print("User cache expiry test passed")
+
+
+def test_unknown_users_are_cached_until_they_register():
+    metrics.reset()
+    db, lookups = counting_repository()
+    set_repository(db)
+    set_user_cache(UserCache(ttl=60, negative_ttl=60))
+    token = create_access_token({"sub": "new@test.dev"})
+
+    async def validate():
+        try:
+            return await validate_token(token)
+        except HTTPException as e:
+            return e.status_code
+
+    async def run():
+        before = [await validate() for _ in range(3)]
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/api/auth/register", json={
+                "email": "new@test.dev", "username": "new", "password": "secret-password",
+            })
+        assert response.status_code == 200
+        after = await validate()
+        return before, after
+
+    try:
+        before, after = asyncio.run(run())
+    finally:
+        set_repository(None)
+        set_user_cache(None)
+
+    assert before == [401, 401, 401]
+    assert metrics.get_counter("user_cache.negative_hits") == 2
+    assert after["email"] == "new@test.dev"
+    # One miss before registering, the register check, one miss after
+    assert lookups == ["new@test.dev"] * 3
+    print("Negative user cache test passed")
+
+
+if __name__ == "__main__":
+    test_validate_token_reads_each_user_once()
+    test_entries_expire()
+    test_unknown_users_are_cached_until_they_register()
@@ -0,0 +1,34 @@
+import os
+import argparse
+import asyncio
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.services.job_queue import get_job_queue, Worker, LANES
+# Importing the routers registers their job handlers
+from app.routers import research  # noqa: F401
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a DeepR job worker")
+    parser.add_argument(
+        "--lanes",
+        default=",".join(LANES),
+        help="Comma-separated priority lanes to consume, highest first",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(os.environ.get("WORKER_CONCURRENCY", 4)),
+        help="Number of jobs to run at the same time",
+    )
+    args = parser.parse_args()
+
+    lanes = [lane.strip() for lane in args.lanes.split(",") if lane.strip()]
+    worker = Worker(get_job_queue(), lanes=lanes, concurrency=args.concurrency)
+    print(f"Worker started on lanes {lanes} with concurrency {args.concurrency}")
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        print("Worker stopped")
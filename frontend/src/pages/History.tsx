@@ -1,26 +1,46 @@
 import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
-import researchService from '../services/researchService';
-import { FiSearch, FiClock, FiArrowRight, FiLoader, FiAlertCircle } from 'react-icons/fi';
+import researchService, { ResearchHistoryItem } from '../services/researchService';
+import { FiSearch, FiClock, FiArrowRight, FiLoader, FiAlertCircle, FiFileText } from 'react-icons/fi';
 
-interface ResearchItem {
-  id: string;
-  user_id: number;
-  topic: string;
-  created_at: string;
-}
+// Wait this long after the last keystroke before searching
+const SEARCH_DELAY = 300;
 
 const History: React.FC = () => {
-  const [researches, setResearches] = useState<ResearchItem[]>([]);
+  const [researches, setResearches] = useState<ResearchHistoryItem[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [query, setQuery] = useState('');
+  const [search, setSearch] = useState('');
   const [isLoading, setIsLoading] = useState(true);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [debugInfo, setDebugInfo] = useState<string | null>(null);
   
+  useEffect(() => {
+    const timer = setTimeout(() => setSearch(query.trim()), SEARCH_DELAY);
+    return () => clearTimeout(timer);
+  }, [query]);
+  
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    setIsLoadingMore(true);
+    try {
+      const response = await researchService.getResearchHistory({ cursor: nextCursor, q: search || undefined });
+      setResearches(current => [...current, ...response.researches]);
+      setNextCursor(response.next_cursor ?? null);
+    } catch (err) {
+      console.error('Failed to load more history:', err);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+  
   useEffect(() => {
     const fetchHistory = async () => {
       try {
-        const response = await researchService.getResearchHistory();
+        const response = await researchService.getResearchHistory({ q: search || undefined });
         setResearches(response.researches);
+        setNextCursor(response.next_cursor ?? null);
         setIsLoading(false);
       } catch (err: any) {
         // Detailed error logging
@@ -47,7 +67,7 @@ const History: React.FC = () => {
     };
     
     fetchHistory();
-  }, []);
+  }, [search]);
   
   if (isLoading) {
     return (
@@ -78,7 +98,7 @@ const History: React.FC = () => {
     );
   }
   
-  if (researches.length === 0) {
+  if (researches.length === 0 && !search) {
     return (
       <div className="container mx-auto max-w-4xl px-4 py-8">
         <div className="text-center mb-8">
@@ -121,7 +141,21 @@ const History: React.FC = () => {
         </div>
       </div>
       
+      <div className="relative mb-6">
+        <FiSearch className="absolute left-3 top-1/2 -translate-y-1/2 text-gray-400" />
+        <input
+          type="text"
+          value={query}
+          onChange={(e) => setQuery(e.target.value)}
+          placeholder="Search your research by topic"
+          className="input w-full pl-10"
+        />
+      </div>
+      
       <div className="card">
+        {researches.length === 0 && (
+          <p className="text-center text-gray-500 py-8">No research matches "{search}"</p>
+        )}
         <div className="divide-y divide-gray-200">
           {researches.map((research) => (
             <div key={research.id} className="py-4 first:pt-0 last:pb-0">
@@ -132,6 +166,12 @@ const History: React.FC = () => {
                     <FiClock className="mr-2" size={14} />
                     {new Date(research.created_at).toLocaleDateString()} at{' '}
                     {new Date(research.created_at).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })}
+                    {research.section_count != null && research.word_count != null && (
+                      <span className="flex items-center ml-4">
+                        <FiFileText className="mr-2" size={14} />
+                        {research.section_count} sections, {research.word_count.toLocaleString()} words
+                      </span>
+                    )}
                   </p>
                 </div>
                 
@@ -145,6 +185,19 @@ const History: React.FC = () => {
             </div>
           ))}
         </div>
+        
+        {nextCursor && (
+          <div className="text-center pt-6">
+            <button
+              onClick={loadMore}
+              disabled={isLoadingMore}
+              className="btn btn-secondary inline-flex items-center"
+            >
+              {isLoadingMore && <FiLoader className="animate-spin mr-2" />}
+              Load more
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
@@ -40,26 +40,33 @@ const ResearchResult: React.FC = () => {
   const [pdfError, setPdfError] = useState<string | null>(null);
   const { darkMode } = useTheme();
   
+  const [progress, setProgress] = useState(0);
+  const [partialText, setPartialText] = useState('');
+  
   useEffect(() => {
-    const fetchData = async () => {
-      if (!id) return;
-      
+    if (!id) return;
+    const controller = new AbortController();
+    
+    const loadReport = async () => {
+      const reportData = await researchService.getResearchResult(id);
+      setReport(reportData);
+      setIsLoading(false);
+    };
+    
+    // Fallback when the progress stream is unavailable: poll every 5 seconds
+    const pollStatus = async () => {
+      if (controller.signal.aborted) return;
       try {
-        // First check the status
         const statusResponse = await researchService.getResearchStatus(id);
         setStatus(statusResponse.status);
         
         if (statusResponse.status === 'completed') {
-          // If completed, get the report
-          const reportData = await researchService.getResearchResult(id);
-          setReport(reportData);
-          setIsLoading(false);
+          await loadReport();
         } else if (statusResponse.status === 'failed') {
           setError('Research failed. Please try again.');
           setIsLoading(false);
         } else {
-          // If still in progress, poll every 5 seconds
-          setTimeout(fetchData, 5000);
+          setTimeout(pollStatus, 5000);
         }
       } catch (err: any) {
         console.error('Error fetching research:', err);
@@ -68,7 +75,46 @@ const ResearchResult: React.FC = () => {
       }
     };
     
-    fetchData();
+    const streamProgress = async () => {
+      let finalStatus = '';
+      try {
+        await researchService.streamResearchEvents(id, (event) => {
+          if (event.type === 'status' && event.status) {
+            finalStatus = event.status;
+            setStatus(event.status);
+            setProgress(event.progress || 0);
+          } else if (event.type === 'delta' && event.text) {
+            const text = event.text;
+            setPartialText(previous => previous.slice(0, event.offset ?? previous.length) + text);
+          } else if (event.type === 'reset') {
+            setPartialText('');
+          }
+        }, controller.signal);
+      } catch (err) {
+        if (controller.signal.aborted) return;
+        console.error('Progress stream failed, falling back to polling:', err);
+        pollStatus();
+        return;
+      }
+      
+      if (finalStatus === 'completed') {
+        try {
+          await loadReport();
+        } catch (err: any) {
+          setError(err.response?.data?.detail || 'Failed to load research. Please try again.');
+          setIsLoading(false);
+        }
+      } else if (finalStatus === 'failed') {
+        setError('Research failed. Please try again.');
+        setIsLoading(false);
+      } else if (!controller.signal.aborted) {
+        // The stream ended early (e.g. a proxy timeout); keep going by polling
+        pollStatus();
+      }
+    };
+    
+    streamProgress();
+    return () => controller.abort();
   }, [id]);
   
   const handleDownloadPdf = async () => {
@@ -104,7 +150,7 @@ const ResearchResult: React.FC = () => {
     }
   };
   
-  if (isLoading || status === 'in_progress') {
+  if (isLoading || status === 'in_progress' || status === 'processing') {
     return (
       <div className="container mx-auto max-w-4xl px-4 py-8">
         <div className="card text-center py-16">
@@ -115,8 +161,16 @@ const ResearchResult: React.FC = () => {
               We're conducting deep research on your topic. This usually takes 1-2 minutes.
             </p>
             <div className="w-64 h-2 bg-gray-200 rounded-full overflow-hidden mt-4">
-              <div className="h-full bg-primary-500 rounded-full animate-pulse"></div>
+              <div
+                className="h-full bg-primary-500 rounded-full animate-pulse transition-all duration-500"
+                style={{ width: `${Math.max(progress, 5)}%` }}
+              ></div>
             </div>
+            {partialText && (
+              <pre className="mt-6 w-full max-h-48 overflow-hidden text-left text-xs text-gray-500 whitespace-pre-wrap break-words">
+                {partialText.slice(-1500)}
+              </pre>
+            )}
           </div>
         </div>
       </div>
@@ -2,7 +2,7 @@ import axios from 'axios';
 import { createClient } from '@supabase/supabase-js';
 
 // API URL from environment with HTTPS enforcement
-const API_URL = process.env.REACT_APP_API_URL?.replace('http://', 'https://');
+export const API_URL = process.env.REACT_APP_API_URL?.replace('http://', 'https://');
 
 // Initialize Supabase client
 const supabaseUrl = process.env.REACT_APP_SUPABASE_URL || '';
@@ -19,6 +19,20 @@ export const api = axios.create({
   withCredentials: false // Change to false to test basic connectivity
 });
 
+// Build auth headers: Supabase session first, then the stored token
+export const getAuthHeaders = async (): Promise<Record<string, string>> => {
+  const { data: { session } } = await supabase.auth.getSession();
+  if (session?.access_token) {
+    return {
+      Authorization: `Bearer ${session.access_token}`,
+      apikey: supabaseKey
+    };
+  }
+
+  const token = localStorage.getItem('access_token');
+  return token ? { Authorization: `Bearer ${token}` } : {};
+};
+
 // Add request interceptor
 api.interceptors.request.use(
   async (config) => {
@@ -27,18 +41,10 @@ api.interceptors.request.use(
       config.url = config.url.replace('http://', 'https://');
     }
 
-    // Try to get Supabase session first
-    const { data: { session } } = await supabase.auth.getSession();
-    if (session?.access_token) {
-      config.headers.Authorization = `Bearer ${session.access_token}`;
-      config.headers.apikey = supabaseKey; // Ensure apikey is set for this request
-    } else {
-      // Fallback to stored token
-      const token = localStorage.getItem('access_token');
-      if (token) {
-        config.headers.Authorization = `Bearer ${token}`;
-      }
-    }
+    const authHeaders = await getAuthHeaders();
+    Object.entries(authHeaders).forEach(([name, value]) => {
+      config.headers[name] = value;
+    });
     
     return config;
   },
@@ -8,48 +8,45 @@ interface CachedReport {
 const CACHE_EXPIRY = 30 * 60 * 1000; // 30 minutes
 const REPORTS_CACHE_KEY = 'cached_reports';
 const HISTORY_CACHE_KEY = 'cached_history';
+// Reports are cached as they are opened, most recent first
+const MAX_CACHED_REPORTS = 20;
 
 const cacheService = {
   async prefetchAndCacheReports() {
     try {
-      // First get the history
+      // The first history page carries everything the list needs, so
+      // reports themselves are only fetched when opened
+      cacheService.clearCache();
       const history = await researchService.getResearchHistory();
-      localStorage.setItem(HISTORY_CACHE_KEY, JSON.stringify({
-        data: history,
-        timestamp: Date.now()
-      }));
+      return { history };
+    } catch (error) {
+      console.error('Failed to prefetch reports:', error);
+      throw error;
+    }
+  },
 
-      // Then fetch each report in parallel
-      const reports = await Promise.all(
-        history.researches.map(async (research) => {
-          try {
-            const report = await researchService.getResearchResult(research.id);
-            return {
-              id: research.id,
-              data: report
-            };
-          } catch (error) {
-            console.error(`Failed to fetch report ${research.id}:`, error);
-            return null;
-          }
-        })
-      );
+  cacheHistory(history: any) {
+    localStorage.setItem(HISTORY_CACHE_KEY, JSON.stringify({
+      data: history,
+      timestamp: Date.now()
+    }));
+  },
 
-      // Filter out failed fetches and store in cache
-      const validReports = reports.filter(report => report !== null);
-      const cacheData = {
-        data: validReports,
-        timestamp: Date.now()
-      };
+  cacheReport(reportId: string, report: any) {
+    const cached = localStorage.getItem(REPORTS_CACHE_KEY);
+    const reports = cached ? JSON.parse(cached).data : [];
+    const cacheData = {
+      data: [
+        { id: reportId, data: report },
+        ...reports.filter((r: any) => r.id !== reportId)
+      ].slice(0, MAX_CACHED_REPORTS),
+      timestamp: Date.now()
+    };
+    try {
       localStorage.setItem(REPORTS_CACHE_KEY, JSON.stringify(cacheData));
-
-      return {
-        history: history,
-        reports: validReports
-      };
     } catch (error) {
-      console.error('Failed to prefetch reports:', error);
-      throw error;
+      // Storage is full; the report is simply fetched again next time
+      console.error('Failed to cache report:', error);
     }
   },
 
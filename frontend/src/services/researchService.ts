@@ -1,10 +1,18 @@
-import api from './api';
+import api, { API_URL, getAuthHeaders } from './api';
 import cacheService from './cacheService';
 
 // Define interfaces
 interface ResearchRequest {
   topic: string;
   additional_context?: string;
+  force_refresh?: boolean;
+}
+
+interface ExportRequest {
+  research_ids?: string[];
+  start_date?: string;
+  end_date?: string;
+  format?: 'zip' | 'pdf';
 }
 
 interface ResearchResponse {
@@ -29,19 +37,41 @@ interface ResearchResult {
   created_at: string;
 }
 
-interface ResearchHistoryResponse {
-  researches: Array<{
-    id: string;
-    user_id: number;
-    topic: string;
-    created_at: string;
-  }>;
+export interface ResearchEvent {
+  type: 'status' | 'delta' | 'reset';
+  status?: string;
+  progress?: number;
+  error?: string | null;
+  offset?: number;
+  text?: string;
+}
+
+export interface ResearchHistoryItem {
+  id: string;
+  user_id: number;
+  topic: string;
+  created_at: string;
+  section_count?: number | null;
+  word_count?: number | null;
+}
+
+export interface ResearchHistoryResponse {
+  researches: ResearchHistoryItem[];
+  // Pass back as `cursor` to load the next page; null on the last page
+  next_cursor?: string | null;
+}
+
+interface HistoryQuery {
+  cursor?: string;
+  limit?: number;
+  q?: string;
 }
 
 // Research service with methods for research operations
 const researchService = {
-  startResearch: async (topic: string, additional_context?: string): Promise<ResearchResponse> => {
-    const response = await api.post('/research', { topic, additional_context });
+  startResearch: async (topic: string, additional_context?: string, force_refresh = false): Promise<ResearchResponse> => {
+    const request: ResearchRequest = { topic, additional_context, force_refresh };
+    const response = await api.post('/research', request);
     return response.data;
   },
 
@@ -50,6 +80,49 @@ const researchService = {
     return response.data;
   },
 
+  // Stream status changes and partial output over server-sent events.
+  // fetch is used instead of EventSource so the auth headers can be sent.
+  // Resolves when the research completes or fails; call abort() to stop early.
+  streamResearchEvents: async (
+    researchId: string,
+    onEvent: (event: ResearchEvent) => void,
+    signal?: AbortSignal
+  ): Promise<void> => {
+    const headers = await getAuthHeaders();
+    const response = await fetch(`${API_URL}/research/${researchId}/events`, {
+      headers: { ...headers, Accept: 'text/event-stream' },
+      signal
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Progress stream failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // Events are separated by a blank line
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        const data = block
+          .split('\n')
+          .filter(line => line.startsWith('data: '))
+          .map(line => line.slice(6))
+          .join('\n');
+        if (data) {
+          onEvent(JSON.parse(data));
+        }
+        boundary = buffer.indexOf('\n\n');
+      }
+    }
+  },
+
   getResearchResult: async (researchId: string): Promise<ResearchResult> => {
     // Try to get from cache first
     const cachedReport = cacheService.getCachedReport(researchId);
@@ -59,18 +132,25 @@ const researchService = {
 
     // If not in cache, fetch from API
     const response = await api.get(`/research/${researchId}`);
+    cacheService.cacheReport(researchId, response.data);
     return response.data;
   },
 
-  getResearchHistory: async (): Promise<ResearchHistoryResponse> => {
-    // Try to get from cache first
-    const cachedHistory = cacheService.getCachedHistory();
-    if (cachedHistory) {
-      return cachedHistory;
+  // One page of history, newest first. Only the unfiltered first page is
+  // cached; the browser revalidates pages with the server's ETag.
+  getResearchHistory: async (query: HistoryQuery = {}): Promise<ResearchHistoryResponse> => {
+    const firstPage = !query.cursor && !query.q;
+    if (firstPage) {
+      const cachedHistory = cacheService.getCachedHistory();
+      if (cachedHistory) {
+        return cachedHistory;
+      }
     }
 
-    // If not in cache, fetch from API
-    const response = await api.get('/research/history');
+    const response = await api.get('/research/history', { params: query });
+    if (firstPage) {
+      cacheService.cacheHistory(response.data);
+    }
     return response.data;
   },
 
@@ -79,6 +159,14 @@ const researchService = {
       responseType: 'blob'
     });
     return response.data;
+  },
+
+  // Download several reports at once: a ZIP of PDFs, or one combined PDF
+  exportReports: async (request: ExportRequest): Promise<Blob> => {
+    const response = await api.post('/research/export', request, {
+      responseType: 'blob'
+    });
+    return response.data;
   }
 };
 